@@ -0,0 +1,50 @@
+-- 📊 ROLLUPS DE ANALYTICS DE IA
+-- Agregados incrementales de conversation_history que leen los endpoints /ai-analytics
+-- Mantenidos por services/conversation_rollup_service.py (job en background del backend)
+
+-- 1. Agregados por tenant, día e intención ('' = sin intención detectada)
+CREATE TABLE IF NOT EXISTS conversation_intent_daily (
+    tenant_id VARCHAR(100) NOT NULL,
+    dia DATE NOT NULL,
+    intencion VARCHAR(100) NOT NULL DEFAULT '',
+    mensajes INTEGER NOT NULL DEFAULT 0,
+    mensajes_con_duracion INTEGER NOT NULL DEFAULT 0,
+    duracion_total_ms BIGINT NOT NULL DEFAULT 0,
+    latencia_histograma INTEGER[] NOT NULL, -- buckets <=250,500,1000,2000,4000,8000,16000 ms y >16000 ms
+    respuestas_exitosas INTEGER NOT NULL DEFAULT 0, -- respuesta con ✅ o 🎉
+    conversiones INTEGER NOT NULL DEFAULT 0, -- respuesta con 🎉
+    respuestas_confusas INTEGER NOT NULL DEFAULT 0, -- "Lo siento" / "no entiendo"
+    productos JSONB NOT NULL DEFAULT '{}', -- primer producto mencionado -> frecuencia
+    usuarios_hll BYTEA NOT NULL, -- sketch HyperLogLog de teléfonos distintos
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, dia, intencion)
+);
+
+-- 2. Agregados por tenant, día y usuario (segmentación de comportamiento)
+CREATE TABLE IF NOT EXISTS conversation_user_daily (
+    tenant_id VARCHAR(100) NOT NULL,
+    dia DATE NOT NULL,
+    telefono VARCHAR(20) NOT NULL,
+    mensajes INTEGER NOT NULL DEFAULT 0,
+    intentos_compra INTEGER NOT NULL DEFAULT 0,
+    productos TEXT[] NOT NULL DEFAULT '{}',
+    primera_interaccion TIMESTAMP,
+    ultima_interaccion TIMESTAMP,
+    PRIMARY KEY (tenant_id, dia, telefono)
+);
+
+-- 3. Watermark por job: último conversation_history.id ya plegado
+CREATE TABLE IF NOT EXISTS analytics_watermarks (
+    job VARCHAR(100) PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    filas_procesadas BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- conversation-flow sigue leyendo mensajes crudos: índice por tenant y fecha
+CREATE INDEX IF NOT EXISTS idx_conversation_history_tenant_timestamp
+    ON conversation_history(tenant_id, timestamp_mensaje DESC);
+
+COMMENT ON TABLE conversation_intent_daily IS 'Rollup diario por intención de conversation_history';
+COMMENT ON TABLE conversation_user_daily IS 'Rollup diario por usuario de conversation_history';
+COMMENT ON TABLE analytics_watermarks IS 'Progreso incremental de los jobs de rollup';
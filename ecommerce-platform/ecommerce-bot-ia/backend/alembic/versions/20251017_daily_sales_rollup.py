@@ -0,0 +1,47 @@
+"""Add daily_sales_rollup table for dashboard sales aggregates
+
+Revision ID: daily_sales_rollup_001
+Revises: twilio_accounts_001
+Create Date: 2025-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'daily_sales_rollup_001'
+down_revision = 'twilio_accounts_001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Create daily_sales_rollup and backfill it with one GROUP BY over orders"""
+    op.create_table(
+        "daily_sales_rollup",
+        sa.Column("client_id", sa.String(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("revenue", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("orders_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("completed_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("pending_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("client_id", "day"),
+    )
+
+    op.execute("""
+        INSERT INTO daily_sales_rollup (client_id, day, revenue, orders_count, completed_count, pending_count, updated_at)
+        SELECT COALESCE(client_id, ''),
+               date_trunc('day', date)::date,
+               COALESCE(SUM(CASE WHEN status IN ('Shipped', 'Delivered') THEN total ELSE 0 END), 0),
+               COUNT(*),
+               SUM(CASE WHEN status IN ('Shipped', 'Delivered') THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'Pending' THEN 1 ELSE 0 END),
+               NOW()
+        FROM orders
+        WHERE date IS NOT NULL
+        GROUP BY COALESCE(client_id, ''), date_trunc('day', date)::date
+    """)
+
+def downgrade():
+    """Drop daily_sales_rollup table"""
+    op.drop_table("daily_sales_rollup")
@@ -0,0 +1,28 @@
+"""Add partial index on active flow_sesiones for the timeout scheduler
+
+Revision ID: flow_sesiones_active_idx_001
+Revises: flow_sesiones_version_001
+Create Date: 2025-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'flow_sesiones_active_idx_001'
+down_revision = 'flow_sesiones_version_001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Índice parcial: recuperación y lectura incremental de sesiones activas por last_message_at"""
+    op.create_index(
+        'ix_flow_sesiones_active_last_message',
+        'flow_sesiones',
+        ['conversation_active', 'last_message_at'],
+        postgresql_where=sa.text('conversation_active = true')
+    )
+
+def downgrade():
+    """Drop ix_flow_sesiones_active_last_message"""
+    op.drop_index('ix_flow_sesiones_active_last_message', table_name='flow_sesiones')
@@ -0,0 +1,26 @@
+"""Add version column to flow_sesiones for compare-and-set session writes
+
+Revision ID: flow_sesiones_version_001
+Revises: daily_sales_rollup_001
+Create Date: 2025-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'flow_sesiones_version_001'
+down_revision = 'daily_sales_rollup_001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Versión por sesión: el store del bot escribe con WHERE version = última persistida"""
+    op.add_column(
+        'flow_sesiones',
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0')
+    )
+
+def downgrade():
+    """Drop flow_sesiones.version"""
+    op.drop_column('flow_sesiones', 'version')
@@ -0,0 +1,34 @@
+"""Add product_category_index for precomputed product categories
+
+Revision ID: product_category_index_001
+Revises: tenant_counters_001
+Create Date: 2025-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'product_category_index_001'
+down_revision = 'tenant_counters_001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Create product_category_index (el backfill lo hace el primer barrido de services/category_index.py)"""
+    op.create_table(
+        "product_category_index",
+        sa.Column("product_id", sa.String(), nullable=False),
+        sa.Column("client_id", sa.String(), nullable=False),
+        sa.Column("categories", sa.Text(), nullable=False),
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column("indexed_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("product_id"),
+    )
+    op.create_index("ix_product_category_index_client_id", "product_category_index", ["client_id"])
+
+def downgrade():
+    """Drop product_category_index table"""
+    op.drop_index("ix_product_category_index_client_id", table_name="product_category_index")
+    op.drop_table("product_category_index")
@@ -0,0 +1,42 @@
+"""Add tenant_counters for per-tenant order numbers
+
+Revision ID: tenant_counters_001
+Revises: flow_sesiones_active_idx_001
+Create Date: 2025-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'tenant_counters_001'
+down_revision = 'flow_sesiones_active_idx_001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Create tenant_counters seeded from existing ORD-XXXXXX numbers (unicidad: ix_orders_client_order_number)"""
+    op.create_table(
+        "tenant_counters",
+        sa.Column("client_id", sa.String(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("value", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("client_id", "name"),
+    )
+
+    # Cada tenant continúa desde su número más alto (una sola agregación, solo al migrar)
+    op.execute("""
+        INSERT INTO tenant_counters (client_id, name, value, updated_at)
+        SELECT COALESCE(client_id, ''),
+               'order_number',
+               MAX(CAST(substring(order_number FROM '^ORD-([0-9]+)$') AS INTEGER)),
+               NOW()
+        FROM orders
+        WHERE order_number ~ '^ORD-[0-9]+$'
+        GROUP BY COALESCE(client_id, '')
+    """)
+
+def downgrade():
+    """Drop tenant_counters table"""
+    op.drop_table("tenant_counters")
@@ -0,0 +1,60 @@
+"""
+Middleware ASGI para paths problemáticos del frontend
+Reemplaza el @app.middleware("http") de main.py (BaseHTTPMiddleware + print por request):
+
+1. Corrige el prefijo duplicado /api/api/ (redirect 301)
+2. Redirige GET /api/orders legacy al endpoint tenant-aware (307, conserva método y headers)
+3. Devuelve 401 informativo si el legacy /api/orders llega sin Bearer token
+El resto de requests pasa directo, sin envolver la respuesta.
+"""
+import logging
+
+from starlette.datastructures import URL, Headers
+from starlette.responses import RedirectResponse, Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class ApiPathFixMiddleware:
+    """Corrige /api/api/ y el endpoint legacy /api/orders antes de llegar al router"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response = self._fix(scope)
+        if response is None:
+            await self.app(scope, receive, send)
+        else:
+            await response(scope, receive, send)
+
+    @staticmethod
+    def _fix(scope: Scope):
+        path = scope["path"]
+
+        # Fix duplicate /api/api/ prefix - redirect to correct path
+        if "/api/api/" in path:
+            new_path = path.replace("/api/api/", "/api/")
+            logger.debug(f"Redirecting {path} to {new_path}")
+            return RedirectResponse(url=str(URL(scope=scope).replace(path=new_path)), status_code=301)
+
+        # Handle legacy /api/orders requests for GET method
+        if path == "/api/orders" and scope["method"] == "GET":
+            auth_header = Headers(scope=scope).get("authorization")
+            if auth_header and auth_header.startswith("Bearer "):
+                # Redirect to tenant-orders with 307 to preserve method and headers
+                new_url = URL(scope=scope).replace(path="/api/tenant-orders/")
+                return RedirectResponse(url=str(new_url), status_code=307)
+            # Return a more informative error for missing auth
+            return Response(
+                content='{"detail":"Authentication required. Please use /api/tenant-orders/ with valid Bearer token."}',
+                status_code=401,
+                media_type="application/json"
+            )
+
+        return None
@@ -13,13 +13,14 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 
 from database import SessionLocal
+from services.cache import cache_manager
 
 # Global context variable for tenant_id per request
 _tenant_context: ContextVar[Optional[str]] = ContextVar('tenant_id', default=None)
 
-# Simple in-memory cache with TTL for slug->tenant_id mapping
-_slug_cache: Dict[str, Dict[str, Any]] = {}
+# Bounded cache with TTL for slug->tenant_id mapping
 _cache_ttl = 60  # seconds
+_slug_cache = cache_manager.namespace("tenant_slugs", ttl=_cache_ttl, max_entries=5000, shared=True)
 
 
 class TenantMiddleware(BaseHTTPMiddleware):
@@ -131,19 +132,12 @@ class TenantMiddleware(BaseHTTPMiddleware):
         Returns:
             Tenant ID or None if not found
         """
-        # Check cache first
-        cache_key = f"subdomain:{subdomain}"
-        cached = self._get_cached_value(cache_key)
-        if cached is not None:
-            return cached
-
-        # Query database
-        tenant_id = await self._query_tenant_by_slug(subdomain)
-        
-        # Cache result (even if None, to avoid repeated DB calls)
-        self._set_cached_value(cache_key, tenant_id)
-        
-        return tenant_id
+        # Single-flight cache lookup (None is cached too, to avoid repeated DB calls)
+        return await _slug_cache.aget_or_load(
+            f"subdomain:{subdomain}",
+            lambda: self._query_tenant_by_slug(subdomain),
+            cache_none=True
+        )
 
     async def _query_tenant_by_slug(self, slug: str) -> Optional[str]:
         """
@@ -170,26 +164,6 @@ class TenantMiddleware(BaseHTTPMiddleware):
             print(f"Error querying tenant by slug '{slug}': {e}")
             return None
 
-    def _get_cached_value(self, key: str) -> Optional[str]:
-        """Get value from cache if not expired."""
-        if key not in _slug_cache:
-            return None
-            
-        entry = _slug_cache[key]
-        if time.time() - entry['timestamp'] > _cache_ttl:
-            # Expired, remove from cache
-            del _slug_cache[key]
-            return None
-            
-        return entry['value']
-
-    def _set_cached_value(self, key: str, value: Optional[str]) -> None:
-        """Set value in cache with current timestamp."""
-        _slug_cache[key] = {
-            'value': value,
-            'timestamp': time.time()
-        }
-
 
 def get_tenant_id() -> str:
     """
@@ -222,22 +196,17 @@ def set_tenant_id(tenant_id: str) -> None:
 
 def clear_tenant_cache() -> None:
     """Clear the slug->tenant_id cache (useful for testing)."""
-    global _slug_cache
     _slug_cache.clear()
 
 
 def get_cache_stats() -> Dict[str, Any]:
     """Get cache statistics (useful for debugging)."""
-    current_time = time.time()
-    total_entries = len(_slug_cache)
-    expired_entries = sum(
-        1 for entry in _slug_cache.values()
-        if current_time - entry['timestamp'] > _cache_ttl
-    )
-    
+    stats = _slug_cache.get_stats()
     return {
-        'total_entries': total_entries,
-        'expired_entries': expired_entries,
-        'active_entries': total_entries - expired_entries,
-        'cache_ttl': _cache_ttl
+        'total_entries': stats['entries'],
+        'expired_entries': stats['expired_entries'],
+        'active_entries': stats['active_entries'],
+        'cache_ttl': _cache_ttl,
+        'max_entries': stats['max_entries'],
+        'hit_rate': stats['hit_rate']
     }
\ No newline at end of file
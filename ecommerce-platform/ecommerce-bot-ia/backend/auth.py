@@ -1,19 +1,29 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional, Union
+from typing import Dict, Optional, Tuple, Union
+import asyncio
 import os
+import threading
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from database import get_db
+from database import SessionLocal
 from auth_models import TenantUser, TenantClient
+from services.cache import cache_manager
+from services.invalidation_bus import subscribe_invalidation
 
 # Configuration
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 JWT_ALGORITHM = os.getenv("JWT_ALG", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TTL_MIN", "120"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TTL_DAYS", "7"))
+# Cache de principal (usuario + cliente) por (sub, client_id, iat); 0 desactiva
+AUTH_PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("AUTH_PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+# Claims firmados: el access token lleva email/rol/slug y se acepta sin ir a la DB
+AUTH_SIGNED_CLAIMS = os.getenv("AUTH_SIGNED_CLAIMS", "false").lower() in ("1", "true", "yes")
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -21,6 +31,75 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # Security
 security = HTTPBearer()
 
+@dataclass(frozen=True)
+class PrincipalUser:
+    """Copia inmutable de TenantUser compartible entre requests (mismos atributos que usan los routers)"""
+    id: str
+    client_id: str
+    email: str
+    role: str
+    is_active: bool
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_model(cls, user: TenantUser) -> "PrincipalUser":
+        return cls(id=user.id, client_id=user.client_id, email=user.email, role=user.role,
+                   is_active=bool(user.is_active), created_at=user.created_at)
+
+
+@dataclass(frozen=True)
+class PrincipalClient:
+    """Copia inmutable de TenantClient"""
+    id: str
+    name: str
+    slug: str
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_model(cls, client: TenantClient) -> "PrincipalClient":
+        return cls(id=client.id, name=client.name, slug=client.slug, created_at=client.created_at)
+
+
+Principal = Tuple[Optional[PrincipalUser], Optional[PrincipalClient]]
+
+_principal_cache = cache_manager.namespace("auth_principals", ttl=AUTH_PRINCIPAL_CACHE_TTL_SECONDS, max_entries=10000)
+
+
+class ClaimsTrust:
+    """
+    Desde cuándo se puede confiar en los claims firmados de un tenant
+    Un token emitido antes de la última invalidación del tenant (o antes de
+    arrancar el proceso) se valida contra la DB/cache como siempre
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._not_before_all = time.time()
+        self._not_before: Dict[str, float] = {}
+
+    def revoke(self, client_id: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            if client_id:
+                self._not_before[client_id] = now
+            else:
+                self._not_before_all = now
+                self._not_before.clear()
+
+    def trusted(self, client_id: str, issued_at: Optional[int]) -> bool:
+        if not issued_at:
+            return False
+        with self._lock:
+            not_before = max(self._not_before_all, self._not_before.get(client_id, 0.0))
+        return issued_at > not_before
+
+
+claims_trust = ClaimsTrust()
+# admin.py publica "auth_principals" al borrar/editar usuarios o clientes; el bus ya
+# invalida el namespace homónimo, aquí además se dejan de aceptar claims viejos
+subscribe_invalidation("auth_principals", lambda event: claims_trust.revoke(event.tenant_id))
+
+
 class AuthService:
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -50,6 +129,22 @@ class AuthService:
         encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
         return encoded_jwt
     
+    @staticmethod
+    def principal_claims(user: TenantUser, client: TenantClient) -> dict:
+        """Claims de principal para el access token (vacío si AUTH_SIGNED_CLAIMS está apagado)"""
+        if not AUTH_SIGNED_CLAIMS:
+            return {}
+        return {
+            "pc": {
+                "email": user.email,
+                "act": bool(user.is_active),
+                "uca": user.created_at.isoformat() if user.created_at else None,
+                "slug": client.slug,
+                "name": client.name,
+                "cca": client.created_at.isoformat() if client.created_at else None,
+            }
+        }
+    
     @staticmethod
     def verify_token(token: str) -> dict:
         try:
@@ -104,14 +199,65 @@ class TenantService:
         db.refresh(db_user)
         return db_user
 
-def get_current_user_and_client(
+def _load_principal(user_id: str, client_id: str) -> Principal:
+    """Las dos consultas de siempre, en una sesión propia (corre en un thread)"""
+    db = SessionLocal()
+    try:
+        user = TenantService.get_user_by_id(db, user_id)
+        client = TenantService.get_client_by_id(db, client_id)
+        return (
+            PrincipalUser.from_model(user) if user is not None else None,
+            PrincipalClient.from_model(client) if client is not None else None,
+        )
+    finally:
+        db.close()
+
+
+def _parse_claim_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _principal_from_claims(payload: dict) -> Optional[Principal]:
+    """Principal desde claims firmados, si el modo está activo y el token es posterior a la última invalidación"""
+    claims = payload.get("pc")
+    if not AUTH_SIGNED_CLAIMS or not isinstance(claims, dict):
+        return None
+    client_id = payload["client_id"]
+    if not claims_trust.trusted(client_id, payload.get("iat")):
+        return None
+    user = PrincipalUser(
+        id=payload["sub"], client_id=client_id, email=claims.get("email", ""),
+        role=payload.get("role", "user"), is_active=bool(claims.get("act")),
+        created_at=_parse_claim_datetime(claims.get("uca")),
+    )
+    client = PrincipalClient(
+        id=client_id, name=claims.get("name", ""), slug=claims.get("slug", ""),
+        created_at=_parse_claim_datetime(claims.get("cca")),
+    )
+    return user, client
+
+
+async def get_principal(user_id: str, client_id: str, issued_at: Optional[int]) -> Principal:
+    """Principal cacheado por (sub, client_id, iat); los fallos también se cachean para no martillar la DB"""
+    if AUTH_PRINCIPAL_CACHE_TTL_SECONDS <= 0:
+        return await asyncio.to_thread(_load_principal, user_id, client_id)
+    return await _principal_cache.aget_or_load(
+        f"{user_id}:{issued_at or 0}",
+        lambda: asyncio.to_thread(_load_principal, user_id, client_id),
+        ttl=AUTH_PRINCIPAL_CACHE_TTL_SECONDS,
+        tenant_id=client_id,
+        cache_none=True,
+    )
+
+
+async def get_current_user_and_client(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
     request: Request = None
-) -> tuple[TenantUser, TenantClient]:
+) -> tuple[PrincipalUser, PrincipalClient]:
     """
     Dependency que extrae y valida el usuario y client del JWT token.
     También valida opcionalmente el header X-Client-Slug.
+    Sin consultas a la DB mientras el principal esté en cache (o venga en claims firmados).
     """
     token = credentials.credentials
     payload = AuthService.verify_token(token)
@@ -126,7 +272,7 @@ def get_current_user_and_client(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = TenantService.get_user_by_id(db, user_id)
+    user, client = _principal_from_claims(payload) or await get_principal(user_id, client_id, payload.get("iat"))
     if user is None or not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -134,7 +280,6 @@ def get_current_user_and_client(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    client = TenantService.get_client_by_id(db, client_id)
     if client is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -154,15 +299,15 @@ def get_current_user_and_client(
     return user, client
 
 def get_current_user(
-    user_and_client: tuple[TenantUser, TenantClient] = Depends(get_current_user_and_client)
-) -> TenantUser:
+    user_and_client: tuple[PrincipalUser, PrincipalClient] = Depends(get_current_user_and_client)
+) -> PrincipalUser:
     """Convenience dependency para obtener solo el usuario."""
     user, _ = user_and_client
     return user
 
 def get_current_client(
-    user_and_client: tuple[TenantUser, TenantClient] = Depends(get_current_user_and_client)
-) -> TenantClient:
+    user_and_client: tuple[PrincipalUser, PrincipalClient] = Depends(get_current_user_and_client)
+) -> PrincipalClient:
     """Convenience dependency para obtener solo el client."""
     _, client = user_and_client
     return client
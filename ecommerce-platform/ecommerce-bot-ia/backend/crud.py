@@ -1,9 +1,10 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, case
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
 import models
 import schemas
+from services import sales_rollup, order_numbers
 
 # PRODUCTS
 def get_product(db: Session, product_id: str):
@@ -80,32 +81,18 @@ def get_order_by_number(db: Session, order_number: str):
 def get_orders(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Order).order_by(desc(models.Order.date)).offset(skip).limit(limit).all()
 
-def generate_order_number(db: Session) -> str:
-    """Generate sequential order number"""
-    # Get the latest order number
-    latest_order = db.query(models.Order).filter(
-        models.Order.order_number.isnot(None)
-    ).order_by(desc(models.Order.created_at)).first()
-    
-    if latest_order and latest_order.order_number:
-        # Extract number from format ORD-XXXXXX
-        try:
-            current_number = int(latest_order.order_number.split('-')[1])
-            next_number = current_number + 1
-        except (IndexError, ValueError):
-            next_number = 1
-    else:
-        next_number = 1
-    
-    return f"ORD-{next_number:06d}"
+def generate_order_number(db: Session, client_id: str = None) -> str:
+    """Generate sequential order number (contador por tenant, sin escanear orders)"""
+    return order_numbers.next_order_number(client_id)
 
 def create_order(db: Session, order: Dict[str, Any], order_id: str):
     # Generate order number if not provided
     if 'order_number' not in order or not order['order_number']:
-        order['order_number'] = generate_order_number(db)
+        order['order_number'] = generate_order_number(db, order.get('client_id'))
     
     db_order = models.Order(id=order_id, **order)
     db.add(db_order)
+    sales_rollup.apply_order_change(db, None, sales_rollup.order_state(db_order))
     db.commit()
     db.refresh(db_order)
     return db_order
@@ -113,9 +100,11 @@ def create_order(db: Session, order: Dict[str, Any], order_id: str):
 def update_order(db: Session, order_id: str, order: Dict[str, Any]):
     db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if db_order:
+        before = sales_rollup.order_state(db_order)
         for key, value in order.items():
             setattr(db_order, key, value)
         db_order.updated_at = datetime.utcnow()
+        sales_rollup.apply_order_change(db, before, sales_rollup.order_state(db_order))
         db.commit()
         db.refresh(db_order)
     return db_order
@@ -123,6 +112,7 @@ def update_order(db: Session, order_id: str, order: Dict[str, Any]):
 def delete_order(db: Session, order_id: str):
     db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if db_order:
+        sales_rollup.apply_order_change(db, sales_rollup.order_state(db_order), None)
         db.delete(db_order)
         db.commit()
     return db_order
@@ -193,44 +183,27 @@ def delete_discount(db: Session, discount_id: str):
     return db_discount
 
 # DASHBOARD STATS
-def get_dashboard_stats(db: Session):
-    total_products = db.query(models.Product).count()
-    active_products = db.query(models.Product).filter(models.Product.status == 'Active').count()
-    total_orders = db.query(models.Order).count()
-    pending_orders = db.query(models.Order).filter(models.Order.status == 'Pending').count()
-    total_clients = db.query(models.Client).count()
-    
-    # Calculate total revenue from completed orders
-    total_revenue = db.query(func.sum(models.Order.total)).filter(
-        models.Order.status.in_(['Shipped', 'Delivered'])
-    ).scalar() or 0.0
-    
-    # Get sales data for the last 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    sales_data = []
-    
-    for i in range(30):
-        day = thirty_days_ago + timedelta(days=i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        daily_sales = db.query(func.sum(models.Order.total)).filter(
-            models.Order.date >= day_start,
-            models.Order.date <= day_end,
-            models.Order.status.in_(['Shipped', 'Delivered'])
-        ).scalar() or 0.0
-        
-        sales_data.append({
-            "name": day.strftime("%b %d"),
-            "sales": daily_sales
-        })
-    
+def get_dashboard_stats(db: Session, client_id: str = None):
+    """Conteos de catálogo en una consulta; órdenes, ingresos y serie de 30 días desde daily_sales_rollup"""
+    product_filter = [models.Product.client_id == client_id] if client_id is not None else []
+    product_counts = db.query(
+        func.count(models.Product.id),
+        func.coalesce(func.sum(case((models.Product.status == 'Active', 1), else_=0)), 0)
+    ).filter(*product_filter).one()
+    client_query = db.query(func.count(models.Client.id))
+    if client_id is not None:
+        client_query = client_query.filter(models.Client.client_id == client_id)
+    total_clients = client_query.scalar() or 0
+
+    totals = db.execute(sales_rollup.totals_query(client_id)).one()
+    rows = db.execute(sales_rollup.series_query(client_id, sales_rollup.series_start())).all()
+
     return {
-        "total_products": total_products,
-        "active_products": active_products,
-        "total_orders": total_orders,
-        "pending_orders": pending_orders,
+        "total_products": product_counts[0] or 0,
+        "active_products": int(product_counts[1] or 0),
+        "total_orders": int(totals.orders_count or 0),
+        "pending_orders": int(totals.pending_count or 0),
         "total_clients": total_clients,
-        "total_revenue": total_revenue,
-        "sales_data": sales_data
+        "total_revenue": float(totals.revenue or 0),
+        "sales_data": sales_rollup.build_sales_series(rows)
     }
\ No newline at end of file
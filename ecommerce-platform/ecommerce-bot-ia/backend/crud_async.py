@@ -5,6 +5,7 @@ from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import models
 import schemas
+from services import sales_rollup, order_numbers
 
 # ==================== PRODUCTS ====================
 
@@ -202,11 +203,14 @@ async def get_orders_async(
     skip: int = 0, 
     limit: int = 100,
     status: Optional[str] = None,
-    customer_name: Optional[str] = None
+    customer_name: Optional[str] = None,
+    client_id: Optional[str] = None
 ):
-    """Get orders with optional filtering"""
+    """Get orders with optional filtering including client filtering"""
     query = select(models.Order)
     
+    if client_id:
+        query = query.where(models.Order.client_id == client_id)
     if status:
         query = query.where(models.Order.status == status)
     if customer_name:
@@ -219,16 +223,13 @@ async def get_orders_async(
 
 async def create_order_async(db: AsyncSession, order: Dict[str, Any], order_id: str):
     """Create a new order with auto-generated order number"""
-    # Get the next order number
-    count_query = select(func.count(models.Order.id))
-    count_result = await db.execute(count_query)
-    count = count_result.scalar() or 0
-    
-    if 'order_number' not in order:
-        order['order_number'] = f"ORD-{count + 1:06d}"
+    # Siguiente número del tenant desde el bloque reservado (sin COUNT(*) sobre orders)
+    if not order.get('order_number'):
+        order['order_number'] = await order_numbers.next_order_number_async(order.get('client_id'))
     
     db_order = models.Order(id=order_id, **order)
     db.add(db_order)
+    await sales_rollup.apply_order_change_async(db, None, sales_rollup.order_state(db_order))
     await db.commit()
     await db.refresh(db_order)
     return db_order
@@ -240,8 +241,10 @@ async def update_order_async(db: AsyncSession, order_id: str, order: Dict[str, A
     db_order = result.scalar_one_or_none()
     
     if db_order:
+        before = sales_rollup.order_state(db_order)
         for key, value in order.items():
             setattr(db_order, key, value)
+        await sales_rollup.apply_order_change_async(db, before, sales_rollup.order_state(db_order))
         await db.commit()
         await db.refresh(db_order)
     
@@ -254,9 +257,54 @@ async def delete_order_async(db: AsyncSession, order_id: str):
     db_order = result.scalar_one_or_none()
     
     if db_order:
+        await sales_rollup.apply_order_change_async(db, sales_rollup.order_state(db_order), None)
         await db.delete(db_order)
         await db.commit()
 
+# ==================== DASHBOARD ====================
+
+async def get_dashboard_stats_async(db: AsyncSession, client_id: Optional[str] = None):
+    """Dashboard stats: catalog counts in one query, order totals and 30-day series from daily_sales_rollup"""
+    product_query = select(
+        func.count(models.Product.id),
+        func.coalesce(func.sum(case((models.Product.status == 'Active', 1), else_=0)), 0)
+    )
+    client_query = select(func.count(models.Client.id))
+    if client_id is not None:
+        product_query = product_query.where(models.Product.client_id == client_id)
+        client_query = client_query.where(models.Client.client_id == client_id)
+    
+    total_products, active_products = (await db.execute(product_query)).one()
+    total_clients = (await db.execute(client_query)).scalar() or 0
+    totals = (await db.execute(sales_rollup.totals_query(client_id))).one()
+    rows = (await db.execute(sales_rollup.series_query(client_id, sales_rollup.series_start()))).all()
+    
+    return {
+        "total_products": total_products or 0,
+        "active_products": int(active_products or 0),
+        "total_orders": int(totals.orders_count or 0),
+        "pending_orders": int(totals.pending_count or 0),
+        "total_clients": total_clients,
+        "total_revenue": float(totals.revenue or 0),
+        "sales_data": sales_rollup.build_sales_series(rows)
+    }
+
+async def get_low_stock_products_async(db: AsyncSession, threshold: int = 10, client_id: Optional[str] = None):
+    """Get products below the stock threshold, filtered in SQL"""
+    query = select(models.Product).where(models.Product.stock < threshold)
+    if client_id is not None:
+        query = query.where(models.Product.client_id == client_id)
+    
+    query = query.order_by(models.Product.stock, models.Product.name)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+async def get_revenue_summary_async(db: AsyncSession, client_id: Optional[str] = None):
+    """Revenue summary read from daily_sales_rollup (O(days), independent of order volume)"""
+    totals = (await db.execute(sales_rollup.totals_query(client_id))).one()
+    rows = (await db.execute(sales_rollup.series_query(client_id, sales_rollup.series_start()))).all()
+    return sales_rollup.build_revenue_summary(totals, rows)
+
 # ==================== DISCOUNTS ====================
 
 async def get_discount_async(db: AsyncSession, discount_id: str):
@@ -1,6 +1,5 @@
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
 from database import engine, Base
 from routers import products, orders, clients, dashboard, assistant
 from routers.campaigns import router as campaigns_router
@@ -20,6 +19,7 @@ from routers.admin import router as admin_router
 from routers.ai_analytics import router as ai_analytics_router
 from routers.tenant_prompts import router as tenant_prompts_router
 from tenant_middleware import TenantMiddleware
+from api_path_middleware import ApiPathFixMiddleware
 
 app = FastAPI(
     title="E-commerce Backoffice API",
@@ -36,50 +36,68 @@ async def startup_event():
     """Inicializa servicios en background al arrancar la aplicación"""
     try:
         from services.timeout_service import start_timeout_service
+        from services.conversation_rollup_service import start_conversation_rollup_service
         start_timeout_service()
+        start_conversation_rollup_service()
+        from services.db_pool import start_leak_monitor
+        from services.read_routing import start_replica_lag_monitor
+        start_leak_monitor()
+        start_replica_lag_monitor()
+        from services.category_index import start_category_indexer
+        start_category_indexer()
+        from services.flow_client import bind_event_loop
+        bind_event_loop()
         print("✅ Background services initialized")
     except Exception as e:
         print(f"⚠️ Warning: Could not start background services: {e}")
+    try:
+        from services.invalidation_bus import invalidation_bus
+        invalidation_bus.start()
+    except Exception as e:
+        print(f"⚠️ Warning: Could not start cache invalidation bus: {e}")
+    try:
+        from services.audit_sink import audit_sink
+        audit_sink.start()
+    except Exception as e:
+        print(f"⚠️ Warning: Could not start audit sink: {e}")
+    try:
+        # Tabla creada por create_all sobre una base con órdenes: poblar el rollup del dashboard
+        from database import SessionLocal
+        from services.sales_rollup import ensure_sales_rollup
+        db = SessionLocal()
+        try:
+            if ensure_sales_rollup(db):
+                print("✅ daily_sales_rollup backfilled from orders")
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"⚠️ Warning: Could not check daily_sales_rollup: {e}")
+    try:
+        # Tabla creada por create_all sobre una base con órdenes: continuar la numeración existente
+        from database import SessionLocal
+        from services.order_numbers import ensure_order_counters
+        db = SessionLocal()
+        try:
+            seeded = ensure_order_counters(db)
+            if seeded:
+                print(f"✅ tenant_counters seeded from orders ({seeded} tenants)")
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"⚠️ Warning: Could not check tenant_counters: {e}")
 
-# Custom middleware to handle problematic API paths and reduce error notifications
-@app.middleware("http")
-async def fix_problematic_api_paths(request: Request, call_next):
-    """
-    Middleware to handle common frontend API path issues:
-    1. Fix duplicate /api/api/ paths
-    2. Redirect legacy /api/orders to tenant-aware endpoint
-    3. Return proper errors for invalid paths to reduce noise
-    """
-    path = request.url.path
-    print(f"Middleware processing path: {path}")  # Debug log
-    
-    # Fix duplicate /api/api/ prefix - redirect to correct path
-    if "/api/api/" in path:
-        new_path = path.replace("/api/api/", "/api/")
-        new_url = str(request.url).replace(path, new_path)
-        print(f"Redirecting {path} to {new_path}")  # Debug log
-        return RedirectResponse(url=new_url, status_code=301)
-    
-    # Handle legacy /api/orders requests for GET method
-    if path == "/api/orders" and request.method == "GET":
-        print(f"Handling legacy orders endpoint")  # Debug log
-        # Check if user has valid authentication for tenant-orders
-        auth_header = request.headers.get("authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            # Redirect to tenant-orders with 307 to preserve method and headers
-            new_url = str(request.url).replace("/api/orders", "/api/tenant-orders/")
-            return RedirectResponse(url=new_url, status_code=307)
-        else:
-            # Return a more informative error for missing auth
-            return Response(
-                content='{"detail":"Authentication required. Please use /api/tenant-orders/ with valid Bearer token."}',
-                status_code=401,
-                media_type="application/json"
-            )
-    
-    # Continue with normal request processing
-    response = await call_next(request)
-    return response
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Cierra los clientes HTTP compartidos (Twilio, bot), el bus de invalidación y drena el sink de auditoría"""
+    from services.http_pool import http_clients
+    from services.invalidation_bus import invalidation_bus
+    from services.audit_sink import audit_sink
+    await http_clients.aclose_all()
+    invalidation_bus.stop()
+    await audit_sink.stop()
+
+# Paths problemáticos del frontend (/api/api/, legacy /api/orders) - ASGI puro, sin logs por request
+app.add_middleware(ApiPathFixMiddleware)
 
 # Tenant middleware is already registered above
 
@@ -181,6 +199,72 @@ async def debug_test_db_queries(request_data: dict):
             "error_type": type(e).__name__
         }
 
+@app.get("/debug/http-stats")
+async def debug_http_stats():
+    """Latencia de envío y handshakes TCP/TLS por proveedor"""
+    from services.http_pool import http_clients
+    return http_clients.get_stats()
+
+@app.get("/debug/flow-stats")
+async def debug_flow_stats():
+    """Links de pago Flow creados vs. reutilizados (idempotencia por commerceOrder) y latencia HTTP"""
+    from services.flow_client import get_flow_client_stats
+    return get_flow_client_stats()
+
+@app.get("/debug/cache-stats")
+async def debug_cache_stats():
+    """Hit-rate, tamaño y desalojos por namespace del cache unificado"""
+    from services.cache import get_cache_manager_stats
+    return get_cache_manager_stats()
+
+@app.get("/debug/invalidation-stats")
+async def debug_invalidation_stats():
+    """Eventos publicados/recibidos por el bus de invalidación de caches"""
+    from services.invalidation_bus import get_invalidation_bus_stats
+    return get_invalidation_bus_stats()
+
+@app.get("/debug/analytics-rollup-stats")
+async def debug_analytics_rollup_stats():
+    """Watermark y filas plegadas por el job de rollups de conversation_history"""
+    from services.conversation_rollup_service import get_conversation_rollup_stats
+    return get_conversation_rollup_stats()
+
+@app.get("/debug/db-pool-stats")
+async def debug_db_pool_stats():
+    """Conexiones en uso, overflow, espera por conexión y fugas de los pools sync/async"""
+    from services.db_pool import get_db_pool_stats
+    return get_db_pool_stats()
+
+@app.get("/debug/replica-stats")
+async def debug_replica_stats():
+    """Lecturas enviadas a la réplica vs. primario (read-your-writes / lag)"""
+    from services.read_routing import get_replica_routing_stats
+    return get_replica_routing_stats()
+
+@app.get("/debug/order-number-stats")
+async def debug_order_number_stats():
+    """Números de orden entregados, bloques reservados en tenant_counters y restante por tenant"""
+    from services.order_numbers import get_order_number_stats
+    return get_order_number_stats()
+
+@app.get("/debug/category-index-stats")
+async def debug_category_index_stats():
+    """Indexador de categorías: tenants/productos indexados, filas reescritas y barridos"""
+    from services.category_index import get_category_index_stats
+    return get_category_index_stats()
+
+@app.get("/debug/timeout-stats")
+async def debug_timeout_stats():
+    """Scheduler de timeouts: liderazgo, timers pendientes, mensajes enviados y vencimientos descartados"""
+    from services.timeout_service import get_timeout_service_stats
+    return get_timeout_service_stats()
+
+@app.get("/debug/audit-stats")
+async def debug_audit_stats():
+    """Eventos encolados, muestreados, descartados (buffer lleno) y escritos por el sink de auditoría"""
+    from services.audit_sink import get_audit_sink_stats
+    return get_audit_sink_stats()
+
 # Debug endpoints (only for development/testing)
 app.include_router(admin_router, prefix="/api", tags=["admin"])
 app.include_router(debug_router, tags=["debug"])
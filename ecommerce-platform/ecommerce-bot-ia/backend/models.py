@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index, LargeBinary, UniqueConstraint, func, Enum
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Text, Index, LargeBinary, UniqueConstraint, func, Enum
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from database import Base
@@ -44,7 +44,7 @@ class Order(Base):
     __tablename__ = "orders"
     
     id = Column(String, primary_key=True, index=True)
-    order_number = Column(String, unique=True, index=True)  # Número de orden secuencial
+    order_number = Column(String, index=True)  # Número de orden secuencial por tenant (services/order_numbers.py)
     customer_name = Column(String)
     customer_email = Column(String, nullable=True)
     customer_phone = Column(String, nullable=True)
@@ -55,6 +55,43 @@ class Order(Base):
     client_id = Column(String, nullable=True, index=True)  # Multi-tenant support
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # La numeración es por tenant: ORD-000001 puede existir en varios tenants
+        # (índice ya creado por la migración complete_multi_tenant_support_orders_clients)
+        Index('ix_orders_client_order_number', 'client_id', 'order_number', unique=True),
+    )
+
+class TenantCounter(Base):
+    """Contadores por tenant (numeración de órdenes); se reservan en bloques"""
+    __tablename__ = "tenant_counters"
+    
+    client_id = Column(String, primary_key=True)  # "" para órdenes sin client_id
+    name = Column(String, primary_key=True)  # p. ej. "order_number"
+    value = Column(Integer, nullable=False, default=0)  # Último número reservado
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ProductCategoryIndex(Base):
+    """Categorías del tenant asignadas a cada producto (services/category_index.py, al crear/editar)"""
+    __tablename__ = "product_category_index"
+    
+    product_id = Column(String, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    client_id = Column(String, nullable=False, index=True)
+    categories = Column(Text, nullable=False)  # JSON: etiquetas de categoría del tenant
+    content_hash = Column(String(64), nullable=False)  # Nombre/descr./categoría + vocabulario usados
+    indexed_at = Column(DateTime, default=datetime.utcnow)
+
+class DailySalesRollup(Base):
+    """Ventas diarias por tenant, mantenidas incrementalmente al crear/editar/borrar órdenes"""
+    __tablename__ = "daily_sales_rollup"
+    
+    client_id = Column(String, primary_key=True)  # "" agrupa órdenes sin client_id
+    day = Column(Date, primary_key=True)
+    revenue = Column(Float, nullable=False, default=0.0)  # Solo órdenes Shipped/Delivered
+    orders_count = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+    pending_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Campaign(Base):
     __tablename__ = "campaigns"
@@ -134,12 +171,19 @@ class FlowSesion(Base):
     conversation_active = Column(Boolean, default=True)  # Si la conversación está activa
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Versión para compare-and-set con el store de sesiones del bot (services/session_store.py)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Define composite unique index at table level
     __table_args__ = (
         # Unique constraint on tenant_id + telefono combination
         Index('ux_flow_sesiones_tenant_phone', 'tenant_id', 'telefono', unique=True),
+        # Recuperación del scheduler de timeouts: solo sesiones activas
+        Index('ix_flow_sesiones_active_last_message', 'conversation_active', 'last_message_at',
+              postgresql_where='conversation_active = true'),
     )
+    # Cada UPDATE del ORM (timeout_service, flujo del backend) sube la versión y falla si cambió
+    __mapper_args__ = {"version_id_col": version}
 
 class WhatsAppSettings(Base):
     """Configuración global de canal WhatsApp (single tenant)"""
@@ -43,6 +43,8 @@ class NLUParams(BaseModel):
     confidence_threshold: Optional[float] = Field(0.7, ge=0.1, le=1.0)
     enable_intent_detection: Optional[bool] = True
     enable_entity_extraction: Optional[bool] = True
+    # two_pass: intención y respuesta en dos llamadas; single_pass: una sola respuesta estructurada
+    pipeline_mode: Optional[Literal["two_pass", "single_pass"]] = "two_pass"
 
 
 class DatabaseQuery(BaseModel):
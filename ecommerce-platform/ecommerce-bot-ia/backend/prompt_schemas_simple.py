@@ -3,7 +3,7 @@ Esquemas Pydantic simplificados para configuración de prompts por tenant
 Compatible con versiones anteriores de Pydantic
 """
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 
 
@@ -18,6 +18,7 @@ class NLUParams(BaseModel):
     modelo: Optional[str] = "gpt-4o-mini"
     temperature_nlu: Optional[float] = Field(default=0.3, ge=0.0, le=1.0)
     max_tokens_nlu: Optional[int] = Field(default=150, ge=50, le=500)
+    pipeline_mode: Optional[Literal["two_pass", "single_pass"]] = "two_pass"
 
 
 class NLGParams(BaseModel):
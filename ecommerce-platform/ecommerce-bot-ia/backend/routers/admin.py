@@ -16,6 +16,7 @@ from admin_schemas import (
     AdminUserCreate, AdminUserUpdate, TenantUserResponse
 )
 from auth import AuthService
+from services.invalidation_bus import publish_invalidation
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -190,6 +191,12 @@ async def update_client(
         db.commit()
         db.refresh(client)
         
+        # Invalidar config del tenant (bot), principals de auth y la resolución slug -> tenant en todos los procesos
+        publish_invalidation("tenant_config", client_id)
+        publish_invalidation("auth_principals", client_id)
+        if update_data.slug is not None:
+            publish_invalidation("tenant_resolution")
+        
         # Get users
         users = db.query(TenantUser).filter(TenantUser.client_id == client_id).all()
         user_responses = [
@@ -237,6 +244,10 @@ async def delete_client(client_id: str, db: Session = Depends(get_db)):
         db.delete(client)
         db.commit()
         
+        publish_invalidation("tenant_config", client_id)
+        publish_invalidation("tenant_resolution")
+        publish_invalidation("auth_principals", client_id)
+        
         logger.warning(f"DELETED client {client_id} ({client.slug}) and all its users")
         
         return {"message": f"Client {client.slug} deleted successfully"}
@@ -362,6 +373,9 @@ async def delete_user(user_id: str, db: Session = Depends(get_db)):
         db.delete(user)
         db.commit()
         
+        # Tokens vigentes del usuario dejan de validarse contra el principal cacheado
+        publish_invalidation("auth_principals", user.client_id)
+        
         logger.info(f"Deleted user {user_id} ({user.email})")
         
         return {"message": f"User {user.email} deleted successfully"}
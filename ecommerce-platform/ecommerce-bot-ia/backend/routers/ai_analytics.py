@@ -7,8 +7,13 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
-from database import get_db
+from database import get_db, get_read_db
 from auth import get_current_client
+from services.conversation_rollup_service import (
+    read_conversation_stats,
+    read_intent_analysis,
+    read_user_behavior,
+)
 import json
 
 router = APIRouter()
@@ -16,48 +21,12 @@ router = APIRouter()
 @router.get("/ai-analytics/conversation-stats")
 async def get_conversation_stats(
     days_back: int = Query(30, ge=1, le=365),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_client = Depends(get_current_client)
 ):
-    """Estadísticas generales de conversaciones del bot"""
+    """Estadísticas generales de conversaciones del bot (desde conversation_intent_daily)"""
     try:
-        query = text("""
-            SELECT 
-                COUNT(*) as total_conversaciones,
-                COUNT(DISTINCT telefono) as usuarios_unicos,
-                AVG(duracion_respuesta_ms) as tiempo_promedio_respuesta,
-                COUNT(CASE WHEN intencion_detectada = 'intencion_compra' THEN 1 END) as intentos_compra,
-                COUNT(CASE WHEN respuesta_bot LIKE '%🎉%' THEN 1 END) as conversiones_exitosas
-            FROM conversation_history
-            WHERE tenant_id = :tenant_id 
-            AND timestamp_mensaje >= NOW() - INTERVAL ':days_back days'
-        """)
-        
-        result = db.execute(query, {
-            "tenant_id": current_client.id,
-            "days_back": days_back
-        }).first()
-        
-        if not result:
-            return {
-                "total_conversaciones": 0,
-                "usuarios_unicos": 0,
-                "tiempo_promedio_respuesta": 0,
-                "intentos_compra": 0,
-                "conversiones_exitosas": 0,
-                "conversion_rate": 0
-            }
-        
-        conversion_rate = (result.conversiones_exitosas / result.intentos_compra * 100) if result.intentos_compra > 0 else 0
-        
-        return {
-            "total_conversaciones": result.total_conversaciones,
-            "usuarios_unicos": result.usuarios_unicos,
-            "tiempo_promedio_respuesta": round(result.tiempo_promedio_respuesta or 0),
-            "intentos_compra": result.intentos_compra,
-            "conversiones_exitosas": result.conversiones_exitosas,
-            "conversion_rate": round(conversion_rate, 2)
-        }
+        return read_conversation_stats(db, current_client.id, days_back)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting stats: {str(e)}")
@@ -65,44 +34,12 @@ async def get_conversation_stats(
 @router.get("/ai-analytics/intent-analysis")
 async def get_intent_analysis(
     days_back: int = Query(30, ge=1, le=365),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_client = Depends(get_current_client)
 ):
-    """Análisis de intenciones detectadas por el bot"""
+    """Análisis de intenciones detectadas por el bot (desde conversation_intent_daily)"""
     try:
-        query = text("""
-            SELECT 
-                intencion_detectada,
-                COUNT(*) as frecuencia,
-                AVG(duracion_respuesta_ms) as tiempo_promedio,
-                COUNT(CASE WHEN respuesta_bot LIKE '%✅%' OR respuesta_bot LIKE '%🎉%' 
-                           THEN 1 END) as respuestas_exitosas,
-                array_agg(DISTINCT productos_mencionados[1]) FILTER (WHERE productos_mencionados[1] IS NOT NULL) as productos_frecuentes
-            FROM conversation_history
-            WHERE tenant_id = :tenant_id 
-            AND timestamp_mensaje >= NOW() - INTERVAL ':days_back days'
-            AND intencion_detectada IS NOT NULL
-            GROUP BY intencion_detectada
-            ORDER BY frecuencia DESC
-        """)
-        
-        result = db.execute(query, {
-            "tenant_id": current_client.id,
-            "days_back": days_back
-        })
-        
-        intenciones = []
-        for row in result:
-            efectividad = (row.respuestas_exitosas / row.frecuencia * 100) if row.frecuencia > 0 else 0
-            intenciones.append({
-                "intencion": row.intencion_detectada,
-                "frecuencia": row.frecuencia,
-                "tiempo_promedio_ms": round(row.tiempo_promedio or 0),
-                "efectividad": round(efectividad, 2),
-                "productos_frecuentes": row.productos_frecuentes or []
-            })
-        
-        return {"intenciones": intenciones}
+        return {"intenciones": read_intent_analysis(db, current_client.id, days_back)}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing intents: {str(e)}")
@@ -111,7 +48,7 @@ async def get_intent_analysis(
 async def get_product_performance(
     days_back: int = Query(30, ge=1, le=365),
     limit: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_client = Depends(get_current_client)
 ):
     """Análisis de rendimiento de productos en conversaciones"""
@@ -158,12 +95,13 @@ async def get_product_performance(
 async def get_conversation_flow(
     telefono: Optional[str] = Query(None),
     days_back: int = Query(7, ge=1, le=30),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_client = Depends(get_current_client)
 ):
     """Flujo detallado de conversaciones para análisis"""
     try:
-        conditions = ["tenant_id = :tenant_id", "timestamp_mensaje >= NOW() - INTERVAL ':days_back days'"]
+        # Mensajes crudos (máx. 100) por el índice (tenant_id, timestamp_mensaje)
+        conditions = ["tenant_id = :tenant_id", "timestamp_mensaje >= NOW() - make_interval(days => :days_back)"]
         params = {"tenant_id": current_client.id, "days_back": days_back}
         
         if telefono:
@@ -207,57 +145,12 @@ async def get_conversation_flow(
 @router.get("/ai-analytics/user-behavior")
 async def get_user_behavior_analysis(
     days_back: int = Query(30, ge=1, le=365),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_client = Depends(get_current_client)
 ):
-    """Análisis de comportamiento de usuarios"""
+    """Análisis de comportamiento de usuarios (desde conversation_user_daily)"""
     try:
-        # Análisis de patrones de uso
-        query = text("""
-            WITH user_stats AS (
-                SELECT 
-                    telefono,
-                    COUNT(*) as total_mensajes,
-                    COUNT(DISTINCT DATE(timestamp_mensaje)) as dias_activos,
-                    COUNT(CASE WHEN intencion_detectada = 'intencion_compra' THEN 1 END) as intentos_compra,
-                    MIN(timestamp_mensaje) as primera_interaccion,
-                    MAX(timestamp_mensaje) as ultima_interaccion,
-                    array_agg(DISTINCT productos_mencionados[1]) FILTER (WHERE productos_mencionados[1] IS NOT NULL) as productos_interes
-                FROM conversation_history
-                WHERE tenant_id = :tenant_id 
-                AND timestamp_mensaje >= NOW() - INTERVAL ':days_back days'
-                GROUP BY telefono
-            )
-            SELECT 
-                CASE 
-                    WHEN total_mensajes >= 10 THEN 'usuario_frecuente'
-                    WHEN intentos_compra > 0 THEN 'comprador_potencial'
-                    WHEN total_mensajes >= 3 THEN 'explorador'
-                    ELSE 'nuevo_usuario'
-                END as tipo_usuario,
-                COUNT(*) as cantidad_usuarios,
-                AVG(total_mensajes) as promedio_mensajes,
-                AVG(dias_activos) as promedio_dias_activos
-            FROM user_stats
-            GROUP BY tipo_usuario
-            ORDER BY cantidad_usuarios DESC
-        """)
-        
-        result = db.execute(query, {
-            "tenant_id": current_client.id,
-            "days_back": days_back
-        })
-        
-        tipos_usuario = []
-        for row in result:
-            tipos_usuario.append({
-                "tipo_usuario": row.tipo_usuario,
-                "cantidad_usuarios": row.cantidad_usuarios,
-                "promedio_mensajes": round(row.promedio_mensajes, 1),
-                "promedio_dias_activos": round(row.promedio_dias_activos, 1)
-            })
-        
-        return {"tipos_usuario": tipos_usuario}
+        return {"tipos_usuario": read_user_behavior(db, current_client.id, days_back)}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing user behavior: {str(e)}")
@@ -314,7 +207,7 @@ async def submit_response_feedback(
 @router.get("/ai-analytics/training-data")
 async def get_training_data_suggestions(
     min_frequency: int = Query(5, ge=1, le=100),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_client = Depends(get_current_client)
 ):
     """Sugerencias para mejorar el entrenamiento del bot"""
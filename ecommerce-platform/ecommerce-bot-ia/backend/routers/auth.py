@@ -86,7 +86,7 @@ def register(
     
     # Generar tokens
     token_data = {"sub": user.id, "client_id": client.id, "role": user.role}
-    access_token = AuthService.create_access_token(token_data)
+    access_token = AuthService.create_access_token({**token_data, **AuthService.principal_claims(user, client)})
     refresh_token = AuthService.create_refresh_token(token_data)
     
     return TokenResponse(
@@ -139,7 +139,7 @@ def login(
     
     # Generar tokens
     token_data = {"sub": user.id, "client_id": client.id, "role": user.role}
-    access_token = AuthService.create_access_token(token_data)
+    access_token = AuthService.create_access_token({**token_data, **AuthService.principal_claims(user, client)})
     refresh_token = AuthService.create_refresh_token(token_data)
     
     return TokenResponse(
@@ -180,6 +180,9 @@ def refresh_token(
         
         # Generar nuevo access token
         token_data = {"sub": user.id, "client_id": client_id, "role": user.role}
+        client = TenantService.get_client_by_id(db, client_id)
+        if client is not None:
+            token_data.update(AuthService.principal_claims(user, client))
         access_token = AuthService.create_access_token(token_data)
         
         return {
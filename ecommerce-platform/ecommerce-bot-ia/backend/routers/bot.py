@@ -3,7 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
-from database import get_async_db, get_db
+from database import get_async_db, get_async_read_db, get_db
 from models import Product, Campaign, Discount, FlowPedido
 from auth import get_current_client, TenantClient
 import crud_async
@@ -84,7 +84,7 @@ async def process_chat_message(data: ChatMessage, db: AsyncSession = Depends(get
 async def search_products_for_bot(
     query: str = Query(..., description="Search query", min_length=1),
     limit: int = Query(5, description="Number of results to return", ge=1, le=50),
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Search products for WhatsApp bot responses using optimized SQL queries
@@ -126,7 +126,7 @@ async def get_products_by_category_for_bot(
     category: str = Query(..., description="Product category", min_length=1),
     limit: int = Query(10, description="Number of results to return", ge=1, le=100),
     offset: int = Query(0, description="Pagination offset", ge=0),
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Get products by category for bot responses with SQL-level filtering and pagination - filtered by tenant
@@ -163,7 +163,7 @@ async def get_products_by_category_for_bot(
 
 @router.get("/bot/products/catalog")
 async def get_catalog_for_bot(
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Get catalog summary for bot responses using optimized SQL aggregation - filtered by tenant
@@ -184,7 +184,7 @@ async def get_catalog_for_bot(
     }
 
 @router.get("/bot/campaigns/active")
-async def get_active_campaigns_for_bot(db: AsyncSession = Depends(get_async_db)):
+async def get_active_campaigns_for_bot(db: AsyncSession = Depends(get_async_read_db)):
     """
     Get active campaigns for bot responses using SQL filtering
     """
@@ -205,7 +205,7 @@ async def get_active_campaigns_for_bot(db: AsyncSession = Depends(get_async_db))
     ]
 
 @router.get("/bot/discounts/active")
-async def get_active_discounts_for_bot(db: AsyncSession = Depends(get_async_db)):
+async def get_active_discounts_for_bot(db: AsyncSession = Depends(get_async_read_db)):
     """
     Get active discounts for bot responses using SQL filtering
     """
@@ -226,7 +226,7 @@ async def get_active_discounts_for_bot(db: AsyncSession = Depends(get_async_db))
     ]
 
 @router.get("/bot/product/{product_id}")
-async def get_product_details_for_bot(product_id: str, db: AsyncSession = Depends(get_async_db)):
+async def get_product_details_for_bot(product_id: str, db: AsyncSession = Depends(get_async_read_db)):
     """
     Get detailed product information for bot with optimized discount lookup
     """
@@ -386,4 +386,30 @@ async def debug_cache_stats() -> Dict[str, Any]:
             "endpoint": "TEMPORARY DEBUG - REMOVE IN PRODUCTION"
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting cache stats: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error getting cache stats: {str(e)}")
+
+@router.get("/bot/debug/intent-cache")
+async def debug_intent_cache_stats() -> Dict[str, Any]:
+    """
+    TEMPORARY: Debug endpoint to view the WhatsApp bot intent cache hit rate.
+    The cache lives in the bot process, so stats are fetched from it.
+    """
+    try:
+        from services.http_pool import http_clients
+        from services.catalog_events import WHATSAPP_BOT_URL
+        
+        async with http_clients.client("whatsapp_bot") as client:
+            response = await client.get(f"{WHATSAPP_BOT_URL}/internal/intent-cache/stats")
+        
+        if response.status_code != 200:
+            raise HTTPException(status_code=502, detail=f"Bot returned {response.status_code}")
+        
+        return {
+            "intent_cache_stats": response.json(),
+            "message": "Intent cache statistics retrieved",
+            "endpoint": "TEMPORARY DEBUG - REMOVE IN PRODUCTION"
+        }
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting intent cache stats: {str(e)}")
@@ -12,6 +12,7 @@ from models import FlowAccount
 from auth_models import TenantClient
 from flow_schemas import FlowConfigIn, FlowConfigOut, FlowWebhookUrls
 from crypto_utils import encrypt_token, decrypt_token
+from services.flow_client import invalidate_flow_credentials
 from tenant_middleware import get_tenant_id
 
 logger = logging.getLogger(__name__)
@@ -98,6 +99,8 @@ async def upsert_flow_config(
     
     db.commit()
     db.refresh(flow_account)
+    # Credenciales cacheadas por services/flow_client (todos los procesos)
+    invalidate_flow_credentials(tenant_id_str)
     
     environment = "production" if "flow.cl/api" in flow_account.base_url and "sandbox" not in flow_account.base_url else "sandbox"
     
@@ -152,6 +155,7 @@ async def delete_flow_config(db: Session = Depends(get_db)):
     
     db.delete(flow_account)
     db.commit()
+    invalidate_flow_credentials(tenant_id_str)
     
     logger.info(f"Deleted Flow config for tenant {tenant_id_str}")
     
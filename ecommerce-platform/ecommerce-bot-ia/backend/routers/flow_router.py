@@ -9,7 +9,7 @@ from database import get_db
 from services.flow_service import validar_firma
 from models import FlowPedido
 import logging
-import httpx
+from services.http_pool import http_clients
 import os
 
 # Configure logging
@@ -47,7 +47,7 @@ async def enviar_confirmacion_whatsapp(telefono: str, pedido_id: str, total: flo
 
 💬 Si tienes alguna pregunta, no dudes en escribirnos."""
         
-        async with httpx.AsyncClient() as client:
+        async with http_clients.client("twilio") as client:
             auth = (account_sid, auth_token)
             
             data = {
@@ -148,18 +148,14 @@ async def flow_return(request: Request, db: Session = Depends(get_db)):
 
         # Si tenemos token pero no commerceOrder, consultar a Flow
         if not commerce_order and token:
-            from services.flow_service import FLOW_API_KEY, FLOW_BASE_URL, _firmar
-            import requests
+            from services.flow_client import flow_client
             
-            params = {"apiKey": FLOW_API_KEY, "token": token}
-            params["s"] = _firmar(params)
-
-            response = requests.get(f"{FLOW_BASE_URL}/payment/getStatus", params=params)
-            if response.status_code == 200:
-                datos = response.json()
+            try:
+                datos = await flow_client.get_status(None, token)
                 commerce_order = datos.get("commerceOrder")
                 status = "SUCCESS" if datos.get("status") == 2 else "FAILED"
-            else:
+            except Exception as e:
+                logger.warning(f"⚠️ [Flow Return] No se pudo consultar el estado del pago: {e}")
                 return f"<h1>⚠️ No se pudo obtener información del pago (token={token}).</h1>"
 
         # Procesar resultado del pago
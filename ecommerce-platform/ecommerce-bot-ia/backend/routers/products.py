@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from uuid import uuid4
-from database import get_async_db
+from database import get_async_db, get_async_read_db
 from models import Product as ProductModel
 from schemas import Product, ProductCreate, ProductUpdate
 from auth import get_current_client, TenantClient
 from tenant_middleware import get_tenant_id
+from services.catalog_events import notify_catalog_changed
 import crud_async
 
 router = APIRouter()
@@ -17,7 +18,7 @@ async def get_products(
     limit: int = Query(100, ge=1, le=1000),
     status: Optional[str] = Query(None, description="Filter by status"),
     category: Optional[str] = Query(None, description="Filter by category"),
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get products with optional filtering using SQL WHERE clauses - filtered by tenant"""
     # Get tenant_id from middleware context
@@ -31,7 +32,7 @@ async def get_products(
 @router.get("/products/{product_id}", response_model=Product)
 async def get_product(
     product_id: str,
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get a single product by ID - filtered by tenant"""
     # Get tenant_id from middleware context
@@ -45,6 +46,7 @@ async def get_product(
 @router.post("/products", response_model=Product)
 async def create_product(
     product: ProductCreate,
+    background_tasks: BackgroundTasks,
     current_client: TenantClient = Depends(get_current_client), 
     db: AsyncSession = Depends(get_async_db)
 ):
@@ -52,12 +54,15 @@ async def create_product(
     product_id = str(uuid4())
     product_data = product.dict()
     product_data['client_id'] = current_client.id  # Assign to current tenant
-    return await crud_async.create_product_async(db=db, product=product_data, product_id=product_id)
+    db_product = await crud_async.create_product_async(db=db, product=product_data, product_id=product_id)
+    background_tasks.add_task(notify_catalog_changed, current_client.id)
+    return db_product
 
 @router.put("/products/{product_id}", response_model=Product)
 async def update_product(
     product_id: str, 
     product: ProductUpdate, 
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_async_db)
 ):
     """Update an existing product"""
@@ -65,13 +70,17 @@ async def update_product(
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    return await crud_async.update_product_async(
+    tenant_id = db_product.client_id
+    updated_product = await crud_async.update_product_async(
         db=db, product_id=product_id, product=product.dict(exclude_unset=True)
     )
+    background_tasks.add_task(notify_catalog_changed, tenant_id)
+    return updated_product
 
 @router.delete("/products/{product_id}")
 async def delete_product(
     product_id: str, 
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a product"""
@@ -79,7 +88,9 @@ async def delete_product(
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    tenant_id = db_product.client_id
     await crud_async.delete_product_async(db=db, product_id=product_id)
+    background_tasks.add_task(notify_catalog_changed, tenant_id)
     return {"message": "Product deleted successfully"}
 
 @router.get("/products/category/{category}", response_model=List[Product])
@@ -87,7 +98,7 @@ async def get_products_by_category(
     category: str, 
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get products by category using optimized SQL filtering"""
     return await crud_async.get_products_by_category_async(
@@ -99,7 +110,7 @@ async def get_products_by_status(
     status: str, 
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get products by status using optimized SQL filtering"""
     return await crud_async.get_products_async(
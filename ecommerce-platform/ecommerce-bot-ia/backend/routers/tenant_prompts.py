@@ -9,11 +9,10 @@ from typing import List, Optional, Dict, Any
 import json
 import time
 import uuid
-from datetime import datetime
 
 from database import get_db
 from auth import get_current_user, get_current_client
-from models import TenantPrompts, TenantPromptAuditLog, PromptAction
+from models import TenantPrompts, TenantPromptAuditLog
 from auth_models import TenantUser as User, TenantClient
 from prompt_schemas import (
     TenantPromptCreate, TenantPromptUpdate, TenantPromptResponse,
@@ -21,6 +20,7 @@ from prompt_schemas import (
     TenantPromptAuditLogResponse, TenantPromptRollbackRequest,
     TenantPromptVersionsResponse, TenantPromptError
 )
+from services.audit_sink import audit_sink, prompt_audit_row
 from services.tenant_prompt_cache import (
     get_tenant_prompt_config, invalidate_tenant_prompt_cache,
     compose_final_system_prompt, BASE_SECURE_RULES
@@ -68,22 +68,26 @@ async def log_audit_action(
     previous_version: Optional[int] = None,
     new_version: Optional[int] = None
 ):
-    """Registrar acción en log de auditoría"""
-    audit_log = TenantPromptAuditLog(
-        id=str(uuid.uuid4()),
+    """
+    Registrar acción en log de auditoría
+    Con el sink activo la fila se encola y se inserta en lote fuera del request;
+    si no está corriendo (scripts, sink deshabilitado) se inserta en la sesión como antes
+    """
+    row = prompt_audit_row(
         tenant_id=tenant_id,
         prompt_config_id=prompt_config_id,
-        action=PromptAction(action),
-        changes_diff=changes_diff or {},
-        previous_version=previous_version,
-        new_version=new_version,
+        action=action,
+        changes_diff=changes_diff,
         performed_by=user.id,
-        performed_at=datetime.utcnow(),
         ip_address=request.client.host if request.client else None,
-        user_agent=request.headers.get("user-agent")
+        user_agent=request.headers.get("user-agent"),
+        previous_version=previous_version,
+        new_version=new_version
     )
+    if audit_sink.running and audit_sink.record_prompt_action(row):
+        return
     
-    db.add(audit_log)
+    db.add(TenantPromptAuditLog(**row))
     db.commit()
 
 
@@ -224,8 +228,8 @@ async def update_tenant_prompt_config(
         new_version=new_version
     )
     
-    # Invalidar caché
-    invalidate_tenant_prompt_cache(tenant_id)
+    # Invalidar caché en todos los workers y en el bot
+    invalidate_tenant_prompt_cache(tenant_id, version=new_version)
     
     return new_config
 
@@ -291,8 +295,8 @@ async def create_tenant_prompt_config(
         new_version=1
     )
     
-    # Invalidar caché
-    invalidate_tenant_prompt_cache(tenant_id)
+    # Invalidar caché en todos los workers y en el bot
+    invalidate_tenant_prompt_cache(tenant_id, version=1)
     
     return new_config
 
@@ -631,8 +635,8 @@ async def rollback_tenant_prompt_config(
         new_version=new_version
     )
     
-    # Invalidar caché
-    invalidate_tenant_prompt_cache(tenant_id)
+    # Invalidar caché en todos los workers y en el bot
+    invalidate_tenant_prompt_cache(tenant_id, version=new_version)
     
     return {"message": f"Rollback exitoso a versión {rollback_request.target_version}"}
 
@@ -656,6 +660,9 @@ async def get_tenant_prompt_audit_log(
             detail="Solo administradores pueden ver el log de auditoría"
         )
     
+    # Incluir acciones de este worker que aún esperan en el buffer del sink
+    await audit_sink.flush()
+    
     audit_logs = db.query(TenantPromptAuditLog).filter(
         TenantPromptAuditLog.tenant_id == tenant_id
     ).order_by(TenantPromptAuditLog.performed_at.desc()).limit(limit).all()
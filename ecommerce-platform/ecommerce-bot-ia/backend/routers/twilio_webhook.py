@@ -212,7 +212,8 @@ async def process_whatsapp_message_text(phone_number: str, message: str, message
             # Use Flow service with real DB session (sync)
             sync_db = SessionLocal()
             try:
-                response_text = procesar_mensaje_flow(sync_db, phone_number, message, tenant_id)
+                # Flujo bloqueante (BD sync + OpenAI + Flow) fuera del event loop
+                response_text = await asyncio.to_thread(procesar_mensaje_flow, sync_db, phone_number, message, tenant_id)
                 return response_text
             finally:
                 sync_db.close()
@@ -239,7 +240,8 @@ async def process_whatsapp_message(phone_number: str, message: str, message_sid:
             # Use Flow service with real DB session (sync)
             sync_db = SessionLocal()
             try:
-                response_text = procesar_mensaje_flow(sync_db, phone_number, message, tenant_id)
+                # Flujo bloqueante (BD sync + OpenAI + Flow) fuera del event loop
+                response_text = await asyncio.to_thread(procesar_mensaje_flow, sync_db, phone_number, message, tenant_id)
             finally:
                 sync_db.close()
         except ImportError:
@@ -11,6 +11,7 @@ from whatsapp_schemas import (
     WhatsAppProvidersInfo
 )
 from encryption_service import encrypt_sensitive_data, decrypt_sensitive_data
+from services.invalidation_bus import publish_invalidation
 import logging
 from datetime import datetime
 from typing import Optional
@@ -105,6 +106,8 @@ async def create_or_update_whatsapp_settings(
         
         db.commit()
         db.refresh(db_settings)
+        # El bot cachea la configuración activa: invalidarla
+        publish_invalidation("whatsapp_settings")
         
         return create_settings_response(db_settings)
         
@@ -274,6 +277,7 @@ async def delete_whatsapp_settings(db: Session = Depends(get_db)):
         
         db.delete(db_settings)
         db.commit()
+        publish_invalidation("whatsapp_settings")
         
         return {"message": "Configuración de WhatsApp eliminada exitosamente"}
         
@@ -0,0 +1,333 @@
+"""
+Sink de auditoría en lote: el camino del request solo hace un append a un ring buffer
+Una tarea en background drena el buffer y escribe fuera del event loop:
+
+- Eventos de resolución de tenant (TenantMiddleware) -> líneas JSON compactas
+  (archivo AUDIT_JSONL_PATH o logger "audit")
+- Acciones sobre prompts (routers/tenant_prompts) -> INSERT multi-fila en
+  tenant_prompt_audit_log + su línea JSON
+- Muestreo de eventos de alto volumen (BYPASS y success); REJECTED/ERROR siempre se registran
+- Buffer acotado: si está lleno el evento se descarta y se cuenta en "dropped"
+  (las acciones sobre prompts se insertan entonces en la transacción del request)
+- Si el INSERT del lote falla se reintenta fila por fila; las filas que siguen fallando
+  vuelven a encolarse hasta AUDIT_ROW_MAX_ATTEMPTS flushes y luego se registran completas
+  en el log de errores ("rows_failed"): nunca se descartan en silencio
+- Al apagar se drena lo pendiente (stop)
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from starlette.datastructures import Headers, QueryParams
+
+from database import engine
+from models import TenantPromptAuditLog, PromptAction
+
+logger = logging.getLogger(__name__)
+audit_logger = logging.getLogger("audit")
+
+AUDIT_SINK_ENABLED = os.getenv("AUDIT_SINK_ENABLED", "true").lower() == "true"
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1.0"))
+# Fracción de eventos registrados (0 = ninguno, 1 = todos)
+AUDIT_SAMPLE_BYPASS = float(os.getenv("AUDIT_SAMPLE_BYPASS", "0.01"))
+AUDIT_SAMPLE_SUCCESS = float(os.getenv("AUDIT_SAMPLE_SUCCESS", "0.1"))
+# Flushes en que se reintenta una fila de tenant_prompt_audit_log antes de darla por perdida
+AUDIT_ROW_MAX_ATTEMPTS = int(os.getenv("AUDIT_ROW_MAX_ATTEMPTS", "5"))
+# Vacío => las líneas JSON van al logger "audit"
+AUDIT_JSONL_PATH = os.getenv("AUDIT_JSONL_PATH", "")
+
+_RESOLUTION = "tenant_resolution"
+_PROMPT_ACTION = "prompt_action"
+
+
+def _compact(data: Dict[str, Any]) -> str:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _resolution_line(event: tuple) -> str:
+    """Arma la línea JSON de un evento del middleware (se hace en el drenado, no en el request)"""
+    _, ts, scope, tenant_id, method, status, duration = event
+    headers = Headers(scope=scope)
+    client = scope.get("client")
+    return _compact({
+        "type": _RESOLUTION,
+        "timestamp": datetime.utcfromtimestamp(ts).isoformat(),
+        "tenant_id": tenant_id,
+        "resolution_method": method,
+        "status": status,
+        "duration_ms": round(duration * 1000, 2),
+        "method": scope.get("method"),
+        "path": scope.get("path"),
+        "host": headers.get("host", ""),
+        "user_agent": headers.get("user-agent", "")[:100],
+        "ip": client[0] if client else "",
+        "query_params": dict(QueryParams(scope.get("query_string", b""))),
+    })
+
+
+class AuditSink:
+    """Ring buffer acotado + drenado periódico en lotes"""
+
+    def __init__(self, max_size: int = AUDIT_BUFFER_SIZE):
+        self.max_size = max_size
+        self._buffer: deque = deque()
+        # Filas de prompts cuyo INSERT falló: (intentos, fila), se reintentan en el próximo flush
+        self._retry: List[tuple] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._jsonl_file = None
+        self._stats: Dict[str, Any] = {
+            "enqueued": 0,
+            "sampled_out": 0,
+            "dropped": 0,
+            "rows_written": 0,
+            "rows_retried": 0,
+            "rows_failed": 0,
+            "lines_written": 0,
+            "flushes": 0,
+            "errors": 0,
+            "last_flush_ms": None,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # ==================== CAMINO DEL REQUEST ====================
+
+    def _append(self, event: tuple) -> bool:
+        if len(self._buffer) >= self.max_size:
+            self._stats["dropped"] += 1
+            return False
+        self._buffer.append(event)
+        self._stats["enqueued"] += 1
+        if len(self._buffer) >= AUDIT_BATCH_SIZE and self._wake is not None:
+            self._wake.set()
+        return True
+
+    def record_resolution(self, scope, tenant_id: Optional[str], method: str,
+                          status: str, duration: float) -> None:
+        """Evento del TenantMiddleware; el scope se guarda tal cual y se serializa al drenar"""
+        if self._task is None:
+            return
+        if method == "BYPASS":
+            rate = AUDIT_SAMPLE_BYPASS
+        elif status == "success":
+            rate = AUDIT_SAMPLE_SUCCESS
+        else:
+            rate = 1.0
+        if rate < 1.0 and random.random() >= rate:
+            self._stats["sampled_out"] += 1
+            return
+        self._append((_RESOLUTION, time.time(), scope, tenant_id, method, status, duration))
+
+    def record_prompt_action(self, row: Dict[str, Any]) -> bool:
+        """Fila para tenant_prompt_audit_log (ya con id y performed_at del momento del request)"""
+        return self._append((_PROMPT_ACTION, row))
+
+    # ==================== DRENADO ====================
+
+    def _take_batch(self) -> List[tuple]:
+        batch = []
+        buffer = self._buffer
+        while buffer and len(batch) < AUDIT_BATCH_SIZE:
+            batch.append(buffer.popleft())
+        return batch
+
+    def _insert_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """INSERT multi-fila; si falla, fila por fila. Devuelve las filas que no se escribieron"""
+        table = TenantPromptAuditLog.__table__
+        try:
+            with engine.begin() as conn:
+                conn.execute(table.insert().values(rows))
+            self._stats["rows_written"] += len(rows)
+            return []
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Audit batch insert failed ({len(rows)} rows), retrying row by row: {e}")
+
+        failed = []
+        for row in rows:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(table.insert().values(row))
+                self._stats["rows_written"] += 1
+            except Exception as e:
+                logger.error(f"Could not write audit row {row['id']}: {e}")
+                failed.append(row)
+        return failed
+
+    def _write_lines(self, lines: List[str]) -> None:
+        if AUDIT_JSONL_PATH:
+            try:
+                if self._jsonl_file is None:
+                    self._jsonl_file = open(AUDIT_JSONL_PATH, "a", encoding="utf-8")
+                self._jsonl_file.write("\n".join(lines) + "\n")
+                self._jsonl_file.flush()
+                self._stats["lines_written"] += len(lines)
+                return
+            except OSError as e:
+                # Sin archivo: las líneas van al logger "audit" en vez de perderse
+                self._stats["errors"] += 1
+                logger.error(f"Could not write {AUDIT_JSONL_PATH}, logging audit lines instead: {e}")
+        if audit_logger.isEnabledFor(logging.INFO):
+            for line in lines:
+                audit_logger.info(line)
+        self._stats["lines_written"] += len(lines)
+
+    def _write_batch(self, batch: List[tuple]) -> List[Dict[str, Any]]:
+        """
+        Corre en un thread: INSERT multi-fila de las acciones de prompts + líneas JSON
+        Devuelve las filas de prompts que no se pudieron insertar (sus líneas se escriben al insertarlas)
+        """
+        rows = [event[1] for event in batch if event[0] == _PROMPT_ACTION]
+        failed = self._insert_rows(rows) if rows else []
+        failed_ids = {row["id"] for row in failed}
+
+        lines = []
+        for event in batch:
+            if event[0] == _RESOLUTION:
+                lines.append(_resolution_line(event))
+            elif event[1]["id"] not in failed_ids:
+                row = event[1]
+                lines.append(_compact({"type": _PROMPT_ACTION, **row, "action": row["action"].value}))
+        if lines:
+            self._write_lines(lines)
+        return failed
+
+    def _requeue(self, failed: List[Dict[str, Any]], attempts: Dict[str, int]) -> None:
+        """Reencola las filas que fallaron; agotados los intentos se registran completas como error"""
+        for row in failed:
+            attempt = attempts.get(row["id"], 0) + 1
+            if attempt < AUDIT_ROW_MAX_ATTEMPTS:
+                self._retry.append((attempt, row))
+                self._stats["rows_retried"] += 1
+            else:
+                self._stats["rows_failed"] += 1
+                logger.error("Audit row not written after %d attempts: %s", attempt,
+                             _compact({"type": _PROMPT_ACTION, **row, "action": row["action"].value}))
+
+    async def flush(self) -> int:
+        """
+        Drena lo pendiente al empezar (más las filas a reintentar); devuelve cuántos eventos se escribieron
+        Las filas que vuelven a fallar quedan para el próximo flush
+        """
+        retry, self._retry = self._retry, []
+        attempts = {row["id"]: attempt for attempt, row in retry}
+        self._buffer.extendleft((_PROMPT_ACTION, row) for _, row in reversed(retry))
+
+        written = 0
+        pending = len(self._buffer)
+        while self._buffer and pending > 0:
+            batch = self._take_batch()
+            pending -= len(batch)
+            started = time.perf_counter()
+            try:
+                failed = await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                # Error inesperado (p.ej. serializando líneas): reintentar las filas de prompts del lote
+                self._stats["errors"] += 1
+                logger.error(f"Error writing audit batch ({len(batch)} events): {e}")
+                failed = [event[1] for event in batch if event[0] == _PROMPT_ACTION]
+            written += len(batch) - len(failed)
+            self._requeue(failed, attempts)
+            self._stats["flushes"] += 1
+            self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return written
+
+    async def _loop(self) -> None:
+        logger.info("Starting audit sink...")
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), AUDIT_FLUSH_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in audit sink loop: {e}")
+                await asyncio.sleep(AUDIT_FLUSH_INTERVAL_SECONDS)
+
+    def start(self) -> None:
+        if not AUDIT_SINK_ENABLED:
+            logger.info("Audit sink disabled by configuration")
+            return
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+        logger.info("Audit sink started")
+
+    async def stop(self) -> None:
+        """Detiene el loop y escribe lo que quede en el buffer"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self._retry:
+            # Un último intento para las filas que fallaron; las que sigan fallando van al log de errores
+            await self.flush()
+        for _, row in self._retry:
+            self._stats["rows_failed"] += 1
+            logger.error("Audit row not written before shutdown: %s",
+                         _compact({"type": _PROMPT_ACTION, **row, "action": row["action"].value}))
+        self._retry = []
+        if self._jsonl_file is not None:
+            self._jsonl_file.close()
+            self._jsonl_file = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "running": self.running,
+            "buffered": len(self._buffer),
+            "retry_pending": len(self._retry),
+            "capacity": self.max_size,
+            "sample_bypass": AUDIT_SAMPLE_BYPASS,
+            "sample_success": AUDIT_SAMPLE_SUCCESS,
+        }
+
+
+# Sink global del proceso
+audit_sink = AuditSink()
+
+
+def prompt_audit_row(tenant_id: str, prompt_config_id: str, action: str,
+                     changes_diff: Optional[Dict[str, Any]], performed_by: str,
+                     ip_address: Optional[str], user_agent: Optional[str],
+                     previous_version: Optional[int] = None,
+                     new_version: Optional[int] = None) -> Dict[str, Any]:
+    """Fila de tenant_prompt_audit_log lista para el INSERT multi-fila"""
+    return {
+        "id": str(uuid.uuid4()),
+        "tenant_id": tenant_id,
+        "prompt_config_id": prompt_config_id,
+        "action": PromptAction(action),
+        "changes_diff": changes_diff or {},
+        "previous_version": previous_version,
+        "new_version": new_version,
+        "performed_by": performed_by,
+        "performed_at": datetime.utcnow(),
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+    }
+
+
+def get_audit_sink_stats() -> Dict[str, Any]:
+    return audit_sink.get_stats()
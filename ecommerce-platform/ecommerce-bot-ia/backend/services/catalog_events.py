@@ -0,0 +1,58 @@
+"""
+Notificación de cambios de catálogo hacia el bot de WhatsApp
+El bot mantiene un snapshot de catálogo por tenant; el backend le avisa
+cuando un producto se crea, actualiza o elimina para que lo invalide
+(evento "catalog" del bus de invalidación + llamada HTTP directa).
+Antes de avisar se reindexan las categorías del tenant (services/category_index.py)
+para que el snapshot reconstruido ya traiga las asignaciones nuevas.
+"""
+import asyncio
+import os
+import logging
+
+from services.category_index import reindex_tenant_categories
+from services.http_pool import http_clients
+from services.invalidation_bus import publish_invalidation
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_BOT_URL = os.getenv("WHATSAPP_BOT_URL", "http://ecommerce-whatsapp-bot:9001")
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+
+async def notify_catalog_changed(tenant_id: str) -> bool:
+    """
+    Pide al bot invalidar el snapshot de catálogo del tenant.
+    Nunca lanza excepción: si el bot no responde, su revalidación
+    periódica por huella detecta el cambio igualmente.
+    """
+    if not tenant_id:
+        return False
+
+    try:
+        await reindex_tenant_categories(tenant_id)
+    except Exception as e:
+        # El barrido periódico del indexador lo reintenta
+        logger.warning(f"Could not reindex categories for {tenant_id}: {e}")
+
+    # Bus de invalidación (LISTEN/NOTIFY): llega a todas las réplicas del bot
+    try:
+        await asyncio.to_thread(publish_invalidation, "catalog", tenant_id)
+    except Exception as e:
+        logger.warning(f"Could not publish catalog invalidation for {tenant_id}: {e}")
+
+    # Llamada directa al bot como respaldo si el bus no está disponible
+    headers = {"X-Internal-Token": INTERNAL_API_TOKEN} if INTERNAL_API_TOKEN else {}
+    try:
+        async with http_clients.client("whatsapp_bot") as client:
+            response = await client.post(
+                f"{WHATSAPP_BOT_URL}/internal/catalog/invalidate/{tenant_id}",
+                headers=headers
+            )
+        if response.status_code != 200:
+            logger.warning(f"Catalog invalidation for {tenant_id} returned {response.status_code}")
+            return False
+        return True
+    except Exception as e:
+        logger.warning(f"Could not notify catalog change for {tenant_id}: {e}")
+        return False
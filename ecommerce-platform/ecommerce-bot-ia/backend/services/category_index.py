@@ -0,0 +1,215 @@
+"""
+Índice de categorías de productos por tenant (tabla product_category_index)
+Reemplaza la clasificación con GPT en cada mensaje del bot (que además solo veía
+los primeros 20-30 productos del catálogo):
+
+- Vocabulario del tenant: las categorías que el propio tenant usa en products.category
+- Cada producto queda asignado a su categoría y a cualquier otra del vocabulario que
+  aparezca en su nombre (o en la descripción si no tiene categoría: "Tintura CBD 10%,
+  aceite sublingual" => Aceites)
+- Se indexa al crear/editar/borrar productos (notify_catalog_changed) y con un barrido
+  periódico que recoge productos sin indexar o cambiados por otras vías
+- Solo se reescriben las filas cuyo contenido cambió (content_hash); el bot lee las
+  asignaciones junto con el catálogo y arma el índice invertido categoría -> productos
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import or_
+
+from database import SessionLocal
+import models
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_INDEX_SWEEP_SECONDS = float(os.getenv("CATEGORY_INDEX_SWEEP_SECONDS", "300"))
+# Productos sin categoría propia ni coincidencias con el vocabulario
+DEFAULT_CATEGORY = "General"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _singular(token: str) -> str:
+    """
+    Plural simple del español: flores -> flor, aceites -> aceite, semillas -> semilla
+    "-es" solo se quita tras vocal + r/l/n/d/j; en grupos (muebles, verdes) se quita solo la "s"
+    """
+    if len(token) > 4 and token.endswith("es") and token[-3] in "rlndj" and token[-4] in "aeiou":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def category_tokens(text: Optional[str]) -> List[str]:
+    """Tokens normalizados (minúsculas, sin tildes, en singular)"""
+    plain = unicodedata.normalize("NFKD", (text or "").lower())
+    plain = "".join(ch for ch in plain if not unicodedata.combining(ch))
+    return [_singular(token) for token in _TOKEN_RE.findall(plain)]
+
+
+def tenant_vocabulary(categories: Iterable[Optional[str]]) -> Dict[str, str]:
+    """Clave normalizada -> etiqueta (la primera forma usada por el tenant)"""
+    vocabulary: Dict[str, str] = {}
+    for label in categories:
+        label = (label or "").strip()
+        key = " ".join(category_tokens(label))
+        if key and label.lower() != DEFAULT_CATEGORY.lower():
+            vocabulary.setdefault(key, label)
+    return vocabulary
+
+
+def classify_product(name: Optional[str], description: Optional[str], category: Optional[str],
+                     vocabulary: Dict[str, str]) -> List[str]:
+    """
+    Etiquetas de categoría del producto: la propia primero, luego las del vocabulario que
+    menciona su nombre. La descripción solo cuenta si el producto no tiene categoría propia
+    ("Grinder ... ideal para flores" no es una flor)
+    """
+    own_key = " ".join(category_tokens(category))
+    labels = [vocabulary[own_key]] if own_key in vocabulary else []
+    words = set(category_tokens(name if labels else f"{name or ''} {description or ''}"))
+    for key, label in sorted(vocabulary.items()):
+        if key != own_key and all(token in words for token in key.split()):
+            labels.append(label)
+    return labels or [DEFAULT_CATEGORY]
+
+
+def _content_hash(product: Any, vocabulary_labels: Sequence[str]) -> str:
+    payload = json.dumps([product.name, product.description, product.category, list(vocabulary_labels)])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CategoryIndexer:
+    """Mantiene product_category_index al día, un tenant a la vez"""
+
+    def __init__(self):
+        self._stats: Dict[str, Any] = {
+            "tenants_indexed": 0,
+            "products_seen": 0,
+            "rows_written": 0,
+            "rows_deleted": 0,
+            "sweeps": 0,
+            "errors": 0,
+            "last_sweep_at": None,
+        }
+
+    def index_tenant(self, tenant_id: str) -> int:
+        """
+        Reindexa el catálogo del tenant (bloqueante: corre en un thread)
+        Devuelve cuántas asignaciones cambiaron (0 => el bot no necesita reconstruir)
+        """
+        Product, Index = models.Product, models.ProductCategoryIndex
+        with SessionLocal() as db:
+            products = db.query(
+                Product.id, Product.name, Product.description, Product.category, Product.updated_at
+            ).filter(Product.client_id == tenant_id).all()
+            existing = {row.product_id: row for row in db.query(Index).filter(Index.client_id == tenant_id)}
+
+            vocabulary = tenant_vocabulary(product.category for product in products)
+            vocabulary_labels = sorted(vocabulary.values())
+            now = datetime.utcnow()
+            changed = 0
+
+            for product in products:
+                content_hash = _content_hash(product, vocabulary_labels)
+                row = existing.pop(product.id, None)
+                if row is not None and row.content_hash == content_hash:
+                    # Cambio que no afecta la clasificación (stock, precio): solo marca como visto
+                    if product.updated_at and row.indexed_at and product.updated_at > row.indexed_at:
+                        row.indexed_at = now
+                    continue
+                categories = json.dumps(
+                    classify_product(product.name, product.description, product.category, vocabulary),
+                    ensure_ascii=False,
+                )
+                if row is None:
+                    db.add(Index(product_id=product.id, client_id=tenant_id, categories=categories,
+                                 content_hash=content_hash, indexed_at=now))
+                else:
+                    row.categories, row.content_hash, row.indexed_at = categories, content_hash, now
+                changed += 1
+
+            # Productos borrados (SQLite no aplica el ON DELETE CASCADE)
+            for row in existing.values():
+                db.delete(row)
+            db.commit()
+
+        self._stats["tenants_indexed"] += 1
+        self._stats["products_seen"] += len(products)
+        self._stats["rows_written"] += changed
+        self._stats["rows_deleted"] += len(existing)
+        if changed or existing:
+            logger.info(f"🗂️ Category index: tenant={tenant_id} | {changed} productos reindexados, "
+                        f"{len(existing)} eliminados, {len(vocabulary)} categorías")
+        return changed + len(existing)
+
+    def stale_tenants(self) -> List[str]:
+        """Tenants con productos sin indexar o modificados después de su última indexación"""
+        Product, Index = models.Product, models.ProductCategoryIndex
+        with SessionLocal() as db:
+            rows = db.query(Product.client_id).distinct().outerjoin(
+                Index, Index.product_id == Product.id
+            ).filter(
+                Product.client_id.isnot(None),
+                or_(Index.product_id.is_(None), Product.updated_at > Index.indexed_at),
+            ).all()
+        return [row.client_id for row in rows]
+
+    async def sweep(self) -> int:
+        """Reindexa los tenants pendientes y avisa al bot de los que cambiaron"""
+        from services.invalidation_bus import publish_invalidation
+
+        tenants = await asyncio.to_thread(self.stale_tenants)
+        for tenant_id in tenants:
+            try:
+                if await asyncio.to_thread(self.index_tenant, tenant_id):
+                    await asyncio.to_thread(publish_invalidation, "catalog", tenant_id)
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.error(f"Error indexing categories for tenant {tenant_id}: {e}")
+        self._stats["sweeps"] += 1
+        self._stats["last_sweep_at"] = datetime.utcnow().isoformat()
+        return len(tenants)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "sweep_seconds": CATEGORY_INDEX_SWEEP_SECONDS}
+
+
+# Indexador global del proceso
+category_indexer = CategoryIndexer()
+
+
+async def reindex_tenant_categories(tenant_id: str) -> int:
+    """Tras crear/editar/borrar productos del tenant (antes de invalidar el catálogo del bot)"""
+    return await asyncio.to_thread(category_indexer.index_tenant, tenant_id)
+
+
+async def category_index_loop():
+    """Primer barrido al arrancar (backfill) y luego cada CATEGORY_INDEX_SWEEP_SECONDS"""
+    while True:
+        try:
+            await category_indexer.sweep()
+        except Exception as e:
+            logger.error(f"Error in category index loop: {str(e)}")
+        await asyncio.sleep(CATEGORY_INDEX_SWEEP_SECONDS)
+
+
+def start_category_indexer():
+    """Inicia el barrido de categorías en background"""
+    if os.getenv("ENABLE_CATEGORY_INDEX", "true").lower() != "true":
+        logger.info("Category indexer disabled by configuration")
+        return
+    asyncio.create_task(category_index_loop())
+    logger.info("Category indexer started")
+
+
+def get_category_index_stats() -> Dict[str, Any]:
+    return category_indexer.get_stats()
@@ -111,7 +111,7 @@ async def create_real_order(customer_phone: str, product_name: str, quantity: in
                 
                 # Generate Flow payment link
                 try:
-                    from services.flow_service import crear_orden_flow
+                    from services.flow_service import crear_orden_flow_async
                     from database import SessionLocal
                     from models import FlowPedido
                     
@@ -121,7 +121,7 @@ async def create_real_order(customer_phone: str, product_name: str, quantity: in
                         # Create FlowPedido entry
                         flow_pedido = FlowPedido(
                             telefono=customer_phone,
-                            client_id=client_info.get("client_id", ""),
+                            tenant_id=client_info.get("client_id", ""),
                             total=total,
                             estado="pendiente_pago"
                         )
@@ -130,12 +130,12 @@ async def create_real_order(customer_phone: str, product_name: str, quantity: in
                         flow_pedido_id = flow_pedido.id
                         sync_db.commit()
                         
-                        payment_link = crear_orden_flow(
+                        payment_link = await crear_orden_flow_async(
                             order_id=str(flow_pedido_id),
                             monto=int(total),
                             descripcion=f"{product_name} x{quantity}",
-                            client_id=client_info.get("client_id", ""),
-                            db=sync_db
+                            db=sync_db,
+                            tenant_id=client_info.get("client_id", "") or None
                         )
                     finally:
                         sync_db.close()
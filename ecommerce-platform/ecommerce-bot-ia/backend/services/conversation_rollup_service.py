@@ -0,0 +1,510 @@
+"""
+Rollups incrementales de conversation_history para /ai-analytics
+Un job en background pliega las filas nuevas en agregados por tenant y día:
+
+- conversation_intent_daily: por intención -> conteos, histograma de latencia,
+  marcadores de éxito/conversión/confusión, productos y usuarios distintos (HyperLogLog)
+- conversation_user_daily: por usuario -> mensajes, intentos de compra y productos
+- analytics_watermarks: último id procesado; cada corrida solo lee id > watermark
+- Un solo worker por corrida (pg_try_advisory_xact_lock); agregados y watermark
+  se escriben en la misma transacción
+Tablas: ai_analytics_rollups.sql
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from database import SessionLocal, SQLALCHEMY_DATABASE_URL
+from services.hyperloglog import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_ROLLUP_INTERVAL_SECONDS = int(os.getenv("ANALYTICS_ROLLUP_INTERVAL_SECONDS", "60"))
+ANALYTICS_ROLLUP_BATCH_SIZE = int(os.getenv("ANALYTICS_ROLLUP_BATCH_SIZE", "5000"))
+ANALYTICS_ROLLUP_MAX_BATCHES = int(os.getenv("ANALYTICS_ROLLUP_MAX_BATCHES", "20"))
+# Filas más nuevas que esto se dejan para la próxima corrida (ids SERIAL pueden confirmarse desordenados)
+ANALYTICS_ROLLUP_SAFETY_SECONDS = int(os.getenv("ANALYTICS_ROLLUP_SAFETY_SECONDS", "10"))
+
+ROLLUP_JOB_NAME = "conversation_history"
+# Clave arbitraria del advisory lock del job
+ROLLUP_LOCK_KEY = 74_210_010
+
+# Límites superiores (ms) de los buckets del histograma; el último bucket es "más de 16 s"
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000)
+PURCHASE_INTENT = "intencion_compra"
+NO_INTENT = ""
+MAX_PRODUCTS_PER_INTENT = 50
+
+_SUCCESS_MARKERS = ("✅", "🎉")
+_CONVERSION_MARKER = "🎉"
+_CONFUSION_MARKERS = ("lo siento", "no entiendo")
+
+
+def latency_bucket(duration_ms: int) -> int:
+    for index, limit in enumerate(LATENCY_BUCKETS_MS):
+        if duration_ms <= limit:
+            return index
+    return len(LATENCY_BUCKETS_MS)
+
+
+def histogram_percentile(histogram: List[int], percentile: float) -> Optional[int]:
+    """Percentil aproximado: límite superior del bucket que lo contiene"""
+    total = sum(histogram)
+    if not total:
+        return None
+    target = total * percentile
+    running = 0
+    for index, count in enumerate(histogram):
+        running += count
+        if running >= target:
+            return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else LATENCY_BUCKETS_MS[-1] * 2
+    return LATENCY_BUCKETS_MS[-1] * 2
+
+
+def _empty_histogram() -> List[int]:
+    return [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+@dataclass
+class IntentDayAggregate:
+    """Fila de conversation_intent_daily en memoria"""
+    mensajes: int = 0
+    mensajes_con_duracion: int = 0
+    duracion_total_ms: int = 0
+    latencia_histograma: List[int] = field(default_factory=_empty_histogram)
+    respuestas_exitosas: int = 0
+    conversiones: int = 0
+    respuestas_confusas: int = 0
+    productos: Dict[str, int] = field(default_factory=dict)
+    usuarios: HyperLogLog = field(default_factory=HyperLogLog)
+
+    def add_row(self, row: Dict[str, Any]) -> None:
+        self.mensajes += 1
+        duration = row.get("duracion_respuesta_ms")
+        if duration is not None:
+            self.mensajes_con_duracion += 1
+            self.duracion_total_ms += int(duration)
+            self.latencia_histograma[latency_bucket(int(duration))] += 1
+        respuesta = row.get("respuesta_bot") or ""
+        if any(marker in respuesta for marker in _SUCCESS_MARKERS):
+            self.respuestas_exitosas += 1
+        if _CONVERSION_MARKER in respuesta:
+            self.conversiones += 1
+        if any(marker in respuesta.lower() for marker in _CONFUSION_MARKERS):
+            self.respuestas_confusas += 1
+        producto = row.get("producto")
+        if producto:
+            self.productos[producto] = self.productos.get(producto, 0) + 1
+        if row.get("telefono"):
+            self.usuarios.add(row["telefono"])
+
+    def merge(self, other: "IntentDayAggregate") -> "IntentDayAggregate":
+        self.mensajes += other.mensajes
+        self.mensajes_con_duracion += other.mensajes_con_duracion
+        self.duracion_total_ms += other.duracion_total_ms
+        self.latencia_histograma = [a + b for a, b in zip(self.latencia_histograma, other.latencia_histograma)]
+        self.respuestas_exitosas += other.respuestas_exitosas
+        self.conversiones += other.conversiones
+        self.respuestas_confusas += other.respuestas_confusas
+        for producto, count in other.productos.items():
+            self.productos[producto] = self.productos.get(producto, 0) + count
+        if len(self.productos) > MAX_PRODUCTS_PER_INTENT:
+            top = sorted(self.productos.items(), key=lambda item: item[1], reverse=True)
+            self.productos = dict(top[:MAX_PRODUCTS_PER_INTENT])
+        self.usuarios.merge(other.usuarios)
+        return self
+
+    @classmethod
+    def from_row(cls, row: Any) -> "IntentDayAggregate":
+        histogram = list(row.latencia_histograma or [])
+        histogram += [0] * (len(LATENCY_BUCKETS_MS) + 1 - len(histogram))
+        productos = row.productos or {}
+        if isinstance(productos, str):
+            productos = json.loads(productos)
+        return cls(
+            mensajes=row.mensajes or 0,
+            mensajes_con_duracion=row.mensajes_con_duracion or 0,
+            duracion_total_ms=row.duracion_total_ms or 0,
+            latencia_histograma=histogram,
+            respuestas_exitosas=row.respuestas_exitosas or 0,
+            conversiones=row.conversiones or 0,
+            respuestas_confusas=row.respuestas_confusas or 0,
+            productos=dict(productos),
+            usuarios=HyperLogLog.from_bytes(row.usuarios_hll),
+        )
+
+
+@dataclass
+class UserDayAggregate:
+    """Fila de conversation_user_daily en memoria"""
+    mensajes: int = 0
+    intentos_compra: int = 0
+    productos: set = field(default_factory=set)
+    primera_interaccion: Optional[datetime] = None
+    ultima_interaccion: Optional[datetime] = None
+
+    def add_row(self, row: Dict[str, Any]) -> None:
+        self.mensajes += 1
+        if row.get("intencion_detectada") == PURCHASE_INTENT:
+            self.intentos_compra += 1
+        if row.get("producto"):
+            self.productos.add(row["producto"])
+        timestamp = row.get("timestamp_mensaje")
+        if timestamp is not None:
+            if self.primera_interaccion is None or timestamp < self.primera_interaccion:
+                self.primera_interaccion = timestamp
+            if self.ultima_interaccion is None or timestamp > self.ultima_interaccion:
+                self.ultima_interaccion = timestamp
+
+
+IntentKey = Tuple[str, date, str]
+UserKey = Tuple[str, date, str]
+
+
+def fold_rows(rows: Iterable[Dict[str, Any]]) -> Tuple[Dict[IntentKey, IntentDayAggregate], Dict[UserKey, UserDayAggregate]]:
+    """Pliega filas de conversation_history en agregados por (tenant, día, intención) y (tenant, día, usuario)"""
+    intents: Dict[IntentKey, IntentDayAggregate] = {}
+    users: Dict[UserKey, UserDayAggregate] = {}
+    for row in rows:
+        timestamp = row.get("timestamp_mensaje")
+        if timestamp is None:
+            continue
+        day = timestamp.date()
+        tenant_id = row["tenant_id"]
+        intent_key = (tenant_id, day, row.get("intencion_detectada") or NO_INTENT)
+        intents.setdefault(intent_key, IntentDayAggregate()).add_row(row)
+        if row.get("telefono"):
+            users.setdefault((tenant_id, day, row["telefono"]), UserDayAggregate()).add_row(row)
+    return intents, users
+
+
+# ==================== PERSISTENCIA ====================
+
+_FETCH_ROWS = text("""
+    SELECT id, tenant_id, telefono, intencion_detectada, respuesta_bot,
+           productos_mencionados[1] AS producto, timestamp_mensaje,
+           duracion_respuesta_ms,
+           COALESCE(created_at, timestamp_mensaje) > NOW() - make_interval(secs => :safety_seconds) AS reciente
+    FROM conversation_history
+    WHERE id > :last_id
+    ORDER BY id
+    LIMIT :batch_size
+""")
+
+_UPSERT_INTENT = text("""
+    INSERT INTO conversation_intent_daily
+        (tenant_id, dia, intencion, mensajes, mensajes_con_duracion, duracion_total_ms,
+         latencia_histograma, respuestas_exitosas, conversiones, respuestas_confusas,
+         productos, usuarios_hll, updated_at)
+    VALUES
+        (:tenant_id, :dia, :intencion, :mensajes, :mensajes_con_duracion, :duracion_total_ms,
+         :latencia_histograma, :respuestas_exitosas, :conversiones, :respuestas_confusas,
+         CAST(:productos AS JSONB), :usuarios_hll, NOW())
+    ON CONFLICT (tenant_id, dia, intencion) DO UPDATE SET
+        mensajes = EXCLUDED.mensajes,
+        mensajes_con_duracion = EXCLUDED.mensajes_con_duracion,
+        duracion_total_ms = EXCLUDED.duracion_total_ms,
+        latencia_histograma = EXCLUDED.latencia_histograma,
+        respuestas_exitosas = EXCLUDED.respuestas_exitosas,
+        conversiones = EXCLUDED.conversiones,
+        respuestas_confusas = EXCLUDED.respuestas_confusas,
+        productos = EXCLUDED.productos,
+        usuarios_hll = EXCLUDED.usuarios_hll,
+        updated_at = NOW()
+""")
+
+# Los agregados por usuario son aditivos: se suman directamente en SQL
+_UPSERT_USER = text("""
+    INSERT INTO conversation_user_daily
+        (tenant_id, dia, telefono, mensajes, intentos_compra, productos,
+         primera_interaccion, ultima_interaccion)
+    VALUES
+        (:tenant_id, :dia, :telefono, :mensajes, :intentos_compra, :productos,
+         :primera_interaccion, :ultima_interaccion)
+    ON CONFLICT (tenant_id, dia, telefono) DO UPDATE SET
+        mensajes = conversation_user_daily.mensajes + EXCLUDED.mensajes,
+        intentos_compra = conversation_user_daily.intentos_compra + EXCLUDED.intentos_compra,
+        productos = ARRAY(SELECT DISTINCT unnest(conversation_user_daily.productos || EXCLUDED.productos)),
+        primera_interaccion = LEAST(conversation_user_daily.primera_interaccion, EXCLUDED.primera_interaccion),
+        ultima_interaccion = GREATEST(conversation_user_daily.ultima_interaccion, EXCLUDED.ultima_interaccion)
+""")
+
+
+def _cut_at_safety_window(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Corta en la primera fila demasiado reciente para no saltar ids de transacciones aún abiertas"""
+    for index, row in enumerate(rows):
+        if row.get("reciente"):
+            return rows[:index]
+    return rows
+
+
+def _load_existing_intents(db, keys: List[IntentKey]) -> Dict[IntentKey, IntentDayAggregate]:
+    existing: Dict[IntentKey, IntentDayAggregate] = {}
+    by_tenant_day: Dict[Tuple[str, date], List[str]] = {}
+    for tenant_id, day, intencion in keys:
+        by_tenant_day.setdefault((tenant_id, day), []).append(intencion)
+    for (tenant_id, day), intenciones in by_tenant_day.items():
+        result = db.execute(text("""
+            SELECT * FROM conversation_intent_daily
+            WHERE tenant_id = :tenant_id AND dia = :dia AND intencion = ANY(:intenciones)
+            FOR UPDATE
+        """), {"tenant_id": tenant_id, "dia": day, "intenciones": intenciones})
+        for row in result:
+            existing[(tenant_id, day, row.intencion)] = IntentDayAggregate.from_row(row)
+    return existing
+
+
+def _process_batch(db, last_id: int) -> Tuple[int, int]:
+    """Procesa un lote sobre el watermark; devuelve (filas procesadas, nuevo watermark)"""
+    result = db.execute(_FETCH_ROWS, {
+        "last_id": last_id,
+        "batch_size": ANALYTICS_ROLLUP_BATCH_SIZE,
+        "safety_seconds": ANALYTICS_ROLLUP_SAFETY_SECONDS,
+    })
+    rows = _cut_at_safety_window([dict(row._mapping) for row in result])
+    if not rows:
+        return 0, last_id
+
+    intents, users = fold_rows(rows)
+    existing = _load_existing_intents(db, list(intents))
+    for key, aggregate in intents.items():
+        if key in existing:
+            aggregate = existing[key].merge(aggregate)
+        tenant_id, day, intencion = key
+        db.execute(_UPSERT_INTENT, {
+            "tenant_id": tenant_id,
+            "dia": day,
+            "intencion": intencion,
+            "mensajes": aggregate.mensajes,
+            "mensajes_con_duracion": aggregate.mensajes_con_duracion,
+            "duracion_total_ms": aggregate.duracion_total_ms,
+            "latencia_histograma": aggregate.latencia_histograma,
+            "respuestas_exitosas": aggregate.respuestas_exitosas,
+            "conversiones": aggregate.conversiones,
+            "respuestas_confusas": aggregate.respuestas_confusas,
+            "productos": json.dumps(aggregate.productos, ensure_ascii=False),
+            "usuarios_hll": aggregate.usuarios.to_bytes(),
+        })
+    for (tenant_id, day, telefono), aggregate in users.items():
+        db.execute(_UPSERT_USER, {
+            "tenant_id": tenant_id,
+            "dia": day,
+            "telefono": telefono,
+            "mensajes": aggregate.mensajes,
+            "intentos_compra": aggregate.intentos_compra,
+            "productos": sorted(aggregate.productos),
+            "primera_interaccion": aggregate.primera_interaccion,
+            "ultima_interaccion": aggregate.ultima_interaccion,
+        })
+    return len(rows), rows[-1]["id"]
+
+
+class ConversationRollupJob:
+    """Job incremental con watermark; seguro de correr en varios workers a la vez"""
+
+    def __init__(self):
+        self._stats: Dict[str, Any] = {
+            "runs": 0,
+            "skipped_locked": 0,
+            "rows_processed": 0,
+            "errors": 0,
+            "last_run_at": None,
+            "last_run_ms": None,
+            "last_run_rows": 0,
+            "watermark": None,
+        }
+
+    def run_once(self, db) -> int:
+        """Procesa hasta ANALYTICS_ROLLUP_MAX_BATCHES lotes; cada lote es una transacción"""
+        started = time.perf_counter()
+        processed = 0
+        for _ in range(ANALYTICS_ROLLUP_MAX_BATCHES):
+            locked = db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK_KEY}).scalar()
+            if not locked:
+                db.rollback()
+                self._stats["skipped_locked"] += 1
+                break
+            db.execute(text("""
+                INSERT INTO analytics_watermarks (job, last_id) VALUES (:job, 0)
+                ON CONFLICT (job) DO NOTHING
+            """), {"job": ROLLUP_JOB_NAME})
+            last_id = db.execute(text(
+                "SELECT last_id FROM analytics_watermarks WHERE job = :job FOR UPDATE"
+            ), {"job": ROLLUP_JOB_NAME}).scalar() or 0
+
+            count, new_last_id = _process_batch(db, last_id)
+            if count:
+                db.execute(text("""
+                    UPDATE analytics_watermarks
+                    SET last_id = :last_id, filas_procesadas = filas_procesadas + :count, updated_at = NOW()
+                    WHERE job = :job
+                """), {"job": ROLLUP_JOB_NAME, "last_id": new_last_id, "count": count})
+            db.commit()
+            processed += count
+            self._stats["watermark"] = new_last_id
+            if count < ANALYTICS_ROLLUP_BATCH_SIZE:
+                break
+
+        self._stats["runs"] += 1
+        self._stats["rows_processed"] += processed
+        self._stats["last_run_rows"] = processed
+        self._stats["last_run_at"] = datetime.utcnow().isoformat()
+        self._stats["last_run_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return processed
+
+    def run_with_new_session(self) -> int:
+        db = SessionLocal()
+        try:
+            return self.run_once(db)
+        except Exception:
+            db.rollback()
+            self._stats["errors"] += 1
+            raise
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+
+# Job global del proceso
+conversation_rollup_job = ConversationRollupJob()
+
+
+async def conversation_rollup_loop():
+    """Loop principal: corre el job fuera del event loop cada ANALYTICS_ROLLUP_INTERVAL_SECONDS"""
+    logger.info("Starting conversation analytics rollup service...")
+
+    while True:
+        try:
+            processed = await asyncio.to_thread(conversation_rollup_job.run_with_new_session)
+            if processed:
+                logger.info(f"Conversation rollup folded {processed} new rows")
+            await asyncio.sleep(ANALYTICS_ROLLUP_INTERVAL_SECONDS)
+        except Exception as e:
+            logger.error(f"Error in conversation rollup loop: {str(e)}")
+            await asyncio.sleep(ANALYTICS_ROLLUP_INTERVAL_SECONDS * 5)
+
+
+def start_conversation_rollup_service():
+    """Inicia el job de rollups en background (solo Postgres)"""
+    if os.getenv("ENABLE_ANALYTICS_ROLLUP", "true").lower() != "true":
+        logger.info("Conversation rollup service disabled by configuration")
+        return
+    if not SQLALCHEMY_DATABASE_URL.startswith("postgres"):
+        logger.info("Conversation rollup service requires Postgres; not started")
+        return
+    asyncio.create_task(conversation_rollup_loop())
+    logger.info("Conversation rollup service started")
+
+
+def get_conversation_rollup_stats() -> Dict[str, Any]:
+    return conversation_rollup_job.get_stats()
+
+
+# ==================== LECTURAS PARA /ai-analytics ====================
+
+def read_conversation_stats(db, tenant_id: str, days_back: int) -> Dict[str, Any]:
+    result = db.execute(text("""
+        SELECT intencion, mensajes, mensajes_con_duracion, duracion_total_ms, latencia_histograma,
+               respuestas_exitosas, conversiones, respuestas_confusas, productos, usuarios_hll
+        FROM conversation_intent_daily
+        WHERE tenant_id = :tenant_id AND dia >= CURRENT_DATE - :days_back
+    """), {"tenant_id": tenant_id, "days_back": days_back})
+
+    total = IntentDayAggregate()
+    intentos_compra = 0
+    for row in result:
+        total.merge(IntentDayAggregate.from_row(row))
+        if row.intencion == PURCHASE_INTENT:
+            intentos_compra += row.mensajes or 0
+
+    promedio = total.duracion_total_ms / total.mensajes_con_duracion if total.mensajes_con_duracion else 0
+    return {
+        "total_conversaciones": total.mensajes,
+        "usuarios_unicos": total.usuarios.count() if total.mensajes else 0,
+        "tiempo_promedio_respuesta": round(promedio),
+        "latencia_p50_ms": histogram_percentile(total.latencia_histograma, 0.5),
+        "latencia_p95_ms": histogram_percentile(total.latencia_histograma, 0.95),
+        "intentos_compra": intentos_compra,
+        "conversiones_exitosas": total.conversiones,
+        "conversion_rate": round(total.conversiones / intentos_compra * 100, 2) if intentos_compra else 0,
+    }
+
+
+def read_intent_analysis(db, tenant_id: str, days_back: int, top_products: int = 10) -> List[Dict[str, Any]]:
+    result = db.execute(text("""
+        SELECT intencion, mensajes, mensajes_con_duracion, duracion_total_ms, latencia_histograma,
+               respuestas_exitosas, conversiones, respuestas_confusas, productos, usuarios_hll
+        FROM conversation_intent_daily
+        WHERE tenant_id = :tenant_id AND dia >= CURRENT_DATE - :days_back AND intencion <> ''
+    """), {"tenant_id": tenant_id, "days_back": days_back})
+
+    por_intencion: Dict[str, IntentDayAggregate] = {}
+    for row in result:
+        aggregate = IntentDayAggregate.from_row(row)
+        if row.intencion in por_intencion:
+            por_intencion[row.intencion].merge(aggregate)
+        else:
+            por_intencion[row.intencion] = aggregate
+
+    intenciones = []
+    for intencion, aggregate in sorted(por_intencion.items(), key=lambda item: item[1].mensajes, reverse=True):
+        promedio = aggregate.duracion_total_ms / aggregate.mensajes_con_duracion if aggregate.mensajes_con_duracion else 0
+        productos = sorted(aggregate.productos.items(), key=lambda item: item[1], reverse=True)[:top_products]
+        intenciones.append({
+            "intencion": intencion,
+            "frecuencia": aggregate.mensajes,
+            "usuarios_unicos": aggregate.usuarios.count(),
+            "tiempo_promedio_ms": round(promedio),
+            "latencia_p95_ms": histogram_percentile(aggregate.latencia_histograma, 0.95),
+            "efectividad": round(aggregate.respuestas_exitosas / aggregate.mensajes * 100, 2) if aggregate.mensajes else 0,
+            "productos_frecuentes": [producto for producto, _ in productos],
+        })
+    return intenciones
+
+
+def read_user_behavior(db, tenant_id: str, days_back: int) -> List[Dict[str, Any]]:
+    """Misma segmentación que antes, pero sobre filas usuario-día en vez de mensajes"""
+    result = db.execute(text("""
+        WITH user_stats AS (
+            SELECT
+                telefono,
+                SUM(mensajes) as total_mensajes,
+                COUNT(*) as dias_activos,
+                SUM(intentos_compra) as intentos_compra
+            FROM conversation_user_daily
+            WHERE tenant_id = :tenant_id AND dia >= CURRENT_DATE - :days_back
+            GROUP BY telefono
+        )
+        SELECT
+            CASE
+                WHEN total_mensajes >= 10 THEN 'usuario_frecuente'
+                WHEN intentos_compra > 0 THEN 'comprador_potencial'
+                WHEN total_mensajes >= 3 THEN 'explorador'
+                ELSE 'nuevo_usuario'
+            END as tipo_usuario,
+            COUNT(*) as cantidad_usuarios,
+            AVG(total_mensajes) as promedio_mensajes,
+            AVG(dias_activos) as promedio_dias_activos
+        FROM user_stats
+        GROUP BY tipo_usuario
+        ORDER BY cantidad_usuarios DESC
+    """), {"tenant_id": tenant_id, "days_back": days_back})
+
+    return [
+        {
+            "tipo_usuario": row.tipo_usuario,
+            "cantidad_usuarios": row.cantidad_usuarios,
+            "promedio_mensajes": round(float(row.promedio_mensajes), 1),
+            "promedio_dias_activos": round(float(row.promedio_dias_activos), 1),
+        }
+        for row in result
+    ]
@@ -0,0 +1,282 @@
+"""
+Fábrica de engines SQLAlchemy con pool configurable y métricas
+Usado por database.py del backend y del bot (mismo módulo en ambos procesos):
+
+- Pool por variables de entorno: DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+  DB_POOL_PRE_PING, DB_POOL_RECYCLE (solo Postgres; SQLite usa el pool por defecto)
+- statement_timeout de Postgres en cada conexión (DB_STATEMENT_TIMEOUT_MS)
+- Cache de prepared statements de asyncpg (DB_ASYNCPG_STATEMENT_CACHE_SIZE; 0 con pgbouncer)
+- Métricas por engine: conexiones en uso, overflow, checkouts, espera por conexión y timeouts
+- Detector de fugas: conexiones no devueltas al pool en DB_SESSION_LEAK_SECONDS,
+  con el origen (módulo:línea) de quien la pidió
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# 0 = sin límite
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_ASYNCPG_STATEMENT_CACHE_SIZE = int(os.getenv("DB_ASYNCPG_STATEMENT_CACHE_SIZE", "500"))
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+# 0 = detector de fugas desactivado
+DB_SESSION_LEAK_SECONDS = float(os.getenv("DB_SESSION_LEAK_SECONDS", "60"))
+DB_LEAK_CHECK_INTERVAL_SECONDS = float(os.getenv("DB_LEAK_CHECK_INTERVAL_SECONDS", "30"))
+
+# Frames que no son "quien pidió la conexión"
+_INTERNAL_MODULES = ("sqlalchemy", "asyncio", "concurrent", "threading", "contextlib", "greenlet", __name__)
+
+
+def _caller_origin() -> str:
+    """Primer frame fuera de SQLAlchemy/asyncio: dónde se abrió la sesión que tomó la conexión"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith(_INTERNAL_MODULES):
+            return f"{module}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+class PoolMetrics:
+    """Contadores de un pool + conexiones actualmente prestadas (para detectar fugas)"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.pool = None
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.leaks_reported = 0
+        # id(connection_record) -> (momento del checkout, origen, ya reportada)
+        self._checked_out: Dict[int, Tuple[float, str, bool]] = {}
+
+    def record_wait(self, seconds: float) -> None:
+        self.wait_count += 1
+        self.wait_total += seconds
+        if seconds > self.wait_max:
+            self.wait_max = seconds
+
+    def attach(self, sync_engine) -> None:
+        """Registra los eventos del pool; se mantienen aunque el pool se recree (dispose)"""
+        self.pool = sync_engine.pool
+
+        @event.listens_for(sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            self.connects += 1
+
+        @event.listens_for(sync_engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            self.checkouts += 1
+            if DB_SESSION_LEAK_SECONDS > 0:
+                self._checked_out[id(connection_record)] = (time.monotonic(), _caller_origin(), False)
+
+        @event.listens_for(sync_engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            self._checked_out.pop(id(connection_record), None)
+
+        @event.listens_for(sync_engine, "invalidate")
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            self.invalidations += 1
+
+    def find_leaks(self, older_than: float = DB_SESSION_LEAK_SECONDS) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {"origin": origin, "held_seconds": round(now - since, 1)}
+            for since, origin, _ in list(self._checked_out.values())
+            if now - since >= older_than
+        ]
+
+    def report_leaks(self) -> int:
+        """Loguea una vez cada conexión retenida más de DB_SESSION_LEAK_SECONDS"""
+        now = time.monotonic()
+        reported = 0
+        for key, (since, origin, already) in list(self._checked_out.items()):
+            if already or now - since < DB_SESSION_LEAK_SECONDS:
+                continue
+            self._checked_out[key] = (since, origin, True)
+            reported += 1
+            logger.warning(
+                f"🚰 [{self.label}] connection checked out for {now - since:.0f}s without being returned "
+                f"(opened at {origin})"
+            )
+        self.leaks_reported += reported
+        return reported
+
+    def get_stats(self) -> Dict[str, Any]:
+        pool = self.pool
+        stats: Dict[str, Any] = {"pool_class": type(pool).__name__ if pool is not None else None}
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": DB_MAX_OVERFLOW,
+            })
+        else:
+            stats["checked_out"] = len(self._checked_out)
+        stats.update({
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            "leaks_reported": self.leaks_reported,
+            "leaks_open": self.find_leaks() if DB_SESSION_LEAK_SECONDS > 0 else [],
+        })
+        return stats
+
+
+class _TimedPoolMixin:
+    """Mide cuánto espera cada checkout por una conexión (incluye abrir conexiones nuevas)"""
+    _metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            if self._metrics is not None:
+                self._metrics.timeouts += 1
+            raise
+        finally:
+            if self._metrics is not None:
+                self._metrics.record_wait(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool._metrics = self._metrics
+        if self._metrics is not None:
+            self._metrics.pool = pool
+        return pool
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# Métricas por engine del proceso ("sync", "async")
+_pool_metrics: Dict[str, PoolMetrics] = {}
+
+
+def _pool_kwargs(url: str, poolclass) -> Dict[str, Any]:
+    if "sqlite" in url:
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
+def _register(label: str, sync_engine) -> None:
+    metrics = PoolMetrics(label)
+    metrics.attach(sync_engine)
+    if isinstance(sync_engine.pool, _TimedPoolMixin):
+        sync_engine.pool._metrics = metrics
+    _pool_metrics[label] = metrics
+
+
+def create_pooled_engine(url: str, label: str = "sync"):
+    """Engine sync (psycopg2/sqlite) con pool y statement_timeout configurados por entorno"""
+    connect_args: Dict[str, Any] = {}
+    if "sqlite" in url:
+        connect_args["check_same_thread"] = False
+    elif url.startswith("postgres") and DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    engine = create_engine(url, connect_args=connect_args, echo=DB_ECHO, **_pool_kwargs(url, TimedQueuePool))
+    _register(label, engine)
+    return engine
+
+
+def create_pooled_async_engine(url: str, label: str = "async"):
+    """Engine async (asyncpg/aiosqlite); con asyncpg activa el cache de prepared statements"""
+    connect_args: Dict[str, Any] = {}
+    if "sqlite" in url:
+        connect_args["check_same_thread"] = False
+    elif "+asyncpg" in url:
+        url = str(make_url(url).update_query_dict({
+            "prepared_statement_cache_size": str(DB_ASYNCPG_STATEMENT_CACHE_SIZE)
+        }))
+        if DB_ASYNCPG_STATEMENT_CACHE_SIZE == 0:
+            # pgbouncer en modo transacción: sin statements preparados del lado de asyncpg tampoco
+            connect_args["statement_cache_size"] = 0
+        if DB_STATEMENT_TIMEOUT_MS > 0:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+
+    engine = create_async_engine(
+        url, connect_args=connect_args, echo=DB_ECHO, **_pool_kwargs(url, TimedAsyncAdaptedQueuePool)
+    )
+    _register(label, engine.sync_engine)
+    return engine
+
+
+def exempt_from_leak_detection(connection) -> None:
+    """Conexión retenida a propósito (p. ej. la que mantiene un advisory lock): no es una fuga"""
+    record = connection.connection._connection_record
+    for metrics in _pool_metrics.values():
+        metrics._checked_out.pop(id(record), None)
+
+
+def get_db_pool_stats() -> Dict[str, Any]:
+    return {
+        "config": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+            "asyncpg_statement_cache_size": DB_ASYNCPG_STATEMENT_CACHE_SIZE,
+            "leak_seconds": DB_SESSION_LEAK_SECONDS,
+        },
+        "engines": {label: metrics.get_stats() for label, metrics in _pool_metrics.items()},
+    }
+
+
+async def leak_monitor_loop():
+    """Revisa periódicamente conexiones retenidas más de DB_SESSION_LEAK_SECONDS"""
+    logger.info("Starting DB connection leak monitor...")
+    while True:
+        await asyncio.sleep(DB_LEAK_CHECK_INTERVAL_SECONDS)
+        for metrics in list(_pool_metrics.values()):
+            try:
+                metrics.report_leaks()
+            except Exception as e:
+                logger.error(f"Error checking connection leaks: {e}")
+
+
+def start_leak_monitor():
+    """Inicia el detector de fugas en background (DB_SESSION_LEAK_SECONDS=0 lo desactiva)"""
+    if DB_SESSION_LEAK_SECONDS <= 0:
+        logger.info("DB connection leak monitor disabled by configuration")
+        return
+    asyncio.create_task(leak_monitor_loop())
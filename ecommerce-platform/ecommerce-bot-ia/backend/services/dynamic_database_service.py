@@ -3,20 +3,20 @@
 Permite al bot ejecutar queries SQL configurables de manera segura
 """
 import logging
-import time
 import re
 from typing import Dict, List, Any, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from database import SessionLocal
 from prompt_schemas import DatabaseQuery, DatabaseQueries
+from services.cache import cache_manager
 import hashlib
 import json
 
 logger = logging.getLogger(__name__)
 
-# Cache simple en memoria para queries frecuentes
-_query_cache: Dict[str, Dict[str, Any]] = {}
+# Cache acotado para queries frecuentes (TTL por query, claves namespaced por tenant)
+_query_cache = cache_manager.namespace("db_queries", ttl=300, max_entries=2000)
 
 class DynamicDatabaseService:
     """
@@ -32,12 +32,6 @@ class DynamicDatabaseService:
     
     def __init__(self, tenant_id: str):
         self.tenant_id = tenant_id
-        self.db = SessionLocal()
-    
-    def __del__(self):
-        """Cleanup database connection"""
-        if hasattr(self, 'db') and self.db:
-            self.db.close()
     
     def execute_query(
         self,
@@ -63,22 +57,24 @@ class DynamicDatabaseService:
             # Preparar parámetros
             safe_params = self._prepare_parameters(query_config, parameters or {})
             
-            # Verificar cache
-            cache_key = self._generate_cache_key(query_config, safe_params)
-            cached_result = self._get_cached_result(cache_key, query_config.cache_ttl_seconds)
-            if cached_result is not None:
-                logger.info(f"Cache hit para query {query_config.name}")
-                return cached_result
-            
-            # Validar SQL por seguridad
-            safe_sql = self._validate_and_prepare_sql(query_config.sql_template, safe_params)
-            
-            # Ejecutar query
-            logger.info(f"Ejecutando query {query_config.name} para tenant {self.tenant_id}")
-            results = self._execute_safe_sql(safe_sql, safe_params, query_config.max_results)
+            def run_query() -> List[Dict[str, Any]]:
+                # Validar SQL por seguridad
+                safe_sql = self._validate_and_prepare_sql(query_config.sql_template, safe_params)
+                
+                # Ejecutar query
+                logger.info(f"Ejecutando query {query_config.name} para tenant {self.tenant_id}")
+                return self._execute_safe_sql(safe_sql, safe_params, query_config.max_results)
             
-            # Cachear resultado
-            self._cache_result(cache_key, results, query_config.cache_ttl_seconds)
+            # Solo cachear si TTL > 0; llamadas concurrentes con la misma clave ejecutan una sola query
+            if query_config.cache_ttl_seconds > 0:
+                cache_key = self._generate_cache_key(query_config, safe_params)
+                results = _query_cache.get_or_load(
+                    cache_key, run_query,
+                    ttl=query_config.cache_ttl_seconds,
+                    tenant_id=self.tenant_id
+                )
+            else:
+                results = run_query()
             
             logger.info(f"Query {query_config.name} retornó {len(results)} resultados")
             return results
@@ -193,12 +189,14 @@ class DynamicDatabaseService:
             for param_name, param_value in parameters.items():
                 sql_params[f"param_{param_name}"] = param_value
             
-            # Ejecutar query con límite
-            result = self.db.execute(text(sql), sql_params)
-            
-            # Convertir resultados a diccionarios
-            columns = result.keys()
-            rows = result.fetchmany(max_results)
+            # Sesión solo durante la query: la conexión vuelve al pool al salir
+            # (antes quedaba retenida hasta que el GC llamara a __del__)
+            with SessionLocal() as db:
+                result = db.execute(text(sql), sql_params)
+                
+                # Convertir resultados a diccionarios
+                columns = result.keys()
+                rows = result.fetchmany(max_results)
             
             return [dict(zip(columns, row)) for row in rows]
             
@@ -217,39 +215,21 @@ class DynamicDatabaseService:
         cache_string = json.dumps(cache_data, sort_keys=True)
         return hashlib.md5(cache_string.encode()).hexdigest()
     
-    def _get_cached_result(self, cache_key: str, ttl_seconds: int) -> Optional[List[Dict[str, Any]]]:
-        """Obtiene resultado del cache si no ha expirado"""
-        if cache_key not in _query_cache:
-            return None
-        
-        cache_entry = _query_cache[cache_key]
-        if time.time() - cache_entry["timestamp"] > ttl_seconds:
-            # Cache expirado
-            del _query_cache[cache_key]
-            return None
-        
-        return cache_entry["data"]
-    
-    def _cache_result(self, cache_key: str, data: List[Dict[str, Any]], ttl_seconds: int):
-        """Guarda resultado en cache"""
-        if ttl_seconds > 0:  # Solo cachear si TTL > 0
-            _query_cache[cache_key] = {
-                "data": data,
-                "timestamp": time.time()
-            }
-    
     @staticmethod
-    def clear_cache():
-        """Limpia todo el cache (útil para testing)"""
-        global _query_cache
-        _query_cache.clear()
+    def clear_cache(tenant_id: Optional[str] = None):
+        """Limpia el cache completo o solo el de un tenant (útil para testing)"""
+        if tenant_id:
+            _query_cache.invalidate_tenant(tenant_id)
+        else:
+            _query_cache.clear()
     
     @staticmethod
     def get_cache_stats() -> Dict[str, Any]:
         """Obtiene estadísticas del cache"""
         return {
-            "total_entries": len(_query_cache),
-            "cache_keys": list(_query_cache.keys())
+            **_query_cache.get_stats(),
+            "total_entries": len(_query_cache.keys()),
+            "cache_keys": _query_cache.keys()
         }
 
 
@@ -85,6 +85,10 @@ def guardar_sesion(db: Session, sesion, estado: str = None, datos: dict = None,
         sesion.timeout_warning_sent = False  # Reset warning cuando hay nuevo mensaje
     sesion.updated_at = datetime.utcnow()
     db.commit()
+    if update_last_message:
+        # Reprograma los timeouts de la sesión en el scheduler (sin escanear la tabla)
+        from services.timeout_service import note_session_activity
+        note_session_activity(sesion.id, sesion.last_message_at)
 
 def check_conversation_timeout(db: Session, sesion) -> str:
     """
@@ -0,0 +1,236 @@
+"""
+Cliente async de la API de Flow (pagos) sobre el pool HTTP compartido
+Reemplaza requests.post/get bloqueantes y sin timeout de services/flow_service.py:
+
+- httpx.AsyncClient del registro http_clients (proveedor "flow"): keep-alive, timeouts
+  estrictos y reintentos en 429/5xx/errores de conexión (HTTP_POOL_FLOW_*)
+- Credenciales por tenant desde flow_accounts (secret descifrado), cacheadas en memoria
+  del proceso (namespace "flow_accounts"; nunca van a Redis). Sin cuenta => FLOW_API_KEY/FLOW_SECRET_KEY
+- Idempotencia por commerceOrder: el link creado se guarda en "flow_payment_links" (compartido)
+  y las confirmaciones repetidas/concurrentes del mismo pedido reutilizan el token
+- Puente sync (run_sync) para el código bloqueante que corre en threads (procesar_mensaje_flow):
+  la corrutina se ejecuta en el loop principal, donde vive el pool
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from database import SessionLocal
+from services.cache import cache_manager
+from services.http_pool import HttpClientRegistry, http_clients
+
+logger = logging.getLogger(__name__)
+
+FLOW_API_KEY = os.getenv("FLOW_API_KEY", "749C736F-E427-482B-8400-7630D11L7766")
+FLOW_SECRET_KEY = os.getenv("FLOW_SECRET_KEY", "30f3d774a49a886cb28502ddf26864b69b4589be")
+FLOW_BASE_URL = os.getenv("FLOW_BASE_URL", "https://sandbox.flow.cl/api")
+BASE_URL = os.getenv("BASE_URL", "https://webhook.sintestesia.cl")
+
+FLOW_ACCOUNT_CACHE_TTL = float(os.getenv("FLOW_ACCOUNT_CACHE_TTL", "300"))
+FLOW_PAYMENT_LINK_TTL = float(os.getenv("FLOW_PAYMENT_LINK_TTL", "86400"))
+# Espera máxima del código sync por una llamada a Flow (incluye reintentos)
+FLOW_SYNC_TIMEOUT_SECONDS = float(os.getenv("FLOW_SYNC_TIMEOUT_SECONDS", "30"))
+
+# Secretos descifrados: solo memoria local (la invalidación entre procesos va por el bus)
+_accounts = cache_manager.namespace("flow_accounts", ttl=FLOW_ACCOUNT_CACHE_TTL, max_entries=1000)
+_payment_links = cache_manager.namespace("flow_payment_links", ttl=FLOW_PAYMENT_LINK_TTL,
+                                         max_entries=10000, shared=True)
+
+
+class FlowApiError(Exception):
+    """Respuesta no exitosa (o sin token) de la API de Flow"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class FlowCredentials:
+    api_key: str
+    secret_key: str
+    base_url: str
+    webhook_base_url: str
+
+    def payment_url(self, token: str) -> str:
+        """URL de pago según ambiente"""
+        if "sandbox" in self.base_url:
+            return f"https://sandbox.flow.cl/app/web/pay.php?token={token}"
+        return f"https://www.flow.cl/app/web/pay.php?token={token}"
+
+
+@dataclass(frozen=True)
+class FlowPayment:
+    commerce_order: str
+    token: str
+    url: str
+    reused: bool = False
+
+
+def firmar(params: Dict[str, Any], secret_key: str) -> str:
+    """Firma HMAC-SHA256 de Flow: parámetros ordenados por nombre, k=v unidos por &"""
+    cadena = "&".join(f"{key}={params[key]}" for key in sorted(params))
+    return hmac.new(secret_key.encode(), cadena.encode(), hashlib.sha256).hexdigest()
+
+
+def env_credentials() -> FlowCredentials:
+    return FlowCredentials(FLOW_API_KEY, FLOW_SECRET_KEY, FLOW_BASE_URL, BASE_URL)
+
+
+def _load_credentials(tenant_id: str) -> FlowCredentials:
+    """Cuenta Flow activa del tenant (bloqueante: corre en un thread)"""
+    from crypto_utils import decrypt_token
+    from models import FlowAccount
+
+    with SessionLocal() as db:
+        account = db.query(FlowAccount).filter(
+            FlowAccount.tenant_id == tenant_id,
+            FlowAccount.status == "active",
+        ).one_or_none()
+        if account is None:
+            return env_credentials()
+        return FlowCredentials(
+            api_key=account.api_key,
+            secret_key=decrypt_token(account.secret_key_enc),
+            base_url=account.base_url or FLOW_BASE_URL,
+            webhook_base_url=account.webhook_base_url or BASE_URL,
+        )
+
+
+async def get_credentials(tenant_id: Optional[str]) -> FlowCredentials:
+    if not tenant_id:
+        return env_credentials()
+    return await _accounts.aget_or_load(
+        "credentials", lambda: asyncio.to_thread(_load_credentials, tenant_id), tenant_id=tenant_id
+    )
+
+
+def idempotency_key(tenant_id: Optional[str], commerce_order: str) -> str:
+    return hashlib.sha256(f"{tenant_id or ''}:{commerce_order}".encode()).hexdigest()
+
+
+class FlowClient:
+    """Llamadas firmadas a la API de Flow a través de un registro de clientes HTTP"""
+
+    def __init__(self, registry: HttpClientRegistry = http_clients, provider: str = "flow"):
+        self.registry = registry
+        self.provider = provider
+        self._stats: Dict[str, int] = {"created": 0, "reused": 0, "status_checks": 0, "errors": 0}
+
+    async def _call(self, method: str, path: str, credentials: FlowCredentials,
+                    params: Dict[str, Any]) -> Dict[str, Any]:
+        params = {"apiKey": credentials.api_key, **params}
+        params["s"] = firmar(params, credentials.secret_key)
+        url = f"{credentials.base_url}{path}"
+        if method == "POST":
+            response = await self.registry.request(self.provider, "POST", url, data=params)
+        else:
+            response = await self.registry.request(self.provider, "GET", url, params=params)
+        if response.status_code != 200:
+            self._stats["errors"] += 1
+            raise FlowApiError(f"Flow {path} -> {response.status_code}: {response.text[:200]}", response.status_code)
+        return response.json()
+
+    async def create_payment(self, tenant_id: Optional[str], commerce_order: str, amount: int,
+                             subject: str, email: str = "cliente@correo.com",
+                             existing_token: Optional[str] = None) -> FlowPayment:
+        """
+        Crea la orden de pago (o reutiliza la existente del mismo commerceOrder)
+        Confirmaciones concurrentes del mismo pedido esperan una sola creación
+        """
+        credentials = await get_credentials(tenant_id)
+        if existing_token:
+            self._stats["reused"] += 1
+            return FlowPayment(commerce_order, existing_token, credentials.payment_url(existing_token), reused=True)
+
+        key = idempotency_key(tenant_id, commerce_order)
+        created = False
+
+        async def create() -> Dict[str, str]:
+            nonlocal created
+            data = await self._call("POST", "/payment/create", credentials, {
+                "commerceOrder": commerce_order,
+                "subject": subject.replace("#", "").replace(" ", "_"),
+                "amount": int(amount),
+                "email": email,
+                "urlConfirmation": f"{credentials.webhook_base_url}/flow/confirm",
+                "urlReturn": f"{credentials.webhook_base_url}/flow/return",
+            })
+            token = data.get("token")
+            if not token:
+                self._stats["errors"] += 1
+                raise FlowApiError("Flow /payment/create sin token en la respuesta")
+            created = True
+            return {"token": token}
+
+        link = await _payment_links.aget_or_load(key, create)
+        self._stats["created" if created else "reused"] += 1
+        return FlowPayment(commerce_order, link["token"], credentials.payment_url(link["token"]), reused=not created)
+
+    async def get_status(self, tenant_id: Optional[str], token: str) -> Dict[str, Any]:
+        """Estado del pago (status 2 = pagado)"""
+        credentials = await get_credentials(tenant_id)
+        self._stats["status_checks"] += 1
+        return await self._call("GET", "/payment/getStatus", credentials, {"token": token})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+
+# Cliente global del proceso
+flow_client = FlowClient()
+
+# ==================== PUENTE SYNC ====================
+
+_main_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def bind_event_loop(loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+    """Registra el loop de la app (startup): las llamadas sync desde threads se ejecutan ahí"""
+    global _main_loop
+    _main_loop = loop or asyncio.get_running_loop()
+
+
+def _run_private(call: Callable[[FlowClient], Awaitable[Any]]) -> Any:
+    """Sin loop de la app utilizable: loop propio en otro thread con un pool temporal"""
+    async def main():
+        registry = HttpClientRegistry()
+        try:
+            return await call(FlowClient(registry))
+        finally:
+            await registry.aclose_all()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, main()).result()
+
+
+def run_sync(call: Callable[[FlowClient], Awaitable[Any]]) -> Any:
+    """
+    Ejecuta `call(flow_client)` desde código bloqueante
+    Desde un thread => corrutina en el loop principal (pool compartido) y se espera el resultado
+    """
+    loop = _main_loop
+    if loop is not None and loop.is_running():
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not loop:
+            future = asyncio.run_coroutine_threadsafe(call(flow_client), loop)
+            return future.result(FLOW_SYNC_TIMEOUT_SECONDS)
+    return _run_private(call)
+
+
+def invalidate_flow_credentials(tenant_id: str) -> None:
+    """Tras crear/editar/borrar la cuenta Flow del tenant (todos los procesos)"""
+    from services.invalidation_bus import publish_invalidation
+    publish_invalidation("flow_accounts", tenant_id)
+
+
+def get_flow_client_stats() -> Dict[str, Any]:
+    return {**flow_client.get_stats(), "http": http_clients.get_stats()["providers"].get("flow")}
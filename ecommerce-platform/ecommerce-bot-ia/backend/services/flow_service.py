@@ -1,128 +1,125 @@
 """
 Servicio de integración con Flow para pagos
 Multi-tenant compatible
+Las llamadas HTTP van por services/flow_client.py (pool async, timeouts, reintentos e
+idempotencia por commerceOrder); aquí queda la parte de pedidos en BD
 """
-import os
-import requests
-import hashlib
 import hmac
+import logging
+from typing import Optional
+
 from sqlalchemy.orm import Session
 from models import FlowPedido
+from services.flow_client import (
+    FLOW_SECRET_KEY,
+    FlowPayment,
+    firmar,
+    flow_client,
+    run_sync,
+)
+
+logger = logging.getLogger(__name__)
 
-# Configuración de Flow
-FLOW_API_KEY = os.getenv("FLOW_API_KEY", "749C736F-E427-482B-8400-7630D11L7766")
-FLOW_SECRET_KEY = os.getenv("FLOW_SECRET_KEY", "30f3d774a49a886cb28502ddf26864b69b4589be")
-FLOW_BASE_URL = os.getenv("FLOW_BASE_URL", "https://sandbox.flow.cl/api")
-BASE_URL = os.getenv("BASE_URL", "https://webhook.sintestesia.cl")
+ERROR_LINK_PAGO = "Error al generar link de pago"
 
-def _firmar(parametros: dict) -> str:
+def _firmar(parametros: dict, secret_key: str = FLOW_SECRET_KEY) -> str:
     """
     Genera firma HMAC-SHA256 para los parámetros en Flow
     """
-    keys = sorted(parametros.keys())
-    cadena = "&".join([f"{k}={parametros[k]}" for k in keys])
-    firma = hmac.new(FLOW_SECRET_KEY.encode(), cadena.encode(), hashlib.sha256).hexdigest()
-    print(f"🖊️ [Flow] Firma generada para: {cadena}")
-    print(f"➡️ [Flow] Firma: {firma}")
-    return firma
+    return firmar(parametros, secret_key)
 
-def validar_firma(params: dict) -> bool:
+def validar_firma(params: dict, secret_key: str = FLOW_SECRET_KEY) -> bool:
     """
     Valida la firma enviada por Flow en callbacks
     """
     firma_recibida = params.pop("s", None)
     if not firma_recibida:
-        print("⚠️ [Flow] No se recibió firma en el callback")
+        logger.warning("⚠️ [Flow] No se recibió firma en el callback")
         return False
 
-    firma_calculada = _firmar(params)
-    valido = firma_recibida == firma_calculada
-    print(f"🔎 [Flow] Firma recibida: {firma_recibida}")
-    print(f"🔎 [Flow] Firma calculada: {firma_calculada}")
-    print(f"➡️ [Flow] ¿Firma válida? {valido}")
+    valido = hmac.compare_digest(firma_recibida, _firmar(params, secret_key))
+    if not valido:
+        logger.warning("⚠️ [Flow] Firma del callback no coincide")
     return valido
 
-def crear_orden_flow(order_id: str, monto: int, descripcion: str, db: Session, tenant_id: str = None) -> str:
+def _buscar_pedido(db: Session, order_id: str, tenant_id: str = None) -> Optional[FlowPedido]:
+    if tenant_id:
+        return db.query(FlowPedido).filter_by(id=order_id, tenant_id=tenant_id).first()
+    return db.query(FlowPedido).filter_by(id=order_id).first()
+
+def _guardar_token(db: Session, pedido: Optional[FlowPedido], pago: FlowPayment, monto: int) -> str:
+    if pedido and pedido.token != pago.token:
+        pedido.token = pago.token
+        db.commit()
+        logger.info(f"💾 [Flow] Token guardado para pedido {pago.commerce_order}")
+    estado = "reutilizado" if pago.reused else "creado"
+    logger.info(f"💰 [Flow] Pedido #{pago.commerce_order} {estado} (${monto}). URL: {pago.url}")
+    return pago.url
+
+async def crear_orden_flow_async(order_id: str, monto: int, descripcion: str, db: Session, tenant_id: str = None) -> str:
     """
     Crea una orden de pago en Flow y devuelve el link de pago
-    Sistema simplificado sin multi-tenant
+    Si el pedido ya tiene token (confirmación repetida) se reutiliza
     """
-    url = f"{FLOW_BASE_URL}/payment/create"
-    params = {
-        "apiKey": FLOW_API_KEY,
-        "commerceOrder": order_id,
-        "subject": descripcion.replace("#", "").replace(" ", "_"),
-        "amount": int(monto),
-        "email": "cliente@correo.com",
-        "urlConfirmation": f"{BASE_URL}/flow/confirm",
-        "urlReturn": f"{BASE_URL}/flow/return"
-    }
+    pedido = _buscar_pedido(db, order_id, tenant_id)
+    try:
+        pago = await flow_client.create_payment(
+            tenant_id, str(order_id), int(monto), descripcion,
+            existing_token=pedido.token if pedido else None,
+        )
+    except Exception as e:
+        logger.error(f"❌ [Flow] Error al generar link de pago para pedido {order_id}: {e}")
+        return ERROR_LINK_PAGO
+    return _guardar_token(db, pedido, pago, monto)
 
-    params["s"] = _firmar(params)
-    print(f"➡️ [Flow] Payload enviado a Flow: {params}")
-
-    response = requests.post(url, data=params)
-    print(f"➡️ [Flow] Respuesta Flow: {response.status_code} - {response.text}")
-
-    if response.status_code == 200:
-        data = response.json()
-        token = data.get("token")
-        if not token:
-            print("⚠️ [Flow] No se recibió token en la respuesta")
-            return "Error al generar link de pago"
-
-        # Guardar token en la BD
-        if tenant_id:
-            pedido = db.query(FlowPedido).filter_by(id=order_id, tenant_id=tenant_id).first()
-        else:
-            pedido = db.query(FlowPedido).filter_by(id=order_id).first()
-        if pedido:
-            pedido.token = token
-            db.commit()
-            print(f"💾 [Flow] Token guardado para pedido {order_id}")
+def crear_orden_flow(order_id: str, monto: int, descripcion: str, db: Session, tenant_id: str = None) -> str:
+    """
+    Versión sync para el flujo bloqueante (procesar_mensaje_flow, corre en un thread)
+    La BD se usa en el thread del llamador; solo la llamada HTTP va al loop principal
+    """
+    pedido = _buscar_pedido(db, order_id, tenant_id)
+    existing_token = pedido.token if pedido else None
+    try:
+        pago = run_sync(lambda client: client.create_payment(
+            tenant_id, str(order_id), int(monto), descripcion, existing_token=existing_token
+        ))
+    except Exception as e:
+        logger.error(f"❌ [Flow] Error al generar link de pago para pedido {order_id}: {e}")
+        return ERROR_LINK_PAGO
+    return _guardar_token(db, pedido, pago, monto)
 
-        # URL de pago según ambiente
-        if "sandbox" in FLOW_BASE_URL:
-            url_pago = f"https://sandbox.flow.cl/app/web/pay.php?token={token}"
-        else:
-            url_pago = f"https://www.flow.cl/app/web/pay.php?token={token}"
-        
-        print(f"💰 [Flow] Pedido #{order_id} creado (${monto}). URL: {url_pago}")
-        return url_pago
-    else:
-        print("❌ [Flow] Error al generar link de pago")
-        return "Error al generar link de pago"
+def _pagado(order_id: str, data: dict) -> bool:
+    estado = data.get("status")
+    logger.info(f"🔎 [Flow] Estado recibido para pedido {order_id}: {estado}")
+    return estado == 2  # 2 = pagado exitoso
 
-def verificar_pago_flow(order_id: str, db: Session, tenant_id: str = None) -> bool:
+async def verificar_pago_flow_async(order_id: str, db: Session, tenant_id: str = None) -> bool:
     """
     Verifica en Flow si un pago fue realizado exitosamente usando el token
     """
-    if tenant_id:
-        pedido = db.query(FlowPedido).filter_by(id=order_id, tenant_id=tenant_id).first()
-    else:
-        pedido = db.query(FlowPedido).filter_by(id=order_id).first()
+    pedido = _buscar_pedido(db, order_id, tenant_id)
     if not pedido or not pedido.token:
-        print(f"⚠️ [Flow] No se encontró token para el pedido {order_id}")
+        logger.warning(f"⚠️ [Flow] No se encontró token para el pedido {order_id}")
+        return False
+    try:
+        return _pagado(order_id, await flow_client.get_status(tenant_id, pedido.token))
+    except Exception as e:
+        logger.error(f"❌ [Flow] Error al consultar estado de pago del pedido {order_id}: {e}")
         return False
 
-    url = f"{FLOW_BASE_URL}/payment/getStatus"
-    params = {
-        "apiKey": FLOW_API_KEY,
-        "token": pedido.token
-    }
-    params["s"] = _firmar(params)
-
-    print(f"➡️ [Flow] Verificando pago con params: {params}")
-    response = requests.get(url, params=params)
-    print(f"➡️ [Flow] Respuesta Flow: {response.status_code} - {response.text}")
-
-    if response.status_code == 200:
-        data = response.json()
-        estado = data.get("status")
-        print(f"🔎 [Flow] Estado recibido: {estado}")
-        return estado == 2  # 2 = pagado exitoso
-    else:
-        print("❌ [Flow] Error al consultar estado de pago")
+def verificar_pago_flow(order_id: str, db: Session, tenant_id: str = None) -> bool:
+    """
+    Versión sync de verificar_pago_flow_async (ver crear_orden_flow)
+    """
+    pedido = _buscar_pedido(db, order_id, tenant_id)
+    if not pedido or not pedido.token:
+        logger.warning(f"⚠️ [Flow] No se encontró token para el pedido {order_id}")
+        return False
+    token = pedido.token
+    try:
+        return _pagado(order_id, run_sync(lambda client: client.get_status(tenant_id, token)))
+    except Exception as e:
+        logger.error(f"❌ [Flow] Error al consultar estado de pago del pedido {order_id}: {e}")
         return False
 
-# Función get_client_id_for_phone removida - ya no se usa multi-tenant
\ No newline at end of file
+# Función get_client_id_for_phone removida - ya no se usa multi-tenant
@@ -0,0 +1,343 @@
+"""
+Bus de invalidación de caches entre procesos
+Eventos (namespace, tenant_id, version) publicados por quien modifica datos y
+recibidos por todos los workers del backend y por el bot de WhatsApp:
+
+- Transporte por defecto: Postgres LISTEN/NOTIFY (canal CACHE_INVALIDATION_CHANNEL)
+- Fallback en proceso (tests, SQLite o sin psycopg2): InProcessTransport
+- El proceso que publica aplica la invalidación localmente de inmediato
+- Un evento invalida automáticamente el namespace homónimo del cache unificado
+  (por tenant, o completo si tenant_id es None); además se pueden suscribir handlers
+- `key` opcional identifica una entrada dentro del tenant (p.ej. el teléfono de una sesión)
+- Tras una reconexión del listener se limpian los namespaces suscritos (pudo perder eventos)
+"""
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import uuid
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.cache import cache_manager
+
+logger = logging.getLogger(__name__)
+
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache_invalidation")
+# auto | postgres | inprocess
+INVALIDATION_BUS_TRANSPORT = os.getenv("INVALIDATION_BUS_TRANSPORT", "auto").lower()
+INVALIDATION_BUS_RECONNECT_SECONDS = float(os.getenv("INVALIDATION_BUS_RECONNECT_SECONDS", "2"))
+
+
+@dataclass(frozen=True)
+class InvalidationEvent:
+    """Evento de invalidación; version permite descartar eventos viejos fuera de orden"""
+    namespace: str
+    tenant_id: Optional[str] = None
+    version: Optional[int] = None
+    origin: str = ""
+    key: Optional[str] = None
+
+    def to_payload(self) -> str:
+        return json.dumps(asdict(self), separators=(",", ":"))
+
+    @classmethod
+    def from_payload(cls, payload: str) -> "InvalidationEvent":
+        data = json.loads(payload)
+        return cls(
+            namespace=data["namespace"],
+            tenant_id=data.get("tenant_id"),
+            version=data.get("version"),
+            origin=data.get("origin", ""),
+            key=data.get("key"),
+        )
+
+
+EventCallback = Callable[[InvalidationEvent], None]
+
+
+class InProcessTransport:
+    """
+    Entrega los eventos a todos los buses del mismo proceso
+    Compartir una instancia entre varios InvalidationBus simula varios workers en pruebas
+    """
+    name = "inprocess"
+
+    def __init__(self):
+        self._listeners: List[EventCallback] = []
+        self._lock = threading.Lock()
+
+    def start(self, on_event: EventCallback, on_reconnect: Optional[Callable[[], None]] = None) -> None:
+        with self._lock:
+            self._listeners.append(on_event)
+
+    def stop(self, on_event: Optional[EventCallback] = None) -> None:
+        with self._lock:
+            if on_event is None:
+                self._listeners.clear()
+            elif on_event in self._listeners:
+                self._listeners.remove(on_event)
+
+    def publish(self, event: InvalidationEvent) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(event)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"transport": self.name, "listeners": len(self._listeners)}
+
+
+class PostgresNotifyTransport:
+    """
+    LISTEN/NOTIFY sobre Postgres
+    - publish: SELECT pg_notify(...) por el pool del engine sync
+    - listen: conexión psycopg2 dedicada en autocommit dentro de un thread daemon
+    """
+    name = "postgres"
+
+    def __init__(self, dsn: str, channel: str = CACHE_INVALIDATION_CHANNEL,
+                 reconnect_seconds: float = INVALIDATION_BUS_RECONNECT_SECONDS):
+        if not re.fullmatch(r"[a-z_][a-z0-9_]{0,62}", channel):
+            raise ValueError(f"Canal de invalidación inválido: {channel}")
+        # psycopg2 no entiende el sufijo de driver de SQLAlchemy (postgresql+psycopg2://)
+        self._dsn = re.sub(r"^postgres(?:ql)?\+\w+://", "postgresql://", dsn)
+        self._channel = channel
+        self._reconnect_seconds = reconnect_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.connected = False
+        self.connects = 0
+        self.errors = 0
+
+    def start(self, on_event: EventCallback, on_reconnect: Optional[Callable[[], None]] = None) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._listen_loop, args=(on_event, on_reconnect),
+            name="cache-invalidation-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, on_event: Optional[EventCallback] = None) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def publish(self, event: InvalidationEvent) -> None:
+        from sqlalchemy import text
+        from database import engine
+
+        with engine.connect() as conn:
+            conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self._channel, "payload": event.to_payload()}
+            )
+            conn.commit()
+
+    def _listen_loop(self, on_event: EventCallback, on_reconnect: Optional[Callable[[], None]]) -> None:
+        import select
+        import psycopg2
+        import psycopg2.extensions
+
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self._dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self._channel}")
+                self.connects += 1
+                self.connected = True
+                if self.connects > 1 and on_reconnect:
+                    on_reconnect()
+                logger.info(f"Listening for cache invalidations on channel '{self._channel}'")
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            on_event(InvalidationEvent.from_payload(notify.payload))
+                        except Exception as e:
+                            self.errors += 1
+                            logger.error(f"Invalid cache invalidation payload {notify.payload!r}: {e}")
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Cache invalidation listener error: {e}")
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(self._reconnect_seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "transport": self.name,
+            "channel": self._channel,
+            "connected": self.connected,
+            "connects": self.connects,
+            "errors": self.errors,
+        }
+
+
+def _default_transport():
+    """Postgres si DATABASE_URL es Postgres y psycopg2 está disponible; si no, en proceso"""
+    database_url = os.getenv("DATABASE_URL", "")
+    if INVALIDATION_BUS_TRANSPORT == "inprocess":
+        return InProcessTransport()
+    if INVALIDATION_BUS_TRANSPORT == "postgres" or database_url.startswith("postgres"):
+        try:
+            import psycopg2  # noqa: F401
+            return PostgresNotifyTransport(database_url)
+        except ImportError:
+            logger.warning("psycopg2 not installed; cache invalidation bus falls back to in-process")
+    return InProcessTransport()
+
+
+class InvalidationBus:
+    """Publica y aplica eventos de invalidación en este proceso"""
+
+    def __init__(self, transport: Any = None):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._transport = transport
+        self._handlers: Dict[str, List[EventCallback]] = defaultdict(list)
+        self._versions: Dict[Tuple[str, Optional[str]], int] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._stats = {
+            "published": 0,
+            "publish_errors": 0,
+            "received": 0,
+            "applied": 0,
+            "stale": 0,
+            "handler_errors": 0,
+            "resyncs": 0,
+        }
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    def subscribe(self, namespace: str, handler: EventCallback) -> None:
+        """Registra un handler para un namespace ('*' recibe todos los eventos)"""
+        with self._lock:
+            self._handlers[namespace].append(handler)
+
+    def start(self) -> None:
+        """Conecta el transporte (idempotente)"""
+        if self._started:
+            return
+        if self._transport is None:
+            self._transport = _default_transport()
+        self._transport.start(self._receive, self._resync)
+        self._started = True
+        logger.info(f"Cache invalidation bus started ({self._transport.name}), origin {self.origin}")
+
+    def stop(self) -> None:
+        if not self._started:
+            return
+        self._transport.stop(self._receive)
+        self._started = False
+
+    def publish(self, namespace: str, tenant_id: Optional[str] = None,
+                version: Optional[int] = None, key: Optional[str] = None) -> InvalidationEvent:
+        """
+        Invalida localmente y notifica al resto de procesos
+        Un fallo del transporte no impide la invalidación local
+        """
+        event = InvalidationEvent(namespace=namespace, tenant_id=tenant_id, version=version,
+                                  origin=self.origin, key=key)
+        self._apply(event)
+        self._stats["published"] += 1
+        if self._started:
+            try:
+                self._transport.publish(event)
+            except Exception as e:
+                self._stats["publish_errors"] += 1
+                logger.warning(f"Could not publish cache invalidation {event}: {e}")
+        return event
+
+    def _receive(self, event: InvalidationEvent) -> None:
+        # El publicador ya aplicó su propio evento
+        if event.origin == self.origin:
+            return
+        self._stats["received"] += 1
+        self._apply(event)
+
+    def _apply(self, event: InvalidationEvent) -> None:
+        if event.version is not None:
+            key = (event.namespace, event.tenant_id)
+            with self._lock:
+                last = self._versions.get(key)
+                if last is not None and event.version < last:
+                    self._stats["stale"] += 1
+                    return
+                self._versions[key] = event.version
+
+        namespace = cache_manager.get_namespace(event.namespace)
+        if namespace is not None:
+            if event.tenant_id:
+                namespace.invalidate_tenant(event.tenant_id)
+            else:
+                namespace.clear()
+
+        with self._lock:
+            handlers = list(self._handlers.get(event.namespace, ())) + list(self._handlers.get("*", ()))
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                self._stats["handler_errors"] += 1
+                logger.error(f"Cache invalidation handler failed for {event}: {e}")
+        self._stats["applied"] += 1
+
+    def _resync(self) -> None:
+        """
+        Tras reconectar pudimos perder eventos: vaciar los namespaces con suscriptores
+        (no todo el cache: p. ej. la deduplicación de webhooks debe sobrevivir la reconexión)
+        """
+        self._stats["resyncs"] += 1
+        with self._lock:
+            namespaces = [name for name in self._handlers if name != "*"]
+        for name in namespaces:
+            self._apply(InvalidationEvent(namespace=name, origin=self.origin))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subscriptions = {name: len(handlers) for name, handlers in self._handlers.items()}
+        return {
+            **self._stats,
+            "started": self._started,
+            "origin": self.origin,
+            "subscriptions": subscriptions,
+            "transport": self._transport.get_stats() if self._transport is not None else None,
+        }
+
+
+# Bus global del proceso
+invalidation_bus = InvalidationBus()
+
+
+def publish_invalidation(namespace: str, tenant_id: Optional[str] = None,
+                         version: Optional[int] = None, key: Optional[str] = None) -> InvalidationEvent:
+    """Función de conveniencia sobre el bus global"""
+    return invalidation_bus.publish(namespace, tenant_id, version, key)
+
+
+def subscribe_invalidation(namespace: str, handler: EventCallback) -> None:
+    invalidation_bus.subscribe(namespace, handler)
+
+
+def get_invalidation_bus_stats() -> Dict[str, Any]:
+    return invalidation_bus.get_stats()
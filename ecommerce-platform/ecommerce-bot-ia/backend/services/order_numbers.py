@@ -0,0 +1,176 @@
+"""
+Numeración de órdenes por tenant (tabla tenant_counters) con bloques pre-asignados
+Reemplaza COUNT(*) / "última orden" al crear órdenes:
+
+- Cada tenant tiene su contador (client_id, name) en tenant_counters; órdenes sin
+  client_id usan la clave "" (mismo criterio que daily_sales_rollup)
+- Un worker reserva ORDER_NUMBER_BLOCK_SIZE números de una vez con
+  INSERT ... ON CONFLICT DO UPDATE SET value = value + bloque RETURNING value,
+  en su propia transacción corta: la orden no bloquea la fila del contador
+- Los números del bloque se entregan desde memoria; al reiniciar o si una orden
+  falla quedan huecos en la numeración (igual que una secuencia de Postgres)
+- Unicidad: índice único ix_orders_client_order_number (client_id, order_number) en orders
+- La migración siembra los contadores desde las órdenes existentes; en bases creadas con
+  create_all lo hace ensure_order_counters() al arrancar
+"""
+import logging
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import engine, async_engine
+import models
+
+logger = logging.getLogger(__name__)
+
+ORDER_NUMBER_BLOCK_SIZE = int(os.getenv("ORDER_NUMBER_BLOCK_SIZE", "20"))
+ORDER_NUMBER_COUNTER = "order_number"
+# Órdenes sin client_id (mismo criterio que sales_rollup.NO_CLIENT_KEY)
+NO_CLIENT_KEY = ""
+
+_ORDER_NUMBER_RE = re.compile(r"^ORD-([0-9]+)$")
+
+
+def format_order_number(number: int) -> str:
+    return f"ORD-{number:06d}"
+
+
+def _insert_for(dialect_name: str):
+    if dialect_name == "postgresql":
+        return postgresql.insert
+    if dialect_name == "sqlite":
+        return sqlite.insert
+    raise NotImplementedError(f"tenant_counters no soporta el dialecto {dialect_name}")
+
+
+def _reserve_statement(dialect_name: str, client_id: str, name: str, size: int):
+    """Sube el contador en `size` y devuelve el último número del bloque reservado"""
+    table = models.TenantCounter.__table__
+    statement = _insert_for(dialect_name)(table).values(client_id=client_id, name=name, value=size, updated_at=datetime.utcnow())
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.client_id, table.c.name],
+        set_={"value": table.c.value + size, "updated_at": statement.excluded.updated_at},
+    ).returning(table.c.value)
+
+
+class BlockAllocator:
+    """Rangos [siguiente, último] reservados por (tenant, contador), consumidos desde memoria"""
+
+    def __init__(self, block_size: int = ORDER_NUMBER_BLOCK_SIZE):
+        self.block_size = max(1, block_size)
+        self._blocks: Dict[Tuple[str, str], Deque[list]] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"allocated": 0, "blocks_reserved": 0}
+
+    def _take(self, key: Tuple[str, str]) -> Optional[int]:
+        with self._lock:
+            blocks = self._blocks.get(key)
+            while blocks:
+                block = blocks[0]
+                if block[0] <= block[1]:
+                    number = block[0]
+                    block[0] += 1
+                    self._stats["allocated"] += 1
+                    return number
+                blocks.popleft()
+        return None
+
+    def _add_block(self, key: Tuple[str, str], last: int) -> None:
+        with self._lock:
+            self._blocks.setdefault(key, deque()).append([last - self.block_size + 1, last])
+            self._stats["blocks_reserved"] += 1
+
+    def next(self, client_id: Optional[str], name: str = ORDER_NUMBER_COUNTER) -> int:
+        key = (client_id or NO_CLIENT_KEY, name)
+        number = self._take(key)
+        while number is None:
+            # Transacción propia y corta: independiente de la transacción de la orden
+            with engine.begin() as conn:
+                last = conn.execute(
+                    _reserve_statement(engine.dialect.name, key[0], name, self.block_size)
+                ).scalar_one()
+            self._add_block(key, last)
+            number = self._take(key)
+        return number
+
+    async def next_async(self, client_id: Optional[str], name: str = ORDER_NUMBER_COUNTER) -> int:
+        key = (client_id or NO_CLIENT_KEY, name)
+        number = self._take(key)
+        while number is None:
+            async with async_engine.begin() as conn:
+                result = await conn.execute(
+                    _reserve_statement(async_engine.dialect.name, key[0], name, self.block_size)
+                )
+                last = result.scalar_one()
+            self._add_block(key, last)
+            number = self._take(key)
+        return number
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            remaining = {
+                f"{client_id or '(sin tenant)'}:{name}": sum(block[1] - block[0] + 1 for block in blocks)
+                for (client_id, name), blocks in self._blocks.items()
+            }
+        return {**self._stats, "block_size": self.block_size, "remaining": remaining}
+
+
+def ensure_order_counters(db) -> int:
+    """
+    Si tenant_counters está vacía pero hay órdenes (p. ej. tabla recién creada con create_all),
+    siembra cada tenant desde su ORD-XXXXXX más alto; devuelve cuántos contadores creó
+    """
+    table = models.TenantCounter.__table__
+    if db.execute(select(table.c.client_id).limit(1)).first() is not None:
+        return 0
+
+    # MAX por (tenant, largo): el mayor de cada largo ordena bien como texto
+    Order = models.Order
+    rows = db.execute(
+        select(func.coalesce(Order.client_id, NO_CLIENT_KEY), func.max(Order.order_number))
+        .where(Order.order_number.like("ORD-%"))
+        .group_by(func.coalesce(Order.client_id, NO_CLIENT_KEY), func.length(Order.order_number))
+    ).all()
+    highest: Dict[str, int] = {}
+    for client_id, order_number in rows:
+        match = _ORDER_NUMBER_RE.match(order_number or "")
+        if match:
+            highest[client_id] = max(highest.get(client_id, 0), int(match.group(1)))
+    if not highest:
+        return 0
+
+    now = datetime.utcnow()
+    insert = _insert_for(db.get_bind().dialect.name)
+    for client_id, value in highest.items():
+        statement = insert(table).values(client_id=client_id, name=ORDER_NUMBER_COUNTER, value=value, updated_at=now)
+        # Otro worker sembró (o reservó) primero: conservar el mayor
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.client_id, table.c.name],
+            set_={"value": case((table.c.value < statement.excluded.value, statement.excluded.value),
+                                else_=table.c.value)},
+        ))
+    db.commit()
+    logger.info(f"tenant_counters seeded from existing orders for {len(highest)} tenants")
+    return len(highest)
+
+
+# Allocator global del proceso
+order_number_allocator = BlockAllocator()
+
+
+def next_order_number(client_id: Optional[str]) -> str:
+    return format_order_number(order_number_allocator.next(client_id))
+
+
+async def next_order_number_async(client_id: Optional[str]) -> str:
+    return format_order_number(await order_number_allocator.next_async(client_id))
+
+
+def get_order_number_stats() -> Dict[str, Any]:
+    return order_number_allocator.get_stats()
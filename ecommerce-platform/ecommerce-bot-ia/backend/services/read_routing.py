@@ -0,0 +1,186 @@
+"""
+Ruteo de lecturas a réplica (DATABASE_READ_URL) con read-your-writes por tenant
+Usado por database.py del backend y del bot (mismo módulo en ambos procesos):
+
+- Sin DATABASE_READ_URL todo va al primario (comportamiento anterior)
+- Read-your-writes: un tenant que escribió lee del primario durante
+  READ_YOUR_WRITES_SECONDS (marca en el cache "replica_sticky"; compartida entre
+  workers si hay CACHE_REDIS_URL)
+- Las escrituras se detectan solas: los commits de PrimarySession marcan los tenants
+  (client_id / tenant_id) de los objetos insertados, modificados o borrados;
+  SQL crudo puede marcar con mark_tenant_write()
+- Lag: un monitor mide el retraso de la réplica cada REPLICA_LAG_CHECK_SECONDS; si supera
+  REPLICA_MAX_LAG_SECONDS (o no hay medición reciente) las lecturas vuelven al primario
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from services.cache import cache_manager
+
+logger = logging.getLogger(__name__)
+
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "2"))
+
+# Retraso de replay; 0 si no hay nada pendiente de aplicar (primario ocioso no cuenta como lag)
+_PG_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+_sticky = cache_manager.namespace("replica_sticky", ttl=READ_YOUR_WRITES_SECONDS, max_entries=10000, shared=True)
+
+
+class PrimarySession(Session):
+    """Sesión del primario; sus commits marcan los tenants escritos (ver track_writes)"""
+
+
+class ReplicaRouter:
+    """Decide, por lectura, si se puede usar la réplica"""
+
+    def __init__(self):
+        self.read_engine = None
+        # Tenant del request actual (el backend registra el ContextVar del TenantMiddleware)
+        self.tenant_resolver: Callable[[], Optional[str]] = lambda: None
+        self.lag_seconds: Optional[float] = None
+        self._lag_checked_at = 0.0
+        self._stats: Dict[str, int] = {
+            "replica": 0,
+            "primary_sticky": 0,
+            "primary_lag": 0,
+            "primary_unconfigured": 0,
+            "writes_marked": 0,
+            "lag_check_errors": 0,
+        }
+
+    @property
+    def configured(self) -> bool:
+        return self.read_engine is not None
+
+    def configure(self, read_engine) -> None:
+        self.read_engine = read_engine
+
+    def mark_write(self, tenant_id: Optional[str]) -> None:
+        if not tenant_id or not self.configured:
+            return
+        _sticky.set("w", True, tenant_id=tenant_id)
+        self._stats["writes_marked"] += 1
+
+    def _replica_healthy(self) -> bool:
+        if self.lag_seconds is None:
+            return False
+        # Medición vieja (monitor caído) => no confiar en la réplica
+        if time.monotonic() - self._lag_checked_at > REPLICA_LAG_CHECK_SECONDS * 3:
+            return False
+        return self.lag_seconds <= REPLICA_MAX_LAG_SECONDS
+
+    def use_replica(self, tenant_id: Optional[str] = None) -> bool:
+        if not self.configured:
+            self._stats["primary_unconfigured"] += 1
+            return False
+        if tenant_id is None:
+            tenant_id = self.tenant_resolver()
+        if tenant_id and _sticky.get("w", tenant_id=tenant_id):
+            self._stats["primary_sticky"] += 1
+            return False
+        if not self._replica_healthy():
+            self._stats["primary_lag"] += 1
+            return False
+        self._stats["replica"] += 1
+        return True
+
+    def check_lag(self) -> Optional[float]:
+        """Mide el lag de la réplica (bloqueante; el monitor lo corre en un thread)"""
+        if not self.configured:
+            return None
+        try:
+            if self.read_engine.dialect.name == "postgresql":
+                with self.read_engine.connect() as conn:
+                    lag = float(conn.execute(_PG_LAG_QUERY).scalar() or 0)
+            else:
+                # SQLite como réplica en tests: sin replicación
+                lag = 0.0
+        except Exception as e:
+            self._stats["lag_check_errors"] += 1
+            logger.warning(f"Replica lag check failed: {e}")
+            lag = None
+        self.lag_seconds = lag
+        self._lag_checked_at = time.monotonic()
+        return lag
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "configured": self.configured,
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": REPLICA_MAX_LAG_SECONDS,
+            "read_your_writes_seconds": READ_YOUR_WRITES_SECONDS,
+        }
+
+
+# Router global del proceso
+replica_router = ReplicaRouter()
+
+
+def _written_tenants(session: Session) -> set:
+    tenants = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tenant_id = getattr(obj, "client_id", None) or getattr(obj, "tenant_id", None)
+        if isinstance(tenant_id, str):
+            tenants.add(tenant_id)
+    return tenants
+
+
+def track_writes(session_class) -> None:
+    """Marca read-your-writes al confirmar cada transacción que escribió filas de un tenant"""
+
+    @event.listens_for(session_class, "after_flush")
+    def collect(session, flush_context):
+        if replica_router.configured:
+            session.info.setdefault("written_tenants", set()).update(_written_tenants(session))
+
+    @event.listens_for(session_class, "after_commit")
+    def mark(session):
+        for tenant_id in session.info.pop("written_tenants", ()):
+            replica_router.mark_write(tenant_id)
+
+    @event.listens_for(session_class, "after_rollback")
+    def discard(session):
+        session.info.pop("written_tenants", None)
+
+
+track_writes(PrimarySession)
+
+
+def mark_tenant_write(tenant_id: Optional[str]) -> None:
+    """Para escrituras con SQL crudo o hechas por otro proceso (eventos del bus)"""
+    replica_router.mark_write(tenant_id)
+
+
+async def replica_lag_loop():
+    logger.info("Starting replica lag monitor...")
+    while True:
+        await asyncio.to_thread(replica_router.check_lag)
+        await asyncio.sleep(REPLICA_LAG_CHECK_SECONDS)
+
+
+def start_replica_lag_monitor():
+    """Inicia la medición de lag (solo si hay DATABASE_READ_URL)"""
+    if not replica_router.configured:
+        return
+    asyncio.create_task(replica_lag_loop())
+    logger.info("Replica lag monitor started")
+
+
+def get_replica_routing_stats() -> Dict[str, Any]:
+    return replica_router.get_stats()
@@ -0,0 +1,257 @@
+"""
+Rollup diario de ventas por tenant (tabla daily_sales_rollup)
+El dashboard lee una fila por día en vez de recorrer la tabla de órdenes:
+
+- Cada alta/edición/borrado de orden aplica un delta (client_id, day) en la
+  misma transacción, vía INSERT ... ON CONFLICT DO UPDATE
+- La reconstrucción usa una sola agregación GROUP BY día sobre orders
+  (date_trunc('day', date) en Postgres, date(date) en SQLite)
+- Las lecturas de /dashboard/stats y /dashboard/revenue-summary son O(días)
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# Estados que cuentan como venta concretada (mismo criterio que el dashboard histórico)
+REVENUE_STATUSES = ("Shipped", "Delivered")
+PENDING_STATUS = "Pending"
+SALES_SERIES_DAYS = 30
+# Órdenes sin client_id: se acumulan bajo esta clave para la vista global
+NO_CLIENT_KEY = ""
+
+_METRICS = ("revenue", "orders_count", "completed_count", "pending_count")
+
+RollupKey = Tuple[str, date]
+
+
+def _day_of(value: Any) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def order_state(order: Any) -> Optional[Dict[str, Any]]:
+    """Campos de la orden que afectan al rollup (None si no aporta: sin orden o sin fecha)"""
+    if order is None:
+        return None
+    day = _day_of(getattr(order, "date", None))
+    if day is None:
+        return None
+    return {
+        "client_id": getattr(order, "client_id", None) or NO_CLIENT_KEY,
+        "day": day,
+        "total": float(getattr(order, "total", 0) or 0),
+        "status": getattr(order, "status", None),
+    }
+
+
+def rollup_deltas(before: Optional[Dict[str, Any]],
+                  after: Optional[Dict[str, Any]]) -> Dict[RollupKey, Dict[str, float]]:
+    """
+    Diferencia entre el estado anterior y el nuevo de una orden
+    Alta: before=None; borrado: after=None; edición: ambos (cambio de estado, total, fecha o tenant)
+    """
+    deltas: Dict[RollupKey, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(_METRICS, 0))
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        values = deltas[(state["client_id"], state["day"])]
+        values["orders_count"] += sign
+        if state["status"] in REVENUE_STATUSES:
+            values["revenue"] += sign * state["total"]
+            values["completed_count"] += sign
+        elif state["status"] == PENDING_STATUS:
+            values["pending_count"] += sign
+    return {key: values for key, values in deltas.items() if any(values.values())}
+
+
+def _upsert_statements(dialect_name: str, deltas: Dict[RollupKey, Dict[str, float]]) -> Iterable[Any]:
+    if dialect_name == "postgresql":
+        insert = postgresql.insert
+    elif dialect_name == "sqlite":
+        insert = sqlite.insert
+    else:
+        raise NotImplementedError(f"daily_sales_rollup no soporta el dialecto {dialect_name}")
+
+    table = models.DailySalesRollup.__table__
+    now = datetime.utcnow()
+    for (client_id, day), values in deltas.items():
+        statement = insert(table).values(client_id=client_id, day=day, updated_at=now, **values)
+        set_ = {metric: table.c[metric] + statement.excluded[metric] for metric in _METRICS}
+        set_["updated_at"] = statement.excluded.updated_at
+        yield statement.on_conflict_do_update(index_elements=[table.c.client_id, table.c.day], set_=set_)
+
+
+def apply_order_change(db, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> int:
+    """Aplica el delta en la sesión sync (sin commit: viaja en la transacción de la orden)"""
+    deltas = rollup_deltas(before, after)
+    for statement in _upsert_statements(db.get_bind().dialect.name, deltas):
+        db.execute(statement)
+    return len(deltas)
+
+
+async def apply_order_change_async(db, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> int:
+    """Versión async de apply_order_change"""
+    deltas = rollup_deltas(before, after)
+    for statement in _upsert_statements(db.bind.dialect.name, deltas):
+        await db.execute(statement)
+    return len(deltas)
+
+
+# ==================== AGREGACIÓN SOBRE ORDERS ====================
+
+def _order_day(dialect_name: str):
+    if dialect_name == "postgresql":
+        return func.date_trunc("day", models.Order.date)
+    return func.date(models.Order.date)
+
+
+def daily_sales_query(dialect_name: str, client_id: Optional[str] = None, since: Optional[date] = None):
+    """Una sola agregación GROUP BY día sobre orders (reconstrucción del rollup)"""
+    day = _order_day(dialect_name).label("day")
+    completed = models.Order.status.in_(REVENUE_STATUSES)
+    query = select(
+        func.coalesce(models.Order.client_id, NO_CLIENT_KEY).label("client_id"),
+        day,
+        func.coalesce(func.sum(case((completed, models.Order.total), else_=0.0)), 0.0).label("revenue"),
+        func.count(models.Order.id).label("orders_count"),
+        func.coalesce(func.sum(case((completed, 1), else_=0)), 0).label("completed_count"),
+        func.coalesce(func.sum(case((models.Order.status == PENDING_STATUS, 1), else_=0)), 0).label("pending_count"),
+    ).where(models.Order.date.isnot(None))
+    if client_id == NO_CLIENT_KEY:
+        query = query.where(models.Order.client_id.is_(None))
+    elif client_id is not None:
+        query = query.where(models.Order.client_id == client_id)
+    if since is not None:
+        query = query.where(models.Order.date >= datetime.combine(since, datetime.min.time()))
+    return query.group_by(func.coalesce(models.Order.client_id, NO_CLIENT_KEY), day)
+
+
+def rebuild_sales_rollup(db, client_id: Optional[str] = None) -> int:
+    """
+    Recalcula el rollup desde orders (todo o un tenant) y hace commit
+    Útil como reparación o tras cargas masivas que no pasan por crud
+    """
+    dialect_name = db.get_bind().dialect.name
+    table = models.DailySalesRollup.__table__
+    statement = delete(table)
+    if client_id is not None:
+        statement = statement.where(table.c.client_id == client_id)
+    db.execute(statement)
+
+    rows = db.execute(daily_sales_query(dialect_name, client_id)).all()
+    now = datetime.utcnow()
+    if rows:
+        db.execute(table.insert(), [
+            {
+                "client_id": row.client_id,
+                "day": _day_of(row.day),
+                "revenue": float(row.revenue or 0),
+                "orders_count": int(row.orders_count or 0),
+                "completed_count": int(row.completed_count or 0),
+                "pending_count": int(row.pending_count or 0),
+                "updated_at": now,
+            }
+            for row in rows
+        ])
+    db.commit()
+    logger.info(f"daily_sales_rollup rebuilt ({len(rows)} rows, client={client_id or 'all'})")
+    return len(rows)
+
+
+def ensure_sales_rollup(db) -> bool:
+    """Si el rollup está vacío pero hay órdenes (p. ej. tabla recién creada con create_all), lo reconstruye"""
+    has_rollup = db.execute(select(models.DailySalesRollup.day).limit(1)).first() is not None
+    if has_rollup:
+        return False
+    has_orders = db.execute(select(models.Order.id).limit(1)).first() is not None
+    if not has_orders:
+        return False
+    rebuild_sales_rollup(db)
+    return True
+
+
+# ==================== LECTURAS DEL DASHBOARD ====================
+
+def _client_filter(query, client_id: Optional[str]):
+    # client_id None = vista global (todas las filas del rollup)
+    if client_id is not None:
+        query = query.where(models.DailySalesRollup.client_id == client_id)
+    return query
+
+
+def series_query(client_id: Optional[str], since: date):
+    """Filas diarias desde `since` (lectura por índice de la PK client_id, day)"""
+    rollup = models.DailySalesRollup
+    query = select(
+        rollup.day,
+        func.sum(rollup.revenue).label("revenue"),
+        func.sum(rollup.orders_count).label("orders_count"),
+        func.sum(rollup.completed_count).label("completed_count"),
+    ).where(rollup.day >= since)
+    return _client_filter(query, client_id).group_by(rollup.day)
+
+
+def totals_query(client_id: Optional[str]):
+    """Totales históricos del tenant sumando sus filas del rollup (una por día con órdenes)"""
+    rollup = models.DailySalesRollup
+    query = select(
+        func.coalesce(func.sum(rollup.revenue), 0.0).label("revenue"),
+        func.coalesce(func.sum(rollup.orders_count), 0).label("orders_count"),
+        func.coalesce(func.sum(rollup.completed_count), 0).label("completed_count"),
+        func.coalesce(func.sum(rollup.pending_count), 0).label("pending_count"),
+    )
+    return _client_filter(query, client_id)
+
+
+def series_start(days: int = SALES_SERIES_DAYS, today: Optional[date] = None) -> date:
+    today = today or datetime.utcnow().date()
+    return today - timedelta(days=days - 1)
+
+
+def build_sales_series(rows: Iterable[Any], days: int = SALES_SERIES_DAYS,
+                       today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Serie de `days` días terminando hoy, con ceros en los días sin ventas"""
+    start = series_start(days, today)
+    by_day = {_day_of(row.day): float(row.revenue or 0) for row in rows}
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        series.append({"name": day.strftime("%b %d"), "sales": by_day.get(day, 0.0)})
+    return series
+
+
+def build_revenue_summary(totals: Any, rows: Iterable[Any], days: int = SALES_SERIES_DAYS,
+                          today: Optional[date] = None) -> Dict[str, Any]:
+    """Resumen de ingresos a partir de los totales y las filas diarias del rollup"""
+    today = today or datetime.utcnow().date()
+    rows = list(rows)
+    week_start = today - timedelta(days=6)
+    revenue_30d = sum(float(row.revenue or 0) for row in rows)
+    revenue_7d = sum(float(row.revenue or 0) for row in rows if _day_of(row.day) >= week_start)
+    completed_30d = sum(int(row.completed_count or 0) for row in rows)
+    total_revenue = float(totals.revenue or 0)
+    completed_orders = int(totals.completed_count or 0)
+    return {
+        "total_revenue": total_revenue,
+        "completed_orders": completed_orders,
+        "total_orders": int(totals.orders_count or 0),
+        "pending_orders": int(totals.pending_count or 0),
+        "average_order_value": round(total_revenue / completed_orders, 2) if completed_orders else 0.0,
+        "revenue_last_7_days": revenue_7d,
+        "revenue_last_30_days": revenue_30d,
+        "completed_orders_last_30_days": completed_30d,
+        "sales_data": build_sales_series(rows, days, today),
+    }
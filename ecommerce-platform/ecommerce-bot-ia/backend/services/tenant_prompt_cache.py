@@ -3,14 +3,21 @@ Servicio de caché para configuración de prompts por tenant
 Implementa namespace estricto y TTL para invalidación automática
 """
 import json
+import os
 import time
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any
 from dataclasses import dataclass
 from sqlalchemy.orm import Session
 
 from models import TenantPrompts
 from prompt_schemas import DatabaseQueries
 from services.bot_prompt_integration import BotPromptIntegration
+from services.cache import cache_manager
+from services.invalidation_bus import publish_invalidation
+
+
+# Con el bus de invalidación activo el TTL puede subirse a horas
+TENANT_PROMPT_CACHE_TTL_SECONDS = int(os.getenv("TENANT_PROMPT_CACHE_TTL_SECONDS", "600"))
 
 
 @dataclass
@@ -31,22 +38,21 @@ class CachedPromptConfig:
 class TenantPromptCache:
     """
     Cache en memoria para configuraciones de prompts por tenant
-    Implementa namespace estricto: tenant:{tenant_id}:prompt
+    Implementa namespace estricto: tenant_prompts:tenant:{tenant_id}:prompt
+    Respaldado por el cache unificado (acotado, single-flight, compartible entre workers)
     """
     
-    def __init__(self, default_ttl: int = 600):
-        self._cache: Dict[str, CachedPromptConfig] = {}
+    def __init__(self, default_ttl: int = TENANT_PROMPT_CACHE_TTL_SECONDS, max_entries: int = 1000):
         self._default_ttl = default_ttl
+        self._cache = cache_manager.namespace(
+            "tenant_prompts", ttl=default_ttl, max_entries=max_entries, shared=True
+        )
     
     def _get_cache_key(self, tenant_id: str) -> str:
         """Generar clave de caché con namespace estricto"""
         if not tenant_id:
             raise ValueError("tenant_id es requerido para cache")
-        return f"tenant:{tenant_id}:prompt"
-    
-    def _is_expired(self, config: CachedPromptConfig) -> bool:
-        """Verificar si la configuración está expirada"""
-        return time.time() - config.cached_at > config.ttl_seconds
+        return "prompt"
     
     def get(self, tenant_id: str) -> Optional[CachedPromptConfig]:
         """
@@ -55,28 +61,17 @@ class TenantPromptCache:
         """
         if not tenant_id:
             return None
-            
-        cache_key = self._get_cache_key(tenant_id)
-        config = self._cache.get(cache_key)
         
-        if not config:
-            return None
-        
-        if self._is_expired(config):
-            # Eliminar configuración expirada
-            del self._cache[cache_key]
-            return None
-        
-        return config
+        return self._cache.get(self._get_cache_key(tenant_id), tenant_id=tenant_id)
     
-    def set(
+    def build(
         self, 
         tenant_id: str, 
         prompt_config: TenantPrompts, 
         ttl_seconds: Optional[int] = None
-    ) -> None:
+    ) -> CachedPromptConfig:
         """
-        Guardar configuración en caché
+        Construir la configuración cacheable (incluye prompt enriquecido)
         ESTRICTO: Solo permite cache por tenant_id válido
         """
         if not tenant_id:
@@ -91,7 +86,6 @@ class TenantPromptCache:
                 f"tenant_id mismatch: cache={tenant_id}, config={prompt_config.tenant_id}"
             )
         
-        cache_key = self._get_cache_key(tenant_id)
         ttl = ttl_seconds or self._default_ttl
         
         # 🤖 GENERAR PROMPT ENRIQUECIDO con capacidades de BD
@@ -111,7 +105,7 @@ class TenantPromptCache:
             print(f"Warning: Error generating enhanced prompt for {tenant_id}: {e}")
             enhanced_prompt = prompt_config.system_prompt
         
-        cached_config = CachedPromptConfig(
+        return CachedPromptConfig(
             tenant_id=tenant_id,
             system_prompt=prompt_config.system_prompt,
             enhanced_system_prompt=enhanced_prompt,
@@ -123,8 +117,34 @@ class TenantPromptCache:
             cached_at=time.time(),
             ttl_seconds=ttl
         )
+    
+    def set(
+        self, 
+        tenant_id: str, 
+        prompt_config: TenantPrompts, 
+        ttl_seconds: Optional[int] = None
+    ) -> None:
+        """Guardar configuración en caché"""
+        cached_config = self.build(tenant_id, prompt_config, ttl_seconds)
+        self._cache.set(
+            self._get_cache_key(tenant_id), cached_config,
+            ttl=cached_config.ttl_seconds, tenant_id=tenant_id
+        )
+    
+    def get_or_load(
+        self, 
+        tenant_id: str, 
+        loader: Callable[[], Optional[TenantPrompts]]
+    ) -> Optional[CachedPromptConfig]:
+        """
+        Cache-aside con single-flight: requests concurrentes del mismo tenant
+        comparten una sola consulta a BD
+        """
+        def load() -> Optional[CachedPromptConfig]:
+            db_config = loader()
+            return self.build(tenant_id, db_config) if db_config else None
         
-        self._cache[cache_key] = cached_config
+        return self._cache.get_or_load(self._get_cache_key(tenant_id), load, tenant_id=tenant_id)
     
     def invalidate(self, tenant_id: str) -> bool:
         """
@@ -133,54 +153,34 @@ class TenantPromptCache:
         """
         if not tenant_id:
             return False
-            
-        cache_key = self._get_cache_key(tenant_id)
-        if cache_key in self._cache:
-            del self._cache[cache_key]
-            return True
-        return False
+        
+        return self._cache.delete(self._get_cache_key(tenant_id), tenant_id=tenant_id)
     
     def invalidate_all(self) -> int:
         """
         Invalidar todo el caché
         Retorna número de entradas eliminadas
         """
-        count = len(self._cache)
-        self._cache.clear()
-        return count
+        return self._cache.clear()
     
     def cleanup_expired(self) -> int:
         """
         Limpiar entradas expiradas
         Retorna número de entradas eliminadas
         """
-        current_time = time.time()
-        expired_keys = []
-        
-        for key, config in self._cache.items():
-            if current_time - config.cached_at > config.ttl_seconds:
-                expired_keys.append(key)
-        
-        for key in expired_keys:
-            del self._cache[key]
-        
-        return len(expired_keys)
+        return self._cache.cleanup_expired()
     
     def get_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas del caché"""
-        total_entries = len(self._cache)
-        expired_count = 0
-        current_time = time.time()
-        
-        for config in self._cache.values():
-            if current_time - config.cached_at > config.ttl_seconds:
-                expired_count += 1
-        
+        stats = self._cache.get_stats()
         return {
-            "total_entries": total_entries,
-            "active_entries": total_entries - expired_count,
-            "expired_entries": expired_count,
-            "default_ttl": self._default_ttl
+            "total_entries": stats["entries"],
+            "active_entries": stats["active_entries"],
+            "expired_entries": stats["expired_entries"],
+            "default_ttl": self._default_ttl,
+            "max_entries": stats["max_entries"],
+            "hit_rate": stats["hit_rate"],
+            "coalesced_loads": stats["coalesced"]
         }
 
 
@@ -196,34 +196,28 @@ def get_tenant_prompt_config(tenant_id: str, db: Session) -> Optional[CachedProm
     if not tenant_id:
         raise ValueError("tenant_id es requerido")
     
-    # Intentar obtener del caché primero
-    cached_config = tenant_prompt_cache.get(tenant_id)
-    if cached_config:
-        return cached_config
-    
-    # Si no está en caché, obtener de base de datos
-    db_config = db.query(TenantPrompts).filter(
-        TenantPrompts.tenant_id == tenant_id,
-        TenantPrompts.is_active == True
-    ).first()
-    
-    if not db_config:
-        return None
-    
-    # Guardar en caché y retornar
-    tenant_prompt_cache.set(tenant_id, db_config)
-    return tenant_prompt_cache.get(tenant_id)
+    # Caché primero; si no está, una sola consulta a BD aunque lleguen requests concurrentes
+    return tenant_prompt_cache.get_or_load(
+        tenant_id,
+        lambda: db.query(TenantPrompts).filter(
+            TenantPrompts.tenant_id == tenant_id,
+            TenantPrompts.is_active == True
+        ).first()
+    )
 
 
-def invalidate_tenant_prompt_cache(tenant_id: str) -> bool:
+def invalidate_tenant_prompt_cache(tenant_id: str, version: Optional[int] = None) -> bool:
     """
     Invalidar caché para un tenant específico
-    Se debe llamar después de PUT/rollback
+    Se debe llamar después de PUT/rollback: invalida este worker y publica el evento
+    (tenant_prompts, tenant_id, version) para el resto de workers y el bot
     """
     if not tenant_id:
         return False
     
-    return tenant_prompt_cache.invalidate(tenant_id)
+    removed = tenant_prompt_cache.invalidate(tenant_id)
+    publish_invalidation("tenant_prompts", tenant_id, version)
+    return removed
 
 
 def compose_final_system_prompt(
@@ -1,22 +1,53 @@
 """
 Servicio para manejar timeouts de conversación automáticamente
+Scheduler por heap de vencimientos en lugar de escanear flow_sesiones cada 10 segundos:
+
+- Un solo worker dispara timeouts: líder por pg_try_advisory_lock en una conexión dedicada
+  (los demás reintentan cada TIMEOUT_LEADER_RETRY_SECONDS; SQLite = siempre líder)
+- El heap se alimenta con la actividad de las sesiones (note_session_activity desde
+  guardar_sesion) y, para la actividad de otros workers/procesos, con una lectura incremental
+  last_message_at > watermark sobre el índice parcial ix_flow_sesiones_active_last_message
+- Al asumir el liderazgo (o tras reiniciar) se recargan las sesiones activas por el mismo índice
+- Al vencer se re-verifica la fila y se reclama con UPDATE condicional antes de enviar
+  (actividad nueva o finalización por otro camino => se descarta)
+- Envíos concurrentes acotados por TIMEOUT_SEND_CONCURRENCY
+- Cada reclamo sube flow_sesiones.version y se publica "flow_sessions" en el bus de
+  invalidación: el bot descarta su copia en cache de la sesión (session_store.py)
 """
 import asyncio
+import heapq
+import itertools
 import os
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from database import SessionLocal
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from database import SessionLocal, engine, SQLALCHEMY_DATABASE_URL
 from models import FlowSesion
-import httpx
+from services.db_pool import exempt_from_leak_detection
+from services.http_pool import http_clients
+from services.invalidation_bus import publish_invalidation
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Configuración de timeout (PRUEBA RÁPIDA - CAMBIAR A MINUTOS EN PRODUCCIÓN)
-TIMEOUT_CHECK_INTERVAL = 10   # Verificar cada 10 segundos (PRUEBA)
 WARNING_TIMEOUT_MINUTES = 0.5  # Advertencia a los 30 segundos (PRUEBA)
 FINAL_TIMEOUT_MINUTES = 1     # Finalizar a los 60 segundos (PRUEBA)
 
+TIMEOUT_SEND_CONCURRENCY = int(os.getenv("TIMEOUT_SEND_CONCURRENCY", "10"))
+# Cada cuánto se leen sesiones con actividad hecha en otros workers (índice parcial, solo filas nuevas)
+TIMEOUT_CATCHUP_SECONDS = float(os.getenv("TIMEOUT_CATCHUP_SECONDS", "5"))
+TIMEOUT_LEADER_RETRY_SECONDS = float(os.getenv("TIMEOUT_LEADER_RETRY_SECONDS", "15"))
+# Clave arbitraria del advisory lock de líder
+TIMEOUT_LEADER_LOCK_KEY = 74_210_017
+
+WARNING = "warning"
+FINAL = "final"
+
+_EPOCH = datetime(1970, 1, 1)
+
 async def send_timeout_message(telefono: str, mensaje: str):
     """Envía mensaje de timeout usando Twilio directamente"""
     try:
@@ -35,7 +66,7 @@ async def send_timeout_message(telefono: str, mensaje: str):
                 telefono = '+' + telefono
             telefono = f'whatsapp:{telefono}'
         
-        async with httpx.AsyncClient() as client:
+        async with http_clients.client("twilio") as client:
             auth = (account_sid, auth_token)
             
             data = {
@@ -58,24 +89,7 @@ async def send_timeout_message(telefono: str, mensaje: str):
     except Exception as e:
         logger.error(f"Error sending timeout message: {str(e)}")
 
-async def check_and_handle_timeouts():
-    """Verifica y maneja timeouts de todas las sesiones activas"""
-    db = SessionLocal()
-    try:
-        now = datetime.utcnow()
-        
-        # Buscar sesiones activas que necesiten advertencia (30 min)
-        warning_threshold = now - timedelta(minutes=WARNING_TIMEOUT_MINUTES)
-        sesiones_warning = db.query(FlowSesion).filter(
-            FlowSesion.conversation_active == True,
-            FlowSesion.timeout_warning_sent == False,
-            FlowSesion.last_message_at <= warning_threshold,
-            FlowSesion.estado != "FINALIZADA"
-        ).all()
-        
-        # Enviar advertencias
-        for sesion in sesiones_warning:
-            mensaje_warning = """⏰ *Seguimiento de Conversación*
+MENSAJE_WARNING = """⏰ *Seguimiento de Conversación*
             
 ¡Hola! Veo que ha pasado un tiempo desde tu último mensaje.
 
@@ -84,57 +98,307 @@ async def check_and_handle_timeouts():
 👉 Escribe *continuar* para seguir, o *finalizar* para terminar la conversación.
 
 ⏳ Si no respondes en 30 minutos más, finalizaré automáticamente la sesión."""
-            
-            await send_timeout_message(sesion.telefono, mensaje_warning)
-            sesion.timeout_warning_sent = True
-            
-        # Buscar sesiones para finalizar (60 min)
-        final_threshold = now - timedelta(minutes=FINAL_TIMEOUT_MINUTES)
-        sesiones_final = db.query(FlowSesion).filter(
-            FlowSesion.conversation_active == True,
-            FlowSesion.last_message_at <= final_threshold,
-            FlowSesion.estado != "FINALIZADA"
-        ).all()
-        
-        # Finalizar conversaciones
-        for sesion in sesiones_final:
-            mensaje_final = """🔚 *Conversación Finalizada*
+
+MENSAJE_FINAL = """🔚 *Conversación Finalizada*
 
 Por tu seguridad y para optimizar nuestro servicio, he finalizado esta conversación por inactividad.
 
 Si necesitas ayuda nuevamente, envía *hola* para iniciar una nueva sesión.
 
 ¡Gracias por contactar Sintestesia! 🙏"""
-            
-            await send_timeout_message(sesion.telefono, mensaje_final)
-            sesion.conversation_active = False
-            sesion.estado = "FINALIZADA"
-            
-        db.commit()
-        logger.info(f"Processed {len(sesiones_warning)} warnings, {len(sesiones_final)} finalizations")
-        
-    except Exception as e:
-        logger.error(f"Error in timeout check: {str(e)}")
-        db.rollback()
-    finally:
-        db.close()
-
-async def timeout_service_loop():
-    """Loop principal del servicio de timeouts"""
-    logger.info("Starting conversation timeout service...")
-    
-    while True:
+
+# Reclamos condicionales: si llegó un mensaje nuevo (last_message_at cambió) no se aplican
+_CLAIM_VALUES = {
+    WARNING: {"timeout_warning_sent": True},
+    FINAL: {"conversation_active": False, "estado": "FINALIZADA"},
+}
+
+
+def _epoch(value: datetime) -> float:
+    return (value - _EPOCH).total_seconds()
+
+
+class TimeoutScheduler:
+    """Heap de vencimientos (momento, seq, session_id, last_message_at, tipo) con verificación al disparar"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, int, datetime, str]] = []
+        # session_id -> last_message_at vigente; los timers de actividad anterior se descartan al salir del heap
+        self._latest: Dict[int, datetime] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock_conn = None
+        self.is_leader = False
+        self._watermark = _EPOCH
+        self._stats: Dict[str, Any] = {
+            "activity_events": 0,
+            "catchup_rows": 0,
+            "recovered": 0,
+            "fired": 0,
+            "warnings_sent": 0,
+            "finals_sent": 0,
+            "stale_skipped": 0,
+            "send_errors": 0,
+            "last_fire_ms": None,
+        }
+
+    # ==================== ALIMENTACIÓN ====================
+
+    def _schedule(self, session_id: int, last_message_at: datetime, warning_sent: bool) -> None:
+        base = _epoch(last_message_at)
+        with self._lock:
+            current = self._latest.get(session_id)
+            if current is not None and current >= last_message_at:
+                return
+            self._latest[session_id] = last_message_at
+            if not warning_sent:
+                heapq.heappush(self._heap, (base + WARNING_TIMEOUT_MINUTES * 60, next(self._seq),
+                                            session_id, last_message_at, WARNING))
+            heapq.heappush(self._heap, (base + FINAL_TIMEOUT_MINUTES * 60, next(self._seq),
+                                        session_id, last_message_at, FINAL))
+            if last_message_at > self._watermark:
+                self._watermark = last_message_at
+
+    def note_activity(self, session_id: Optional[int], last_message_at: Optional[datetime]) -> None:
+        """Mensaje nuevo en una sesión (llamado desde guardar_sesion; seguro desde threads)"""
+        if not self.is_leader or session_id is None or last_message_at is None:
+            return
+        self._stats["activity_events"] += 1
+        self._schedule(session_id, last_message_at, False)
+        # Los vencimientos viejos de la sesión se descartan al salir del heap (_latest)
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _load_active(self, since: datetime) -> int:
+        """Sesiones activas con last_message_at > since (índice parcial); bloqueante"""
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(FlowSesion.id, FlowSesion.last_message_at, FlowSesion.timeout_warning_sent)
+                .filter(
+                    FlowSesion.conversation_active == True,
+                    FlowSesion.last_message_at > since,
+                    FlowSesion.estado != "FINALIZADA",
+                )
+                .all()
+            )
+        finally:
+            db.close()
+        for row in rows:
+            self._schedule(row.id, row.last_message_at, bool(row.timeout_warning_sent))
+        return len(rows)
+
+    # ==================== LIDERAZGO ====================
+
+    def _try_acquire_leadership(self) -> bool:
+        if not SQLALCHEMY_DATABASE_URL.startswith("postgres"):
+            return True
+        conn = engine.connect()
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": TIMEOUT_LEADER_LOCK_KEY}).scalar()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        # La conexión mantiene el lock mientras viva: retenida a propósito
+        exempt_from_leak_detection(conn)
+        self._lock_conn = conn
+        return True
+
+    def _still_leader(self) -> bool:
+        if self._lock_conn is None:
+            return self.is_leader
         try:
-            await check_and_handle_timeouts()
-            await asyncio.sleep(TIMEOUT_CHECK_INTERVAL)
+            self._lock_conn.execute(text("SELECT 1"))
+            self._lock_conn.commit()
+            return True
         except Exception as e:
-            logger.error(f"Error in timeout service loop: {str(e)}")
-            await asyncio.sleep(60)  # Esperar 1 minuto antes de reintentar
+            logger.warning(f"Timeout scheduler lost its leader connection: {e}")
+            self._release_leadership()
+            return False
+
+    def _release_leadership(self) -> None:
+        self.is_leader = False
+        with self._lock:
+            self._heap.clear()
+            self._latest.clear()
+        if self._lock_conn is not None:
+            try:
+                self._lock_conn.close()
+            except Exception:
+                pass
+            self._lock_conn = None
+
+    # ==================== DISPARO ====================
+
+    def _pop_due(self, now: float) -> List[Tuple[float, int, int, datetime, str]]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                session_id, last_message_at, kind = entry[2], entry[3], entry[4]
+                if self._latest.get(session_id) != last_message_at:
+                    self._stats["stale_skipped"] += 1
+                    continue
+                if kind == FINAL:
+                    del self._latest[session_id]
+                due.append(entry)
+        return due
+
+    def _claim(self, due) -> List[Tuple[str, str]]:
+        """Verifica y reclama los vencimientos en una transacción; devuelve (tipo, teléfono) a enviar"""
+        db = SessionLocal()
+        try:
+            ids = {entry[2] for entry in due}
+            rows = {
+                row.id: row
+                for row in db.query(FlowSesion.id, FlowSesion.tenant_id, FlowSesion.telefono,
+                                    FlowSesion.last_message_at)
+                .filter(FlowSesion.id.in_(ids))
+            }
+            to_send = []
+            claimed_sessions = []
+            for _, _, session_id, last_message_at, kind in due:
+                row = rows.get(session_id)
+                if row is None or row.last_message_at != last_message_at:
+                    self._stats["stale_skipped"] += 1
+                    continue
+                query = db.query(FlowSesion).filter(
+                    FlowSesion.id == session_id,
+                    FlowSesion.last_message_at == last_message_at,
+                    FlowSesion.conversation_active == True,
+                    FlowSesion.estado != "FINALIZADA",
+                )
+                if kind == WARNING:
+                    query = query.filter(FlowSesion.timeout_warning_sent == False)
+                claimed = query.update(
+                    {**_CLAIM_VALUES[kind], "version": FlowSesion.version + 1},
+                    synchronize_session=False,
+                )
+                if claimed == 1:
+                    to_send.append((kind, row.telefono))
+                    claimed_sessions.append((row.tenant_id, row.telefono))
+                else:
+                    self._stats["stale_skipped"] += 1
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        # La versión de la fila cambió: el bot debe releerla en vez de escribir sobre ella
+        for tenant_id, telefono in claimed_sessions:
+            publish_invalidation("flow_sessions", tenant_id, key=telefono)
+        return to_send
+
+    async def _send_all(self, to_send: List[Tuple[str, str]]) -> None:
+        semaphore = asyncio.Semaphore(TIMEOUT_SEND_CONCURRENCY)
+
+        async def send(kind: str, telefono: str) -> None:
+            async with semaphore:
+                await send_timeout_message(telefono, MENSAJE_WARNING if kind == WARNING else MENSAJE_FINAL)
+            self._stats["warnings_sent" if kind == WARNING else "finals_sent"] += 1
+
+        results = await asyncio.gather(*(send(kind, telefono) for kind, telefono in to_send), return_exceptions=True)
+        self._stats["send_errors"] += sum(1 for result in results if isinstance(result, Exception))
+
+    async def fire_due(self) -> int:
+        due = self._pop_due(_epoch(datetime.utcnow()))
+        if not due:
+            return 0
+        started = time.perf_counter()
+        self._stats["fired"] += len(due)
+        to_send = await asyncio.to_thread(self._claim, due)
+        if to_send:
+            await self._send_all(to_send)
+            logger.info(f"Timeout scheduler sent {len(to_send)} messages")
+        self._stats["last_fire_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return len(to_send)
+
+    def _seconds_to_next_due(self) -> float:
+        with self._lock:
+            if not self._heap:
+                return TIMEOUT_CATCHUP_SECONDS
+            return max(0.0, self._heap[0][0] - _epoch(datetime.utcnow()))
+
+    # ==================== LOOP ====================
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        logger.info("Starting conversation timeout service...")
+        last_catchup = 0.0
+
+        while True:
+            try:
+                if not self.is_leader:
+                    if not await asyncio.to_thread(self._try_acquire_leadership):
+                        await asyncio.sleep(TIMEOUT_LEADER_RETRY_SECONDS)
+                        continue
+                    # Recuperación: todas las sesiones activas, por el índice parcial
+                    # Si falla se suelta el lock: otro worker (o el próximo intento) la reintenta
+                    self.is_leader = True
+                    try:
+                        self._stats["recovered"] += await asyncio.to_thread(self._load_active, _EPOCH)
+                    except Exception:
+                        self._release_leadership()
+                        raise
+                    last_catchup = time.monotonic()
+                    logger.info("Timeout scheduler is the leader for this deployment")
+
+                await self.fire_due()
+
+                if time.monotonic() - last_catchup >= TIMEOUT_CATCHUP_SECONDS:
+                    if not await asyncio.to_thread(self._still_leader):
+                        continue
+                    # Actividad de otros workers: solo filas con last_message_at posterior al watermark
+                    self._stats["catchup_rows"] += await asyncio.to_thread(self._load_active, self._watermark)
+                    last_catchup = time.monotonic()
+
+                timeout = min(self._seconds_to_next_due(), TIMEOUT_CATCHUP_SECONDS)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+            except asyncio.CancelledError:
+                self._release_leadership()
+                raise
+            except Exception as e:
+                logger.error(f"Error in timeout service loop: {str(e)}")
+                await asyncio.sleep(60)  # Esperar 1 minuto antes de reintentar
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._heap)
+            sessions = len(self._latest)
+        return {**self._stats, "is_leader": self.is_leader, "pending_timers": pending,
+                "tracked_sessions": sessions,
+                "watermark": self._watermark.isoformat() if self._watermark > _EPOCH else None}
+
+
+# Scheduler global del proceso
+timeout_scheduler = TimeoutScheduler()
+
+
+def note_session_activity(session_id: Optional[int], last_message_at: Optional[datetime]) -> None:
+    timeout_scheduler.note_activity(session_id, last_message_at)
+
 
 def start_timeout_service():
     """Inicia el servicio de timeouts en background"""
     if os.getenv("ENABLE_TIMEOUT_SERVICE", "true").lower() == "true":
-        asyncio.create_task(timeout_service_loop())
+        asyncio.create_task(timeout_scheduler.run())
         logger.info("Conversation timeout service started")
     else:
-        logger.info("Timeout service disabled by configuration")
\ No newline at end of file
+        logger.info("Timeout service disabled by configuration")
+
+
+def get_timeout_service_stats() -> Dict[str, Any]:
+    return timeout_scheduler.get_stats()
@@ -12,21 +12,29 @@ from urllib.parse import urlparse
 from datetime import datetime
 import re
 
-from fastapi import HTTPException, Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import text, create_engine
-from sqlalchemy.pool import StaticPool
+from fastapi import HTTPException
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from sqlalchemy import text
 
-from database import SessionLocal
+from database import async_engine
+from services.cache import cache_manager
+from services.audit_sink import audit_sink
+from services.read_routing import replica_router
 
 # Global context variables para request multi-tenant
 _tenant_context: ContextVar[Optional[str]] = ContextVar('tenant_id', default=None)
 _request_context: ContextVar[Optional[Dict]] = ContextVar('request_info', default=None)
 
-# Cache optimizado para resolución de tenants
-_tenant_cache: Dict[str, Dict[str, Any]] = {}
+# get_read_db / get_async_read_db aplican read-your-writes al tenant del request
+replica_router.tenant_resolver = _tenant_context.get
+
+# Cache optimizado para resolución de tenants (acotado, compartido entre workers si hay Redis)
 _cache_ttl = 300  # 5 minutos - más tiempo para estabilidad
+_tenant_cache = cache_manager.namespace("tenant_resolution", ttl=_cache_ttl, max_entries=5000, shared=True)
+
+_IPV4_RE = re.compile(r'^\d+\.\d+\.\d+\.\d+$')
 
 # Logger para auditoría
 logger = logging.getLogger(__name__)
@@ -42,9 +50,37 @@ _resolution_stats = {
 }
 
 
-class TenantMiddleware(BaseHTTPMiddleware):
+class TenantLookupUnavailable(Exception):
+    """La BD no respondió al resolver el tenant: 503, y el resultado no se cachea"""
+
+
+class PrefixTrie:
+    """Trie de caracteres compilado una vez: ¿algún prefijo registrado es prefijo del path?"""
+    
+    _END = object()
+    
+    def __init__(self, prefixes: List[str]):
+        self._root: Dict[Any, Any] = {}
+        for prefix in prefixes:
+            node = self._root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[self._END] = True
+    
+    def matches(self, path: str) -> bool:
+        node = self._root
+        for char in path:
+            if self._END in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return self._END in node
+
+
+class TenantMiddleware:
     """
-    🏢 MIDDLEWARE MULTI-TENANT AVANZADO
+    🏢 MIDDLEWARE MULTI-TENANT AVANZADO (ASGI puro)
     
     Resolución multi-fuente de tenants con auditoría y seguridad:
     
@@ -60,6 +96,11 @@ class TenantMiddleware(BaseHTTPMiddleware):
     - Auditoría completa de accesos
     - Cache con TTL para performance
     
+    ⚡ RENDIMIENTO:
+    - ASGI puro: no envuelve ni bufferea el body de la respuesta (streaming intacto)
+    - Consultas por el engine async (no bloquean el event loop)
+    - Bypass por set exacto + trie de prefijos compilado al iniciar
+    
     ❌ RECHAZO:
     - Requests sin tenant válido
     - Tenant IDs malformados
@@ -71,6 +112,8 @@ class TenantMiddleware(BaseHTTPMiddleware):
         "/",
         "/health",
         "/__debug/health", 
+        "/__debug/tenant/cache",
+        "/__debug/tenant/cache/clear",
         "/docs",
         "/openapi.json",
         "/redoc",
@@ -92,92 +135,116 @@ class TenantMiddleware(BaseHTTPMiddleware):
         "/bot-proxy/", # Bot proxy endpoint (fixes HTTPS mixed content)
         "/debug/" # Debug endpoints for development
     ]
+    
+    # Static assets
+    BYPASS_SUFFIXES = ('.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.ico', '.svg', '.woff', '.woff2', '.ttf', '.eot')
+    
+    # Hosts donde se permite resolver por ?client_slug / X-Client-Slug
+    ALLOWED_FALLBACK_HOSTS = {
+        "app.sintestesia.cl", "sintestesia.cl",
+        "127.0.0.1:8002", "localhost:8002", "localhost:8000", "127.0.0.1:8000"
+    }
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._bypass_exact = frozenset(self.BYPASS_PATHS)
+        self._bypass_prefixes = PrefixTrie(self.BYPASS_PREFIXES)
 
-    async def dispatch(self, request: Request, call_next) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """🔄 Procesa request con resolución multi-fuente de tenant"""
-        start_time = time.time()
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        path = scope["path"]
+        
+        # ✅ Verificar si el path debe bypass tenant resolution
+        if self._should_bypass_tenant_resolution(path):
+            await self.app(scope, receive, send)
+            self._log_audit_event(scope, None, "BYPASS", "success", time.perf_counter() - start_time)
+            return
+        
+        headers = Headers(scope=scope)
         tenant_id = None
         resolution_method = None
-        
         try:
-            # ✅ Verificar si el path debe bypass tenant resolution
-            if self._should_bypass_tenant_resolution(request.url.path):
-                response = await call_next(request)
-                await self._log_audit_event(request, None, "BYPASS", "success", time.time() - start_time)
-                return response
-            
             # 🔍 Resolver tenant (principalmente desde subdomain)
-            tenant_id, resolution_method = await self._resolve_tenant_id(request)
-            
-            # ❌ Rechazar si no se puede resolver tenant
-            if not tenant_id:
-                await self._log_audit_event(request, None, "REJECTED", "no_tenant", time.time() - start_time)
-                _resolution_stats['rejected'] += 1
-                raise HTTPException(
-                    status_code=400,
-                    detail={
-                        "error": "tenant_not_resolved",
-                        "message": "No se pudo resolver el tenant desde ninguna fuente",
-                        "sources_checked": ["header", "subdomain", "path", "query"],
-                        "host": request.headers.get("host", ""),
-                        "path": request.url.path
-                    }
-                )
-            
-            # 🔒 Validar tenant ID
-            if not self._is_valid_tenant_id(tenant_id):
-                await self._log_audit_event(request, tenant_id, "REJECTED", "invalid_tenant", time.time() - start_time)
-                _resolution_stats['rejected'] += 1
-                raise HTTPException(
-                    status_code=400,
-                    detail={
-                        "error": "invalid_tenant_id", 
-                        "message": f"Tenant ID malformado: {tenant_id}",
-                        "tenant_id": tenant_id
-                    }
-                )
-            
-            # ✅ Establecer contexto de tenant
-            _tenant_context.set(tenant_id)
-            _request_context.set({
-                "tenant_id": tenant_id,
-                "resolution_method": resolution_method,
-                "timestamp": datetime.utcnow(),
-                "request_id": id(request),
-                "path": request.url.path,
-                "method": request.method,
-                "host": request.headers.get("host", ""),
-                "user_agent": request.headers.get("user-agent", "")
+            tenant_id, resolution_method = await self._resolve_tenant_id(scope, headers)
+        except TenantLookupUnavailable as e:
+            # Error transitorio de BD: el cliente puede reintentar (no se cacheó "no existe")
+            self._log_audit_event(scope, None, "ERROR", "lookup_unavailable", time.perf_counter() - start_time)
+            await self._reject(scope, receive, send, 503, {
+                "error": "tenant_lookup_unavailable",
+                "message": f"No se pudo verificar el tenant, reintenta: {str(e)}"
             })
-            
-            # 📊 Actualizar estadísticas
-            _resolution_stats[resolution_method] += 1
-            
-            # 🎯 Procesar request
-            response = await call_next(request)
-            
-            # ✅ Log de éxito
-            await self._log_audit_event(request, tenant_id, resolution_method.upper(), "success", time.time() - start_time)
-            
-            return response
-            
-        except HTTPException:
-            raise
+            return
         except Exception as e:
             # ❌ Log de error
-            await self._log_audit_event(request, tenant_id, resolution_method or "ERROR", f"exception: {str(e)}", time.time() - start_time)
-            raise HTTPException(
-                status_code=500,
-                detail={
-                    "error": "tenant_resolution_error",
-                    "message": f"Error interno resolviendo tenant: {str(e)}",
-                    "tenant_id": tenant_id
-                }
-            )
+            self._log_audit_event(scope, tenant_id, "ERROR", f"exception: {str(e)}", time.perf_counter() - start_time)
+            await self._reject(scope, receive, send, 500, {
+                "error": "tenant_resolution_error",
+                "message": f"Error interno resolviendo tenant: {str(e)}",
+                "tenant_id": tenant_id
+            })
+            return
+        
+        # ❌ Rechazar si no se puede resolver tenant
+        if not tenant_id:
+            self._log_audit_event(scope, None, "REJECTED", "no_tenant", time.perf_counter() - start_time)
+            _resolution_stats['rejected'] += 1
+            await self._reject(scope, receive, send, 400, {
+                "error": "tenant_not_resolved",
+                "message": "No se pudo resolver el tenant desde ninguna fuente",
+                "sources_checked": ["header", "subdomain", "path", "query"],
+                "host": headers.get("host", ""),
+                "path": path
+            })
+            return
+        
+        # 🔒 Validar tenant ID
+        if not self._is_valid_tenant_id(tenant_id):
+            self._log_audit_event(scope, tenant_id, "REJECTED", "invalid_tenant", time.perf_counter() - start_time)
+            _resolution_stats['rejected'] += 1
+            await self._reject(scope, receive, send, 400, {
+                "error": "invalid_tenant_id", 
+                "message": f"Tenant ID malformado: {tenant_id}",
+                "tenant_id": tenant_id
+            })
+            return
+        
+        # ✅ Establecer contexto de tenant
+        tenant_token = _tenant_context.set(tenant_id)
+        request_token = _request_context.set({
+            "tenant_id": tenant_id,
+            "resolution_method": resolution_method,
+            "timestamp": datetime.utcnow(),
+            "request_id": id(scope),
+            "path": path,
+            "method": scope["method"],
+            "host": headers.get("host", ""),
+            "user_agent": headers.get("user-agent", "")
+        })
+        
+        # 📊 Actualizar estadísticas
+        _resolution_stats[resolution_method] += 1
+        
+        try:
+            # 🎯 Procesar request (send pasa directo: sin buffer de la respuesta)
+            await self.app(scope, receive, send)
+            
+            # ✅ Log de éxito
+            self._log_audit_event(scope, tenant_id, resolution_method.upper(), "success", time.perf_counter() - start_time)
         finally:
             # 🧹 Limpiar contexto después del request
-            _tenant_context.set(None)
-            _request_context.set(None)
+            _tenant_context.reset(tenant_token)
+            _request_context.reset(request_token)
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, status_code: int, detail: Dict[str, Any]) -> None:
+        """Responde el error directamente (mismo body que un HTTPException de FastAPI)"""
+        response = JSONResponse({"detail": detail}, status_code=status_code)
+        await response(scope, receive, send)
 
     def _should_bypass_tenant_resolution(self, path: str) -> bool:
         """
@@ -189,36 +256,30 @@ class TenantMiddleware(BaseHTTPMiddleware):
         Returns:
             True if path should bypass tenant resolution
         """
-        # Exact match for bypass paths
-        if path in self.BYPASS_PATHS:
-            return True
-        
-        # Check bypass prefixes
-        if any(path.startswith(prefix) for prefix in self.BYPASS_PREFIXES):
+        # Exact match for bypass paths (includes specific debug endpoints)
+        if path in self._bypass_exact:
             return True
         
-        # Allow specific debug endpoints (not tenant-related ones)
-        if path in ["/__debug/health", "/__debug/tenant/cache", "/__debug/tenant/cache/clear"]:
+        # Check bypass prefixes (single walk over the compiled trie)
+        if self._bypass_prefixes.matches(path):
             return True
             
         # Allow static assets
-        if path.endswith(('.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.ico', '.svg', '.woff', '.woff2', '.ttf', '.eot')):
-            return True
-            
-        return False
+        return path.endswith(self.BYPASS_SUFFIXES)
 
-    async def _resolve_tenant_id(self, request: Request) -> tuple[Optional[str], Optional[str]]:
+    async def _resolve_tenant_id(self, scope: Scope, headers: Headers) -> tuple[Optional[str], Optional[str]]:
         """
         Resolve tenant_id using the configured resolution order.
         
         Args:
-            request: FastAPI request object
+            scope: ASGI scope
+            headers: Request headers
             
         Returns:
             Tuple(tenant_id, resolution_method) or (None, None)
         """
         # 1. Check X-Tenant-Id header first (webhooks, APIs internas)
-        tenant_header = request.headers.get("X-Tenant-Id")
+        tenant_header = headers.get("X-Tenant-Id")
         if tenant_header and tenant_header.strip():
             tenant_id = tenant_header.strip()
             # Validar que el tenant existe
@@ -226,13 +287,13 @@ class TenantMiddleware(BaseHTTPMiddleware):
                 return tenant_id, "header"
         
         # 2. Extract subdomain from Host header (método principal)
-        host = request.headers.get("Host", "")
+        host = headers.get("Host", "")
         if host:
             subdomain = self._extract_subdomain(host)
             if subdomain:
                 # Usar cache primero
                 cache_key = f"subdomain:{subdomain}"
-                cached_tenant = self._get_cached_value(cache_key)
+                cached_tenant = _tenant_cache.get(cache_key)
                 if cached_tenant:
                     _resolution_stats['cached'] += 1
                     return cached_tenant, "subdomain"
@@ -244,16 +305,12 @@ class TenantMiddleware(BaseHTTPMiddleware):
         
         # 3. Fallback SEGURO: solo permitir client_slug cuando el host NO es un subdominio tenant
         # (ej. app.sintestesia.cl, sintestesia.cl, localhost/dev). Evita spoofing entre tenants.
-        host_clean = (request.headers.get("host") or "").lower()
-        allowed_fallback_hosts = {
-            "app.sintestesia.cl", "sintestesia.cl",
-            "127.0.0.1:8002", "localhost:8002", "localhost:8000", "127.0.0.1:8000"
-        }
+        host_clean = host.lower()
         # si ya había subdominio válido, no usar fallback
         sub = self._extract_subdomain(host_clean) if host_clean else None
         is_tenant_subdomain = bool(sub and sub not in {"app", "www"})
-        if (not is_tenant_subdomain) and (host_clean in allowed_fallback_hosts):
-            slug = request.query_params.get("client_slug") or request.headers.get("X-Client-Slug")
+        if (not is_tenant_subdomain) and (host_clean in self.ALLOWED_FALLBACK_HOSTS):
+            slug = QueryParams(scope.get("query_string", b"")).get("client_slug") or headers.get("X-Client-Slug")
             if slug and re.fullmatch(r"[a-z0-9-]{1,63}", slug):
                 tenant_id = await self._resolve_subdomain_to_tenant_id(slug.strip())
                 if tenant_id:
@@ -281,8 +338,7 @@ class TenantMiddleware(BaseHTTPMiddleware):
             host_clean = host.split(':')[0]
             
             # Skip IP addresses (like 127.0.0.1, 192.168.1.1, etc.)
-            import re
-            if re.match(r'^\d+\.\d+\.\d+\.\d+$', host_clean):
+            if _IPV4_RE.match(host_clean):
                 return None
             
             # Skip localhost
@@ -313,23 +369,17 @@ class TenantMiddleware(BaseHTTPMiddleware):
         Returns:
             Tenant ID or None if not found
         """
-        # Check cache first
-        cache_key = f"subdomain:{subdomain}"
-        cached = self._get_cached_value(cache_key)
-        if cached is not None:
-            return cached
-
-        # Query database
-        tenant_id = await self._query_tenant_by_slug(subdomain)
-        
-        # Cache result (even if None, to avoid repeated DB calls)
-        self._set_cached_value(cache_key, tenant_id)
-        
-        return tenant_id
+        # Cache con single-flight: una ráfaga de requests al mismo subdominio hace una sola consulta
+        # (se cachea también None para evitar consultas repetidas)
+        return await _tenant_cache.aget_or_load(
+            f"subdomain:{subdomain}",
+            lambda: self._query_tenant_by_slug(subdomain),
+            cache_none=True
+        )
 
     async def _query_tenant_by_slug(self, slug: str) -> Optional[str]:
         """
-        Query tenant_clients table for tenant_id by slug.
+        Query tenant_clients table for tenant_id by slug (async engine).
         
         Args:
             slug: Slug to search for
@@ -338,9 +388,9 @@ class TenantMiddleware(BaseHTTPMiddleware):
             Tenant ID or None if not found
         """
         try:
-            with SessionLocal() as db:
+            async with async_engine.connect() as conn:
                 # Use raw SQL to avoid model dependencies
-                result = db.execute(
+                result = await conn.execute(
                     text("SELECT id FROM tenant_clients WHERE slug = :slug LIMIT 1"),
                     {"slug": slug}
                 )
@@ -348,33 +398,13 @@ class TenantMiddleware(BaseHTTPMiddleware):
                 return row[0] if row else None
                 
         except Exception as e:
-            # Log error but don't break request processing
-            print(f"Error querying tenant by slug '{slug}': {e}")
-            return None
-
-    def _get_cached_value(self, key: str) -> Optional[str]:
-        """Get value from cache if not expired."""
-        if key not in _slug_cache:
-            return None
-            
-        entry = _slug_cache[key]
-        if time.time() - entry['timestamp'] > _cache_ttl:
-            # Expired, remove from cache
-            del _slug_cache[key]
-            return None
-            
-        return entry['value']
-
-    def _set_cached_value(self, key: str, value: Optional[str]) -> None:
-        """Set value in cache with current timestamp."""
-        _tenant_cache[key] = {
-            'value': value,
-            'timestamp': time.time()
-        }
+            # Sin cachear None: un error transitorio no debe ocultar el tenant durante el TTL
+            logger.error(f"Error querying tenant by slug '{slug}': {e}")
+            raise TenantLookupUnavailable(str(e)) from e
 
     async def _validate_tenant_exists(self, tenant_id: str) -> bool:
         """
-        🔍 Valida que el tenant existe en la base de datos
+        🔍 Valida que el tenant existe en la base de datos (cacheado, con single-flight)
         
         Args:
             tenant_id: ID del tenant a validar
@@ -382,16 +412,23 @@ class TenantMiddleware(BaseHTTPMiddleware):
         Returns:
             True si existe, False si no
         """
+        return await _tenant_cache.aget_or_load(
+            f"exists:{tenant_id}",
+            lambda: self._query_tenant_exists(tenant_id)
+        )
+
+    async def _query_tenant_exists(self, tenant_id: str) -> bool:
         try:
-            with SessionLocal() as db:
-                result = db.execute(
+            async with async_engine.connect() as conn:
+                result = await conn.execute(
                     text("SELECT 1 FROM tenant_clients WHERE id = :tenant_id LIMIT 1"),
                     {"tenant_id": tenant_id}
                 )
                 return result.fetchone() is not None
         except Exception as e:
+            # Sin cachear False: un error transitorio no debe rechazar el tenant durante el TTL
             logger.error(f"Error validating tenant {tenant_id}: {e}")
-            return False
+            raise TenantLookupUnavailable(str(e)) from e
 
     def _is_valid_tenant_id(self, tenant_id: str) -> bool:
         """
@@ -410,59 +447,20 @@ class TenantMiddleware(BaseHTTPMiddleware):
         # Longitud entre 3 y 63 caracteres
         return bool(re.fullmatch(r"[a-z0-9-]{3,63}", tenant_id))
 
-    async def _log_audit_event(self, request: Request, tenant_id: Optional[str], 
-                              method: str, status: str, duration: float) -> None:
+    def _log_audit_event(self, scope: Scope, tenant_id: Optional[str],
+                         method: str, status: str, duration: float) -> None:
         """
         📋 Registra eventos de auditoría para resolución de tenants
         
         Args:
-            request: Request object
+            scope: ASGI scope del request
             tenant_id: ID del tenant resuelto (o None)
             method: Método de resolución usado
             status: Estado del evento (success, error, rejected)
             duration: Duración del procesamiento en segundos
         """
-        try:
-            audit_data = {
-                "timestamp": datetime.utcnow().isoformat(),
-                "tenant_id": tenant_id,
-                "resolution_method": method,
-                "status": status,
-                "duration_ms": round(duration * 1000, 2),
-                "request_info": {
-                    "method": request.method,
-                    "path": request.url.path,
-                    "host": request.headers.get("host", ""),
-                    "user_agent": request.headers.get("user-agent", "")[:100],  # Truncar
-                    "ip": getattr(request.client, 'host', '') if request.client else '',
-                    "query_params": dict(request.query_params) if request.query_params else {}
-                }
-            }
-            
-            # Log estructurado para auditoría
-            if status == "success":
-                logger.info("TENANT_RESOLVED", extra=audit_data)
-            elif status == "rejected" or status == "no_tenant":
-                logger.warning("TENANT_REJECTED", extra=audit_data)
-            else:
-                logger.error("TENANT_ERROR", extra=audit_data)
-                
-        except Exception as e:
-            # No permitir que errores de auditoría afecten el request
-            logger.error(f"Error logging audit event: {e}")
-
-    def _get_cached_value(self, key: str) -> Optional[str]:
-        """Get value from cache if not expired."""
-        if key not in _tenant_cache:
-            return None
-            
-        entry = _tenant_cache[key]
-        if time.time() - entry['timestamp'] > _cache_ttl:
-            # Expired, remove from cache
-            del _tenant_cache[key]
-            return None
-            
-        return entry['value']
+        # Un solo append al ring buffer; muestreo, serialización y escritura en services/audit_sink
+        audit_sink.record_resolution(scope, tenant_id, method, status, duration)
 
 
 def get_tenant_id() -> str:
@@ -476,9 +474,7 @@ def get_tenant_id() -> str:
         HTTPException: If no tenant_id is set in context
     """
     tenant_id = _tenant_context.get()
-    print(f"DEBUG get_tenant_id: context value = {tenant_id}")  # DEBUG
     if not tenant_id:
-        print("DEBUG get_tenant_id: No tenant_id in context!")  # DEBUG
         raise HTTPException(
             status_code=400,
             detail="Tenant no resuelto"
@@ -498,22 +494,19 @@ def set_tenant_id(tenant_id: str) -> None:
 
 def clear_tenant_cache() -> None:
     """Clear the slug->tenant_id cache (useful for testing)."""
-    global _slug_cache
-    _slug_cache.clear()
+    _tenant_cache.clear()
 
 
 def get_cache_stats() -> Dict[str, Any]:
     """Get cache statistics (useful for debugging)."""
-    current_time = time.time()
-    total_entries = len(_slug_cache)
-    expired_entries = sum(
-        1 for entry in _slug_cache.values()
-        if current_time - entry['timestamp'] > _cache_ttl
-    )
-    
+    stats = _tenant_cache.get_stats()
     return {
-        'total_entries': total_entries,
-        'expired_entries': expired_entries,
-        'active_entries': total_entries - expired_entries,
-        'cache_ttl': _cache_ttl
+        'total_entries': stats['entries'],
+        'expired_entries': stats['expired_entries'],
+        'active_entries': stats['active_entries'],
+        'cache_ttl': _cache_ttl,
+        'max_entries': stats['max_entries'],
+        'hit_rate': stats['hit_rate'],
+        'evictions': stats['evictions'],
+        'coalesced_loads': stats['coalesced']
     }
\ No newline at end of file
@@ -4,5 +4,6 @@ Adapters para diferentes proveedores de WhatsApp
 from .base import WhatsAppAdapter
 from .twilio_adapter import TwilioAdapter
 from .meta_adapter import MetaAdapter
+from .http_pool import HttpClientRegistry, http_clients
 
-__all__ = ["WhatsAppAdapter", "TwilioAdapter", "MetaAdapter"]
\ No newline at end of file
+__all__ = ["WhatsAppAdapter", "TwilioAdapter", "MetaAdapter", "HttpClientRegistry", "http_clients"]
\ No newline at end of file
@@ -0,0 +1,250 @@
+"""
+Registro de clientes HTTP compartidos para los proveedores de WhatsApp
+Un httpx.AsyncClient por proveedor para todo el proceso:
+
+- Keep-alive: se reutilizan las conexiones TCP+TLS hacia api.twilio.com / graph.facebook.com
+- HTTP/2 donde el proveedor lo soporta (requiere el paquete h2)
+- Límites de conexiones por proveedor
+- Reintentos con backoff exponencial + jitter (o Retry-After): errores de conexión (la
+  request no salió) y 429 para todo método; 5xx solo para métodos idempotentes
+- Métricas: latencia de envío y cantidad de handshakes TCP/TLS
+- Cierre ordenado en el shutdown de la app (aclose_all)
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Un 429 garantiza que el proveedor no procesó la request; un 5xx no (podría duplicar el envío/cobro)
+NON_IDEMPOTENT_RETRY_STATUS_CODES = {429}
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+@dataclass(frozen=True)
+class ProviderConfig:
+    """Configuración de pool por proveedor (sobrescribible con HTTP_POOL_<PROVIDER>_*)"""
+    name: str
+    http2: bool = False
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 60.0
+    timeout: float = 10.0
+    connect_timeout: float = 5.0
+    max_retries: int = 2
+    backoff_base: float = 0.25
+    backoff_cap: float = 4.0
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "ProviderConfig":
+        prefix = f"HTTP_POOL_{name.upper()}_"
+        base = cls(name=name, **defaults)
+        return cls(
+            name=name,
+            http2=os.getenv(prefix + "HTTP2", str(base.http2)).lower() in ("1", "true", "yes"),
+            max_connections=_env_int(prefix + "MAX_CONNECTIONS", base.max_connections),
+            max_keepalive_connections=_env_int(prefix + "MAX_KEEPALIVE", base.max_keepalive_connections),
+            keepalive_expiry=_env_float(prefix + "KEEPALIVE_EXPIRY", base.keepalive_expiry),
+            timeout=_env_float(prefix + "TIMEOUT", base.timeout),
+            connect_timeout=_env_float(prefix + "CONNECT_TIMEOUT", base.connect_timeout),
+            max_retries=_env_int(prefix + "MAX_RETRIES", base.max_retries),
+            backoff_base=_env_float(prefix + "BACKOFF_BASE", base.backoff_base),
+            backoff_cap=_env_float(prefix + "BACKOFF_CAP", base.backoff_cap),
+        )
+
+
+DEFAULT_PROVIDERS = {
+    "twilio": ProviderConfig.from_env("twilio", http2=False, max_connections=20),
+    "meta": ProviderConfig.from_env("meta", http2=True, max_connections=20),
+    "default": ProviderConfig.from_env("default"),
+}
+
+
+class _ProviderStats:
+    """Contadores por proveedor"""
+
+    def __init__(self, window: int = 512):
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.tcp_connects = 0
+        self.tls_handshakes = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    def record_latency(self, seconds: float) -> None:
+        self.requests += 1
+        self.latency_total += seconds
+        self.latency_max = max(self.latency_max, seconds)
+        self._latencies.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self._latencies)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * (len(ordered) - 1)))] if ordered else 0.0
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "tcp_connects": self.tcp_connects,
+            "tls_handshakes": self.tls_handshakes,
+            "avg_latency_ms": round(self.latency_total / self.requests * 1000, 2) if self.requests else 0.0,
+            "p95_latency_ms": round(p95 * 1000, 2),
+            "max_latency_ms": round(self.latency_max * 1000, 2),
+        }
+
+
+class PooledClient:
+    """Vista de un proveedor del registro: misma interfaz post/get que httpx con reintentos"""
+
+    def __init__(self, registry: "HttpClientRegistry", provider: str):
+        self._registry = registry
+        self._provider = provider
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self._registry.request(self._provider, "POST", url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self._registry.request(self._provider, "GET", url, **kwargs)
+
+
+class HttpClientRegistry:
+    """Registro de httpx.AsyncClient por proveedor, creados de forma lazy"""
+
+    def __init__(self, providers: Optional[Dict[str, ProviderConfig]] = None):
+        self._providers = dict(providers or DEFAULT_PROVIDERS)
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, _ProviderStats] = {}
+
+    def _config_for(self, provider: str) -> ProviderConfig:
+        return self._providers.get(provider) or self._providers["default"]
+
+    def _stats_for(self, provider: str) -> _ProviderStats:
+        stats = self._stats.get(provider)
+        if stats is None:
+            stats = self._stats[provider] = _ProviderStats()
+        return stats
+
+    def get_client(self, provider: str) -> httpx.AsyncClient:
+        """Cliente compartido del proveedor (se crea en el primer uso)"""
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            config = self._config_for(provider)
+            client = httpx.AsyncClient(
+                http2=config.http2 and HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=config.max_connections,
+                    max_keepalive_connections=config.max_keepalive_connections,
+                    keepalive_expiry=config.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            )
+            self._clients[provider] = client
+        return client
+
+    @asynccontextmanager
+    async def client(self, provider: str):
+        """
+        Reemplazo directo de `async with httpx.AsyncClient() as client:`
+        El cliente subyacente NO se cierra al salir del bloque
+        """
+        yield PooledClient(self, provider)
+
+    def _trace_for(self, provider: str):
+        stats = self._stats_for(provider)
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                stats.tcp_connects += 1
+            elif event_name == "connection.start_tls.complete":
+                stats.tls_handshakes += 1
+
+        return trace
+
+    def _backoff(self, config: ProviderConfig, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), config.backoff_cap)
+        # Full jitter
+        return random.uniform(0, min(config.backoff_cap, config.backoff_base * (2 ** attempt)))
+
+    async def request(self, provider: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Request con reintentos en errores de conexión (la request no llegó a enviarse) y 429
+        (respetando Retry-After); los 5xx solo se reintentan en métodos idempotentes
+        """
+        config = self._config_for(provider)
+        retry_status_codes = (RETRY_STATUS_CODES if method.upper() in IDEMPOTENT_METHODS
+                              else NON_IDEMPOTENT_RETRY_STATUS_CODES)
+        stats = self._stats_for(provider)
+        client = self.get_client(provider)
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions.setdefault("trace", self._trace_for(provider))
+
+        attempt = 0
+        while True:
+            started_at = time.monotonic()
+            try:
+                response = await client.request(method, url, extensions=extensions, **kwargs)
+            except RETRY_EXCEPTIONS as e:
+                stats.errors += 1
+                if attempt >= config.max_retries:
+                    raise
+                delay = self._backoff(config, attempt)
+                logger.warning(f"{provider} connection error ({type(e).__name__}), retrying in {delay:.2f}s")
+            else:
+                stats.record_latency(time.monotonic() - started_at)
+                if response.status_code not in retry_status_codes or attempt >= config.max_retries:
+                    return response
+                delay = self._backoff(config, attempt, response)
+                logger.warning(f"{provider} returned {response.status_code}, retrying in {delay:.2f}s")
+
+            attempt += 1
+            stats.retries += 1
+            await asyncio.sleep(delay)
+
+    async def aclose_all(self) -> None:
+        """Cierra todos los clientes (shutdown de la app)"""
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Error closing HTTP client: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Latencia y handshakes por proveedor"""
+        return {
+            "http2_available": HTTP2_AVAILABLE,
+            "open_clients": sorted(name for name, c in self._clients.items() if not c.is_closed),
+            "providers": {name: stats.snapshot() for name, stats in sorted(self._stats.items())},
+        }
+
+
+# Registro global del proceso
+http_clients = HttpClientRegistry()
@@ -1,8 +1,8 @@
 import os
-import httpx
 import logging
 from typing import Dict, Any, Optional
 from .base import WhatsAppAdapter
+from .http_pool import http_clients
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +28,7 @@ class MetaAdapter(WhatsAppAdapter):
             if not to.startswith('+'):
                 to = '+' + to
             
-            async with httpx.AsyncClient() as client:
+            async with http_clients.client("meta") as client:
                 headers = {
                     "Authorization": f"Bearer {self.token}",
                     "Content-Type": "application/json"
@@ -75,7 +75,7 @@ class MetaAdapter(WhatsAppAdapter):
             if not to.startswith('+'):
                 to = '+' + to
             
-            async with httpx.AsyncClient() as client:
+            async with http_clients.client("meta") as client:
                 headers = {
                     "Authorization": f"Bearer {self.token}",
                     "Content-Type": "application/json"
@@ -178,7 +178,7 @@ class MetaAdapter(WhatsAppAdapter):
             if not to.startswith('+'):
                 to = '+' + to
             
-            async with httpx.AsyncClient() as client:
+            async with http_clients.client("meta") as client:
                 headers = {
                     "Authorization": f"Bearer {self.token}",
                     "Content-Type": "application/json"
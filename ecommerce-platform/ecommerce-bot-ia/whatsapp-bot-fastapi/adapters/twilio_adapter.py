@@ -1,8 +1,8 @@
 import os
-import httpx
 import logging
 from typing import Dict, Any, Optional
 from .base import WhatsAppAdapter
+from .http_pool import http_clients
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +26,7 @@ class TwilioAdapter(WhatsAppAdapter):
                     to = '+' + to
                 to = f'whatsapp:{to}'
             
-            async with httpx.AsyncClient() as client:
+            async with http_clients.client("twilio") as client:
                 auth = (self.account_sid, self.auth_token)
                 
                 data = {
@@ -70,7 +70,7 @@ class TwilioAdapter(WhatsAppAdapter):
                     to = '+' + to
                 to = f'whatsapp:{to}'
             
-            async with httpx.AsyncClient() as client:
+            async with http_clients.client("twilio") as client:
                 auth = (self.account_sid, self.auth_token)
                 
                 # Para Twilio, usamos ContentSid en lugar de template personalizado
@@ -6,6 +6,7 @@ import json
 import hashlib
 import hmac
 from typing import Dict, Any, Optional
+from functools import partial
 import sys
 from pathlib import Path
 
@@ -18,6 +19,8 @@ sys.path.append(str(services_dir))
 
 from services.messaging import send_text
 from services.chat_service import procesar_mensaje
+from services.message_queue import message_queue
+from services.reply_streaming import reply_streaming
 
 router = APIRouter()
 
@@ -134,7 +137,17 @@ async def webhook_meta(
                 # Procesar mensajes entrantes
                 messages = value.get("messages", [])
                 for message in messages:
-                    await process_incoming_message(message, value)
+                    # Encolar y responder 200 de inmediato; un worker procesa y envía la respuesta
+                    # Deduplicado por wamid: si el payload se reintenta, los ya encolados no se repiten
+                    accepted = await message_queue.enqueue(
+                        format_phone_number(message.get("from", "")),
+                        partial(process_incoming_message, message, value),
+                        provider="meta",
+                        message_id=message.get("id")
+                    )
+                    if not accepted:
+                        # Backpressure: Meta reintenta las notificaciones que no reciben 200
+                        raise HTTPException(status_code=503, detail="Message queue full")
                 
                 # Procesar estados de mensajes (delivered, read, etc.)
                 statuses = value.get("statuses", [])
@@ -146,6 +159,8 @@ async def webhook_meta(
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON in webhook: {str(e)}")
         raise HTTPException(status_code=400, detail="Invalid JSON")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing Meta webhook: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -179,12 +194,21 @@ async def process_incoming_message(message: Dict[str, Any], value: Dict[str, Any
             
             logger.info(f"Text message from {phone_number}: {text_content}")
             
-            # Procesar mensaje con IA y obtener respuesta
+            # Procesar mensaje con IA y obtener respuesta (el primer párrafo de una
+            # respuesta generada en streaming se envía mientras se genera el resto)
             try:
-                response_text = await procesar_mensaje(phone_number, text_content)
+                async with reply_streaming(lambda chunk: send_text(phone_number, chunk)) as stream:
+                    async with message_queue.timed("process"):
+                        response_text = await procesar_mensaje(phone_number, text_content)
+                    response_text = await stream.finish(response_text)
+                
+                if not response_text:
+                    logger.info(f"Response fully delivered while streaming to {phone_number}")
+                    return
                 
                 # Enviar respuesta usando el servicio de mensajería
-                success = await send_text(phone_number, response_text)
+                async with message_queue.timed("send"):
+                    success = await send_text(phone_number, response_text)
                 
                 if success:
                     logger.info(f"Response sent successfully to {phone_number}")
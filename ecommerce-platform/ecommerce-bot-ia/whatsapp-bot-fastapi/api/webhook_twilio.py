@@ -15,10 +15,13 @@ import uuid
 from urllib.parse import urlencode
 import httpx
 import asyncio
+from functools import partial
 
 from database import get_db, SessionLocal
 from models import TwilioAccount
 from auth_models import TenantClient
+from services.message_queue import message_queue, run_blocking
+from services.reply_streaming import reply_streaming
 
 router = APIRouter()
 
@@ -98,8 +101,8 @@ async def twilio_webhook_multi_tenant(request: Request, db: Session = Depends(ge
         host = request.headers.get('host', '')
         logger.info(f"Received Twilio webhook for host: {host}")
         
-        # Get tenant's Twilio configuration
-        twilio_config = get_tenant_twilio_config(db, host)
+        # Get tenant's Twilio configuration (sync DB query off the event loop)
+        twilio_config = await run_blocking("resolve_tenant", get_tenant_twilio_config, db, host)
         if not twilio_config:
             logger.error(f"Twilio configuration not found for host: {host}")
             return PlainTextResponse(content="", status_code=404)
@@ -126,10 +129,19 @@ async def twilio_webhook_multi_tenant(request: Request, db: Session = Depends(ge
             # Get tenant ID from the Twilio config
             tenant_id = str(twilio_config.tenant_id)
             
-            # Process message with the tenant's context
-            await process_whatsapp_message(phone_number, message_body, message_sid, tenant_id, twilio_config)
+            # Enqueue processing; the reply is sent via API by a queue worker
+            accepted = await message_queue.enqueue(
+                phone_number,
+                partial(process_whatsapp_message, phone_number, message_body, message_sid, tenant_id, twilio_config),
+                provider="twilio",
+                tenant_id=tenant_id,
+                message_id=message_sid or None
+            )
+            if not accepted:
+                # Backpressure: let Twilio retry later
+                return PlainTextResponse(content="", status_code=503)
             
-            # Return empty response since message is sent via API
+            # Acknowledge immediately
             return PlainTextResponse(content="", status_code=200)
         
         return PlainTextResponse(content="", status_code=200)
@@ -138,6 +150,36 @@ async def twilio_webhook_multi_tenant(request: Request, db: Session = Depends(ge
         logger.error(f"Error processing Twilio webhook: {str(e)}")
         return PlainTextResponse(content="", status_code=200)
 
+def _generar_respuesta_flow(phone_number: str, message: str, tenant_id: str = None, twilio_config = None) -> str:
+    """
+    Genera la respuesta del servicio Flow (bloqueante: sesión SQLAlchemy sync + OpenAI)
+    Se ejecuta en un thread desde process_whatsapp_message
+    """
+    from services.flow_chat_service import procesar_mensaje_flow
+    
+    db = SessionLocal()
+    try:
+        # Use the Flow chat service with tenant context
+        response_text = procesar_mensaje_flow(db, phone_number, message, tenant_id)
+        
+        # Limit response length for WhatsApp (Twilio limit is 1600 chars)
+        if len(response_text) > 1500:
+            # Get tenant name dynamically
+            tenant_name = None
+            if twilio_config:
+                try:
+                    tenant = db.query(TenantClient).filter(TenantClient.id == tenant_id).first()
+                    if tenant:
+                        tenant_name = tenant.name
+                except:
+                    pass
+            response_text = truncate_response_for_whatsapp(response_text, message, tenant_name)
+        
+        logger.info(f"Flow service response: {response_text[:100]}...")
+        return response_text
+    finally:
+        db.close()
+
 async def process_whatsapp_message(phone_number: str, message: str, message_sid: str, tenant_id: str = None, twilio_config = None) -> str:
     """
     Procesa un mensaje de WhatsApp usando el servicio Flow integrado y envía la respuesta usando Twilio API
@@ -145,34 +187,9 @@ async def process_whatsapp_message(phone_number: str, message: str, message_sid:
     try:
         # Import Flow chat service and Twilio adapter
         try:
-            from services.flow_chat_service import procesar_mensaje_flow
             from adapters.twilio_adapter import TwilioAdapter
             
-            # Create database session
-            db = SessionLocal()
-            try:
-                # Use the Flow chat service with tenant context
-                response_text = procesar_mensaje_flow(db, phone_number, message, tenant_id)
-                
-                # Limit response length for WhatsApp (Twilio limit is 1600 chars)
-                if len(response_text) > 1500:
-                    # Get tenant name dynamically
-                    tenant_name = None
-                    if twilio_config:
-                        try:
-                            from auth_models import TenantClient
-                            tenant = db.query(TenantClient).filter(TenantClient.id == tenant_id).first()
-                            if tenant:
-                                tenant_name = tenant.name
-                        except:
-                            pass
-                    response_text = truncate_response_for_whatsapp(response_text, message, tenant_name)
-                
-                logger.info(f"Flow service response: {response_text[:100]}...")
-            finally:
-                db.close()
-                
-            # Send response using Twilio API with tenant configuration
+            # Twilio adapter with tenant configuration (also sends the streamed first chunk)
             if twilio_config:
                 # Decrypt auth token using the proper crypto utilities
                 try:
@@ -198,7 +215,20 @@ async def process_whatsapp_message(phone_number: str, message: str, message_sid:
             else:
                 twilio_adapter = TwilioAdapter()
             
-            success = await twilio_adapter.send_text(phone_number, response_text)
+            # Sync DB + LLM work runs in a thread so the event loop stays free; the first
+            # paragraph of a streamed LLM reply goes out while the rest is generated
+            async with reply_streaming(lambda chunk: twilio_adapter.send_text(phone_number, chunk)) as stream:
+                response_text = await run_blocking(
+                    "process", _generar_respuesta_flow, phone_number, message, tenant_id, twilio_config
+                )
+                response_text = await stream.finish(response_text)
+            
+            if not response_text:
+                logger.info(f"Reply fully delivered while streaming to {phone_number}")
+                return ""
+                
+            async with message_queue.timed("send"):
+                success = await twilio_adapter.send_text(phone_number, response_text)
             
             if success:
                 logger.info(f"Message sent successfully to {phone_number}")
@@ -1,38 +1,57 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from contextlib import contextmanager
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
+from services.db_pool import create_pooled_engine, create_pooled_async_engine
+from services.read_routing import PrimarySession, replica_router
+
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ecommerce.db")
+# Réplica de lectura opcional (otra instancia Postgres, o SQLite en tests)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
 
-# Convert sync URL to async URL
-ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL
-if "sqlite:" in SQLALCHEMY_DATABASE_URL:
-    ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("sqlite:", "sqlite+aiosqlite:")
-elif "postgresql:" in SQLALCHEMY_DATABASE_URL:
-    ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgresql:", "postgresql+asyncpg:")
-
-# Sync engine (para Alembic migrations)
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-)
+
+def to_async_url(url: str) -> str:
+    """Convert sync URL to async URL"""
+    if "sqlite:" in url:
+        return url.replace("sqlite:", "sqlite+aiosqlite:")
+    if "postgresql:" in url:
+        return url.replace("postgresql:", "postgresql+asyncpg:")
+    return url
+
+
+ASYNC_DATABASE_URL = to_async_url(SQLALCHEMY_DATABASE_URL)
+
+# Sync engine (para Alembic migrations) - pool, timeouts y métricas en services/db_pool.py
+engine = create_pooled_engine(SQLALCHEMY_DATABASE_URL)
 
 # Async engine
-async_engine = create_async_engine(
-    ASYNC_DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in ASYNC_DATABASE_URL else {},
-    echo=False  # Set to True for debugging SQL queries
-)
+async_engine = create_pooled_async_engine(ASYNC_DATABASE_URL)
+
+# Engines de lectura: sin réplica configurada apuntan al primario
+if DATABASE_READ_URL:
+    read_engine = create_pooled_engine(DATABASE_READ_URL, label="read")
+    async_read_engine = create_pooled_async_engine(to_async_url(DATABASE_READ_URL), label="async_read")
+    replica_router.configure(read_engine)
+else:
+    read_engine = engine
+    async_read_engine = async_engine
 
 # Sync sessionmaker (para compatibility)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=PrimarySession)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # Async sessionmaker
 AsyncSessionLocal = async_sessionmaker(
-    async_engine, 
-    class_=AsyncSession, 
+    async_engine,
+    class_=AsyncSession,
+    sync_session_class=PrimarySession,
+    expire_on_commit=False
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_read_engine,
+    class_=AsyncSession,
     expire_on_commit=False
 )
 
@@ -52,4 +71,38 @@ async def get_async_db():
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+# Read-only dependencies: réplica salvo read-your-writes del tenant o lag alto
+def get_read_db():
+    db = ReadSessionLocal() if replica_router.use_replica() else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    session_factory = AsyncReadSessionLocal if replica_router.use_replica() else AsyncSessionLocal
+    async with session_factory() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+@contextmanager
+def read_session(tenant_id=None, fallback=None):
+    """
+    Sesión para lecturas fuera de FastAPI (bot): réplica si corresponde;
+    si no, `fallback` (la sesión del llamador) o una sesión nueva del primario
+    """
+    if replica_router.use_replica(tenant_id):
+        db = ReadSessionLocal()
+    elif fallback is not None:
+        yield fallback
+        return
+    else:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
\ No newline at end of file
@@ -2,8 +2,9 @@
 WhatsApp Bot with FastAPI - Multi-tenant E-commerce Bot
 Integrates with OpenAI and backend API for intelligent responses
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from pydantic import BaseModel
+from typing import Optional
 import os
 import sys
 from pathlib import Path
@@ -30,6 +31,64 @@ app = FastAPI(
 def startup_event():
     Base.metadata.create_all(bind=engine)
 
+# Pool de workers para la cola de ingesta de webhooks
+@app.on_event("startup")
+async def start_message_queue():
+    from services.message_queue import message_queue
+    await message_queue.start()
+    from services.db_pool import start_leak_monitor
+    from services.read_routing import start_replica_lag_monitor
+    start_leak_monitor()
+    start_replica_lag_monitor()
+    # Write-behind de sesiones de conversación a flow_sesiones
+    from services.session_store import flow_session_store
+    flow_session_store.start()
+
+@app.on_event("shutdown")
+async def stop_message_queue():
+    from services.message_queue import message_queue
+    await message_queue.stop()
+    # Persistir sesiones pendientes después de drenar la cola
+    from services.session_store import flow_session_store
+    await flow_session_store.stop()
+    # Cerrar los clientes HTTP compartidos después de drenar la cola
+    from adapters.http_pool import http_clients
+    await http_clients.aclose_all()
+    from services.invalidation_bus import invalidation_bus
+    invalidation_bus.stop()
+
+# Bus de invalidación: cambios de prompts/config/catálogo hechos en el backend
+@app.on_event("startup")
+def start_invalidation_bus():
+    from services.invalidation_bus import invalidation_bus
+    from services.catalog_snapshot import invalidate_catalog_snapshot
+    from services.intent_cache import intent_cache
+    from services.tenant_config_manager import clear_tenant_cache
+    from services.read_routing import mark_tenant_write
+    from services.session_store import flow_session_store
+
+    def on_catalog(event):
+        invalidate_catalog_snapshot(event.tenant_id)
+        # El backend escribió el catálogo: leer del primario mientras la réplica se pone al día
+        mark_tenant_write(event.tenant_id)
+
+    def on_prompts(event):
+        # "tenant_config" se invalida solo (namespace homónimo del cache unificado)
+        clear_tenant_cache(event.tenant_id)
+        if event.tenant_id:
+            intent_cache.invalidate_tenant(event.tenant_id)
+        else:
+            intent_cache.clear()
+
+    invalidation_bus.subscribe("catalog", on_catalog)
+    invalidation_bus.subscribe("tenant_prompts", on_prompts)
+    # timeout_service cambió la fila de la sesión (aviso/finalización): releerla en el próximo turno
+    invalidation_bus.subscribe("flow_sessions", lambda event: flow_session_store.invalidate(event.tenant_id, event.key))
+    try:
+        invalidation_bus.start()
+    except Exception as e:
+        print(f"⚠️ Warning: Could not start cache invalidation bus: {e}")
+
 # Include Meta WhatsApp webhook router
 app.include_router(meta_webhook_router, tags=["meta-webhook"])
 
@@ -258,7 +317,105 @@ async def list_available_tenants():
             "message": "Could not retrieve tenant list"
         }
 
+@app.post("/internal/catalog/invalidate/{tenant_id}")
+async def invalidate_catalog(tenant_id: str, x_internal_token: Optional[str] = Header(None)):
+    """
+    Invalida el snapshot de catálogo de un tenant
+    Lo llama el backend después de crear/actualizar/eliminar productos
+    """
+    expected_token = os.getenv("INTERNAL_API_TOKEN")
+    if expected_token and x_internal_token != expected_token:
+        raise HTTPException(status_code=403, detail="Invalid internal token")
+    
+    from services.catalog_snapshot import invalidate_catalog_snapshot
+    removed = invalidate_catalog_snapshot(tenant_id)
+    return {"status": "invalidated", "tenant_id": tenant_id, "removed": removed}
+
+@app.get("/internal/catalog/stats")
+async def catalog_stats():
+    """Estadísticas del cache de catálogo (hits/misses/rebuilds)"""
+    from services.catalog_snapshot import get_catalog_cache_stats
+    return get_catalog_cache_stats()
+
+@app.get("/internal/queue/stats")
+async def queue_stats():
+    """Profundidad de la cola de ingesta y latencia por etapa"""
+    from services.message_queue import message_queue
+    return message_queue.get_stats()
+
+@app.get("/internal/http/stats")
+async def http_stats():
+    """Latencia de envío y handshakes TCP/TLS por proveedor"""
+    from adapters.http_pool import http_clients
+    return http_clients.get_stats()
+
+@app.get("/internal/db/stats")
+async def db_pool_stats():
+    """Conexiones en uso, overflow, espera por conexión y fugas de los pools sync/async"""
+    from services.db_pool import get_db_pool_stats
+    return get_db_pool_stats()
+
+@app.get("/internal/db/replica-stats")
+async def replica_stats():
+    """Lecturas enviadas a la réplica vs. primario (read-your-writes / lag)"""
+    from services.read_routing import get_replica_routing_stats
+    return get_replica_routing_stats()
+
+@app.get("/internal/sessions/stats")
+async def flow_session_stats():
+    """Hits del store de sesiones, conflictos CAS y flushes write-behind a flow_sesiones"""
+    from services.session_store import get_flow_session_store_stats
+    return get_flow_session_store_stats()
+
+@app.get("/internal/orders/stats")
+async def order_placement_stats():
+    """Pedidos creados, rechazados por stock, reintentos por deadlock y latencia media"""
+    from services.order_placement import get_order_placement_stats
+    return get_order_placement_stats()
+
+@app.get("/internal/cache/stats")
+async def cache_stats():
+    """Hit-rate, tamaño y desalojos por namespace del cache unificado"""
+    from services.cache import get_cache_manager_stats
+    return get_cache_manager_stats()
+
+@app.get("/internal/invalidation/stats")
+async def invalidation_stats():
+    """Eventos recibidos por el bus de invalidación de caches"""
+    from services.invalidation_bus import get_invalidation_bus_stats
+    return get_invalidation_bus_stats()
+
+@app.get("/internal/llm/stats")
+async def llm_stats():
+    """Tokens y latencia de las llamadas LLM por tenant y propósito"""
+    from services.llm_gateway import get_llm_stats
+    return get_llm_stats()
+
+@app.get("/internal/reply-streaming/stats")
+async def reply_streaming_stats():
+    """Bloques enviados por WhatsApp antes de terminar la generación y cortes por límite"""
+    from services.reply_streaming import get_reply_streaming_stats
+    return get_reply_streaming_stats()
+
+@app.get("/internal/reasoning/stats")
+async def reasoning_stats():
+    """Motor de razonamiento: mensajes y latencia por modo (planner | three_step) y acciones planificadas"""
+    from services.gpt_reasoning_engine import get_reasoning_engine_stats
+    return get_reasoning_engine_stats()
+
+@app.get("/internal/intent-cache/stats")
+async def intent_cache_stats():
+    """Hit-rate del cache de intenciones"""
+    from services.intent_cache import get_intent_cache_stats
+    return get_intent_cache_stats()
+
+@app.get("/internal/intent-rules/stats")
+async def intent_rules_stats():
+    """Proporción de mensajes resueltos por el clasificador local sin GPT"""
+    from services.intent_rules import get_intent_rules_stats
+    return get_intent_rules_stats()
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "9001"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=port)
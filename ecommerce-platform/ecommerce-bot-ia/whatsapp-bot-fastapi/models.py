@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -21,6 +21,16 @@ class Product(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class ProductCategoryIndex(Base):
+    """Categorías asignadas por el indexador del backend (solo lectura desde el bot)"""
+    __tablename__ = "product_category_index"
+    
+    product_id = Column(String, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    client_id = Column(String, nullable=False, index=True)
+    categories = Column(Text, nullable=False)  # JSON: etiquetas de categoría del tenant
+    content_hash = Column(String(64), nullable=False)
+    indexed_at = Column(DateTime, default=datetime.utcnow)
+
 class Client(Base):
     __tablename__ = "clients"
     
@@ -120,7 +130,7 @@ class FlowSesion(Base):
     __tablename__ = "flow_sesiones"
     
     id = Column(Integer, primary_key=True, index=True)
-    telefono = Column(String, unique=True, index=True)
+    telefono = Column(String, index=False)  # Solo índice compuesto con tenant_id
     tenant_id = Column(String, index=True, nullable=False)  # Multi-tenant support
     estado = Column(String, default="INITIAL")
     datos = Column(Text)  # JSON con datos de la sesión
@@ -129,6 +139,13 @@ class FlowSesion(Base):
     conversation_active = Column(Boolean, default=True)  # Si la conversación está activa
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Versión para compare-and-set (services/session_store.py)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index('ux_flow_sesiones_tenant_phone', 'tenant_id', 'telefono', unique=True),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
 # ============ MODELOS PARA MULTI-TENANT Y TWILIO ============
 
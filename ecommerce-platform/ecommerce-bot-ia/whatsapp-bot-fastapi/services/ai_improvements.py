@@ -8,14 +8,30 @@ import json
 import os
 import re
 import time
+from contextlib import nullcontext
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-import openai
+from services.cache import cache_manager
+from services.llm_gateway import get_llm_client
+from services.intent_cache import get_cached_intent, store_intent
+from services.intent_rules import detect_fast_intent
+from services.catalog_snapshot import products_in_category
+from services.reply_streaming import reply_streaming_suspended, stream_reply
 
-# Configuración OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Modo del pipeline si el tenant no lo define en nlu_params.pipeline_mode
+DEFAULT_PIPELINE_MODE = os.getenv("AI_PIPELINE_MODE", "two_pass")  # two_pass | single_pass
+PIPELINE_MODES = ("two_pass", "single_pass")
+
+# Confianza mínima de intención para que flow_chat_service use la respuesta (si no, la
+# descarta y pasa al motor de razonamiento): por debajo no se transmite por WhatsApp
+AI_REPLY_MIN_CONFIDENCE = float(os.getenv("AI_REPLY_MIN_CONFIDENCE", "0.3"))
+
+# Prefijo estático del prompt (reglas base + prompt del tenant + instrucciones de la tarea)
+# compilado una vez por versión de TenantPrompts: cada versión es inmutable
+PROMPT_PREFIX_CACHE_TTL_SECONDS = int(os.getenv("PROMPT_PREFIX_CACHE_TTL_SECONDS", "3600"))
+_prompt_prefix_cache = cache_manager.namespace("prompt_prefix", ttl=PROMPT_PREFIX_CACHE_TTL_SECONDS, max_entries=3000)
 
 # Importar servicios de configuración de prompts
 try:
@@ -34,87 +50,18 @@ except ImportError:
 # 🛡️ VALIDACIONES MULTITENANT
 # ===========================================
 
-def _filtrar_productos_con_gpt(productos: List[Dict], categoria_solicitada: str) -> List[Dict]:
+def _filtrar_productos_por_categoria(productos: List[Dict], categoria_solicitada: str) -> List[Dict]:
     """
-    Usa GPT para clasificar dinámicamente productos por categoría.
-    Multi-tenant y adaptable a cualquier tipo de negocio.
+    Productos de la categoría pedida desde el índice de categorías precalculado
+    (asignaciones del indexador del backend, todo el catálogo, sin llamar a GPT)
     """
-    print(f"🚀 Iniciando filtrado GPT para categoría: {categoria_solicitada}")
-    print(f"🚀 Total productos a clasificar: {len(productos)}")
-    
-    if not productos or not categoria_solicitada:
-        return []
-    
-    try:
-        # Crear lista de productos para clasificar
-        productos_para_clasificar = []
-        for i, prod in enumerate(productos[:20]):  # Límite para no saturar GPT
-            productos_para_clasificar.append({
-                "index": i,
-                "name": prod.get("name", ""),
-                "description": prod.get("description", ""),
-                "category": prod.get("category", "")
-            })
-        
-        # Prompt para clasificación inteligente
-        classification_prompt = f"""Eres un experto clasificador de productos. 
-        
-TAREA: Determina qué productos pertenecen a la categoría "{categoria_solicitada}".
-
-PRODUCTOS A CLASIFICAR:
-{chr(10).join([f"{p['index']}. {p['name']} - {p['description']}" for p in productos_para_clasificar])}
-
-REGLAS:
-1. Se ESTRICTO: solo productos que realmente pertenecen a "{categoria_solicitada}"
-2. Si categoria_solicitada es "aceites" → solo aceites, tinturas, líquidos cannábicos
-3. Si categoria_solicitada es "semillas" → solo semillas, nunca aceites
-4. Si categoria_solicitada es "flores" → solo flores, cogollos, hierba seca
-5. Si categoria_solicitada es "comestibles" → brownies, galletas, gomitas, chocolates
-6. Si categoria_solicitada es "accesorios" → grinders, pipas, papeles, bongs
-
-RESPONDE SOLO con los números (índices) de productos que SÍ pertenecen a "{categoria_solicitada}".
-Formato: [0, 3, 7] (array de números)
-"""
-        
-        # Llamar a GPT para clasificación
-        import openai
-        import os
-        client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": classification_prompt}],
-            temperature=0.1,
-            max_tokens=100
-        )
-        
-        # Parsear respuesta
-        clasificacion_texto = response.choices[0].message.content.strip()
-        print(f"🔍 GPT clasificación response: {clasificacion_texto}")
-        
-        # Extraer índices de productos relevantes
-        import re
-        numeros = re.findall(r'\d+', clasificacion_texto)
-        indices_relevantes = [int(n) for n in numeros if int(n) < len(productos)]
-        
-        print(f"🔍 Índices encontrados: {indices_relevantes}")
-        
-        # Retornar productos filtrados
-        productos_filtrados = [productos[i] for i in indices_relevantes if i < len(productos)]
-        
-        print(f"🔍 Productos filtrados GPT: {[p.get('name') for p in productos_filtrados]}")
-        
-        return productos_filtrados
-        
-    except Exception as e:
-        print(f"Error en clasificación GPT: {e}")
-        # Fallback: retornar productos que contengan la categoría en el nombre
-        productos_fallback = []
-        for prod in productos:
-            prod_name = prod.get("name", "").lower()
-            if categoria_solicitada.lower() in prod_name:
-                productos_fallback.append(prod)
-        return productos_fallback[:5]  # Máximo 5 en fallback
+    productos_categoria = products_in_category(productos, categoria_solicitada)
+    if not productos_categoria and categoria_solicitada:
+        # No es una categoría del tenant: productos que la mencionan en el nombre
+        buscado = categoria_solicitada.lower()
+        productos_categoria = [p for p in productos if buscado in p.get("name", "").lower()]
+    print(f"🗂️ Índice de categorías: '{categoria_solicitada}' -> {len(productos_categoria)} productos")
+    return productos_categoria
 
 def _validate_tenant_id(tenant_id: str) -> str:
     """
@@ -266,7 +213,8 @@ Siempre verifica la disponibilidad de productos antes de confirmar.""",
             "modelo": "gpt-4o-mini",
             "temperature_nlu": 0.3,
             "max_tokens_nlu": 150,
-            "confidence_threshold": 0.7
+            "confidence_threshold": 0.7,
+            "pipeline_mode": DEFAULT_PIPELINE_MODE
         },
         "nlg_params": {
             "modelo": "gpt-4o-mini", 
@@ -280,14 +228,20 @@ Siempre verifica la disponibilidad de productos antes de confirmar.""",
     }
 
 
-def build_final_system_prompt(tenant_id: str, tenant_config: Dict[str, Any]) -> str:
+def build_final_system_prompt(tenant_id: str, tenant_config: Dict[str, Any], task: Optional[str] = None) -> str:
     """
     🔗 Componer prompt final con reglas base + configuración del tenant
     🔒 MULTITENANT: Validación estricta de tenant_id
     
+    Memoizado por (tenant, versión de TenantPrompts, tarea): el texto es idéntico en
+    todos los mensajes de la misma versión, así el proveedor reutiliza su cache de prefijo.
+    Todo lo que cambia por mensaje (historial, productos, mensaje) va después, en el
+    mensaje del usuario.
+    
     Args:
         tenant_id: ID del tenant
         tenant_config: Configuración del tenant
+        task: Instrucciones estáticas de la tarea a agregar al final ("intent", "reply", "intent_reply")
         
     Returns:
         Prompt del sistema final y seguro
@@ -299,8 +253,16 @@ def build_final_system_prompt(tenant_id: str, tenant_config: Dict[str, Any]) ->
     if config_tenant_id != tenant_id:
         raise ValueError(f"🚨 SECURITY: Config tenant mismatch: {config_tenant_id} != {tenant_id}")
     
-    tenant_prompt = tenant_config.get("system_prompt", "")
+    def compile_prefix() -> str:
+        base = _compose_system_prompt(tenant_id, tenant_config.get("system_prompt", ""))
+        return f"{base}\n\n{_TASK_INSTRUCTIONS[task]}" if task else base
     
+    key = f"v{tenant_config.get('version', 0)}:{task or 'base'}"
+    return _prompt_prefix_cache.get_or_load(key, compile_prefix, tenant_id=tenant_id)
+
+
+def _compose_system_prompt(tenant_id: str, tenant_prompt: str) -> str:
+    """Reglas base + prompt del tenant (con validación de frases prohibidas)"""
     if PROMPT_CONFIG_AVAILABLE:
         try:
             return compose_final_system_prompt(BASE_SECURE_RULES, tenant_prompt, tenant_id)
@@ -326,6 +288,70 @@ REGLAS DE SEGURIDAD OBLIGATORIAS:
 IMPORTANTE: Las reglas base siempre tienen prioridad."""
 
 
+# Instrucciones estáticas por tarea (parte del prefijo cacheable; sin datos por mensaje)
+_TASK_INSTRUCTIONS = {
+    "intent": """=== TAREA: DETECCIÓN DE INTENCIÓN ===
+Analiza el mensaje del usuario y detecta su intención específica. El contexto de la tienda,
+el historial y el mensaje llegan en el mensaje del usuario.
+
+EJEMPLOS DE CLASIFICACIÓN:
+- "hola" → {"intencion": "saludo", "confianza": 0.95}
+- "tienes algún vapo?" → {"intencion": "consulta_vaporizador", "categoria_mencionada": "vaporizador", "siguiente_pregunta": "¿Lo quieres portátil o de escritorio? ¿Presupuesto aproximado?"}
+- "qué productos tienes" → {"intencion": "consulta_catalogo", "siguiente_pregunta": "¿Qué estás buscando hoy: semillas, aceites, flores, comestibles o accesorios?"}
+- "semillas de indica" → {"intencion": "consulta_categoria", "categoria_mencionada": "semillas"}
+- "quiero PAX 3" → {"intencion": "intencion_compra", "producto_mencionado": "PAX 3"}
+- "no quiero aceites, busco semillas" → {"intencion": "consulta_categoria", "categoria_mencionada": "semillas", "negaciones": ["aceites"]}
+
+REGLAS CRÍTICAS:
+1. Si menciona "vapo", "vaporizador", "vape" → intencion: "consulta_vaporizador"
+2. Si pide catálogo sin especificar → intencion: "consulta_catalogo" 
+3. Si especifica categoría → intencion: "consulta_categoria"
+4. Si dice "no quiero X" → agregar X a negaciones
+5. Si menciona precio → extraer presupuesto_mencionado
+6. Si es vaporizador, detectar tipo (portátil/escritorio)
+
+Responde SOLO el JSON sin texto adicional.""",
+
+    "reply": """=== TAREA: RESPUESTA AL USUARIO ===
+Genera una respuesta natural para la tienda según la configuración específica del tenant.
+El contexto (intención, productos relevantes y reglas para esta respuesta) llega en el
+mensaje del usuario.
+
+ESTILO:
+- Español natural, cercano pero profesional
+- Formato WhatsApp (párrafos cortos)
+- Máximo 2 emojis
+- No inventes políticas ni links
+- No uses "gracias por contactarnos" ni texto corporativo
+- Varía las frases (no siempre "¿En qué puedo ayudarte?")
+- Si muestras productos, máximo 3
+- Siempre incluye CTA clara para siguiente paso
+
+EJEMPLOS DE TONO ESPERADO:
+- "¡Hola! Bienvenido a [tienda] 👋 ¿Qué estás buscando hoy: semillas, aceites, flores, comestibles o accesorios?"
+- "¿Lo quieres portátil o de escritorio? ¿Tienes un presupuesto aproximado? 🤔"
+- "Aquí tienes nuestros vaporizadores portátiles más populares: [lista] ¿Comparo 2 modelos o prefieres alguno?\"""",
+
+    "intent_reply": """=== TAREA: INTENCIÓN Y RESPUESTA EN UNA SOLA SALIDA ===
+Analiza el mensaje del usuario y respóndele en la misma salida. El contexto de la tienda,
+los productos preseleccionados y el mensaje llegan en el mensaje del usuario.
+
+INTENCIONES: saludo, consulta_catalogo, consulta_categoria, consulta_producto, intencion_compra,
+consulta_general, queja, despedida, consulta_vaporizador
+
+REGLAS DE RESPUESTA:
+- Español natural, formato WhatsApp (párrafos cortos), máximo 2 emojis
+- Solo menciona productos de la lista de relevantes, máximo 3, con precio
+- Si pide catálogo sin especificar, pregunta qué categoría le interesa
+- No inventes políticas ni links; incluye una CTA clara para el siguiente paso
+
+Responde SOLO este JSON:
+{"intent": {"intencion": "...", "confianza": 0.0, "categoria_mencionada": "", "producto_mencionado": "",
+"negaciones": [], "presupuesto_mencionado": "", "sentimiento": "positivo|neutral|negativo",
+"contexto_detectado": "..."}, "respuesta": "texto para el usuario"}""",
+}
+
+
 # ===========================================
 # 🧠 DETECCIÓN DE INTENCIÓN CON GPT PERSONALIZADA
 # ============================================
@@ -420,16 +446,32 @@ def gpt_detect_intent(
     assert tenant_config["tenant_id"] == tenant_id, f"🚨 SECURITY: Config mismatch {tenant_config['tenant_id']} != {tenant_id}"
     
     nlu_params = tenant_config.get("nlu_params", {})
+    prompt_version = tenant_config.get("version", 0)
     
-    # Construir prompt final con configuración del tenant
-    final_system_prompt = build_final_system_prompt(tenant_id, tenant_config)
-    
-    # Prompt optimizado con few-shots y configuración personalizada
-    prompt = f"""{final_system_prompt}
-
-Analiza el mensaje del usuario y detecta su intención específica para {store_name}.
-
-CONTEXTO DE LA TIENDA:
+    # ⚡ Fast-path local: saludos, confirmaciones, productos/categorías exactas → sin llamada a GPT
+    fast_intent = detect_fast_intent(
+        tenant_id, mensaje, productos, categorias_soportadas, history,
+        confidence_threshold=nlu_params.get("confidence_threshold", 0.7)
+    )
+    if fast_intent:
+        fast_intent["tenant_id"] = tenant_id
+        fast_intent["store_name"] = store_name
+        fast_intent["timestamp"] = datetime.now().isoformat()
+        return fast_intent
+    
+    # ⚡ Cache de intenciones: mismo mensaje + historial + versión de prompt → sin llamada a GPT
+    cached_intent = get_cached_intent(tenant_id, prompt_version, mensaje, history)
+    if cached_intent:
+        cached_intent["tenant_id"] = tenant_id
+        cached_intent["store_name"] = store_name
+        cached_intent["timestamp"] = datetime.now().isoformat()
+        cached_intent["cache_hit"] = True
+        return cached_intent
+    
+    # Prefijo estático memoizado (reglas + tenant + few-shots); lo dinámico va al final
+    final_system_prompt = build_final_system_prompt(tenant_id, tenant_config, task="intent")
+    
+    prompt = f"""CONTEXTO DE LA TIENDA:
 - Nombre: {store_name}
 - Categorías disponibles: {', '.join(categorias_soportadas)}
 - Productos disponibles: {len(productos)} productos en total
@@ -440,25 +482,7 @@ HISTORIAL RECIENTE:
 PRODUCTOS SAMPLE (primeros 10):
 {json.dumps(productos_sample, indent=2)}
 
-MENSAJE DEL USUARIO: "{mensaje}"
-
-EJEMPLOS DE CLASIFICACIÓN:
-- "hola" → {{"intencion": "saludo", "confianza": 0.95}}
-- "tienes algún vapo?" → {{"intencion": "consulta_vaporizador", "categoria_mencionada": "vaporizador", "siguiente_pregunta": "¿Lo quieres portátil o de escritorio? ¿Presupuesto aproximado?"}}
-- "qué productos tienes" → {{"intencion": "consulta_catalogo", "siguiente_pregunta": "¿Qué estás buscando hoy: semillas, aceites, flores, comestibles o accesorios?"}}
-- "semillas de indica" → {{"intencion": "consulta_categoria", "categoria_mencionada": "semillas"}}
-- "quiero PAX 3" → {{"intencion": "intencion_compra", "producto_mencionado": "PAX 3"}}
-- "no quiero aceites, busco semillas" → {{"intencion": "consulta_categoria", "categoria_mencionada": "semillas", "negaciones": ["aceites"]}}
-
-REGLAS CRÍTICAS:
-1. Si menciona "vapo", "vaporizador", "vape" → intencion: "consulta_vaporizador"
-2. Si pide catálogo sin especificar → intencion: "consulta_catalogo" 
-3. Si especifica categoría → intencion: "consulta_categoria"
-4. Si dice "no quiero X" → agregar X a negaciones
-5. Si menciona precio → extraer presupuesto_mencionado
-6. Si es vaporizador, detectar tipo (portátil/escritorio)
-
-Responde SOLO el JSON sin texto adicional."""
+MENSAJE DEL USUARIO: "{mensaje}\""""
 
     try:
         # Usar parámetros de NLU del tenant
@@ -466,7 +490,7 @@ Responde SOLO el JSON sin texto adicional."""
         temperature = nlu_params.get("temperature_nlu", 0.3)
         max_tokens = nlu_params.get("max_tokens_nlu", 150)
         
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        client = get_llm_client(tenant_id, "intent")
         response = client.chat.completions.create(
             model=model,
             messages=[
@@ -488,6 +512,8 @@ Responde SOLO el JSON sin texto adicional."""
         result["store_name"] = store_name
         result["timestamp"] = datetime.now().isoformat()
         
+        store_intent(tenant_id, prompt_version, mensaje, history, result)
+        
         return result
         
     except Exception as e:
@@ -540,11 +566,11 @@ def gpt_generate_reply(
     tipo_vaporizador = intent.get("tipo_vaporizador", "no_especificado")
     negaciones = intent.get("negaciones", [])
     
-    # Filtrar productos usando clasificación inteligente GPT
+    # Filtrar productos con el índice de categorías precalculado
     productos_relevantes = []
     
     if categoria_mencionada:
-        productos_relevantes = _filtrar_productos_con_gpt(productos, categoria_mencionada)
+        productos_relevantes = _filtrar_productos_por_categoria(productos, categoria_mencionada)
     
     elif producto_mencionado:
         # Buscar producto específico
@@ -600,13 +626,10 @@ def gpt_generate_reply(
     style_overrides = tenant_config.get("style_overrides", {})
     nlg_params = tenant_config.get("nlg_params", {})
     
-    # Construir prompt final con configuración del tenant
-    final_system_prompt = build_final_system_prompt(tenant_id, tenant_config)
+    # Prefijo estático memoizado (reglas + tenant + estilo); el contexto del mensaje va al final
+    final_system_prompt = build_final_system_prompt(tenant_id, tenant_config, task="reply")
     
-    # Prompt para generación natural con estilo personalizado
-    prompt = f"""Genera una respuesta natural para {store_name} según la configuración específica del tenant.
-
-CONTEXTO:
+    prompt = f"""CONTEXTO:
 - Tienda: {store_name}
 - Intención detectada: {intencion}
 - Categoría: {categoria_mencionada}
@@ -617,24 +640,9 @@ CONTEXTO:
 PRODUCTOS RELEVANTES:
 {productos_formatted if productos_formatted else "No hay productos específicos para mostrar"}
 
-REGLAS DE RESPUESTA:
+REGLAS PARA ESTA RESPUESTA:
 {context_rules}
 
-ESTILO:
-- Español natural, cercano pero profesional
-- Formato WhatsApp (párrafos cortos)
-- Máximo 2 emojis
-- No inventes políticas ni links
-- No uses "gracias por contactarnos" ni texto corporativo
-- Varía las frases (no siempre "¿En qué puedo ayudarte?")
-- Si muestras productos, máximo 3
-- Siempre incluye CTA clara para siguiente paso
-
-EJEMPLOS DE TONO ESPERADO:
-- "¡Hola! Bienvenido a {store_name} 👋 ¿Qué estás buscando hoy: semillas, aceites, flores, comestibles o accesorios?"
-- "¿Lo quieres portátil o de escritorio? ¿Tienes un presupuesto aproximado? 🤔"
-- "Aquí tienes nuestros vaporizadores portátiles más populares: [lista] ¿Comparo 2 modelos o prefieres alguno?"
-
 Genera la respuesta:"""
 
     try:
@@ -643,8 +651,13 @@ Genera la respuesta:"""
         temperature = nlg_params.get("temperature_nlg", 0.7)
         max_tokens = nlg_params.get("max_tokens_nlg", 300)
         
-        client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        response = client.chat.completions.create(
+        # Streaming: el primer párrafo sale por WhatsApp mientras se genera el resto
+        # y la generación se corta al llegar al límite de caracteres del tenant
+        client = get_llm_client(tenant_id, "reply")
+        reply = stream_reply(
+            client,
+            limit=style_overrides.get("limite_respuesta_caracteres", 500),
+            chunk_transform=lambda chunk: apply_inline_style(chunk, style_overrides),
             model=model,
             messages=[
                 {"role": "system", "content": final_system_prompt},
@@ -652,9 +665,7 @@ Genera la respuesta:"""
             ],
             temperature=temperature,
             max_tokens=max_tokens
-        )
-        
-        reply = response.choices[0].message.content.strip()
+        ).strip()
         
         # Validar que no esté vacía
         if not reply:
@@ -671,6 +682,174 @@ Genera la respuesta:"""
         # Fallback básico
         return f"¡Hola! Soy el asistente de {store_name}. ¿En qué puedo ayudarte? 😊"
 
+# ===========================================
+# ⚡ INTENCIÓN + RESPUESTA EN UNA SOLA LLAMADA
+# ===========================================
+
+def get_pipeline_mode(tenant_config: Dict[str, Any]) -> str:
+    """Modo del pipeline del tenant (nlu_params.pipeline_mode, o nlg_params como alternativa)"""
+    for params_key in ("nlu_params", "nlg_params"):
+        mode = (tenant_config.get(params_key) or {}).get("pipeline_mode")
+        if mode in PIPELINE_MODES:
+            return mode
+    return DEFAULT_PIPELINE_MODE if DEFAULT_PIPELINE_MODE in PIPELINE_MODES else "two_pass"
+
+
+def _reply_streaming_for(intent: Dict):
+    """Con confianza baja el llamador descarta la respuesta: no enviar bloques anticipados"""
+    if intent.get("confianza", 0) > AI_REPLY_MIN_CONFIDENCE:
+        return nullcontext()
+    return reply_streaming_suspended()
+
+
+def _preseleccionar_productos(mensaje: str, productos: List[Dict], limite: int) -> List[Dict]:
+    """
+    Productos candidatos para el mensaje sin llamar a GPT:
+    categorías mencionadas (índice de categorías) + productos nombrados
+    """
+    mensaje_lower = mensaje.lower()
+    palabras = [palabra for palabra in re.findall(r"\w+", mensaje_lower) if len(palabra) > 3]
+    
+    candidatos = []
+    vistos = set()
+    por_nombre = [
+        prod for prod in productos
+        if prod.get("name") and (
+            prod["name"].lower() in mensaje_lower
+            or any(palabra in prod["name"].lower() for palabra in palabras)
+        )
+    ]
+    for prod in por_nombre + products_in_category(productos, mensaje):
+        clave = prod.get("id") or prod.get("name")
+        if clave not in vistos:
+            vistos.add(clave)
+            candidatos.append(prod)
+        if len(candidatos) >= limite:
+            break
+    return candidatos
+
+
+def gpt_detect_intent_and_reply(
+    tenant_id: str,
+    store_name: str,
+    mensaje: str,
+    history: List[Dict],
+    productos: List[Dict],
+    categorias_soportadas: List[str],
+    db: Session
+) -> Tuple[Dict, str]:
+    """
+    ⚡ Modo single_pass: intención y respuesta en una sola llamada estructurada (JSON)
+    🔒 MULTITENANT: Aislado por tenant_id
+    
+    Los productos candidatos se preseleccionan localmente (índice de categorías + nombres)
+    y el prompt del sistema del tenant se envía una sola vez. Fast-path y cache de
+    intenciones se respetan: en ese caso solo queda la llamada de respuesta.
+    
+    Returns:
+        Tuple (intención detectada, respuesta final)
+    """
+    tenant_id = _validate_tenant_id(tenant_id)
+    
+    tenant_config = get_tenant_ai_config(tenant_id, db)
+    assert tenant_config["tenant_id"] == tenant_id, f"🚨 SECURITY: Config mismatch {tenant_config['tenant_id']} != {tenant_id}"
+    
+    nlu_params = tenant_config.get("nlu_params", {})
+    nlg_params = tenant_config.get("nlg_params", {})
+    style_overrides = tenant_config.get("style_overrides", {})
+    prompt_version = tenant_config.get("version", 0)
+    
+    def _reply_from(intent: Dict) -> Tuple[Dict, str]:
+        with _reply_streaming_for(intent):
+            return intent, gpt_generate_reply(
+                tenant_id=tenant_id,
+                store_name=store_name,
+                intent=intent,
+                productos=productos,
+                categorias_soportadas=categorias_soportadas,
+                db=db
+            )
+    
+    # ⚡ Intención ya resuelta localmente o en cache: una sola llamada (la respuesta)
+    fast_intent = detect_fast_intent(
+        tenant_id, mensaje, productos, categorias_soportadas, history,
+        confidence_threshold=nlu_params.get("confidence_threshold", 0.7)
+    )
+    cached_intent = None if fast_intent else get_cached_intent(tenant_id, prompt_version, mensaje, history)
+    if fast_intent or cached_intent:
+        intent = fast_intent or {**cached_intent, "cache_hit": True}
+        intent.update({"tenant_id": tenant_id, "store_name": store_name, "timestamp": datetime.now().isoformat()})
+        return _reply_from(intent)
+    
+    context_info = ""
+    if history:
+        context_info = "\n".join([
+            f"Usuario: {msg.get('user', '')}\nBot: {msg.get('bot', '')}"
+            for msg in history[-3:]
+        ])
+    
+    candidatos = _preseleccionar_productos(mensaje, productos, nlg_params.get("max_items_catalog", 5))
+    productos_formatted = "\n".join(
+        f"- {prod.get('name', '')} | ${prod.get('price', 0):,.0f} | stock {prod.get('stock', 0)} | {prod.get('category', '')}"
+        for prod in candidatos
+    )
+    
+    # Prefijo estático memoizado (reglas + tenant + formato JSON); lo dinámico va al final
+    final_system_prompt = build_final_system_prompt(tenant_id, tenant_config, task="intent_reply")
+    prompt = f"""CONTEXTO DE LA TIENDA:
+- Nombre: {store_name}
+- Categorías disponibles: {', '.join(categorias_soportadas)}
+- Productos disponibles: {len(productos)} productos en total
+
+HISTORIAL RECIENTE:
+{context_info if context_info else "Primera interacción"}
+
+PRODUCTOS RELEVANTES (preseleccionados para este mensaje):
+{productos_formatted if productos_formatted else "Ninguno coincide directamente con el mensaje"}
+
+MENSAJE DEL USUARIO: "{mensaje}\""""
+
+    try:
+        client = get_llm_client(tenant_id, "intent_reply")
+        response = client.chat.completions.create(
+            model=nlg_params.get("modelo", nlu_params.get("modelo", "gpt-4o-mini")),
+            messages=[
+                {"role": "system", "content": final_system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=nlg_params.get("temperature_nlg", 0.7),
+            max_tokens=nlu_params.get("max_tokens_nlu", 150) + nlg_params.get("max_tokens_nlg", 300),
+            response_format={"type": "json_object"}
+        )
+        
+        result = safe_json_loads(response.choices[0].message.content) or {}
+        intent = result.get("intent")
+        reply = (result.get("respuesta") or "").strip()
+        if not isinstance(intent, dict) or not intent.get("intencion"):
+            raise ValueError("GPT no devolvió intención válida")
+        
+        intent.update({"tenant_id": tenant_id, "store_name": store_name, "timestamp": datetime.now().isoformat()})
+        store_intent(tenant_id, prompt_version, mensaje, history, intent)
+        
+        if not reply:
+            # Intención válida sin texto: se genera la respuesta por separado
+            return _reply_from(intent)
+        return intent, apply_style_overrides(reply, style_overrides)
+        
+    except Exception as e:
+        print(f"🚨 Error en gpt_detect_intent_and_reply para tenant {tenant_id}: {e}")
+        # Fallback: pipeline de dos llamadas
+        intent = gpt_detect_intent(
+            tenant_id=tenant_id,
+            store_name=store_name,
+            mensaje=mensaje,
+            history=history,
+            productos=productos,
+            categorias_soportadas=categorias_soportadas,
+            db=db
+        )
+        return _reply_from(intent)
+
 # ===========================================
 # 🎭 FUNCIÓN ORQUESTADORA PRINCIPAL
 # ===========================================
@@ -683,7 +862,8 @@ def handle_message_with_context(
     productos: List[Dict],
     categorias_soportadas: List[str],
     history: Optional[List[Dict]] = None,
-    db: Optional[Session] = None
+    db: Optional[Session] = None,
+    pipeline_mode: Optional[str] = None
 ) -> Tuple[str, Dict]:
     """
     🎯 Función orquestadora principal que maneja mensaje completo
@@ -698,6 +878,7 @@ def handle_message_with_context(
         categorias_soportadas: Categorías que maneja el tenant
         history: Historial de conversación del tenant
         db: Sesión de BD para logging (opcional)
+        pipeline_mode: "two_pass" | "single_pass" (por defecto, el configurado por el tenant)
         
     Returns:
         Tuple (respuesta_generada, metadata)
@@ -719,30 +900,45 @@ def handle_message_with_context(
     
     try:
         # 0. 🔧 Cargar configuración del tenant
+        tenant_cfg = get_tenant_ai_config(tenant_id, db)
         if db:
-            tenant_cfg = get_tenant_ai_config(tenant_id, db)
             print(f"📋 Config cargada para tenant {tenant_id}: version {tenant_cfg.get('version', 0)}")
-        
-        # 1. 🧠 Detectar intención con GPT personalizada
-        intent_result = gpt_detect_intent(
-            tenant_id=tenant_id,
-            store_name=store_name,
-            mensaje=mensaje,
-            history=history,
-            productos=productos,
-            categorias_soportadas=categorias_soportadas,
-            db=db
-        )
-        
-        # 2. ✨ Generar respuesta con GPT personalizada
-        respuesta = gpt_generate_reply(
-            tenant_id=tenant_id,
-            store_name=store_name,
-            intent=intent_result,
-            productos=productos,
-            categorias_soportadas=categorias_soportadas,
-            db=db
-        )
+        if pipeline_mode not in PIPELINE_MODES:
+            pipeline_mode = get_pipeline_mode(tenant_cfg)
+        
+        if pipeline_mode == "single_pass":
+            # 1+2. ⚡ Intención y respuesta en una sola llamada
+            intent_result, respuesta = gpt_detect_intent_and_reply(
+                tenant_id=tenant_id,
+                store_name=store_name,
+                mensaje=mensaje,
+                history=history,
+                productos=productos,
+                categorias_soportadas=categorias_soportadas,
+                db=db
+            )
+        else:
+            # 1. 🧠 Detectar intención con GPT personalizada
+            intent_result = gpt_detect_intent(
+                tenant_id=tenant_id,
+                store_name=store_name,
+                mensaje=mensaje,
+                history=history,
+                productos=productos,
+                categorias_soportadas=categorias_soportadas,
+                db=db
+            )
+            
+            # 2. ✨ Generar respuesta con GPT personalizada
+            with _reply_streaming_for(intent_result):
+                respuesta = gpt_generate_reply(
+                    tenant_id=tenant_id,
+                    store_name=store_name,
+                    intent=intent_result,
+                    productos=productos,
+                    categorias_soportadas=categorias_soportadas,
+                    db=db
+                )
         
         # 3. 📊 Calcular métricas
         end_time = datetime.now()
@@ -777,8 +973,9 @@ def handle_message_with_context(
             "product": intent_result.get("producto_mencionado"),
             "sentiment": intent_result.get("sentimiento"),
             "duration_ms": duration_ms,
-            "products_shown": len([p for p in productos if intent_result.get("categoria_mencionada", "").lower() in p.get("name", "").lower()][:3]),
+            "products_shown": len([p for p in productos if (intent_result.get("categoria_mencionada") or "").lower() in p.get("name", "").lower()][:3]),
             "timestamp": start_time.isoformat(),
+            "pipeline_mode": pipeline_mode,
             "ai_version": "v3.0-gpt-max"
         }
         
@@ -978,32 +1175,47 @@ def apply_style_overrides(text: str, style_overrides: Dict[str, Any]) -> str:
     if cta_principal and not any(trigger in result.lower() for trigger in ["comprar", "precio", "?"]):
         result += f"\n\n{cta_principal}"
     
-    # Ajustar emojis según configuración
-    usar_emojis = style_overrides.get("usar_emojis", True)
-    if not usar_emojis:
-        # Remover emojis si están deshabilitados
-        import re
-        emoji_pattern = re.compile("["
-                                 u"\U0001F600-\U0001F64F"  # emoticons
-                                 u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-                                 u"\U0001F680-\U0001F6FF"  # transport & map
-                                 u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-                                 "]+", flags=re.UNICODE)
-        result = emoji_pattern.sub('', result)
-    
-    # Aplicar tono si está especificado
-    tono = style_overrides.get("tono")
-    if tono == "formal":
-        result = result.replace("!", ".")
-        result = result.replace("🤔", "")
-        result = result.replace("😊", "")
-    elif tono == "casual":
+    # Emojis y tono formal (carácter a carácter)
+    result = apply_inline_style(result, style_overrides)
+    
+    # Cierre casual
+    if style_overrides.get("tono") == "casual":
         if not result.endswith(("!", "?", ".")):
             result += " 😊"
     
     return result.strip()
 
 
+_EMOJI_PATTERN = re.compile("["
+                            u"\U0001F600-\U0001F64F"  # emoticons
+                            u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+                            u"\U0001F680-\U0001F6FF"  # transport & map
+                            u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
+                            "]+", flags=re.UNICODE)
+
+
+def apply_inline_style(text: str, style_overrides: Dict[str, Any]) -> str:
+    """
+    Parte local de apply_style_overrides (emojis deshabilitados, tono formal)
+    Se aplica igual a un bloque enviado en streaming que al texto completo
+    """
+    if not text or not style_overrides:
+        return text
+    
+    result = text
+    
+    # Remover emojis si están deshabilitados
+    if not style_overrides.get("usar_emojis", True):
+        result = _EMOJI_PATTERN.sub('', result)
+    
+    if style_overrides.get("tono") == "formal":
+        result = result.replace("!", ".")
+        result = result.replace("🤔", "")
+        result = result.replace("😊", "")
+    
+    return result
+
+
 def truncate_to_chars(text: str, limit: int) -> str:
     """
     ✂️ Truncar texto respetando palabras completas
@@ -0,0 +1,510 @@
+"""
+Cache unificado por namespace para los procesos del backend y del bot
+Reemplaza los dicts de módulo con TTL manual (_tenant_cache, _slug_cache,
+_query_cache, TenantPromptCache._cache, _config_cache):
+
+- Tamaño acotado con desalojo LRU o LFU por namespace
+- TTL por namespace (y opcional por entrada)
+- Single-flight: N requests concurrentes por la misma clave → una sola carga
+- Invalidación por tenant: claves con formato {namespace}:tenant:{tenant_id}:{key}
+- Backend compartido opcional compatible con Redis (CACHE_REDIS_URL) como segundo nivel;
+  InMemoryRedis es un reemplazo en proceso con la misma interfaz para pruebas
+"""
+import asyncio
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_DEFAULT_MAX_ENTRIES = int(os.getenv("CACHE_DEFAULT_MAX_ENTRIES", "10000"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+# TTL máximo del nivel local cuando hay backend compartido (acota la desincronización entre workers)
+CACHE_LOCAL_TTL_SECONDS = int(os.getenv("CACHE_LOCAL_TTL_SECONDS", "30"))
+
+_MISSING = object()
+
+
+class LocalStore:
+    """Almacén en proceso acotado con política LRU o LFU y expiración por entrada"""
+
+    def __init__(self, max_entries: int = CACHE_DEFAULT_MAX_ENTRIES, policy: str = "lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Política de desalojo no soportada: {policy}")
+        self.max_entries = max(1, max_entries)
+        self.policy = policy
+        # key -> (expires_at, value)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # LFU: key -> frecuencia, frecuencia -> claves en orden de inserción
+        self._freq: Dict[str, int] = {}
+        self._buckets: Dict[int, "OrderedDict[str, None]"] = defaultdict(OrderedDict)
+        self._min_freq = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> List[str]:
+        return list(self._entries.keys())
+
+    def _touch(self, key: str) -> None:
+        if self.policy == "lru":
+            self._entries.move_to_end(key)
+            return
+        freq = self._freq[key]
+        bucket = self._buckets[freq]
+        bucket.pop(key, None)
+        if not bucket:
+            del self._buckets[freq]
+            if self._min_freq == freq:
+                self._min_freq = freq + 1
+        self._freq[key] = freq + 1
+        self._buckets[freq + 1][key] = None
+
+    def _evict_one(self) -> None:
+        if self.policy == "lru":
+            key = next(iter(self._entries))
+        else:
+            if self._min_freq not in self._buckets:
+                self._min_freq = min(self._buckets)
+            key = next(iter(self._buckets[self._min_freq]))
+        self.delete(key)
+        self.evictions += 1
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at and time.monotonic() > expires_at:
+            self.delete(key)
+            self.expirations += 1
+            return _MISSING
+        self._touch(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        expires_at = time.monotonic() + ttl if ttl else 0.0
+        if key in self._entries:
+            self._entries[key] = (expires_at, value)
+            self._touch(key)
+            return
+        while len(self._entries) >= self.max_entries:
+            self._evict_one()
+        self._entries[key] = (expires_at, value)
+        if self.policy == "lfu":
+            self._freq[key] = 1
+            self._buckets[1][key] = None
+            self._min_freq = 1
+
+    def delete(self, key: str) -> bool:
+        if self._entries.pop(key, None) is None:
+            return False
+        if self.policy == "lfu":
+            freq = self._freq.pop(key)
+            bucket = self._buckets.get(freq)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self._buckets[freq]
+        return True
+
+    def delete_prefix(self, prefix: str) -> int:
+        keys = [key for key in self._entries if key.startswith(prefix)]
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def clear(self) -> int:
+        count = len(self._entries)
+        self._entries.clear()
+        self._freq.clear()
+        self._buckets.clear()
+        self._min_freq = 0
+        return count
+
+    def expired_count(self) -> int:
+        now = time.monotonic()
+        return sum(1 for expires_at, _ in self._entries.values() if expires_at and now > expires_at)
+
+
+class InMemoryRedis:
+    """
+    Reemplazo en proceso del subconjunto de redis.Redis que usa SharedStore
+    (get / set con ex / delete / scan_iter / flushdb). Útil para pruebas sin Redis.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[float, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at and time.monotonic() > expires_at:
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ex: Optional[int] = None) -> bool:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ex if ex else 0.0, value)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def scan_iter(self, match: Optional[str] = None, count: int = 500) -> Iterator[str]:
+        prefix = match[:-1] if match and match.endswith("*") else match
+        with self._lock:
+            keys = list(self._data.keys())
+        for key in keys:
+            if prefix is None or key.startswith(prefix):
+                yield key
+
+    def flushdb(self) -> bool:
+        with self._lock:
+            self._data.clear()
+        return True
+
+
+class SharedStore:
+    """Segundo nivel compartido entre workers sobre un cliente compatible con Redis"""
+
+    def __init__(self, client: Any, key_prefix: str = "cache:"):
+        self._client = client
+        self._prefix = key_prefix
+        self.errors = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self._prefix}{key}"
+
+    def get(self, key: str) -> Any:
+        try:
+            raw = self._client.get(self._key(key))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Shared cache get failed for {key}: {e}")
+            return _MISSING
+        if raw is None:
+            return _MISSING
+        # Valores propios del proceso (Redis interno, no expuesto)
+        return pickle.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        try:
+            self._client.set(self._key(key), pickle.dumps(value), ex=int(ttl) if ttl else None)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Shared cache set failed for {key}: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self._client.delete(self._key(key))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Shared cache delete failed for {key}: {e}")
+
+    def delete_prefix(self, prefix: str) -> int:
+        try:
+            keys = list(self._client.scan_iter(match=f"{self._key(prefix)}*"))
+            return self._client.delete(*keys) if keys else 0
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Shared cache invalidation failed for {prefix}: {e}")
+            return 0
+
+
+class _Flight:
+    """Carga en curso compartida por los threads que piden la misma clave"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class CacheNamespace:
+    """Namespace de cache con TTL, límite de tamaño y single-flight propios"""
+
+    def __init__(self, name: str, ttl: Optional[float] = 300, max_entries: int = CACHE_DEFAULT_MAX_ENTRIES,
+                 policy: str = "lru", shared: Optional[SharedStore] = None):
+        self.name = name
+        self.ttl = ttl
+        self._local = LocalStore(max_entries=max_entries, policy=policy)
+        self._shared = shared
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[str, "asyncio.Future"] = {}
+        self._stats = {
+            "hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "load_errors": 0,
+            "coalesced": 0,
+            "invalidations": 0,
+        }
+
+    def _full_key(self, key: str, tenant_id: Optional[str] = None) -> str:
+        if tenant_id:
+            return f"{self.name}:tenant:{tenant_id}:{key}"
+        return f"{self.name}:{key}"
+
+    def _local_ttl(self, ttl: Optional[float]) -> Optional[float]:
+        if self._shared is None:
+            return ttl
+        return min(ttl, CACHE_LOCAL_TTL_SECONDS) if ttl else CACHE_LOCAL_TTL_SECONDS
+
+    def _lookup(self, full_key: str) -> Any:
+        with self._lock:
+            value = self._local.get(full_key)
+        if value is not _MISSING:
+            self._stats["hits"] += 1
+            return value
+        if self._shared is not None:
+            value = self._shared.get(full_key)
+            if value is not _MISSING:
+                with self._lock:
+                    self._local.set(full_key, value, self._local_ttl(self.ttl))
+                self._stats["shared_hits"] += 1
+                return value
+        self._stats["misses"] += 1
+        return _MISSING
+
+    def _store(self, full_key: str, value: Any, ttl: Optional[float]) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._local.set(full_key, value, self._local_ttl(ttl))
+        if self._shared is not None:
+            self._shared.set(full_key, value, ttl)
+
+    def get(self, key: str, default: Any = None, tenant_id: Optional[str] = None) -> Any:
+        """Valor cacheado o `default` si no existe / expiró"""
+        value = self._lookup(self._full_key(key, tenant_id))
+        return default if value is _MISSING else value
+
+    def contains(self, key: str, tenant_id: Optional[str] = None) -> bool:
+        """True si hay entrada vigente (aunque el valor cacheado sea None)"""
+        return self._lookup(self._full_key(key, tenant_id)) is not _MISSING
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, tenant_id: Optional[str] = None) -> None:
+        self._store(self._full_key(key, tenant_id), value, ttl)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None,
+                    tenant_id: Optional[str] = None, cache_none: bool = False) -> Any:
+        """
+        Cache-aside con single-flight entre threads: solo el primer llamador
+        ejecuta `loader`, el resto espera su resultado
+        """
+        full_key = self._full_key(key, tenant_id)
+        value = self._lookup(full_key)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            flight = self._flights.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[full_key] = _Flight()
+
+        if not leader:
+            self._stats["coalesced"] += 1
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            self._stats["loads"] += 1
+            flight.value = loader()
+            if flight.value is not None or cache_none:
+                self._store(full_key, flight.value, ttl)
+            return flight.value
+        except BaseException as e:
+            self._stats["load_errors"] += 1
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(full_key, None)
+            flight.event.set()
+
+    async def aget_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None,
+                           tenant_id: Optional[str] = None, cache_none: bool = False) -> Any:
+        """Variante async: las corrutinas que piden la misma clave esperan una sola carga"""
+        full_key = self._full_key(key, tenant_id)
+        value = self._lookup(full_key)
+        if value is not _MISSING:
+            return value
+
+        future = self._async_flights.get(full_key)
+        if future is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_flights[full_key] = future
+        try:
+            self._stats["loads"] += 1
+            value = await loader()
+            if value is not None or cache_none:
+                self._store(full_key, value, ttl)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            self._stats["load_errors"] += 1
+            future.set_exception(e)
+            # Evitar "exception was never retrieved" si nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            self._async_flights.pop(full_key, None)
+
+    def delete(self, key: str, tenant_id: Optional[str] = None) -> bool:
+        full_key = self._full_key(key, tenant_id)
+        with self._lock:
+            removed = self._local.delete(full_key)
+        if self._shared is not None:
+            self._shared.delete(full_key)
+        self._stats["invalidations"] += 1
+        return removed
+
+    def invalidate_tenant(self, tenant_id: str) -> int:
+        """Elimina todas las entradas del tenant en este namespace"""
+        prefix = f"{self.name}:tenant:{tenant_id}:"
+        with self._lock:
+            removed = self._local.delete_prefix(prefix)
+        if self._shared is not None:
+            removed = max(removed, self._shared.delete_prefix(prefix))
+        self._stats["invalidations"] += 1
+        return removed
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = self._local.clear()
+        if self._shared is not None:
+            removed = max(removed, self._shared.delete_prefix(f"{self.name}:"))
+        self._stats["invalidations"] += 1
+        return removed
+
+    def cleanup_expired(self) -> int:
+        """Purga entradas expiradas del nivel local"""
+        with self._lock:
+            before = self._local.expirations
+            for key in self._local.keys():
+                self._local.get(key)
+            return self._local.expirations - before
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return self._local.keys()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._local)
+            expired = self._local.expired_count()
+            evictions = self._local.evictions
+            expirations = self._local.expirations
+        hits = self._stats["hits"] + self._stats["shared_hits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "expired_entries": expired,
+            "active_entries": entries - expired,
+            "max_entries": self._local.max_entries,
+            "policy": self._local.policy,
+            "ttl_seconds": self.ttl,
+            "evictions": evictions,
+            "expirations": expirations,
+            "shared": self._shared is not None,
+            "shared_errors": self._shared.errors if self._shared is not None else 0,
+        }
+
+
+def _build_shared_client() -> Optional[Any]:
+    """Cliente Redis si CACHE_REDIS_URL está configurado y el paquete redis instalado"""
+    if not CACHE_REDIS_URL:
+        return None
+    if CACHE_REDIS_URL == "memory://":
+        return InMemoryRedis()
+    try:
+        import redis
+        return redis.Redis.from_url(CACHE_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    except ImportError:
+        logger.warning("CACHE_REDIS_URL set but the redis package is not installed; using local cache only")
+    except Exception as e:
+        logger.warning(f"Could not connect shared cache backend: {e}")
+    return None
+
+
+class CacheManager:
+    """Registro de namespaces del proceso"""
+
+    def __init__(self, shared_client: Any = _MISSING):
+        self._namespaces: Dict[str, CacheNamespace] = {}
+        self._lock = threading.Lock()
+        self._shared_client = _build_shared_client() if shared_client is _MISSING else shared_client
+
+    def set_shared_client(self, client: Optional[Any]) -> None:
+        """Configura el backend compartido para los namespaces que se creen después"""
+        self._shared_client = client
+
+    def namespace(self, name: str, ttl: Optional[float] = 300, max_entries: int = CACHE_DEFAULT_MAX_ENTRIES,
+                  policy: str = "lru", shared: bool = False) -> CacheNamespace:
+        """Obtiene (o crea) un namespace; `shared=True` usa el backend compartido si existe"""
+        with self._lock:
+            namespace = self._namespaces.get(name)
+            if namespace is None:
+                store = SharedStore(self._shared_client) if shared and self._shared_client is not None else None
+                namespace = CacheNamespace(name, ttl=ttl, max_entries=max_entries, policy=policy, shared=store)
+                self._namespaces[name] = namespace
+            return namespace
+
+    def get_namespace(self, name: str) -> Optional[CacheNamespace]:
+        """Namespace ya registrado o None (no lo crea)"""
+        with self._lock:
+            return self._namespaces.get(name)
+
+    def invalidate_tenant(self, tenant_id: str) -> Dict[str, int]:
+        """Invalida el tenant en todos los namespaces"""
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        return {namespace.name: namespace.invalidate_tenant(tenant_id) for namespace in namespaces}
+
+    def clear_all(self) -> int:
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        return sum(namespace.clear() for namespace in namespaces)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            namespaces = dict(self._namespaces)
+        return {
+            "shared_backend": type(self._shared_client).__name__ if self._shared_client is not None else None,
+            "namespaces": {name: namespace.get_stats() for name, namespace in sorted(namespaces.items())},
+        }
+
+
+# Registro global del proceso
+cache_manager = CacheManager()
+
+
+def invalidate_tenant_caches(tenant_id: str) -> Dict[str, int]:
+    """Función de conveniencia: invalida un tenant en todos los namespaces"""
+    return cache_manager.invalidate_tenant(tenant_id)
+
+
+def get_cache_manager_stats() -> Dict[str, Any]:
+    return cache_manager.get_stats()
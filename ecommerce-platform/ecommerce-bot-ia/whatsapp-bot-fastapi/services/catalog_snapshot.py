@@ -0,0 +1,389 @@
+"""
+📦 Snapshot de catálogo por tenant para el bot de WhatsApp
+Construye una vez el catálogo activo de cada tenant y lo sirve en todos los turnos
+sin volver a ejecutar el SELECT completo sobre products.
+
+- Snapshot inmutable: tupla de registros compactos + índices por nombre y categoría
+- Índice invertido categoría -> productos armado con las asignaciones de
+  product_category_index (indexador del backend): cubre todo el catálogo sin GPT
+- Versionado: cada reconstrucción incrementa la versión del tenant
+- Invalidación explícita (update_product_stock, endpoint interno llamado por el backend)
+- Revalidación barata por huella (COUNT + MAX(updated_at)) como red de seguridad
+  para cambios hechos por otro proceso
+"""
+import json
+import os
+import re
+import threading
+import unicodedata
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Cada cuántos segundos se vuelve a verificar la huella del catálogo en BD
+CATALOG_REVALIDATE_SECONDS = float(os.getenv("CATALOG_REVALIDATE_SECONDS", "30"))
+
+# Productos sin categoría propia ni asignaciones (mismo criterio que el indexador del backend)
+DEFAULT_CATEGORY = "General"
+
+_CATALOG_QUERY = text("""
+    SELECT p.id, p.name, p.description, p.price, p.stock, p.status, p.client_id, p.category,
+           i.categories AS category_tags
+    FROM products p
+    LEFT JOIN product_category_index i ON i.product_id = p.id
+    WHERE p.client_id = :tenant_id
+    AND p.status = 'Active'
+    AND p.stock > 0
+    ORDER BY p.name ASC
+""")
+
+# Huella de todos los productos del tenant: cualquier insert/update/delete la cambia
+# (también una reindexación de categorías)
+_FINGERPRINT_QUERY = text("""
+    SELECT COUNT(*) AS total, MAX(updated_at) AS last_update,
+           (SELECT MAX(indexed_at) FROM product_category_index WHERE client_id = :tenant_id) AS last_indexed
+    FROM products
+    WHERE client_id = :tenant_id
+""")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _singular(token: str) -> str:
+    """
+    Plural simple del español: flores -> flor, aceites -> aceite, semillas -> semilla
+    "-es" solo se quita tras vocal + r/l/n/d/j; en grupos (muebles, verdes) se quita solo la "s"
+    """
+    if len(token) > 4 and token.endswith("es") and token[-3] in "rlndj" and token[-4] in "aeiou":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def category_key(text: Optional[str]) -> str:
+    """Clave normalizada de categoría (minúsculas, sin tildes, en singular)"""
+    plain = unicodedata.normalize("NFKD", (text or "").lower())
+    plain = "".join(ch for ch in plain if not unicodedata.combining(ch))
+    return " ".join(_singular(token) for token in _TOKEN_RE.findall(plain))
+
+
+def _parse_categories(raw: Optional[str], category: str) -> Tuple[str, ...]:
+    """Etiquetas asignadas por el indexador; sin fila aún => la categoría propia del producto"""
+    if raw:
+        try:
+            labels = tuple(label for label in json.loads(raw) if label)
+            if labels:
+                return labels
+        except (TypeError, ValueError):
+            pass
+    return (category,)
+
+
+class ProductRecord(NamedTuple):
+    """Registro compacto e inmutable de un producto del catálogo"""
+    id: str
+    name: str
+    description: str
+    price: float
+    stock: int
+    status: str
+    client_id: str
+    category: str
+    categories: Tuple[str, ...] = ()
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Dict con el mismo formato que devolvía get_real_products_from_backoffice"""
+        return self._asdict()
+
+
+@dataclass(frozen=True)
+class CategoryIndex:
+    """Índice invertido clave de categoría -> posiciones de productos"""
+    by_key: Mapping[str, Tuple[int, ...]] = field(default_factory=lambda: MappingProxyType({}))
+    labels: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+
+    @classmethod
+    def build(cls, categories_per_product: Iterable[Sequence[str]]) -> "CategoryIndex":
+        by_key: Dict[str, List[int]] = {}
+        labels: Dict[str, str] = {}
+        for index, categories in enumerate(categories_per_product):
+            for label in categories:
+                key = category_key(label)
+                if not key:
+                    continue
+                labels.setdefault(key, label)
+                positions = by_key.setdefault(key, [])
+                if not positions or positions[-1] != index:
+                    positions.append(index)
+        return cls(
+            by_key=MappingProxyType({k: tuple(v) for k, v in by_key.items()}),
+            labels=MappingProxyType(labels),
+        )
+
+    def lookup(self, category: str) -> Tuple[int, ...]:
+        """
+        Posiciones de la categoría pedida ("aceites", "Aceites CBD", "flor")
+        Coincidencia exacta de la clave; si no, unión de las palabras que sean categorías
+        """
+        key = category_key(category)
+        if key in self.by_key:
+            return self.by_key[key]
+        matches = set()
+        for token in key.split():
+            matches.update(self.by_key.get(token, ()))
+        return tuple(sorted(matches))
+
+    def grouped(self) -> Dict[str, Tuple[int, ...]]:
+        """Etiqueta -> posiciones, para listar el catálogo por categorías"""
+        return {self.labels[key]: positions for key, positions in self.by_key.items()}
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Catálogo inmutable de un tenant con índices precalculados"""
+    tenant_id: str
+    version: int
+    fingerprint: Tuple[Any, ...]
+    built_at: float
+    products: Tuple[ProductRecord, ...]
+    by_name: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+    by_category: CategoryIndex = field(default_factory=CategoryIndex)
+    product_ids: Tuple[str, ...] = ()
+
+    def as_dicts(self) -> List[Dict[str, Any]]:
+        """Copia mutable para los llamadores que esperan List[Dict]"""
+        return [product.as_dict() for product in self.products]
+
+    def find_by_name(self, name: str) -> Optional[ProductRecord]:
+        """Búsqueda exacta (case-insensitive) por nombre"""
+        index = self.by_name.get((name or "").strip().lower())
+        return self.products[index] if index is not None else None
+
+    def find_by_category(self, category: str) -> Tuple[ProductRecord, ...]:
+        """Productos de una categoría (incluye las asignadas por el indexador)"""
+        return tuple(self.products[i] for i in self.by_category.lookup(category))
+
+
+def build_snapshot(tenant_id: str, rows, version: int, fingerprint: Tuple[Any, ...]) -> CatalogSnapshot:
+    """Construye el snapshot inmutable a partir de las filas de products"""
+    products = tuple(
+        ProductRecord(
+            id=row.id,
+            name=row.name,
+            description=row.description or "Sin descripción",
+            price=float(row.price),
+            stock=int(row.stock),
+            status=row.status,
+            client_id=row.client_id,
+            category=row.category or DEFAULT_CATEGORY,
+            categories=_parse_categories(
+                getattr(row, "category_tags", None), row.category or DEFAULT_CATEGORY
+            ),
+        )
+        for row in rows
+    )
+
+    by_name: Dict[str, int] = {}
+    for index, product in enumerate(products):
+        by_name.setdefault((product.name or "").strip().lower(), index)
+
+    return CatalogSnapshot(
+        tenant_id=tenant_id,
+        version=version,
+        fingerprint=fingerprint,
+        built_at=time.time(),
+        products=products,
+        by_name=MappingProxyType(by_name),
+        by_category=CategoryIndex.build(product.categories for product in products),
+        product_ids=tuple(product.id for product in products),
+    )
+
+
+class CatalogSnapshotCache:
+    """
+    Cache en memoria de snapshots de catálogo por tenant
+    Namespace estricto: tenant:{tenant_id}:catalog
+    """
+
+    def __init__(self, revalidate_seconds: float = CATALOG_REVALIDATE_SECONDS):
+        self._snapshots: Dict[str, CatalogSnapshot] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._versions: Dict[str, int] = {}
+        self._revalidate_seconds = revalidate_seconds
+        # procesar_mensaje_flow corre en threads del executor
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "rebuilds": 0,
+            "invalidations": 0,
+            "revalidations": 0,
+        }
+
+    def _get_cache_key(self, tenant_id: str) -> str:
+        """Generar clave de caché con namespace estricto"""
+        if not tenant_id:
+            raise ValueError("tenant_id es requerido para cache")
+        return f"tenant:{tenant_id}:catalog"
+
+    def _fetch_fingerprint(self, db: Session, tenant_id: str) -> Tuple[Any, ...]:
+        row = db.execute(_FINGERPRINT_QUERY, {"tenant_id": tenant_id}).first()
+        if not row:
+            return (0, None, None)
+        return (
+            int(row.total or 0),
+            str(row.last_update) if row.last_update else None,
+            str(row.last_indexed) if row.last_indexed else None,
+        )
+
+    def _rebuild(self, db: Session, tenant_id: str, cache_key: str) -> CatalogSnapshot:
+        fingerprint = self._fetch_fingerprint(db, tenant_id)
+        rows = db.execute(_CATALOG_QUERY, {"tenant_id": tenant_id}).fetchall()
+
+        with self._lock:
+            version = self._versions.get(cache_key, 0) + 1
+            self._versions[cache_key] = version
+            snapshot = build_snapshot(tenant_id, rows, version, fingerprint)
+            self._snapshots[cache_key] = snapshot
+            self._checked_at[cache_key] = time.time()
+            self._stats["rebuilds"] += 1
+
+        print(f"📦 CATALOG SNAPSHOT: tenant={tenant_id} v{version} | {len(snapshot.products)} productos")
+        return snapshot
+
+    def get(self, db: Session, tenant_id: str) -> CatalogSnapshot:
+        """
+        Obtener el snapshot del tenant, reconstruyéndolo solo si fue invalidado
+        o si la huella en BD cambió desde la última verificación
+        """
+        cache_key = self._get_cache_key(tenant_id)
+
+        with self._lock:
+            snapshot = self._snapshots.get(cache_key)
+            checked_at = self._checked_at.get(cache_key, 0.0)
+
+        if snapshot is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return self._rebuild(db, tenant_id, cache_key)
+
+        if time.time() - checked_at >= self._revalidate_seconds:
+            with self._lock:
+                self._stats["revalidations"] += 1
+            if self._fetch_fingerprint(db, tenant_id) != snapshot.fingerprint:
+                with self._lock:
+                    self._stats["misses"] += 1
+                return self._rebuild(db, tenant_id, cache_key)
+            with self._lock:
+                self._checked_at[cache_key] = time.time()
+
+        with self._lock:
+            self._stats["hits"] += 1
+        return snapshot
+
+    def peek(self, tenant_id: str) -> Optional[CatalogSnapshot]:
+        """Snapshot actual sin tocar la BD (None si no existe)"""
+        with self._lock:
+            return self._snapshots.get(self._get_cache_key(tenant_id))
+
+    def invalidate(self, tenant_id: str) -> bool:
+        """Invalidar el snapshot de un tenant; el próximo turno lo reconstruye"""
+        cache_key = self._get_cache_key(tenant_id)
+        with self._lock:
+            removed = self._snapshots.pop(cache_key, None) is not None
+            self._checked_at.pop(cache_key, None)
+            self._stats["invalidations"] += 1
+        return removed
+
+    def invalidate_all(self) -> int:
+        """Invalidar todos los snapshots"""
+        with self._lock:
+            count = len(self._snapshots)
+            self._snapshots.clear()
+            self._checked_at.clear()
+            self._stats["invalidations"] += count
+        return count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del cache (hit/miss/rebuild)"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "tenants": len(self._snapshots),
+                "versions": {
+                    snapshot.tenant_id: snapshot.version
+                    for snapshot in self._snapshots.values()
+                },
+                "revalidate_seconds": self._revalidate_seconds,
+            }
+
+
+# Instancia global del cache
+catalog_snapshot_cache = CatalogSnapshotCache()
+
+
+def get_catalog_snapshot(db: Session, tenant_id: str) -> CatalogSnapshot:
+    """Función de conveniencia para obtener el snapshot de catálogo"""
+    return catalog_snapshot_cache.get(db, tenant_id)
+
+
+def invalidate_catalog_snapshot(tenant_id: Optional[str] = None) -> int:
+    """Invalidar el catálogo de un tenant (o de todos si tenant_id es None)"""
+    if tenant_id:
+        return 1 if catalog_snapshot_cache.invalidate(tenant_id) else 0
+    return catalog_snapshot_cache.invalidate_all()
+
+
+def get_catalog_cache_stats() -> Dict[str, Any]:
+    """Estadísticas del cache de catálogo"""
+    return catalog_snapshot_cache.get_stats()
+
+
+def _snapshot_for(productos: List[Dict[str, Any]]) -> Optional[CatalogSnapshot]:
+    """Snapshot vigente si `productos` es su catálogo completo (caso normal: as_dicts())"""
+    tenant_id = productos[0].get("client_id") if productos else None
+    snapshot = catalog_snapshot_cache.peek(tenant_id) if tenant_id else None
+    if snapshot is not None and snapshot.product_ids == tuple(p.get("id") for p in productos):
+        return snapshot
+    return None
+
+
+def catalog_version_for(productos: List[Dict[str, Any]]) -> Optional[int]:
+    """Versión del snapshot de `productos` (clave para memoizar derivados del catálogo) o None"""
+    snapshot = _snapshot_for(productos)
+    return snapshot.version if snapshot is not None else None
+
+
+def _category_index_for(productos: List[Dict[str, Any]]) -> CategoryIndex:
+    """
+    Índice del snapshot vigente si `productos` es su catálogo (caso normal: as_dicts());
+    si no (lista filtrada o armada a mano), uno ad hoc con las categorías de cada dict
+    """
+    snapshot = _snapshot_for(productos)
+    if snapshot is not None:
+        return snapshot.by_category
+    return CategoryIndex.build(
+        p.get("categories") or (p.get("category") or DEFAULT_CATEGORY,) for p in productos
+    )
+
+
+def products_in_category(productos: List[Dict[str, Any]], categoria: str) -> List[Dict[str, Any]]:
+    """Productos de `productos` asignados a la categoría pedida (catálogo completo, sin GPT)"""
+    if not productos or not categoria:
+        return []
+    return [productos[i] for i in _category_index_for(productos).lookup(categoria)]
+
+
+def products_by_category(productos: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Etiqueta de categoría -> productos (un producto puede estar en varias)"""
+    if not productos:
+        return {}
+    grouped = _category_index_for(productos).grouped()
+    return {label: [productos[i] for i in positions] for label, positions in grouped.items()}
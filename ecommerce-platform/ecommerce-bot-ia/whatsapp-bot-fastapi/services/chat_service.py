@@ -7,11 +7,10 @@ import asyncio
 import httpx
 from typing import Dict, Any
 
-# OpenAI integration (if available)
+# LLM integration through the shared gateway (OpenAI or local stub)
 try:
-    import openai
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    OPENAI_AVAILABLE = bool(os.getenv("OPENAI_API_KEY"))
+    from services.llm_gateway import get_llm_client, get_async_llm_client, LLM_BACKEND
+    OPENAI_AVAILABLE = LLM_BACKEND == "stub" or bool(os.getenv("OPENAI_API_KEY"))
 except ImportError:
     OPENAI_AVAILABLE = False
 
@@ -70,14 +69,14 @@ async def search_products_backend(query: str, client_phone: str) -> list:
         print(f"Error searching products: {e}")
         return []
 
-async def process_with_openai(mensaje: str, client_info: Dict) -> str:
+async def process_with_openai(mensaje: str, client_info: Dict, tenant_id: str = None) -> str:
     """Process message using OpenAI (if available)"""
     if not OPENAI_AVAILABLE:
         return None
     
     try:
         # FIX: Updated to OpenAI v1.x API syntax
-        client = openai.AsyncOpenAI()
+        client = get_async_llm_client(tenant_id, "legacy_reply")
         prompt = f"""
         Eres un asistente de ventas para {client_info['name']}, una tienda de {client_info['type']}.
         Cliente escribió: "{mensaje}"
@@ -120,28 +119,30 @@ async def procesar_mensaje_con_contexto(telefono: str, mensaje: str, tenant_id:
         from backoffice_integration import get_real_products_from_backoffice, get_tenant_info
         print(f"🔧 All imports successful!")
         
-        # Create database session
-        db = SessionLocal()
-        try:
-            # Convert frontend history format to AI format
-            ai_history = []
-            if historial:
-                for msg in historial[-5:]:  # Last 5 messages for context
-                    ai_history.append({
-                        "user" if msg.get("role") == "user" else "bot": msg.get("content", "")
-                    })
-            
-            print(f"🔧 Calling procesar_mensaje_flow_inteligente with {len(ai_history)} history messages...")
-            
-            # Use Flow chat service with intelligence and context
-            response = procesar_mensaje_flow_inteligente(db, telefono, mensaje, tenant_id, ai_history)
-            
-            print(f"🔧 Got response from flow service: {response[:50]}...")
-            
-            return response
-            
-        finally:
-            db.close()
+        # Convert frontend history format to AI format
+        ai_history = []
+        if historial:
+            for msg in historial[-5:]:  # Last 5 messages for context
+                ai_history.append({
+                    "user" if msg.get("role") == "user" else "bot": msg.get("content", "")
+                })
+        
+        def _procesar_sync() -> str:
+            # Create database session (sync SQLAlchemy + OpenAI, runs in a thread)
+            db = SessionLocal()
+            try:
+                print(f"🔧 Calling procesar_mensaje_flow_inteligente with {len(ai_history)} history messages...")
+                
+                # Use Flow chat service with intelligence and context
+                return procesar_mensaje_flow_inteligente(db, telefono, mensaje, tenant_id, ai_history)
+            finally:
+                db.close()
+        
+        response = await asyncio.to_thread(_procesar_sync)
+        
+        print(f"🔧 Got response from flow service: {response[:50]}...")
+        
+        return response
             
     except Exception as e:
         print(f"🚨 ERROR in context processing: {e}")
@@ -170,14 +171,17 @@ async def procesar_mensaje(telefono: str, mensaje: str, tenant_id: str = None) -
         from flow_chat_service import procesar_mensaje_flow_inteligente
         from database import SessionLocal
         
-        # Create database session
-        db = SessionLocal()
-        try:
-            # Use the integrated Flow chat service with intelligence (no context)
-            response = procesar_mensaje_flow_inteligente(db, telefono, mensaje, tenant_id, [])
-            return response
-        finally:
-            db.close()
+        def _procesar_sync() -> str:
+            # Create database session (sync SQLAlchemy + OpenAI, runs in a thread)
+            db = SessionLocal()
+            try:
+                # Use the integrated Flow chat service with intelligence (no context)
+                return procesar_mensaje_flow_inteligente(db, telefono, mensaje, tenant_id, [])
+            finally:
+                db.close()
+        
+        # Keep the event loop free while the blocking pipeline runs
+        return await asyncio.to_thread(_procesar_sync)
             
     except Exception as e:
         print(f"Error in Flow processing: {e}")
@@ -210,7 +214,7 @@ Nuestro equipo está trabajando para solucionarlo.
 
         # Fallback response with AI if available
         if OPENAI_AVAILABLE:
-            ai_response = await process_with_openai(mensaje, client_info)
+            ai_response = await process_with_openai(mensaje, client_info, tenant_id)
             if ai_response:
                 return ai_response
         
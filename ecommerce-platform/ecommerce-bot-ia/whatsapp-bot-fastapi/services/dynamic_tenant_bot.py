@@ -7,10 +7,7 @@ import os
 from typing import Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
 from models import TenantPrompts
-import openai
-
-# Configuración OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from services.llm_gateway import get_llm_client
 
 def get_tenant_bot_config(db: Session, tenant_id: str) -> Optional[Dict[str, Any]]:
     """
@@ -106,7 +103,7 @@ RESPONDE como el asistente de {tenant_info.get('name', tenant_id)} usando la inf
 
     # 4. Llamada a GPT con configuración personalizada
     try:
-        client = openai.OpenAI()
+        client = get_llm_client(tenant_id, "dynamic_reply")
         
         # Usar parámetros del tenant o valores por defecto
         modelo = bot_config['nlg_params'].get('modelo', 'gpt-4o-mini')
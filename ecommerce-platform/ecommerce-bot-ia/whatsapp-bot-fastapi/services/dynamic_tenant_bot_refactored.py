@@ -8,7 +8,7 @@ import json
 import os
 from typing import Dict, Any, Optional, List
 from sqlalchemy.orm import Session
-import openai
+from services.llm_gateway import get_llm_client
 from services.tenant_config_manager import (
     get_cached_tenant_config,
     extract_dynamic_categories_from_products,
@@ -18,9 +18,6 @@ from services.tenant_config_manager import (
     ProductCategory
 )
 
-# Configuración OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 class DynamicTenantBot:
     """
     Bot completamente dinámico que se adapta automáticamente a cualquier tenant
@@ -33,7 +30,7 @@ class DynamicTenantBot:
         
         # Cargar configuración dinámica desde BD
         self.tenant_config = get_cached_tenant_config(db, tenant_id)
-        self.categorias = extract_dynamic_categories_from_products(productos)
+        self.categorias = extract_dynamic_categories_from_products(productos, tenant_id)
         self.business_insights = get_dynamic_business_insights(self.tenant_config, productos)
         
         print(f"🤖 Bot inicializado para {self.tenant_config.business_name} ({self.tenant_config.business_type})")
@@ -272,7 +269,7 @@ INSTRUCCIONES GENERALES:
         """
         Llama a GPT usando la configuración específica del tenant
         """
-        client = openai.OpenAI()
+        client = get_llm_client(self.tenant_id, "dynamic_reply")
         
         print(f"🤖 Procesando con {self.tenant_config.ai_model} (temp: {self.tenant_config.ai_temperature}) para {self.tenant_id}")
         
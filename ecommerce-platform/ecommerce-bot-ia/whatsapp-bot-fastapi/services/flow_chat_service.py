@@ -5,17 +5,19 @@ Multi-tenant compatible
 import json
 import os
 from sqlalchemy.orm import Session
-from models import FlowProduct, FlowPedido, FlowProductoPedido, FlowSesion
+from models import FlowProduct, FlowPedido
 from services.flow_service import crear_orden_flow, get_client_id_for_phone
 from services.backoffice_integration import (
     get_real_products_from_backoffice, 
-    update_product_stock,
     get_product_by_name_fuzzy,
     get_tenant_from_phone,
     get_tenant_info,
     format_price
 )
-from datetime import datetime
+from services.intent_rules import classify_intent_local, detect_confirmation
+from services.session_store import flow_session_store
+from services.order_placement import place_order
+from services.reply_streaming import stream_reply
 
 # Smart flows integration (DESHABILITADO - USAR MOTOR GPT REASONING)
 try:
@@ -26,16 +28,15 @@ except ImportError:
 
 # AI Improvements integration (SIEMPRE ACTIVO)
 try:
-    from services.ai_improvements import handle_message_with_context
+    from services.ai_improvements import handle_message_with_context, AI_REPLY_MIN_CONFIDENCE
     AI_IMPROVEMENTS_AVAILABLE = True
 except ImportError:
     AI_IMPROVEMENTS_AVAILABLE = False
 
-# OpenAI integration (if available)
+# LLM integration through the shared gateway (OpenAI or local stub)
 try:
-    import openai
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    OPENAI_AVAILABLE = bool(os.getenv("OPENAI_API_KEY"))
+    from services.llm_gateway import get_llm_client, get_async_llm_client, LLM_BACKEND
+    OPENAI_AVAILABLE = LLM_BACKEND == "stub" or bool(os.getenv("OPENAI_API_KEY"))
 except ImportError:
     OPENAI_AVAILABLE = False
 
@@ -79,13 +80,15 @@ def menu_principal(client_info, productos):
     catalogo += "📝 *Ejemplo:* 'Quiero Northern Lights' o solo 'Northern Lights'"
     return catalogo
 
-def procesar_con_openai_contextual(tenant_id: str, tenant_info: dict, mensaje: str, productos: list, historial: list) -> str:
+def procesar_con_openai_contextual(tenant_id: str, tenant_info: dict, mensaje: str, productos: list, historial: list,
+                                   limite_caracteres: int = None) -> str:
     """
     Sistema 100% dinámico usando OpenAI con contexto conversacional
     Escalable para cualquier tenant y tipo de negocio
+    La respuesta se genera en streaming (primer párrafo enviado antes de terminar) y se
+    corta en limite_caracteres (limite_respuesta_caracteres del tenant)
     """
     import os
-    from openai import OpenAI
     
     # Preparar datos dinámicos del tenant
     productos_contexto = ""
@@ -129,9 +132,11 @@ Responde como el asistente experto de {tenant_info['name']}:"""
     print(f"🔍 System prompt: {system_prompt[:200]}...")
     
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        client = get_llm_client(tenant_id, "contextual_reply")
         
-        response = client.chat.completions.create(
+        return stream_reply(
+            client,
+            limit=limite_caracteres,
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -139,9 +144,7 @@ Responde como el asistente experto de {tenant_info['name']}:"""
             ],
             max_tokens=300,
             temperature=0.7
-        )
-        
-        return response.choices[0].message.content.strip()
+        ).strip()
         
     except Exception as e:
         print(f"🚨 Error OpenAI: {e}")
@@ -158,8 +161,13 @@ def generar_respuesta_fallback_dinamica(tenant_info: dict, mensaje: str, product
     # Analizar si hay contexto previo
     contexto_previo = any(msg for msg in historial if any(content for content in msg.values()))
     
+    # Clasificador local del tenant (mismas reglas que el fast-path de gpt_detect_intent)
+    tenant_key = tenant_info.get("tenant_id") or tenant_info.get("name", "default")
+    categorias = sorted({p.get("category") for p in productos if p.get("category")})
+    intent = classify_intent_local(tenant_key, mensaje, productos, categorias, historial)
+    
     # Saludo inteligente basado en contexto
-    if any(word in mensaje_lower for word in ["hola", "hello", "hi", "buenas"]):
+    if intent["intencion"] == "saludo" or intent["contexto_detectado"] == "saludo_con_consulta":
         if not contexto_previo:
             productos_resumen = f"{len(productos)} productos disponibles" if productos else "productos exclusivos"
             return f"¡Hola! Bienvenido a {tenant_info['name']} 😊 Tenemos {productos_resumen}. ¿En qué puedo ayudarte?"
@@ -167,10 +175,10 @@ def generar_respuesta_fallback_dinamica(tenant_info: dict, mensaje: str, product
             return f"¡Hola de nuevo! ¿En qué más puedo ayudarte en {tenant_info['name']}?"
     
     # Búsqueda dinámica en productos reales
-    productos_mencionados = []
-    for producto in productos:
-        if any(word in producto['name'].lower() for word in mensaje_lower.split() if len(word) > 2):
-            productos_mencionados.append(producto)
+    productos_mencionados = [
+        producto for producto in productos
+        if intent["producto_mencionado"] and producto['name'] == intent["producto_mencionado"]
+    ]
     
     if productos_mencionados:
         producto = productos_mencionados[0]
@@ -219,6 +227,16 @@ def procesar_mensaje_flow_inteligente(db: Session, telefono: str, mensaje: str,
     # Usar historial tal como viene (ya está en formato correcto)
     ai_history = historial[-5:] if historial else []
     
+    # Límite de caracteres del tenant (corta la generación en streaming)
+    limite_caracteres = None
+    if AI_IMPROVEMENTS_AVAILABLE:
+        try:
+            from services.ai_improvements import get_tenant_ai_config
+            style_overrides = get_tenant_ai_config(tenant_id, db).get("style_overrides", {})
+            limite_caracteres = style_overrides.get("limite_respuesta_caracteres")
+        except Exception as e:
+            print(f"⚠️ No se pudo obtener el límite de respuesta del tenant: {e}")
+    
     # Sistema dinámico de IA con contexto
     print(f"🚀 Procesando con contexto: {len(ai_history)} mensajes previos")
     
@@ -229,7 +247,8 @@ def procesar_mensaje_flow_inteligente(db: Session, telefono: str, mensaje: str,
             tenant_info=tenant_info,
             mensaje=mensaje,
             productos=productos,
-            historial=ai_history
+            historial=ai_history,
+            limite_caracteres=limite_caracteres
         )
         
         print(f"✅ IA contextual exitosa: {response[:50]}...")
@@ -241,28 +260,12 @@ def procesar_mensaje_flow_inteligente(db: Session, telefono: str, mensaje: str,
         return procesar_mensaje_flow(db, telefono, mensaje, tenant_id)
 
 def obtener_sesion(db: Session, telefono: str, tenant_id: str):
-    """Obtiene o crea una sesión para el usuario"""
-    sesion = db.query(FlowSesion).filter_by(telefono=telefono).first()
-    if not sesion:
-        sesion = FlowSesion(
-            telefono=telefono,
-            tenant_id=tenant_id,
-            estado="INITIAL",
-            datos="{}"
-        )
-        db.add(sesion)
-        db.commit()
-        db.refresh(sesion)
-    return sesion
+    """Obtiene o crea la sesión del usuario (store por (tenant_id, telefono); la fila se crea en el flush)"""
+    return flow_session_store.get(db, tenant_id, telefono)
 
 def guardar_sesion(db: Session, sesion, estado: str = None, datos: dict = None):
-    """Guarda cambios en la sesión"""
-    if estado:
-        sesion.estado = estado
-    if datos:
-        sesion.datos = json.dumps(datos)
-    sesion.updated_at = datetime.utcnow()
-    db.commit()
+    """Guarda cambios en la sesión (write-behind; síncrono al entrar/salir de la confirmación de pedido)"""
+    return flow_session_store.save(db, sesion, estado, json.dumps(datos) if datos else None)
 
 def obtener_productos_cliente_real(db: Session, telefono: str, tenant_id: str = None):
     """
@@ -320,7 +323,8 @@ def procesar_mensaje_flow(db: Session, telefono: str, mensaje: str, tenant_id: s
     # ========================================
     if sesion.estado == "ORDER_CONFIRMATION":
         print(f"⚠️ Estado ORDER_CONFIRMATION detectado, mensaje: '{mensaje}'")
-        if any(word in mensaje_lower for word in ["sí", "si", "yes", "confirmo", "ok", "acepto"]):
+        confirmacion = detect_confirmation(mensaje)
+        if confirmacion is True:
             print(f"✅ Confirmación detectada!")
             datos = json.loads(sesion.datos)
             pedido_data = datos["pedido"]
@@ -329,33 +333,12 @@ def procesar_mensaje_flow(db: Session, telefono: str, mensaje: str, tenant_id: s
             # Obtener datos del tenant para el pedido
             productos, tenant_id, tenant_info = obtener_productos_cliente_real(db, telefono, tenant_id)
             
-            # Crear pedido en BD
-            pedido = FlowPedido(
-                telefono=telefono,
-                tenant_id=tenant_id,
-                total=total,
-                estado="pendiente_pago"
-            )
-            db.add(pedido)
-            db.commit()
-            db.refresh(pedido)
-            
-            # Crear productos del pedido y actualizar stock en tiempo real
-            for prod_id, item in pedido_data.items():
-                # Actualizar stock en la tabla products del backoffice
-                stock_actualizado = update_product_stock(db, prod_id, item["cantidad"], tenant_id)
-                if not stock_actualizado:
-                    return f"❌ Error: No hay suficiente stock de {item['nombre']}. Intenta con menos cantidad."
-                
-                producto_pedido = FlowProductoPedido(
-                    pedido_id=pedido.id,
-                    producto_id=prod_id,  # Usar string ID del backoffice
-                    cantidad=item["cantidad"],
-                    precio_unitario=item["precio"]
-                )
-                db.add(producto_pedido)
-            
-            db.commit()
+            # Crear pedido y reservar el stock de todos los ítems en una sola transacción
+            resultado = place_order(db, telefono, tenant_id, pedido_data, total)
+            if not resultado.ok:
+                sin_stock = ", ".join(pedido_data[prod_id]["nombre"] for prod_id in resultado.insufficient)
+                return f"❌ Error: No hay suficiente stock de {sin_stock}. Intenta con menos cantidad."
+            pedido = resultado.pedido
             
             # Crear orden de pago en Flow
             descripcion = f"Pedido_{client_info['name']}_{pedido.id}"
@@ -383,7 +366,7 @@ Escribe *"pagado"* y verificaremos tu pago automáticamente."""
             guardar_sesion(db, sesion, "ORDER_SCHEDULING", {"pedido_id": pedido.id})
             return respuesta
             
-        elif any(word in mensaje_lower for word in ["no", "cancelar", "cancel"]):
+        elif confirmacion is False:
             guardar_sesion(db, sesion, "INITIAL", {})
             return "❌ **Pedido cancelado**\n\n¿En qué más puedo ayudarte?"
         
@@ -446,7 +429,8 @@ Escribe *"pagado"* y verificaremos tu pago automáticamente."""
                 print(f"✅ IA Mejorada respondió (confianza: {metadata_ia.get('intent_confidence', 0):.2f}, tiempo: {metadata_ia.get('response_time_ms', 0)}ms)")
                 
                 # Si la confianza es alta, usar la respuesta de IA (umbral reducido para testing)
-                if metadata_ia.get('intent_confidence', 0) > 0.3:
+                # Mismo umbral que decide si la respuesta se transmite mientras se genera
+                if metadata_ia.get('intent_confidence', 0) > AI_REPLY_MIN_CONFIDENCE:
                     return respuesta_ia
                 
                 # Si la confianza es media, continuar con smart flows como backup
@@ -568,8 +552,7 @@ def _manejar_contexto_dinamico_con_gpt(db: Session, sesion, mensaje: str, datos_
         return None
     
     try:
-        import openai
-        client = openai.OpenAI()
+        client = get_llm_client(tenant_id, "session_context")
         
         # Obtener información del contexto actual
         estado_sesion = sesion.estado
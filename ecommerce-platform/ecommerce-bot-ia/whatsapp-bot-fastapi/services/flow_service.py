@@ -1,30 +1,64 @@
 """
 Servicio de integración con Flow para pagos
 Multi-tenant compatible
+Corre en threads (procesar_mensaje_flow): requests.Session compartida con pool de
+conexiones, timeouts y reintentos; idempotente por commerceOrder (reutiliza el token del pedido)
 """
 import os
 import requests
 import hashlib
 import hmac
+import logging
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from sqlalchemy.orm import Session
 from models import FlowPedido
 
+logger = logging.getLogger(__name__)
+
 # Configuración de Flow
 FLOW_API_KEY = os.getenv("FLOW_API_KEY", "749C736F-E427-482B-8400-7630D11L7766")
 FLOW_SECRET_KEY = os.getenv("FLOW_SECRET_KEY", "30f3d774a49a886cb28502ddf26864b69b4589be")
 FLOW_BASE_URL = os.getenv("FLOW_BASE_URL", "https://sandbox.flow.cl/api")
 BASE_URL = os.getenv("BASE_URL", "https://webhook.sintestesia.cl")
 
+FLOW_CONNECT_TIMEOUT = float(os.getenv("FLOW_CONNECT_TIMEOUT", "3"))
+FLOW_READ_TIMEOUT = float(os.getenv("FLOW_READ_TIMEOUT", "8"))
+FLOW_MAX_RETRIES = int(os.getenv("FLOW_MAX_RETRIES", "2"))
+FLOW_POOL_SIZE = int(os.getenv("FLOW_POOL_SIZE", "10"))
+
+ERROR_LINK_PAGO = "Error al generar link de pago"
+
+
+def _build_session() -> requests.Session:
+    # POST /payment/create solo se reintenta si no llegó a enviarse (errores de conexión);
+    # GET /payment/getStatus también en 429/5xx
+    retry = Retry(
+        total=FLOW_MAX_RETRIES,
+        connect=FLOW_MAX_RETRIES,
+        read=0,
+        status=FLOW_MAX_RETRIES,
+        backoff_factor=0.25,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+    )
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=FLOW_POOL_SIZE, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Sesión HTTP compartida del proceso (thread-safe para requests simples)
+_session = _build_session()
+
 def _firmar(parametros: dict) -> str:
     """
     Genera firma HMAC-SHA256 para los parámetros en Flow
     """
     keys = sorted(parametros.keys())
     cadena = "&".join([f"{k}={parametros[k]}" for k in keys])
-    firma = hmac.new(FLOW_SECRET_KEY.encode(), cadena.encode(), hashlib.sha256).hexdigest()
-    print(f"🖊️ [Flow] Firma generada para: {cadena}")
-    print(f"➡️ [Flow] Firma: {firma}")
-    return firma
+    return hmac.new(FLOW_SECRET_KEY.encode(), cadena.encode(), hashlib.sha256).hexdigest()
 
 def validar_firma(params: dict) -> bool:
     """
@@ -32,21 +66,31 @@ def validar_firma(params: dict) -> bool:
     """
     firma_recibida = params.pop("s", None)
     if not firma_recibida:
-        print("⚠️ [Flow] No se recibió firma en el callback")
+        logger.warning("⚠️ [Flow] No se recibió firma en el callback")
         return False
 
-    firma_calculada = _firmar(params)
-    valido = firma_recibida == firma_calculada
-    print(f"🔎 [Flow] Firma recibida: {firma_recibida}")
-    print(f"🔎 [Flow] Firma calculada: {firma_calculada}")
-    print(f"➡️ [Flow] ¿Firma válida? {valido}")
+    valido = hmac.compare_digest(firma_recibida, _firmar(params))
+    if not valido:
+        logger.warning("⚠️ [Flow] Firma del callback no coincide")
     return valido
 
+def _url_pago(token: str) -> str:
+    # URL de pago según ambiente
+    if "sandbox" in FLOW_BASE_URL:
+        return f"https://sandbox.flow.cl/app/web/pay.php?token={token}"
+    return f"https://www.flow.cl/app/web/pay.php?token={token}"
+
 def crear_orden_flow(order_id: str, monto: int, descripcion: str, client_id: str, db: Session) -> str:
     """
     Crea una orden de pago en Flow y devuelve el link de pago
     Multi-tenant compatible
+    Si el pedido ya tiene token (confirmación repetida) se reutiliza sin llamar a Flow
     """
+    pedido = db.query(FlowPedido).filter_by(id=order_id).first()
+    if pedido and pedido.token:
+        logger.info(f"♻️ [Flow] Pedido #{order_id} ya tiene link de pago, se reutiliza")
+        return _url_pago(pedido.token)
+
     url = f"{FLOW_BASE_URL}/payment/create"
     params = {
         "apiKey": FLOW_API_KEY,
@@ -57,38 +101,31 @@ def crear_orden_flow(order_id: str, monto: int, descripcion: str, client_id: str
         "urlConfirmation": f"{BASE_URL}/flow/confirm",
         "urlReturn": f"{BASE_URL}/flow/return"
     }
-
     params["s"] = _firmar(params)
-    print(f"➡️ [Flow] Payload enviado a Flow: {params}")
 
-    response = requests.post(url, data=params)
-    print(f"➡️ [Flow] Respuesta Flow: {response.status_code} - {response.text}")
+    try:
+        response = _session.post(url, data=params, timeout=(FLOW_CONNECT_TIMEOUT, FLOW_READ_TIMEOUT))
+    except requests.RequestException as e:
+        logger.error(f"❌ [Flow] Error de red al crear pago del pedido {order_id}: {e}")
+        return ERROR_LINK_PAGO
 
-    if response.status_code == 200:
-        data = response.json()
-        token = data.get("token")
-        if not token:
-            print("⚠️ [Flow] No se recibió token en la respuesta")
-            return "Error al generar link de pago"
-
-        # Guardar token en la BD
-        pedido = db.query(FlowPedido).filter_by(id=order_id).first()
-        if pedido:
-            pedido.token = token
-            db.commit()
-            print(f"💾 [Flow] Token guardado para pedido {order_id}")
-
-        # URL de pago según ambiente
-        if "sandbox" in FLOW_BASE_URL:
-            url_pago = f"https://sandbox.flow.cl/app/web/pay.php?token={token}"
-        else:
-            url_pago = f"https://www.flow.cl/app/web/pay.php?token={token}"
-        
-        print(f"💰 [Flow] Pedido #{order_id} creado (${monto}). URL: {url_pago}")
-        return url_pago
-    else:
-        print("❌ [Flow] Error al generar link de pago")
-        return "Error al generar link de pago"
+    if response.status_code != 200:
+        logger.error(f"❌ [Flow] Error al generar link de pago: {response.status_code} - {response.text[:200]}")
+        return ERROR_LINK_PAGO
+
+    token = response.json().get("token")
+    if not token:
+        logger.warning("⚠️ [Flow] No se recibió token en la respuesta")
+        return ERROR_LINK_PAGO
+
+    # Guardar token en la BD
+    if pedido:
+        pedido.token = token
+        db.commit()
+
+    url_pago = _url_pago(token)
+    logger.info(f"💰 [Flow] Pedido #{order_id} creado (${monto}). URL: {url_pago}")
+    return url_pago
 
 def verificar_pago_flow(order_id: str, db: Session) -> bool:
     """
@@ -96,7 +133,7 @@ def verificar_pago_flow(order_id: str, db: Session) -> bool:
     """
     pedido = db.query(FlowPedido).filter_by(id=order_id).first()
     if not pedido or not pedido.token:
-        print(f"⚠️ [Flow] No se encontró token para el pedido {order_id}")
+        logger.warning(f"⚠️ [Flow] No se encontró token para el pedido {order_id}")
         return False
 
     url = f"{FLOW_BASE_URL}/payment/getStatus"
@@ -106,18 +143,18 @@ def verificar_pago_flow(order_id: str, db: Session) -> bool:
     }
     params["s"] = _firmar(params)
 
-    print(f"➡️ [Flow] Verificando pago con params: {params}")
-    response = requests.get(url, params=params)
-    print(f"➡️ [Flow] Respuesta Flow: {response.status_code} - {response.text}")
+    try:
+        response = _session.get(url, params=params, timeout=(FLOW_CONNECT_TIMEOUT, FLOW_READ_TIMEOUT))
+    except requests.RequestException as e:
+        logger.error(f"❌ [Flow] Error de red al consultar pago del pedido {order_id}: {e}")
+        return False
 
     if response.status_code == 200:
-        data = response.json()
-        estado = data.get("status")
-        print(f"🔎 [Flow] Estado recibido: {estado}")
+        estado = response.json().get("status")
+        logger.info(f"🔎 [Flow] Estado recibido para pedido {order_id}: {estado}")
         return estado == 2  # 2 = pagado exitoso
-    else:
-        print("❌ [Flow] Error al consultar estado de pago")
-        return False
+    logger.error(f"❌ [Flow] Error al consultar estado de pago: {response.status_code}")
+    return False
 
 def get_client_id_for_phone(telefono: str) -> str:
     """
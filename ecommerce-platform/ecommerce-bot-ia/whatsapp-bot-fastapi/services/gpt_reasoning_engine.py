@@ -3,22 +3,90 @@
 Sistema donde GPT toma TODAS las decisiones sin condicionales hardcodeados
 🔒 Multi-tenant puro - GPT razona según el contexto del negocio
 🚀 Escalable automáticamente a cualquier tipo de negocio
+
+Modos (REASONING_ENGINE_MODE):
+- "planner" (por defecto): una sola llamada de planificación devuelve una acción tipada
+  (buscar, mostrar categoría/catálogo, cotizar, iniciar pedido) que se ejecuta localmente
+  contra el catálogo y se formatea con plantillas del tenant, sin llamada de formateo
+- "three_step": decidir, ejecutar y formatear con GPT (tres llamadas en serie)
+
+El contexto del negocio (categorías, estadísticas, productos destacados) se memoiza por
+versión del snapshot de catálogo en vez de reconstruirse en cada instancia
 """
+import hashlib
 import json
 import os
-from typing import Dict, Any, List, Optional
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
-import openai
+from services.cache import cache_manager
+from services.catalog_snapshot import catalog_version_for, category_key, products_by_category, products_in_category
+from services.llm_gateway import get_llm_client
+from services.message_queue import LatencyStats
+from services.reply_streaming import stream_reply
 from services.tenant_config_manager import (
     get_cached_tenant_config,
     extract_dynamic_categories_from_products,
     get_dynamic_business_insights,
     format_currency,
-    TenantConfig
+    ProductCategory
+)
+
+REASONING_ENGINE_MODE = os.getenv("REASONING_ENGINE_MODE", "planner")  # planner | three_step
+REASONING_ENGINE_MODES = ("planner", "three_step")
+REASONING_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("REASONING_CONTEXT_CACHE_TTL_SECONDS", "600"))
+
+# Contexto del negocio por (tenant, versión del catálogo, config del tenant, modo)
+_business_context_cache = cache_manager.namespace(
+    "reasoning_context", ttl=REASONING_CONTEXT_CACHE_TTL_SECONDS, max_entries=1000
+)
+
+PLANNER_ACTIONS = (
+    "buscar_productos", "mostrar_categoria", "mostrar_catalogo",
+    "cotizar_precio", "iniciar_pedido", "respuesta_directa",
 )
 
-# Configuración OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Productos por respuesta según response_length del tenant
+_ITEMS_PER_LENGTH = {'short': 3, 'medium': 5, 'long': 8}
+
+_stats: Dict[str, Any] = {
+    "messages": {mode: 0 for mode in REASONING_ENGINE_MODES},
+    "actions": {action: 0 for action in PLANNER_ACTIONS},
+    "planner_errors": 0,
+}
+_latency = {mode: LatencyStats() for mode in REASONING_ENGINE_MODES}
+
+
+@dataclass
+class PlannedAction:
+    """Acción tipada devuelta por el planificador (una llamada a GPT, ejecución local)"""
+    accion: str
+    terminos: List[str] = field(default_factory=list)
+    categoria: str = ""
+    producto: str = ""
+    cantidad: int = 1
+    respuesta: str = ""  # solo para respuesta_directa
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "PlannedAction":
+        """Normaliza la salida del modelo (acción desconocida => respuesta_directa)"""
+        accion = str(data.get("accion") or "").strip()
+        terminos = data.get("terminos") or []
+        if isinstance(terminos, str):
+            terminos = [terminos]
+        try:
+            cantidad = max(1, int(data.get("cantidad") or 1))
+        except (TypeError, ValueError):
+            cantidad = 1
+        return cls(
+            accion=accion if accion in PLANNER_ACTIONS else "respuesta_directa",
+            terminos=[str(t) for t in terminos if str(t).strip()],
+            categoria=str(data.get("categoria") or "").strip(),
+            producto=str(data.get("producto") or "").strip(),
+            cantidad=cantidad,
+            respuesta=str(data.get("respuesta") or "").strip(),
+        )
 
 class GPTReasoningEngine:
     """
@@ -26,23 +94,68 @@ class GPTReasoningEngine:
     Sin condicionales hardcodeados - GPT analiza y decide dinámicamente
     """
     
-    def __init__(self, db: Session, tenant_id: str, productos: List[Dict]):
+    def __init__(self, db: Session, tenant_id: str, productos: List[Dict], mode: Optional[str] = None):
         self.db = db
         self.tenant_id = tenant_id
         self.productos = productos
+        self.mode = mode if mode in REASONING_ENGINE_MODES else REASONING_ENGINE_MODE
         
-        # Cargar contexto dinámico del tenant
+        # Cargar contexto dinámico del tenant (memoizado por versión del catálogo)
         self.tenant_config = get_cached_tenant_config(db, tenant_id)
-        self.categorias = extract_dynamic_categories_from_products(productos)
-        self.business_insights = get_dynamic_business_insights(self.tenant_config, productos)
+        self.categorias, self.business_insights, self.business_context = self._load_business_context()
+        
+        print(f"🧠 GPT Reasoning Engine ({self.mode}) inicializado para {self.tenant_config.business_name}")
+    
+    def _load_business_context(self) -> Tuple[List[ProductCategory], Dict[str, Any], str]:
+        """
+        Categorías, insights y texto de contexto del negocio
+        Se reutilizan mientras no cambie el catálogo (versión del snapshot) ni la config del tenant
+        """
+        def build() -> Tuple[List[ProductCategory], Dict[str, Any], str]:
+            if self.mode == "planner":
+                # Categorías del índice precalculado (sin llamada a GPT)
+                self.categorias = self._categories_from_index()
+            else:
+                self.categorias = extract_dynamic_categories_from_products(self.productos, self.tenant_id)
+            self.business_insights = get_dynamic_business_insights(self.tenant_config, self.productos)
+            return self.categorias, self.business_insights, self._build_complete_business_context()
         
-        print(f"🧠 GPT Reasoning Engine inicializado para {self.tenant_config.business_name}")
+        catalog_version = catalog_version_for(self.productos)
+        if catalog_version is None:
+            return build()
+        config_digest = hashlib.sha1(repr(self.tenant_config).encode()).hexdigest()[:12]
+        key = f"{self.mode}:catalog:v{catalog_version}:{config_digest}"
+        return _business_context_cache.get_or_load(key, build, tenant_id=self.tenant_id)
+    
+    def _categories_from_index(self) -> List[ProductCategory]:
+        """Categorías del tenant desde el índice de categorías (más productos primero)"""
+        categorias = [
+            ProductCategory(
+                name=label,
+                keywords=[category_key(label)],
+                product_count=len(productos),
+                available_count=sum(1 for p in productos if p.get('stock', 0) > 0)
+            )
+            for label, productos in products_by_category(self.productos).items()
+        ]
+        return sorted(categorias, key=lambda cat: -cat.product_count)
     
     def process_message_with_pure_gpt_reasoning(self, telefono: str, mensaje: str) -> str:
         """
         Procesamiento 100% con razonamiento GPT - SIN CONDICIONALES
         GPT decide qué hacer basándose en el contexto del negocio
         """
+        started_at = time.perf_counter()
+        try:
+            if self.mode == "planner":
+                return self._process_with_planner(telefono, mensaje)
+            return self._process_in_three_steps(mensaje)
+        finally:
+            _stats["messages"][self.mode] += 1
+            _latency[self.mode].record(time.perf_counter() - started_at)
+    
+    def _process_in_three_steps(self, mensaje: str) -> str:
+        """Decidir, ejecutar y formatear con GPT (tres llamadas en serie)"""
         # 1. GPT analiza el mensaje y decide qué acción tomar
         action_decision = self._ask_gpt_what_to_do(mensaje)
         
@@ -54,15 +167,185 @@ class GPTReasoningEngine:
         
         return final_response
     
+    # ========================================
+    # MODO PLANNER: una llamada a GPT, ejecución local
+    # ========================================
+    
+    def _process_with_planner(self, telefono: str, mensaje: str) -> str:
+        """GPT planifica una acción tipada; la búsqueda y el formato se hacen localmente"""
+        try:
+            action = self._plan_action(mensaje)
+        except Exception as e:
+            _stats["planner_errors"] += 1
+            print(f"❌ Error en planificación GPT: {e}")
+            return self._get_safe_fallback_response(mensaje)
+        
+        _stats["actions"][action.accion] += 1
+        print(f"🧠 GPT planificó acción: {action.accion}")
+        return self._apply_final_length_limits(self._execute_planned_action(action, telefono, mensaje))
+    
+    def _planner_system_prompt(self) -> str:
+        """
+        Prefijo estático del planificador (contexto del negocio + acciones + formato JSON)
+        Idéntico entre mensajes del mismo catálogo => aprovecha el cache de prefijo del proveedor
+        """
+        return f"""Eres el planificador del asistente de ventas de {self.tenant_config.business_name}.
+No redactas la respuesta: eliges UNA acción y sus parámetros; el sistema la ejecuta con el catálogo real.
+
+{self.business_context}
+
+ACCIONES DISPONIBLES:
+- buscar_productos: el cliente busca productos concretos => "terminos" con palabras clave
+- mostrar_categoria: el cliente pide una categoría => "categoria" (una de las CATEGORÍAS DISPONIBLES)
+- mostrar_catalogo: el cliente quiere ver qué vendemos en general
+- cotizar_precio: el cliente pregunta el precio de un producto => "producto" y "cantidad"
+- iniciar_pedido: el cliente quiere comprar un producto => "producto" y "cantidad"
+- respuesta_directa: saludo, agradecimiento o consulta sin productos => "respuesta" breve
+
+RESPONDE SOLO EN JSON:
+{{"accion": "una_de_las_acciones", "terminos": [], "categoria": "", "producto": "", "cantidad": 1, "respuesta": ""}}"""
+    
+    def _plan_action(self, mensaje: str) -> PlannedAction:
+        """Única llamada a GPT del modo planner"""
+        client = get_llm_client(self.tenant_id, "reasoning_plan")
+        response = client.chat.completions.create(
+            model=self.tenant_config.ai_model,
+            messages=[
+                {"role": "system", "content": self._planner_system_prompt()},
+                {"role": "user", "content": mensaje}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.2,
+            max_tokens=200
+        )
+        data = json.loads(response.choices[0].message.content or "{}")
+        return PlannedAction.from_json(data if isinstance(data, dict) else {})
+    
+    def _execute_planned_action(self, action: PlannedAction, telefono: str, mensaje: str) -> str:
+        """Ejecuta la acción contra el catálogo local y la formatea con las plantillas del tenant"""
+        if action.accion == "buscar_productos":
+            return self._render_product_list(
+                self._find_products_by_terms(action.terminos or [action.producto or mensaje]),
+                "Encontré estos productos"
+            )
+        if action.accion == "mostrar_categoria":
+            productos = products_in_category(self.productos, action.categoria) or \
+                self._find_products_by_category(action.categoria)
+            return self._render_product_list(productos, f"Productos en {action.categoria or 'la categoría'}")
+        if action.accion == "mostrar_catalogo":
+            return self._render_catalog()
+        if action.accion in ("cotizar_precio", "iniciar_pedido"):
+            producto = self._match_single_product(action.producto or " ".join(action.terminos))
+            if producto is None:
+                return self._render_product_list(
+                    self._find_products_by_terms(action.terminos or [action.producto]),
+                    f"No encontré \"{action.producto}\" exacto, pero tenemos"
+                )
+            if action.accion == "cotizar_precio":
+                return self._render_quote(producto, action.cantidad)
+            return self._start_order(telefono, producto, action.cantidad)
+        return action.respuesta or self._get_safe_fallback_response(mensaje)
+    
+    def _match_single_product(self, texto: str) -> Optional[Dict]:
+        """Producto más parecido al nombre pedido (coincidencia exacta, luego por palabras)"""
+        texto_lower = (texto or "").lower().strip()
+        if not texto_lower:
+            return None
+        for producto in self.productos:
+            if producto.get('name', '').lower() == texto_lower:
+                return producto
+        palabras = set(texto_lower.split())
+        scored = [
+            (len(palabras & set(producto.get('name', '').lower().split())), producto)
+            for producto in self.productos
+        ]
+        scored = [(score, producto) for score, producto in scored if score]
+        if not scored:
+            return None
+        # Más palabras en común; a igualdad, el que tiene stock
+        return max(scored, key=lambda item: (item[0], item[1].get('stock', 0) > 0))[1]
+    
+    def _price(self, amount: float) -> str:
+        return format_currency(float(amount), self.tenant_config.currency)
+    
+    def _emoji(self, emoji: str) -> str:
+        return f"{emoji} " if self.tenant_config.use_emojis else ""
+    
+    def _render_product_list(self, productos: List[Dict], titulo: str) -> str:
+        """Lista de productos (disponibles primero) según response_length del tenant"""
+        if not productos:
+            return (f"{self._emoji('🔍')}No encontré productos para tu consulta.\n\n"
+                    f"¿Quieres que te muestre nuestras categorías?")
+        limite = _ITEMS_PER_LENGTH.get(self.tenant_config.response_length.lower(), 5)
+        ordenados = sorted(productos, key=lambda p: p.get('stock', 0) <= 0)
+        lineas = [
+            f"{i}. {p.get('name', 'N/A')} - {self._price(p.get('price', 0))}"
+            + ("" if p.get('stock', 0) > 0 else " (sin stock)")
+            for i, p in enumerate(ordenados[:limite], 1)
+        ]
+        if len(productos) > limite:
+            lineas.append(f"... y {len(productos) - limite} más")
+        return (f"{self._emoji('🛍️')}{titulo}:\n\n" + "\n".join(lineas) +
+                "\n\n¿Te interesa alguno? Para comprar escribe: Quiero [nombre]")
+    
+    def _render_catalog(self) -> str:
+        """Categorías del tenant con cantidad de productos disponibles"""
+        if not self.categorias:
+            return self._render_product_list(self.productos, f"Productos de {self.tenant_config.business_name}")
+        lineas = [f"• {cat.name} ({cat.available_count} disponibles)" for cat in self.categorias]
+        return (f"{self._emoji('📋')}En {self.tenant_config.business_name} tenemos:\n\n" + "\n".join(lineas) +
+                "\n\n¿Qué categoría quieres ver?")
+    
+    def _render_quote(self, producto: Dict, cantidad: int) -> str:
+        """Precio unitario y total para la cantidad pedida, con stock"""
+        precio = float(producto.get('price', 0))
+        stock = producto.get('stock', 0)
+        respuesta = f"{self._emoji('💰')}{producto.get('name', 'N/A')}: {self._price(precio)}"
+        if cantidad > 1:
+            respuesta += f"\n{cantidad} unidades: {self._price(precio * cantidad)}"
+        if stock >= cantidad:
+            respuesta += f"\n\nTenemos {stock} disponibles. Para comprar escribe: Quiero {producto.get('name', '')}"
+        elif stock > 0:
+            respuesta += f"\n\nSolo quedan {stock} disponibles."
+        else:
+            respuesta += "\n\nPor ahora está sin stock."
+        return respuesta
+    
+    def _start_order(self, telefono: str, producto: Dict, cantidad: int) -> str:
+        """
+        Deja el pedido en ORDER_CONFIRMATION (mismo formato que procesa procesar_mensaje_flow:
+        con SÍ se crea el pedido, se reserva stock y se genera el link de pago)
+        """
+        stock = producto.get('stock', 0)
+        if stock < cantidad:
+            return self._render_quote(producto, cantidad)
+        
+        # Import tardío: flow_chat_service importa este módulo
+        from services.flow_chat_service import guardar_sesion, obtener_sesion
+        
+        precio = float(producto.get('price', 0))
+        total = precio * cantidad
+        sesion = obtener_sesion(self.db, telefono, self.tenant_id)
+        guardar_sesion(self.db, sesion, "ORDER_CONFIRMATION", {
+            "pedido": {str(producto.get('id')): {
+                "nombre": producto.get('name', ''), "precio": precio, "cantidad": cantidad
+            }},
+            "total": total
+        })
+        return (f"{self._emoji('🛒')}Tu pedido:\n\n"
+                f"• {cantidad} x {producto.get('name', '')} = {self._price(total)}\n\n"
+                f"Total: {self._price(total)}\n\n"
+                f"Responde SÍ para confirmar o NO para cancelar")
+    
     def _ask_gpt_what_to_do(self, mensaje: str) -> Dict[str, Any]:
         """
         GPT decide qué acción tomar basándose en el mensaje y contexto del negocio
         """
         try:
-            client = openai.OpenAI()
+            client = get_llm_client(self.tenant_id, "reasoning_decision")
             
-            # Construir contexto completo del negocio para GPT
-            business_context = self._build_complete_business_context()
+            # Contexto completo del negocio (memoizado por versión del catálogo)
+            business_context = self.business_context
             
             decision_prompt = f"""Eres el cerebro de decisiones para {self.tenant_config.business_name}.
 
@@ -132,7 +415,7 @@ RESPONDE EN JSON:
         Delega la ejecución específica a GPT según la acción decidida
         """
         try:
-            client = openai.OpenAI()
+            client = get_llm_client(self.tenant_id, "reasoning_action")
             
             # Preparar contexto específico para la acción
             execution_context = self._build_execution_context(accion, action_decision)
@@ -297,9 +580,10 @@ EJECUTA LA ACCIÓN Y GENERA LA RESPUESTA:"""
     def _ask_gpt_to_format_response(self, response: str) -> str:
         """
         GPT formatea la respuesta final según las preferencias del tenant
+        En streaming: el primer párrafo formateado se envía mientras se genera el resto
         """
         try:
-            client = openai.OpenAI()
+            client = get_llm_client(self.tenant_id, "reasoning_format")
             
             format_prompt = f"""Formatea esta respuesta para {self.tenant_config.business_name}.
 
@@ -323,14 +607,14 @@ INSTRUCCIONES DE FORMATO:
 
 GENERA LA RESPUESTA FORMATEADA:"""
 
-            format_response = client.chat.completions.create(
+            formatted_response = stream_reply(
+                client,
+                limit=self._max_response_length(),
                 model="gpt-4o-mini",  # Usar modelo rápido para formateo
                 messages=[{"role": "user", "content": format_prompt}],
                 temperature=0.3,
                 max_tokens=600
-            )
-            
-            formatted_response = format_response.choices[0].message.content.strip()
+            ).strip()
             
             # Aplicar límites de longitud finales
             return self._apply_final_length_limits(formatted_response)
@@ -339,15 +623,21 @@ GENERA LA RESPUESTA FORMATEADA:"""
             print(f"❌ Error formateando respuesta: {e}")
             return self._apply_final_length_limits(response)
     
-    def _apply_final_length_limits(self, response: str) -> str:
+    def _max_response_length(self) -> int:
         """
-        Aplica límites finales de longitud según configuración
+        Máximo de caracteres según response_length del tenant
         """
-        max_length = {
+        return {
             'short': 400,
             'medium': 800,
             'long': 1500
         }.get(self.tenant_config.response_length.lower(), 800)
+    
+    def _apply_final_length_limits(self, response: str) -> str:
+        """
+        Aplica límites finales de longitud según configuración
+        """
+        max_length = self._max_response_length()
         
         if len(response) > max_length:
             return response[:max_length-3] + "..."
@@ -417,6 +707,16 @@ def process_message_with_pure_gpt_reasoning(
         except:
             return "¡Hola! ¿En qué puedo ayudarte hoy?"
 
+def get_reasoning_engine_stats() -> Dict[str, Any]:
+    """Mensajes y latencia por modo, acciones planificadas y errores del planificador"""
+    return {
+        "mode": REASONING_ENGINE_MODE,
+        "messages": dict(_stats["messages"]),
+        "actions": dict(_stats["actions"]),
+        "planner_errors": _stats["planner_errors"],
+        "latency": {mode: stats.snapshot() for mode, stats in _latency.items()},
+    }
+
 # Función adicional para testing y análisis
 
 def analyze_gpt_decision_process(
@@ -0,0 +1,222 @@
+"""
+🧠 Cache de intenciones por tenant para gpt_detect_intent
+Evita re-enviar el prompt de NLU a GPT para mensajes repetidos ("hola", "catálogo", ...)
+
+Clave: tenant:{tenant_id}:intent:v{prompt_version}:c{catalog_version}:{hash_historial}:{mensaje_normalizado}
+- Editar el prompt del tenant (TenantPrompts.version) o su catálogo invalida naturalmente las entradas
+- LRU acotado + TTL por entrada
+- Matching difuso opcional para casi-duplicados ("holaa", "hola!!")
+"""
+import copy
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+INTENT_CACHE_MAX_ENTRIES = int(os.getenv("INTENT_CACHE_MAX_ENTRIES", "5000"))
+INTENT_CACHE_TTL_SECONDS = int(os.getenv("INTENT_CACHE_TTL_SECONDS", "900"))
+INTENT_CACHE_FUZZY = os.getenv("INTENT_CACHE_FUZZY", "true").lower() in ("1", "true", "yes")
+INTENT_CACHE_FUZZY_RATIO = float(os.getenv("INTENT_CACHE_FUZZY_RATIO", "0.85"))
+INTENT_CACHE_MIN_CONFIDENCE = float(os.getenv("INTENT_CACHE_MIN_CONFIDENCE", "0.5"))
+
+# Límite de candidatos revisados por bucket en matching difuso
+_FUZZY_BUCKET_LIMIT = 200
+# Campos que cambian por llamada y no deben servirse desde cache
+_VOLATILE_FIELDS = ("timestamp",)
+_DIGITS = re.compile(r"\d+")
+# Palabras que invierten el sentido del mensaje ("quiero el pax" ≠ "no quiero el pax")
+_NEGATIONS = frozenset({"no", "sin", "nada", "nunca", "ni", "tampoco", "jamas", "nadie",
+                        "ningun", "ninguno", "ninguna"})
+
+
+def _negations(normalized: str) -> List[str]:
+    """Negaciones presentes en un mensaje ya normalizado (en orden)"""
+    return [word for word in normalized.split() if word in _NEGATIONS]
+
+
+def normalize_message(mensaje: str) -> str:
+    """Minúsculas, sin tildes, sin puntuación y con espacios colapsados"""
+    text = unicodedata.normalize("NFKD", (mensaje or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def hash_history(history: Optional[List[Dict]], turns: int = 3) -> str:
+    """Hash corto de las últimas interacciones (las mismas que ve el prompt de NLU)"""
+    if not history:
+        return "0"
+    recent = history[-turns:]
+    payload = json.dumps(recent, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+class IntentCache:
+    """LRU + TTL con namespace estricto por tenant"""
+
+    def __init__(self, max_entries: int = INTENT_CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = INTENT_CACHE_TTL_SECONDS,
+                 fuzzy: bool = INTENT_CACHE_FUZZY,
+                 fuzzy_ratio: float = INTENT_CACHE_FUZZY_RATIO):
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # bucket (tenant/versiones/historial) -> mensajes normalizados, para matching difuso
+        self._buckets: Dict[str, "OrderedDict[str, None]"] = {}
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._fuzzy = fuzzy
+        self._fuzzy_ratio = fuzzy_ratio
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "fuzzy_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    @staticmethod
+    def _bucket(tenant_id: str, prompt_version: int, catalog_version: int, history_hash: str) -> str:
+        if not tenant_id:
+            raise ValueError("tenant_id es requerido para cache")
+        return f"tenant:{tenant_id}:intent:v{prompt_version}:c{catalog_version}:{history_hash}"
+
+    def _drop(self, key: str) -> None:
+        self._entries.pop(key, None)
+        bucket, _, normalized = key.rpartition(":")
+        members = self._buckets.get(bucket)
+        if members is not None:
+            members.pop(normalized, None)
+            if not members:
+                self._buckets.pop(bucket, None)
+
+    def _lookup(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if now - stored_at > self._ttl:
+            self._drop(key)
+            self._stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, tenant_id: str, prompt_version: int, catalog_version: int,
+            mensaje: str, history: Optional[List[Dict]]) -> Optional[Dict[str, Any]]:
+        normalized = normalize_message(mensaje)
+        if not normalized:
+            return None
+        bucket = self._bucket(tenant_id, prompt_version, catalog_version, hash_history(history))
+        now = time.time()
+
+        with self._lock:
+            value = self._lookup(f"{bucket}:{normalized}", now)
+            if value is not None:
+                self._stats["hits"] += 1
+                return copy.deepcopy(value)
+
+            if self._fuzzy and bucket in self._buckets:
+                # Solo candidatos con los mismos números ("quiero 2" ≠ "quiero 3")
+                # y las mismas negaciones ("quiero el pax" ≠ "no quiero el pax")
+                digits = _DIGITS.findall(normalized)
+                negations = _negations(normalized)
+                candidates = [
+                    candidate for candidate in list(self._buckets[bucket].keys())[-_FUZZY_BUCKET_LIMIT:]
+                    if _DIGITS.findall(candidate) == digits and _negations(candidate) == negations
+                ]
+                matches = difflib.get_close_matches(normalized, candidates, n=1, cutoff=self._fuzzy_ratio)
+                if matches:
+                    value = self._lookup(f"{bucket}:{matches[0]}", now)
+                    if value is not None:
+                        self._stats["fuzzy_hits"] += 1
+                        return copy.deepcopy(value)
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, tenant_id: str, prompt_version: int, catalog_version: int,
+            mensaje: str, history: Optional[List[Dict]], intent: Dict[str, Any]) -> bool:
+        normalized = normalize_message(mensaje)
+        if not normalized or not intent or intent.get("error"):
+            return False
+        if float(intent.get("confianza", 0) or 0) < INTENT_CACHE_MIN_CONFIDENCE:
+            return False
+
+        bucket = self._bucket(tenant_id, prompt_version, catalog_version, hash_history(history))
+        key = f"{bucket}:{normalized}"
+        value = {k: v for k, v in intent.items() if k not in _VOLATILE_FIELDS}
+
+        with self._lock:
+            self._entries[key] = (time.time(), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            self._buckets.setdefault(bucket, OrderedDict())[normalized] = None
+            self._stats["sets"] += 1
+            while len(self._entries) > self._max_entries:
+                oldest_key = next(iter(self._entries))
+                self._drop(oldest_key)
+                self._stats["evictions"] += 1
+        return True
+
+    def invalidate_tenant(self, tenant_id: str) -> int:
+        """Elimina todas las intenciones cacheadas de un tenant"""
+        prefix = f"tenant:{tenant_id}:intent:"
+        with self._lock:
+            keys = [key for key in self._entries if key.startswith(prefix)]
+            for key in keys:
+                self._drop(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._stats["hits"] + self._stats["fuzzy_hits"]
+            lookups = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "ttl_seconds": self._ttl,
+                "fuzzy": self._fuzzy,
+            }
+
+
+# Instancia global del cache
+intent_cache = IntentCache()
+
+
+def _catalog_version(tenant_id: str) -> int:
+    """Versión del snapshot de catálogo vigente (0 si aún no se construyó)"""
+    try:
+        from services.catalog_snapshot import catalog_snapshot_cache
+        snapshot = catalog_snapshot_cache.peek(tenant_id)
+        return snapshot.version if snapshot else 0
+    except Exception:
+        return 0
+
+
+def get_cached_intent(tenant_id: str, prompt_version: int, mensaje: str,
+                      history: Optional[List[Dict]]) -> Optional[Dict[str, Any]]:
+    """Intención cacheada para el mensaje, o None"""
+    return intent_cache.get(tenant_id, prompt_version or 0, _catalog_version(tenant_id), mensaje, history)
+
+
+def store_intent(tenant_id: str, prompt_version: int, mensaje: str,
+                 history: Optional[List[Dict]], intent: Dict[str, Any]) -> bool:
+    """Guarda la intención detectada por GPT"""
+    return intent_cache.set(tenant_id, prompt_version or 0, _catalog_version(tenant_id), mensaje, history, intent)
+
+
+def get_intent_cache_stats() -> Dict[str, Any]:
+    return intent_cache.get_stats()
@@ -0,0 +1,453 @@
+"""
+⚡ Clasificador local de intenciones (fast-path sin GPT)
+Las reglas que antes vivían en prosa dentro del prompt de gpt_detect_intent,
+compiladas por tenant:
+
+- Matcher Aho-Corasick sobre nombres de productos y categorías del tenant
+- Regex para saludos, despedidas, confirmaciones (sí/no), presupuestos y "no quiero X"
+- Mismo esquema JSON que gpt_detect_intent
+- Solo se usa GPT cuando la confianza queda bajo NLUParams.confidence_threshold
+"""
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.intent_cache import normalize_message
+
+INTENT_RULES_ENABLED = os.getenv("INTENT_RULES_ENABLED", "true").lower() in ("1", "true", "yes")
+INTENT_RULES_MAX_TENANTS = int(os.getenv("INTENT_RULES_MAX_TENANTS", "500"))
+
+# Confianza asignada por cada regla (comparable con confidence_threshold del tenant)
+CONFIDENCE = {
+    "saludo": 0.95,
+    "despedida": 0.9,
+    "confirmacion": 0.9,
+    "negacion": 0.85,
+    "queja": 0.85,
+    "consulta_vaporizador": 0.9,
+    "intencion_compra": 0.92,
+    "consulta_producto": 0.85,
+    "consulta_categoria": 0.9,
+    "consulta_catalogo": 0.9,
+    "ambiguo": 0.55,
+    "desconocido": 0.3,
+}
+
+# Mensajes de cortesía que pueden acompañar un saludo / despedida sin cambiar la intención
+_COURTESY = r"(?:hola|que tal|como estas|como esta|buenas|buenos dias|buenas tardes|buenas noches|amigo|amiga|gracias|muchas gracias|por favor)"
+_FILLER = r"(?:\s+" + _COURTESY + r")*"
+
+_GREETING = re.compile(
+    r"^(?:hola+|holi+s?|ola|buenas|buen dia|buenos dias|buenas tardes|buenas noches|hey|hi|hello|saludos|que tal|alo)\b"
+)
+_GREETING_ONLY = re.compile(
+    r"^(?:hola+|holi+s?|ola|buenas|buen dia|buenos dias|buenas tardes|buenas noches|hey|hi|hello|saludos|que tal|alo)"
+    + _FILLER + r"$"
+)
+_FAREWELL = r"(?:chao+|adios|hasta luego|hasta pronto|nos vemos|bye|gracias|muchas gracias|mil gracias)"
+_FAREWELL_ONLY = re.compile(r"^(?:ok\s+)?" + _FAREWELL + r"(?:\s+(?:" + _FAREWELL + r"|" + _COURTESY + r"))*$")
+_YES = re.compile(
+    r"^(?:si+|claro|dale|ok|okay|okey|oka|confirmo|acepto|de acuerdo|perfecto|listo|yes|va|sip|por supuesto)\b"
+)
+# Negación/cancelación solo si es todo el mensaje (más palabras de cierre): "no, gracias", "cancela el pedido"
+# "no se cual elegir" o "no, quiero el pax" (sin comas tras normalizar) no son un rechazo
+_NO_WORD = r"(?:no+|nop|nope|nel|cancelar|cancela|cancelo|cancel|mejor no)"
+_NO_CLOSING = (r"(?:gracias|muchas gracias|por favor|por ahora|todavia|aun|nada|todo|amigo|amiga"
+               r"|(?:el |la |mi )?(?:pedido|compra|orden|pago))")
+_NO = re.compile(r"^" + _NO_WORD + r"(?:\s+(?:" + _NO_WORD + r"|" + _NO_CLOSING + r"))*$")
+# "no quiero aceites, busco semillas": el objeto negado termina en el conector
+_CONNECTOR = r"(?!(?:pero|sino|busco|quiero|prefiero|mejor|y|o)\b)"
+_NEGATION = re.compile(
+    r"\b(?:no quiero|no me interesan?|no busco|no necesito|nada de|sin)\s+"
+    r"(" + _CONNECTOR + r"\w+(?:\s+" + _CONNECTOR + r"\w+){0,2})"
+)
+_BUDGET = re.compile(
+    r"(?:\$\s?\d[\d.,]*(?:\s?(?:mil|lucas|k))?"
+    r"|\b\d[\d.,]*\s?(?:mil|lucas|k|clp|pesos)\b"
+    r"|\b(?:presupuesto(?: de)?|hasta|maximo|menos de|alrededor de)\s+\$?\s?\d[\d.,]*(?:\s?(?:mil|lucas|k))?)"
+)
+_PURCHASE = re.compile(
+    r"\b(?:quiero|quisiera|comprar|compro|me llevo|llevo|agrega|agregar|pedir|pido|dame|encargar|necesito)\b"
+)
+_PRICE = re.compile(r"\b(?:precio|precios|cuesta|cuestan|cuanto|vale|valor)\b")
+_CATALOG = re.compile(
+    r"\b(?:catalogo|menu|que (?:productos|tienes|tienen|venden|vendes|hay)|productos|lista de productos|que ofrecen)\b"
+)
+_COMPLAINT = re.compile(
+    r"\b(?:reclamo|queja|pesimo|horrible|estafa|no (?:me )?(?:ha )?llegado|no llego|nunca llego|devolucion|reembolso)\b"
+)
+_VAPE_TYPE = {
+    "portatil": re.compile(r"\b(?:portatil|portatiles|de bolsillo|pequeno)\b"),
+    "escritorio": re.compile(r"\b(?:escritorio|de mesa|sobremesa)\b"),
+}
+
+_VAPE_KEYWORDS = ("vapo", "vapos", "vaporizador", "vaporizadores", "vape", "vapes", "vaporizer")
+_STOPWORDS = {
+    "de", "del", "la", "el", "los", "las", "con", "para", "por", "una", "uno", "unos", "unas",
+    "mas", "pack", "kit", "gr", "ml", "mg", "x", "y", "en",
+}
+
+
+def _fold(mensaje: str) -> str:
+    """Minúsculas y sin tildes, conservando puntuación (para montos)"""
+    text = unicodedata.normalize("NFKD", (mensaje or "").lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _variants(term: str) -> List[str]:
+    """Formas singular/plural simples de una categoría ("semillas" → "semilla")"""
+    variants = {term}
+    if term.endswith("es") and len(term) > 4:
+        variants.add(term[:-2])
+    if term.endswith("s") and len(term) > 3:
+        variants.add(term[:-1])
+    else:
+        variants.add(term + "s")
+    return [v for v in variants if v]
+
+
+class KeywordMatcher:
+    """
+    Autómata Aho-Corasick sobre texto normalizado
+    Una pasada por el mensaje encuentra todas las palabras clave del tenant
+    """
+
+    def __init__(self, keywords: Iterable[Tuple[str, Tuple[str, str]]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Tuple[str, str]]]] = [[]]
+        self.size = 0
+        for keyword, payload in keywords:
+            self._add(keyword, payload)
+        self._build()
+
+    def _add(self, keyword: str, payload: Tuple[str, str]) -> None:
+        if not keyword:
+            return
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(keyword), payload))
+        self.size += 1
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, int, Tuple[str, str]]]:
+        """
+        Coincidencias de palabra completa como (inicio, fin, payload)
+        Si dos coincidencias se solapan se conserva la más larga
+        """
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, payload in self._out[state]:
+                start, end = i - length + 1, i + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    matches.append((start, end, payload))
+
+        matches.sort(key=lambda m: (-(m[1] - m[0]), m[0]))
+        selected: List[Tuple[int, int, Tuple[str, str]]] = []
+        for match in matches:
+            if all(match[1] <= other[0] or match[0] >= other[1] for other in selected):
+                selected.append(match)
+        return sorted(selected)
+
+
+class LocalIntentClassifier:
+    """Clasificador compilado para un tenant (productos + categorías)"""
+
+    def __init__(self, tenant_id: str, productos: List[Dict], categorias: List[str]):
+        self.tenant_id = tenant_id
+        self.categorias = [c for c in (categorias or []) if c]
+        keywords: List[Tuple[str, Tuple[str, str]]] = []
+
+        for categoria in self.categorias:
+            normalized = normalize_message(categoria)
+            for variant in _variants(normalized):
+                keywords.append((variant, ("categoria", categoria)))
+        for vape in _VAPE_KEYWORDS:
+            keywords.append((vape, ("vapo", "vaporizador")))
+
+        # Nombre completo del producto + tokens distintivos que no se repiten en otro producto
+        token_owners: Dict[str, set] = {}
+        for prod in productos or []:
+            name = prod.get("name") or ""
+            normalized = normalize_message(name)
+            if not normalized:
+                continue
+            keywords.append((normalized, ("producto", name)))
+            for token in normalized.split():
+                if len(token) >= 4 and token not in _STOPWORDS and not token.isdigit():
+                    token_owners.setdefault(token, set()).add(name)
+        category_terms = {variant for c in self.categorias for variant in _variants(normalize_message(c))}
+        for token, owners in token_owners.items():
+            if len(owners) == 1 and token not in category_terms and token not in _VAPE_KEYWORDS:
+                keywords.append((token, ("producto", next(iter(owners)))))
+
+        self.matcher = KeywordMatcher(keywords)
+
+    def _siguiente_pregunta(self, intencion: str, categoria: str = "") -> str:
+        categorias = ", ".join(self.categorias[:5])
+        if intencion in ("saludo", "consulta_catalogo"):
+            return f"¿Qué estás buscando hoy: {categorias}?" if categorias else "¿Qué estás buscando hoy?"
+        if intencion == "consulta_vaporizador":
+            return "¿Lo quieres portátil o de escritorio? ¿Presupuesto aproximado?"
+        if intencion == "consulta_categoria":
+            return f"¿Buscas algo en particular dentro de {categoria}?"
+        if intencion == "consulta_producto":
+            return "¿Quieres que te lo reserve?"
+        if intencion == "intencion_compra":
+            return "¿Cuántas unidades quieres?"
+        return ""
+
+    def _producto_en_historial(self, history: Optional[List[Dict]]) -> str:
+        """Producto ofrecido por el bot en el último turno (para interpretar un "sí")"""
+        if not history or not isinstance(history[-1], dict):
+            return ""
+        last_bot = normalize_message(str(history[-1].get("bot", "")))
+        productos = [payload[1] for _, _, payload in self.matcher.find(last_bot) if payload[0] == "producto"]
+        return productos[0] if len(set(productos)) == 1 else ""
+
+    def classify(self, mensaje: str, history: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """Devuelve el mismo esquema que gpt_detect_intent + fuente='reglas'"""
+        text = normalize_message(mensaje)
+        tokens = text.split()
+
+        result: Dict[str, Any] = {
+            "intencion": "consulta_general",
+            "confianza": CONFIDENCE["desconocido"],
+            "producto_mencionado": "",
+            "categoria_mencionada": "",
+            "negaciones": [],
+            "presupuesto_mencionado": "",
+            "tipo_vaporizador": "no_especificado",
+            "siguiente_pregunta": "",
+            "sentimiento": "neutral",
+            "contexto_detectado": "",
+            "fuente": "reglas",
+        }
+        if not text:
+            result["contexto_detectado"] = "mensaje_vacio"
+            return result
+
+        if _GREETING_ONLY.match(text):
+            return self._finish(result, "saludo", "saludo", sentimiento="positivo")
+        if _FAREWELL_ONLY.match(text):
+            return self._finish(result, "despedida", "despedida", sentimiento="positivo")
+
+        # Confirmaciones cortas: "sí", "dale", "no", "cancelar"
+        if len(tokens) <= 4 and not _NEGATION.search(text):
+            if _NO.match(text):
+                result["contexto_detectado"] = "confirmacion_negativa"
+                result["confianza"] = CONFIDENCE["negacion"]
+                return result
+            if _YES.match(text):
+                producto = self._producto_en_historial(history)
+                if producto:
+                    result["producto_mencionado"] = producto
+                    return self._finish(result, "intencion_compra", "confirmacion_afirmativa",
+                                        confianza=CONFIDENCE["confirmacion"], sentimiento="positivo")
+                # Sin contexto claro GPT decide qué se está confirmando
+                result["contexto_detectado"] = "confirmacion_afirmativa"
+                result["confianza"] = CONFIDENCE["ambiguo"]
+                result["sentimiento"] = "positivo"
+                return result
+
+        if _COMPLAINT.search(text):
+            return self._finish(result, "queja", "queja", sentimiento="negativo")
+
+        # "no quiero X" → negaciones (y X no cuenta como mención positiva)
+        negated_spans = []
+        for match in _NEGATION.finditer(text):
+            negated_spans.append(match.span(1))
+            for _, _, payload in self.matcher.find(match.group(1)):
+                if payload[1] not in result["negaciones"]:
+                    result["negaciones"].append(payload[1])
+            if not result["negaciones"]:
+                result["negaciones"].append(match.group(1))
+
+        # El presupuesto se busca sobre el texto con "$" y separadores de miles
+        budget = _BUDGET.search(_fold(mensaje))
+        if budget:
+            result["presupuesto_mencionado"] = budget.group(0).strip()
+
+        mentions: Dict[str, List[str]] = {"producto": [], "categoria": [], "vapo": []}
+        for start, end, (kind, value) in self.matcher.find(text):
+            if any(start >= s and end <= e for s, e in negated_spans):
+                continue
+            if value not in mentions[kind]:
+                mentions[kind].append(value)
+
+        if mentions["vapo"]:
+            result["categoria_mencionada"] = "vaporizador"
+            for tipo, pattern in _VAPE_TYPE.items():
+                if pattern.search(text):
+                    result["tipo_vaporizador"] = "ambos" if result["tipo_vaporizador"] != "no_especificado" else tipo
+            if mentions["producto"] and len(mentions["producto"]) == 1:
+                result["producto_mencionado"] = mentions["producto"][0]
+            return self._finish(result, "consulta_vaporizador", "consulta_vaporizador")
+
+        if mentions["producto"]:
+            result["producto_mencionado"] = mentions["producto"][0]
+            ambiguous = len(mentions["producto"]) > 1
+            if _PURCHASE.search(text):
+                return self._finish(result, "intencion_compra", "compra_producto",
+                                    confianza=CONFIDENCE["ambiguo"] if ambiguous else None)
+            return self._finish(result, "consulta_producto",
+                                "consulta_precio" if _PRICE.search(text) else "consulta_producto",
+                                confianza=CONFIDENCE["ambiguo"] if ambiguous else None)
+
+        if mentions["categoria"]:
+            categoria = mentions["categoria"][0]
+            result["categoria_mencionada"] = categoria
+            return self._finish(result, "consulta_categoria", "consulta_categoria",
+                                confianza=CONFIDENCE["ambiguo"] if len(mentions["categoria"]) > 1 else None,
+                                categoria=categoria)
+
+        if _CATALOG.search(text) and not result["negaciones"]:
+            return self._finish(result, "consulta_catalogo", "consulta_catalogo")
+
+        if _GREETING.match(text):
+            # Saludo + algo que las reglas no entienden: que decida GPT
+            result["contexto_detectado"] = "saludo_con_consulta"
+            result["sentimiento"] = "positivo"
+        return result
+
+    def _finish(self, result: Dict[str, Any], intencion: str, contexto: str,
+                confianza: Optional[float] = None, sentimiento: Optional[str] = None,
+                categoria: str = "") -> Dict[str, Any]:
+        result["intencion"] = intencion
+        result["confianza"] = confianza if confianza is not None else CONFIDENCE[intencion]
+        result["contexto_detectado"] = contexto
+        result["siguiente_pregunta"] = self._siguiente_pregunta(intencion, categoria)
+        if sentimiento:
+            result["sentimiento"] = sentimiento
+        return result
+
+
+def _catalog_signature(productos: List[Dict], categorias: List[str]) -> str:
+    """Huella de nombres + categorías: cambia cuando el catálogo del tenant cambia"""
+    digest = hashlib.sha1()
+    for prod in productos or []:
+        digest.update((prod.get("name") or "").encode("utf-8"))
+        digest.update(b"\x00")
+    digest.update(b"\x01")
+    for categoria in categorias or []:
+        digest.update((categoria or "").encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class IntentRulesRegistry:
+    """Clasificadores compilados por tenant, recompilados al cambiar el catálogo"""
+
+    def __init__(self, max_tenants: int = INTENT_RULES_MAX_TENANTS):
+        self._classifiers: Dict[str, Tuple[str, LocalIntentClassifier]] = {}
+        self._max_tenants = max_tenants
+        self._lock = threading.Lock()
+        self._stats = {"compiles": 0, "fast_path": 0, "fallback": 0}
+
+    def get(self, tenant_id: str, productos: List[Dict], categorias: List[str]) -> LocalIntentClassifier:
+        if not tenant_id:
+            raise ValueError("tenant_id es requerido para el clasificador local")
+        signature = _catalog_signature(productos, categorias)
+        with self._lock:
+            entry = self._classifiers.get(tenant_id)
+            if entry and entry[0] == signature:
+                return entry[1]
+
+        classifier = LocalIntentClassifier(tenant_id, productos, categorias)
+        with self._lock:
+            if tenant_id not in self._classifiers and len(self._classifiers) >= self._max_tenants:
+                self._classifiers.pop(next(iter(self._classifiers)))
+            self._classifiers[tenant_id] = (signature, classifier)
+            self._stats["compiles"] += 1
+        return classifier
+
+    def record(self, fast_path: bool) -> None:
+        with self._lock:
+            self._stats["fast_path" if fast_path else "fallback"] += 1
+
+    def invalidate(self, tenant_id: Optional[str] = None) -> None:
+        with self._lock:
+            if tenant_id is None:
+                self._classifiers.clear()
+            else:
+                self._classifiers.pop(tenant_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decided = self._stats["fast_path"] + self._stats["fallback"]
+            return {
+                **self._stats,
+                "enabled": INTENT_RULES_ENABLED,
+                "fast_path_rate": round(self._stats["fast_path"] / decided, 4) if decided else 0.0,
+                "tenants": len(self._classifiers),
+            }
+
+
+# Registro global de clasificadores
+intent_rules = IntentRulesRegistry()
+
+
+def classify_intent_local(tenant_id: str, mensaje: str, productos: List[Dict],
+                          categorias: List[str], history: Optional[List[Dict]] = None) -> Dict[str, Any]:
+    """Clasifica el mensaje con las reglas compiladas del tenant"""
+    return intent_rules.get(tenant_id, productos, categorias).classify(mensaje, history)
+
+
+def detect_fast_intent(tenant_id: str, mensaje: str, productos: List[Dict], categorias: List[str],
+                       history: Optional[List[Dict]] = None,
+                       confidence_threshold: float = 0.7) -> Optional[Dict[str, Any]]:
+    """
+    Intención local si supera el umbral del tenant; None para derivar a GPT
+    """
+    if not INTENT_RULES_ENABLED:
+        return None
+    result = classify_intent_local(tenant_id, mensaje, productos, categorias, history)
+    fast_path = result["confianza"] >= confidence_threshold
+    intent_rules.record(fast_path)
+    return result if fast_path else None
+
+
+def detect_confirmation(mensaje: str) -> Optional[bool]:
+    """
+    True = confirma, False = rechaza/cancela, None = no es una confirmación
+    Palabras completas: "bueno" no es "no" y "sigue" no es "si"
+    """
+    text = normalize_message(mensaje)
+    if not text:
+        return None
+    if _NO.match(text):
+        return False
+    if _YES.match(text):
+        return True
+    return None
+
+
+def get_intent_rules_stats() -> Dict[str, Any]:
+    return intent_rules.get_stats()
@@ -0,0 +1,427 @@
+"""
+🤖 Gateway LLM único para el bot de WhatsApp
+Reemplaza las construcciones de openai.OpenAI() por llamada:
+
+- Clientes sync y async compartidos por proceso (pool de conexiones httpx)
+- Timeout por llamada (LLM_TIMEOUT_SECONDS o `timeout=` en create)
+- Límite de concurrencia por tenant (LLM_MAX_CONCURRENCY_PER_TENANT)
+- Contabilidad de tokens y latencia por tenant y por propósito, con la proporción de
+  tokens de prompt servidos desde el cache de prefijo del proveedor (cached_tokens)
+- Backend stub local (LLM_BACKEND=stub) para pruebas de carga offline
+- Streaming sync (stream=True): cerrar el stream antes del final corta la generación
+
+Uso (misma interfaz que el SDK de OpenAI):
+    client = get_llm_client(tenant_id, "intent")
+    response = client.chat.completions.create(model=..., messages=[...])
+    for chunk in client.chat.completions.create(model=..., messages=[...], stream=True):
+        texto += chunk.choices[0].delta.content or ""
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")  # openai | stub
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_CONCURRENCY_PER_TENANT = int(os.getenv("LLM_MAX_CONCURRENCY_PER_TENANT", "4"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+LLM_STUB_MS_PER_TOKEN = float(os.getenv("LLM_STUB_MS_PER_TOKEN", "0"))  # ritmo del stream del stub
+# Cache de prefijo del proveedor (OpenAI): desde 1024 tokens, en bloques de 128
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_BLOCK_TOKENS = 128
+
+GLOBAL_TENANT = "global"
+
+
+class LLMConcurrencyLimitError(RuntimeError):
+    """El tenant superó su límite de llamadas concurrentes durante LLM_QUEUE_TIMEOUT_SECONDS"""
+
+
+# ==================== BACKEND STUB ====================
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text or "") // 4)
+
+
+def _estimate_usage(messages: List[Dict[str, Any]], completion: str, cached_tokens: int = 0) -> Any:
+    prompt_tokens = sum(_estimate_tokens(str(m.get("content", ""))) for m in messages)
+    completion_tokens = _estimate_tokens(completion)
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=min(cached_tokens, prompt_tokens)),
+    )
+
+
+def _cached_prompt_tokens(usage: Any) -> int:
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+
+
+def _stream_chunk(content: Optional[str] = None, finish_reason: Optional[str] = None, usage: Any = None) -> Any:
+    """Chunk con la forma de ChatCompletionChunk (el de usage llega sin choices)"""
+    choices = [] if usage is not None else [SimpleNamespace(
+        index=0,
+        finish_reason=finish_reason,
+        delta=SimpleNamespace(role="assistant", content=content),
+    )]
+    return SimpleNamespace(id="stub-completion", choices=choices, usage=usage)
+
+
+def _default_stub_responder(messages: List[Dict[str, Any]], **kwargs) -> str:
+    """Respuesta determinista: JSON genérico en modo JSON, texto simple en otro caso"""
+    last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    wants_json = (kwargs.get("response_format") or {}).get("type") == "json_object" or "JSON" in last_user
+    if wants_json:
+        return json.dumps({
+            "intent": "consulta_general",
+            "confianza": 0.9,
+            "producto_mencionado": None,
+            "categoria_mencionada": None,
+            "accion_elegida": "conversacion_general",
+            "razonamiento": "stub",
+            "parametros": {},
+        }, ensure_ascii=False)
+    return f"Respuesta simulada para: {str(last_user)[:80]}"
+
+
+class StubBackend:
+    """Backend local sin red: misma forma de respuesta que el SDK de OpenAI"""
+
+    def __init__(self, responder: Callable[..., str] = _default_stub_responder,
+                 latency_ms: float = LLM_STUB_LATENCY_MS, ms_per_token: float = LLM_STUB_MS_PER_TOKEN):
+        self.responder = responder
+        self.latency_ms = latency_ms
+        self.ms_per_token = ms_per_token
+        self._recent_prompts: deque = deque(maxlen=64)
+        self._prompts_lock = threading.Lock()
+
+    def _prefix_cache_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Simula el cache de prefijo del proveedor: prefijo común más largo con prompts recientes"""
+        prompt = "\x00".join(f"{m.get('role')}:{m.get('content', '')}" for m in messages)
+        with self._prompts_lock:
+            common = max((len(os.path.commonprefix([prompt, seen])) for seen in self._recent_prompts), default=0)
+            self._recent_prompts.append(prompt)
+        tokens = common // 4
+        if tokens < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        return tokens - tokens % PROMPT_CACHE_BLOCK_TOKENS
+
+    def _build_response(self, model: str, messages: List[Dict[str, Any]], **kwargs) -> Any:
+        content = self.responder(messages, model=model, **kwargs)
+        return SimpleNamespace(
+            id="stub-completion",
+            model=model,
+            choices=[SimpleNamespace(
+                index=0,
+                finish_reason="stop",
+                message=SimpleNamespace(role="assistant", content=content),
+            )],
+            usage=_estimate_usage(messages, content, self._prefix_cache_tokens(messages)),
+        )
+
+    def create(self, model: str = "stub", messages: Optional[List[Dict[str, Any]]] = None, **kwargs) -> Any:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._build_response(model, messages or [], **kwargs)
+
+    async def acreate(self, model: str = "stub", messages: Optional[List[Dict[str, Any]]] = None, **kwargs) -> Any:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._build_response(model, messages or [], **kwargs)
+
+    def stream(self, model: str = "stub", messages: Optional[List[Dict[str, Any]]] = None, **kwargs) -> Iterator[Any]:
+        """latency_ms hasta el primer token, luego una palabra cada ms_per_token"""
+        messages = messages or []
+        kwargs.pop("stream_options", None)
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        content = self.responder(messages, model=model, **kwargs)
+        for piece in re.findall(r"\s*\S+\s*|\s+", content):
+            if self.ms_per_token:
+                time.sleep(self.ms_per_token / 1000)
+            yield _stream_chunk(piece)
+        yield _stream_chunk(finish_reason="stop")
+        yield _stream_chunk(usage=_estimate_usage(messages, content, self._prefix_cache_tokens(messages)))
+
+
+# ==================== CONTABILIDAD ====================
+
+class _UsageStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record(self, latency: float, response: Any = None, error: bool = False) -> None:
+        self.calls += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        if error:
+            self.errors += 1
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.cached_tokens += _cached_prompt_tokens(usage)
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_token_ratio": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "avg_latency_ms": round(self.latency_total / self.calls * 1000, 2) if self.calls else 0.0,
+            "max_latency_ms": round(self.latency_max * 1000, 2),
+        }
+
+
+# ==================== GATEWAY ====================
+
+class LLMGateway:
+    """Clientes compartidos + límites por tenant + contabilidad"""
+
+    def __init__(self, backend: str = LLM_BACKEND):
+        self.backend = backend
+        self.stub = StubBackend()
+        self._sync_client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+        self._sync_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._async_limits: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, _UsageStats] = {}
+
+    # ---- clientes OpenAI compartidos ----
+
+    def _get_sync_client(self):
+        if self._sync_client is None:
+            with self._lock:
+                if self._sync_client is None:
+                    import httpx
+                    import openai
+                    self._sync_client = openai.OpenAI(
+                        api_key=os.getenv("OPENAI_API_KEY"),
+                        timeout=LLM_TIMEOUT_SECONDS,
+                        max_retries=LLM_MAX_RETRIES,
+                        http_client=httpx.Client(
+                            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                                max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                            timeout=LLM_TIMEOUT_SECONDS,
+                        ),
+                    )
+        return self._sync_client
+
+    def _get_async_client(self):
+        if self._async_client is None:
+            import httpx
+            import openai
+            self._async_client = openai.AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                        max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                    timeout=LLM_TIMEOUT_SECONDS,
+                ),
+            )
+        return self._async_client
+
+    # ---- límites por tenant ----
+
+    def _sync_limit(self, tenant_id: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._sync_limits.get(tenant_id)
+            if semaphore is None:
+                semaphore = self._sync_limits[tenant_id] = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY_PER_TENANT)
+            return semaphore
+
+    def _async_limit(self, tenant_id: str) -> asyncio.Semaphore:
+        semaphore = self._async_limits.get(tenant_id)
+        if semaphore is None:
+            semaphore = self._async_limits[tenant_id] = asyncio.Semaphore(LLM_MAX_CONCURRENCY_PER_TENANT)
+        return semaphore
+
+    def _record(self, tenant_id: str, purpose: str, latency: float, response: Any = None, error: bool = False) -> None:
+        with self._lock:
+            for key in (f"tenant:{tenant_id}", f"purpose:{purpose}", "total"):
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = _UsageStats()
+                stats.record(latency, response, error)
+
+    # ---- llamadas ----
+
+    def chat_completion(self, tenant_id: Optional[str], purpose: str, **kwargs) -> Any:
+        """chat.completions.create sync con límite por tenant y contabilidad"""
+        tenant_key = tenant_id or GLOBAL_TENANT
+        kwargs.setdefault("timeout", LLM_TIMEOUT_SECONDS)
+        semaphore = self._sync_limit(tenant_key)
+        if not semaphore.acquire(timeout=LLM_QUEUE_TIMEOUT_SECONDS):
+            raise LLMConcurrencyLimitError(f"LLM concurrency limit reached for tenant {tenant_key}")
+
+        started_at = time.monotonic()
+        try:
+            if self.backend == "stub":
+                response = self.stub.create(**kwargs)
+            else:
+                response = self._get_sync_client().chat.completions.create(**kwargs)
+        except Exception:
+            self._record(tenant_key, purpose, time.monotonic() - started_at, error=True)
+            raise
+        finally:
+            semaphore.release()
+        self._record(tenant_key, purpose, time.monotonic() - started_at, response)
+        return response
+
+    def stream_chat_completion(self, tenant_id: Optional[str], purpose: str, **kwargs) -> Iterator[Any]:
+        """
+        chat.completions.create(stream=True) sync con límite por tenant y contabilidad
+        El cupo del tenant se ocupa mientras se consume el stream; cerrar el generador antes
+        del final cierra la conexión y el proveedor deja de generar (se contabiliza lo recibido)
+        """
+        tenant_key = tenant_id or GLOBAL_TENANT
+        kwargs.pop("stream", None)
+        kwargs.setdefault("timeout", LLM_TIMEOUT_SECONDS)
+        semaphore = self._sync_limit(tenant_key)
+        if not semaphore.acquire(timeout=LLM_QUEUE_TIMEOUT_SECONDS):
+            raise LLMConcurrencyLimitError(f"LLM concurrency limit reached for tenant {tenant_key}")
+
+        started_at = time.monotonic()
+        stream, usage, error = None, None, False
+        received: List[str] = []
+        try:
+            if self.backend == "stub":
+                stream = self.stub.stream(**kwargs)
+            else:
+                stream = self._get_sync_client().chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **kwargs
+                )
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if chunk.choices:
+                    received.append(chunk.choices[0].delta.content or "")
+                    yield chunk
+        except GeneratorExit:
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            semaphore.release()
+            if usage is None:
+                # Stream cortado antes del chunk de usage: estimación de lo generado
+                usage = _estimate_usage(kwargs.get("messages") or [], "".join(received))
+            self._record(tenant_key, purpose, time.monotonic() - started_at, SimpleNamespace(usage=usage), error)
+
+    async def achat_completion(self, tenant_id: Optional[str], purpose: str, **kwargs) -> Any:
+        """chat.completions.create async con límite por tenant y contabilidad"""
+        tenant_key = tenant_id or GLOBAL_TENANT
+        kwargs.setdefault("timeout", LLM_TIMEOUT_SECONDS)
+        semaphore = self._async_limit(tenant_key)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=LLM_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise LLMConcurrencyLimitError(f"LLM concurrency limit reached for tenant {tenant_key}")
+
+        started_at = time.monotonic()
+        try:
+            if self.backend == "stub":
+                response = await self.stub.acreate(**kwargs)
+            else:
+                response = await self._get_async_client().chat.completions.create(**kwargs)
+        except Exception:
+            self._record(tenant_key, purpose, time.monotonic() - started_at, error=True)
+            raise
+        finally:
+            semaphore.release()
+        self._record(tenant_key, purpose, time.monotonic() - started_at, response)
+        return response
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "max_concurrency_per_tenant": LLM_MAX_CONCURRENCY_PER_TENANT,
+                "timeout_seconds": LLM_TIMEOUT_SECONDS,
+                "usage": {key: stats.snapshot() for key, stats in sorted(self._stats.items())},
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+# ==================== INTERFAZ COMPATIBLE CON EL SDK ====================
+
+class _Completions:
+    def __init__(self, gateway: LLMGateway, tenant_id: Optional[str], purpose: str, is_async: bool):
+        self._gateway = gateway
+        self._tenant_id = tenant_id
+        self._purpose = purpose
+        self._is_async = is_async
+
+    def create(self, **kwargs):
+        if self._is_async:
+            return self._gateway.achat_completion(self._tenant_id, self._purpose, **kwargs)
+        if kwargs.get("stream"):
+            return self._gateway.stream_chat_completion(self._tenant_id, self._purpose, **kwargs)
+        return self._gateway.chat_completion(self._tenant_id, self._purpose, **kwargs)
+
+
+class LLMClient:
+    """Vista por tenant/propósito del gateway con la forma client.chat.completions.create"""
+
+    def __init__(self, gateway: LLMGateway, tenant_id: Optional[str] = None,
+                 purpose: str = "default", is_async: bool = False):
+        self.chat = SimpleNamespace(completions=_Completions(gateway, tenant_id, purpose, is_async))
+
+
+# Instancia global del gateway
+llm_gateway = LLMGateway()
+
+
+def get_llm_client(tenant_id: Optional[str] = None, purpose: str = "default") -> LLMClient:
+    """Cliente sync compartido (reemplazo de openai.OpenAI())"""
+    return LLMClient(llm_gateway, tenant_id, purpose)
+
+
+def get_async_llm_client(tenant_id: Optional[str] = None, purpose: str = "default") -> LLMClient:
+    """Cliente async compartido (reemplazo de openai.AsyncOpenAI())"""
+    return LLMClient(llm_gateway, tenant_id, purpose, is_async=True)
+
+
+def set_llm_backend(backend: str, responder: Optional[Callable[..., str]] = None,
+                    latency_ms: Optional[float] = None, ms_per_token: Optional[float] = None) -> None:
+    """Cambia el backend en caliente (útil para benchmarks con el stub)"""
+    llm_gateway.backend = backend
+    if responder is not None:
+        llm_gateway.stub.responder = responder
+    if latency_ms is not None:
+        llm_gateway.stub.latency_ms = latency_ms
+    if ms_per_token is not None:
+        llm_gateway.stub.ms_per_token = ms_per_token
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Tokens y latencia por tenant y propósito"""
+    return llm_gateway.get_stats()
@@ -0,0 +1,246 @@
+"""
+📥 Cola de ingesta de mensajes para los webhooks de WhatsApp (Twilio y Meta)
+Los webhooks responden 200 de inmediato y el procesamiento ocurre en un pool
+acotado de workers:
+
+- Orden por teléfono: cada número se asigna siempre al mismo worker (shard)
+- Backpressure: cada shard tiene cola acotada; si está llena se rechaza el mensaje
+  para que el proveedor lo reintente
+- Deduplicación por id del proveedor (wamid de Meta, MessageSid de Twilio): un reintento
+  del mismo payload no vuelve a encolar los mensajes que ya entraron
+- El trabajo bloqueante (SQLAlchemy sync, OpenAI) se ejecuta en threads con run_blocking()
+- Métricas: profundidad de cola y latencia por etapa (queue_wait, process, send, total)
+"""
+import asyncio
+import logging
+import os
+import time
+import zlib
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from services.cache import cache_manager
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_QUEUE_WORKERS = int(os.getenv("MESSAGE_QUEUE_WORKERS", "8"))
+MESSAGE_QUEUE_MAX_PENDING = int(os.getenv("MESSAGE_QUEUE_MAX_PENDING", "100"))
+MESSAGE_QUEUE_ENQUEUE_TIMEOUT = float(os.getenv("MESSAGE_QUEUE_ENQUEUE_TIMEOUT", "0.5"))
+MESSAGE_QUEUE_DRAIN_TIMEOUT = float(os.getenv("MESSAGE_QUEUE_DRAIN_TIMEOUT", "20"))
+# Ventana de ids ya encolados (Meta reintenta notificaciones sin 200 durante horas)
+MESSAGE_QUEUE_DEDUPE_TTL_SECONDS = int(os.getenv("MESSAGE_QUEUE_DEDUPE_TTL_SECONDS", "86400"))
+
+# Ids de mensajes ya encolados, compartidos entre workers si hay backend compartido
+_enqueued_ids = cache_manager.namespace(
+    "enqueued_message_ids", ttl=MESSAGE_QUEUE_DEDUPE_TTL_SECONDS, max_entries=50000, shared=True
+)
+
+
+class LatencyStats:
+    """Contador de latencias con ventana de muestras para percentiles"""
+
+    def __init__(self, window: int = 512):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._samples.append(seconds)
+
+    def _percentile(self, ordered: List[float], pct: float) -> float:
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, float]:
+        ordered = sorted(self._samples)
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(self._percentile(ordered, 0.50) * 1000, 2),
+            "p95_ms": round(self._percentile(ordered, 0.95) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+@dataclass
+class MessageJob:
+    """Trabajo encolado: handler async + metadatos para métricas"""
+    provider: str
+    key: str
+    handler: Callable[[], Awaitable[Any]]
+    tenant_id: Optional[str] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class MessageIngestionQueue:
+    """
+    Pool acotado de workers asyncio con una cola por shard
+    Shard = crc32(teléfono) % workers → mensajes del mismo teléfono en orden
+    """
+
+    def __init__(self,
+                 workers: int = MESSAGE_QUEUE_WORKERS,
+                 max_pending: int = MESSAGE_QUEUE_MAX_PENDING,
+                 enqueue_timeout: float = MESSAGE_QUEUE_ENQUEUE_TIMEOUT):
+        self._workers = max(1, workers)
+        self._max_pending = max(1, max_pending)
+        self._enqueue_timeout = enqueue_timeout
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._started = False
+        self._closing = False
+        self._stages: Dict[str, LatencyStats] = {}
+        self._counters = {
+            "enqueued": 0,
+            "processed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "duplicates": 0,
+        }
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    async def start(self) -> None:
+        """Inicia los workers (idempotente)"""
+        if self._started:
+            return
+        self._queues = [asyncio.Queue(maxsize=self._max_pending) for _ in range(self._workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(i, queue), name=f"message-worker-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+        self._started = True
+        logger.info(f"Message ingestion queue started: {self._workers} workers, {self._max_pending} pending/worker")
+
+    async def stop(self, drain_timeout: float = MESSAGE_QUEUE_DRAIN_TIMEOUT) -> None:
+        """Drena las colas (con timeout) y detiene los workers"""
+        if not self._started:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                timeout=drain_timeout
+            )
+        except asyncio.TimeoutError:
+            pending = sum(queue.qsize() for queue in self._queues)
+            logger.warning(f"Message queue drain timed out with {pending} pending messages")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+        self._started = False
+        self._closing = False
+
+    def _shard_for(self, key: str) -> int:
+        return zlib.crc32((key or "").encode("utf-8")) % self._workers
+
+    async def enqueue(self,
+                      key: str,
+                      handler: Callable[[], Awaitable[Any]],
+                      provider: str = "unknown",
+                      tenant_id: Optional[str] = None,
+                      message_id: Optional[str] = None) -> bool:
+        """
+        Encola un handler para el teléfono `key`
+        Retorna False si el shard está lleno (backpressure) tras esperar enqueue_timeout
+        Con `message_id`, un mensaje ya encolado (reintento del proveedor) se acepta sin encolarlo de nuevo
+        """
+        dedupe_key = f"{provider}:{message_id}" if message_id else None
+        if dedupe_key and _enqueued_ids.contains(dedupe_key):
+            self._counters["duplicates"] += 1
+            logger.info(f"Skipping duplicate {provider} message {message_id} from {key}")
+            return True
+        if self._closing:
+            self._counters["rejected"] += 1
+            return False
+        if not self._started:
+            await self.start()
+
+        job = MessageJob(provider=provider, key=key, handler=handler, tenant_id=tenant_id)
+        queue = self._queues[self._shard_for(key)]
+        try:
+            if self._enqueue_timeout > 0:
+                await asyncio.wait_for(queue.put(job), timeout=self._enqueue_timeout)
+            else:
+                queue.put_nowait(job)
+        except (asyncio.TimeoutError, asyncio.QueueFull):
+            self._counters["rejected"] += 1
+            logger.warning(f"Message queue full, rejecting {provider} message from {key}")
+            return False
+
+        if dedupe_key:
+            _enqueued_ids.set(dedupe_key, True)
+        self._counters["enqueued"] += 1
+        return True
+
+    async def _worker(self, index: int, queue: asyncio.Queue) -> None:
+        while True:
+            job: MessageJob = await queue.get()
+            started_at = time.monotonic()
+            self.record_stage("queue_wait", started_at - job.enqueued_at)
+            try:
+                await job.handler()
+                self._counters["processed"] += 1
+            except Exception as e:
+                self._counters["failed"] += 1
+                logger.error(f"Worker {index} failed processing {job.provider} message from {job.key}: {e}")
+            finally:
+                finished_at = time.monotonic()
+                self.record_stage("total", finished_at - job.enqueued_at)
+                self.record_stage(f"{job.provider}.handler", finished_at - started_at)
+                queue.task_done()
+
+    def record_stage(self, stage: str, seconds: float) -> None:
+        """Registra la latencia de una etapa del pipeline"""
+        stats = self._stages.get(stage)
+        if stats is None:
+            stats = self._stages[stage] = LatencyStats()
+        stats.record(seconds)
+
+    @asynccontextmanager
+    async def timed(self, stage: str):
+        """Context manager async para medir una etapa: `async with message_queue.timed("send"):`"""
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.monotonic() - started_at)
+
+    async def run_blocking(self, stage: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Ejecuta trabajo bloqueante (DB sync, OpenAI) en un thread midiendo la etapa"""
+        async with self.timed(stage):
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Profundidad de colas, contadores y latencias por etapa"""
+        depths = [queue.qsize() for queue in self._queues]
+        return {
+            "started": self._started,
+            "workers": self._workers,
+            "max_pending_per_worker": self._max_pending,
+            "queue_depth": sum(depths),
+            "queue_depth_per_worker": depths,
+            **self._counters,
+            "stages": {name: stats.snapshot() for name, stats in sorted(self._stages.items())},
+        }
+
+
+# Instancia global de la cola de ingesta
+message_queue = MessageIngestionQueue()
+
+
+async def run_blocking(stage: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Función de conveniencia sobre la cola global"""
+    return await message_queue.run_blocking(stage, func, *args, **kwargs)
@@ -0,0 +1,157 @@
+"""
+Creación atómica de pedidos del bot (confirmación en ORDER_CONFIRMATION)
+Una sola transacción y un solo commit por pedido:
+
+1. Reserva el stock de todos los ítems en una sentencia:
+   WITH v(product_id, qty) AS (VALUES ...) UPDATE products ... FROM v ... RETURNING
+   (la condición stock >= qty se re-evalúa sobre la fila bloqueada: no hay sobreventa)
+2. Si falta stock de algún ítem => rollback completo (nada queda a medias)
+3. INSERT del pedido (flush para obtener el id) + INSERT en lote de los ítems
+4. Commit; luego se invalida el snapshot del catálogo y se marca read-your-writes
+
+Funciona igual en Postgres y SQLite >= 3.35 (UPDATE ... FROM y RETURNING).
+Deadlocks entre pedidos concurrentes (Postgres 40P01) se reintentan hasta ORDER_DEADLOCK_RETRIES.
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from models import FlowPedido, FlowProductoPedido
+from services.catalog_snapshot import invalidate_catalog_snapshot
+from services.read_routing import mark_tenant_write
+
+logger = logging.getLogger(__name__)
+
+ORDER_DEADLOCK_RETRIES = int(os.getenv("ORDER_DEADLOCK_RETRIES", "3"))
+
+# Postgres: deadlock_detected / serialization_failure
+_RETRYABLE_PGCODES = {"40P01", "40001"}
+
+
+@dataclass
+class OrderPlacementResult:
+    pedido: Optional[FlowPedido] = None
+    # product_id -> cantidad pedida de los ítems sin stock suficiente
+    insufficient: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.pedido is not None
+
+
+_stats: Dict[str, Any] = {
+    "placed": 0,
+    "rejected_stock": 0,
+    "retries": 0,
+    "errors": 0,
+    "total_ms": 0.0,
+}
+
+
+def _reserve_stock_statement(count: int):
+    """UPDATE ... FROM (VALUES ...) RETURNING para `count` ítems (un statement por tamaño de pedido)"""
+    values = ", ".join(f"(:product_id_{i}, :qty_{i})" for i in range(count))
+    return text(f"""
+        WITH v(product_id, qty) AS (VALUES {values})
+        UPDATE products
+        SET stock = stock - v.qty,
+            updated_at = CURRENT_TIMESTAMP
+        FROM v
+        WHERE products.id = v.product_id
+        AND products.client_id = :tenant_id
+        AND products.stock >= v.qty
+        RETURNING products.id
+    """)
+
+
+def _is_retryable(error: DBAPIError) -> bool:
+    return getattr(error.orig, "pgcode", None) in _RETRYABLE_PGCODES
+
+
+def _place_once(db: Session, telefono: str, tenant_id: str,
+                quantities: Dict[str, int], pedido_data: Dict[str, Dict[str, Any]],
+                total: float) -> OrderPlacementResult:
+    # Orden estable de los ids: pedidos concurrentes bloquean las filas en el mismo orden
+    product_ids = sorted(quantities)
+    params: Dict[str, Any] = {"tenant_id": tenant_id}
+    for i, product_id in enumerate(product_ids):
+        params[f"product_id_{i}"] = product_id
+        params[f"qty_{i}"] = quantities[product_id]
+
+    reserved = {row.id for row in db.execute(_reserve_stock_statement(len(product_ids)), params)}
+    if len(reserved) != len(product_ids):
+        db.rollback()
+        return OrderPlacementResult(insufficient={
+            product_id: quantities[product_id] for product_id in product_ids if product_id not in reserved
+        })
+
+    pedido = FlowPedido(telefono=telefono, tenant_id=tenant_id, total=total, estado="pendiente_pago")
+    db.add(pedido)
+    db.flush()
+
+    db.execute(FlowProductoPedido.__table__.insert(), [
+        {
+            "pedido_id": pedido.id,
+            "producto_id": product_id,  # Usar string ID del backoffice
+            "cantidad": item["cantidad"],
+            "precio_unitario": item["precio"],
+        }
+        for product_id, item in pedido_data.items()
+    ])
+    db.commit()
+    return OrderPlacementResult(pedido=pedido)
+
+
+def place_order(db: Session, telefono: str, tenant_id: str,
+                pedido_data: Dict[str, Dict[str, Any]], total: float) -> OrderPlacementResult:
+    """
+    Crea el pedido y descuenta el stock de todos sus ítems de forma atómica
+    pedido_data: {product_id: {"nombre", "cantidad", "precio"}} (datos de la sesión)
+    """
+    started = time.perf_counter()
+    quantities: Dict[str, int] = {}
+    for product_id, item in pedido_data.items():
+        quantities[str(product_id)] = quantities.get(str(product_id), 0) + int(item["cantidad"])
+
+    attempt = 0
+    while True:
+        try:
+            result = _place_once(db, telefono, tenant_id, quantities, pedido_data, total)
+            break
+        except DBAPIError as e:
+            db.rollback()
+            if _is_retryable(e) and attempt < ORDER_DEADLOCK_RETRIES:
+                attempt += 1
+                _stats["retries"] += 1
+                continue
+            _stats["errors"] += 1
+            raise
+        except Exception:
+            db.rollback()
+            _stats["errors"] += 1
+            raise
+
+    if result.ok:
+        _stats["placed"] += 1
+        # El stock cambió: el snapshot del catálogo ya no es válido
+        invalidate_catalog_snapshot(tenant_id)
+        mark_tenant_write(tenant_id)
+    else:
+        _stats["rejected_stock"] += 1
+    _stats["total_ms"] += (time.perf_counter() - started) * 1000
+    return result
+
+
+def get_order_placement_stats() -> Dict[str, Any]:
+    attempts = _stats["placed"] + _stats["rejected_stock"]
+    return {
+        **{key: value for key, value in _stats.items() if key != "total_ms"},
+        "avg_ms": round(_stats["total_ms"] / attempts, 2) if attempts else 0.0,
+        "deadlock_retries_limit": ORDER_DEADLOCK_RETRIES,
+    }
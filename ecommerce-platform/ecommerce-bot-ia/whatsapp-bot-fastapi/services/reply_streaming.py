@@ -0,0 +1,259 @@
+"""
+📨 Entrega anticipada de respuestas LLM por WhatsApp (streaming)
+Antes se esperaba la completion entera antes de enviar nada y luego
+truncate_response_for_whatsapp descartaba parte de lo generado:
+
+- stream_reply() consume la completion como stream de tokens (llm_gateway, stream=True)
+- El primer bloque se corta en un fin de párrafo (o de línea) y se envía apenas está
+  listo, mientras el modelo sigue generando
+- Al llegar al límite de caracteres del tenant (limite_respuesta_caracteres) se cierra
+  el stream: el modelo deja de generar y el texto termina en el último párrafo/línea
+- El webhook envía al final solo lo que falta (ReplyStream.finish), en orden
+
+Solo se transmite una respuesta que el llamador ya decidió usar: las generaciones que aún
+pueden descartarse (p.ej. baja confianza de intención) corren en reply_streaming_suspended()
+
+Uso en el webhook (el trabajo bloqueante corre en run_blocking, que hereda el contexto):
+    async with reply_streaming(lambda chunk: MessagingService.send_text(phone, chunk)) as stream:
+        response_text = await run_blocking("process", generar_respuesta, ...)
+        response_text = await stream.finish(response_text)
+    if response_text:
+        await MessagingService.send_text(phone, response_text)
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services.message_queue import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+REPLY_STREAMING_ENABLED = os.getenv("REPLY_STREAMING_ENABLED", "true").lower() == "true"
+# Tamaño mínimo del bloque anticipado (evita enviar solo "¡Hola!")
+REPLY_STREAM_MIN_CHUNK_CHARS = int(os.getenv("REPLY_STREAM_MIN_CHUNK_CHARS", "120"))
+# Bloques enviados antes de terminar la generación; el resto va en el mensaje final
+REPLY_STREAM_EARLY_CHUNKS = int(os.getenv("REPLY_STREAM_EARLY_CHUNKS", "1"))
+# Límite cuando el tenant no define uno (Twilio corta en 1600)
+REPLY_STREAM_MAX_CHARS = int(os.getenv("REPLY_STREAM_MAX_CHARS", "1500"))
+
+SendFunc = Callable[[str], Awaitable[bool]]
+
+
+class _ReplyStreamingStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "streams": 0,
+            "generations": 0,
+            "early_chunks_sent": 0,
+            "early_chunks_failed": 0,
+            "stopped_at_limit": 0,
+            "prefix_mismatch": 0,
+            "suspended": 0,
+        }
+        self.first_chunk = LatencyStats()
+
+    def incr(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[key] += amount
+
+    def record_first_chunk(self, seconds: float) -> None:
+        with self._lock:
+            self.first_chunk.record(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": REPLY_STREAMING_ENABLED,
+                "min_chunk_chars": REPLY_STREAM_MIN_CHUNK_CHARS,
+                "early_chunks": REPLY_STREAM_EARLY_CHUNKS,
+                **self.counters,
+                "time_to_first_chunk": self.first_chunk.snapshot(),
+            }
+
+
+_stats = _ReplyStreamingStats()
+
+
+class ReplyStream:
+    """Bloques ya enviados de la respuesta en curso de un mensaje entrante"""
+
+    def __init__(self, send: SendFunc, early_chunks: int = REPLY_STREAM_EARLY_CHUNKS):
+        self._send = send
+        self._loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        self._futures: List[Any] = []
+        self._failed = False
+        self._started_at = time.monotonic()
+        self.early_chunks = early_chunks
+        self.sent: List[str] = []
+
+    @property
+    def accepting(self) -> bool:
+        return len(self.sent) < self.early_chunks
+
+    async def _send_in_order(self, text: str) -> None:
+        # El lock (FIFO) mantiene el orden de los bloques programados desde el thread
+        async with self._lock:
+            try:
+                ok = await self._send(text)
+            except Exception as e:
+                logger.error(f"Error sending early reply chunk: {e}")
+                ok = False
+        if ok:
+            _stats.incr("early_chunks_sent")
+        else:
+            self._failed = True
+            _stats.incr("early_chunks_failed")
+
+    def dispatch(self, chunk: str) -> bool:
+        """Programa el envío del bloque en el event loop (se llama desde el thread de run_blocking)"""
+        if not chunk.strip() or not self.accepting:
+            return False
+        if not self.sent:
+            _stats.record_first_chunk(time.monotonic() - self._started_at)
+        self.sent.append(chunk)
+        coro = self._send_in_order(chunk.strip())
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._futures.append(self._loop.create_task(coro))
+        else:
+            self._futures.append(asyncio.run_coroutine_threadsafe(coro, self._loop))
+        return True
+
+    def remaining(self, final_text: str) -> str:
+        """Parte de la respuesta final que aún no se envió"""
+        final = (final_text or "").strip()
+        sent = "".join(self.sent).strip()
+        if not sent:
+            return final
+        if self._failed:
+            return final
+        if final.startswith(sent):
+            return final[len(sent):].strip()
+        # La respuesta final no continúa lo enviado (fallback tras un error, post-proceso):
+        # se envía completa antes que perder contenido
+        _stats.incr("prefix_mismatch")
+        logger.warning("Streamed reply prefix does not match final response, sending it in full")
+        return final
+
+    async def finish(self, final_text: str) -> str:
+        """Espera los envíos anticipados y devuelve lo que falta enviar ("" si nada)"""
+        for future in self._futures:
+            await (future if isinstance(future, asyncio.Future) else asyncio.wrap_future(future))
+        return self.remaining(final_text)
+
+
+_current_stream: contextvars.ContextVar[Optional[ReplyStream]] = contextvars.ContextVar(
+    "reply_stream", default=None
+)
+
+
+def current_reply_stream() -> Optional[ReplyStream]:
+    return _current_stream.get()
+
+
+@asynccontextmanager
+async def reply_streaming(send: SendFunc):
+    """Activa la entrega anticipada para la respuesta generada dentro del bloque"""
+    stream = ReplyStream(send)
+    token = _current_stream.set(stream if REPLY_STREAMING_ENABLED else None)
+    _stats.incr("streams")
+    try:
+        yield stream
+    finally:
+        _current_stream.reset(token)
+
+
+@contextmanager
+def reply_streaming_suspended():
+    """Generación cuya respuesta el llamador aún puede descartar: nada se envía anticipado"""
+    token = _current_stream.set(None)
+    _stats.incr("suspended")
+    try:
+        yield
+    finally:
+        _current_stream.reset(token)
+
+
+def _cut_at_boundary(text: str, limit: int, floor: int = 0) -> str:
+    """Corta en el último fin de párrafo, línea, frase o palabra antes de limit"""
+    head = text[:limit]
+    for separator in ("\n\n", "\n", ". ", " "):
+        index = head.rfind(separator)
+        if index >= max(floor, limit // 2):
+            return head[:index + len(separator)]
+    return head
+
+
+def _ready_chunk_end(text: str, start: int) -> Optional[int]:
+    """Fin del próximo bloque enviable: párrafo completo, o línea si el párrafo se alarga"""
+    pending = text[start:]
+    if len(pending) < REPLY_STREAM_MIN_CHUNK_CHARS:
+        return None
+    index = pending.find("\n\n", REPLY_STREAM_MIN_CHUNK_CHARS - 2)
+    if index >= 0:
+        return start + index + 2
+    if len(pending) >= 2 * REPLY_STREAM_MIN_CHUNK_CHARS:
+        index = pending.rfind("\n")
+        if index >= REPLY_STREAM_MIN_CHUNK_CHARS - 1:
+            return start + index + 1
+    return None
+
+
+def stream_reply(client, limit: Optional[int] = None,
+                 chunk_transform: Optional[Callable[[str], str]] = None, **create_kwargs) -> str:
+    """
+    Genera la respuesta como stream (bloqueante: corre en el thread de run_blocking)
+
+    Args:
+        client: Cliente de llm_gateway (get_llm_client)
+        limit: Máximo de caracteres; al alcanzarlo se corta el stream
+        chunk_transform: Post-proceso local por bloque (emojis, tono) para que lo enviado
+            coincida con el inicio de la respuesta final post-procesada
+        create_kwargs: Parámetros de chat.completions.create
+
+    Returns:
+        Texto generado sin transformar (lo enviado es prefijo de su versión final)
+    """
+    if not REPLY_STREAMING_ENABLED:
+        response = client.chat.completions.create(**create_kwargs)
+        return response.choices[0].message.content or ""
+
+    reply_stream = current_reply_stream()
+    transform = chunk_transform or (lambda chunk: chunk)
+    limit = limit or REPLY_STREAM_MAX_CHARS
+    text, dispatched = "", 0
+    _stats.incr("generations")
+
+    chunks = client.chat.completions.create(stream=True, **create_kwargs)
+    try:
+        for chunk in chunks:
+            text += chunk.choices[0].delta.content or ""
+            if len(text) >= limit:
+                # Límite del tenant: cerrar el stream deja de generar (y de cobrar) tokens
+                text = _cut_at_boundary(text, limit, floor=dispatched)
+                _stats.incr("stopped_at_limit")
+                break
+            if reply_stream is not None and reply_stream.accepting:
+                end = _ready_chunk_end(text, dispatched)
+                if end and reply_stream.dispatch(transform(text[dispatched:end])):
+                    dispatched = end
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    return text
+
+
+def get_reply_streaming_stats() -> Dict[str, Any]:
+    """Bloques enviados antes de terminar la generación y cortes por límite"""
+    return _stats.snapshot()
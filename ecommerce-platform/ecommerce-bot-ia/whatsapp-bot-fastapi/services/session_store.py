@@ -0,0 +1,520 @@
+"""
+🗂️ Store de sesiones de conversación (flow_sesiones) con persistencia write-behind
+Reemplaza el SELECT + COMMIT por turno de obtener_sesion/guardar_sesion:
+
+- Clave (tenant_id, telefono): mismo orden que el índice ux_flow_sesiones_tenant_phone
+- Backend: LRU en memoria del proceso, o Redis (FLOW_SESSION_REDIS_URL) compartido entre workers
+- Compare-and-set: cada escritura sube `version` y solo se aplica si la sesión no cambió
+  desde que el turno la leyó
+- Write-behind: las sesiones modificadas se escriben a flow_sesiones en lotes cada
+  FLOW_SESSION_FLUSH_INTERVAL_SECONDS (una transacción por lote)
+- Flush síncrono solo en transiciones que importan (entrar/salir de ORDER_CONFIRMATION,
+  ORDER_SCHEDULING): el carrito y el pedido quedan en BD antes de responder
+- La BD también se escribe con CAS (WHERE version = última versión persistida): si otro
+  proceso la cambió (timeout_service, backend) se relee la fila y el cambio pendiente del
+  turno se vuelve a aplicar sobre su versión en el próximo flush (no se pierde)
+- Evento "flow_sessions" del bus de invalidación (timeout_service al avisar/finalizar):
+  las copias sin cambios pendientes se descartan y el próximo turno relee la fila
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+FLOW_SESSION_STORE_MAX_ENTRIES = int(os.getenv("FLOW_SESSION_STORE_MAX_ENTRIES", "20000"))
+# Sesiones limpias sin actividad se descartan (menor que el aviso de timeout: al volver se relee la BD)
+FLOW_SESSION_STORE_TTL_SECONDS = int(os.getenv("FLOW_SESSION_STORE_TTL_SECONDS", "600"))
+FLOW_SESSION_FLUSH_INTERVAL_SECONDS = float(os.getenv("FLOW_SESSION_FLUSH_INTERVAL_SECONDS", "1.0"))
+FLOW_SESSION_FLUSH_BATCH_SIZE = int(os.getenv("FLOW_SESSION_FLUSH_BATCH_SIZE", "500"))
+# Vacío => LRU local del proceso
+FLOW_SESSION_REDIS_URL = os.getenv("FLOW_SESSION_REDIS_URL", "")
+
+# Estados cuyo ingreso/salida se persiste antes de responder
+SYNC_FLUSH_STATES = frozenset({"ORDER_CONFIRMATION", "ORDER_SCHEDULING"})
+
+SessionKey = Tuple[str, str]
+
+_LOAD_SESSION = text("""
+    SELECT estado, datos, version
+    FROM flow_sesiones
+    WHERE tenant_id = :tenant_id AND telefono = :telefono
+""")
+
+_UPDATE_SESSION_CAS = text("""
+    UPDATE flow_sesiones
+    SET estado = :estado, datos = :datos, version = :version, updated_at = :now
+    WHERE tenant_id = :tenant_id AND telefono = :telefono AND version = :base_version
+""")
+
+_INSERT_SESSION = text("""
+    INSERT INTO flow_sesiones
+        (tenant_id, telefono, estado, datos, version, last_message_at,
+         timeout_warning_sent, conversation_active, created_at, updated_at)
+    VALUES
+        (:tenant_id, :telefono, :estado, :datos, :version, :now, false, true, :now, :now)
+    ON CONFLICT DO NOTHING
+""")
+
+
+@dataclass
+class SessionState:
+    """Estado de conversación de un usuario; `datos` es el JSON tal como va a la columna"""
+    tenant_id: str
+    telefono: str
+    estado: str = "INITIAL"
+    datos: str = "{}"
+    # Sube en cada escritura al store
+    version: int = 0
+    # Última versión escrita en flow_sesiones (base del CAS contra la BD)
+    persisted_version: int = 0
+    exists_in_db: bool = False
+
+    @property
+    def key(self) -> SessionKey:
+        return (self.tenant_id, self.telefono)
+
+    @property
+    def dirty(self) -> bool:
+        return self.version != self.persisted_version
+
+
+class LocalSessionBackend:
+    """LRU en memoria; nunca desaloja sesiones con cambios sin persistir"""
+
+    def __init__(self, max_entries: int = FLOW_SESSION_STORE_MAX_ENTRIES,
+                 ttl: float = FLOW_SESSION_STORE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[SessionKey, Tuple[float, SessionState]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: SessionKey) -> Optional[SessionState]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            touched_at, state = entry
+            if not state.dirty and time.monotonic() - touched_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return replace(state)
+
+    def _put(self, key: SessionKey, state: SessionState) -> None:
+        self._entries[key] = (time.monotonic(), state)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            for candidate in list(self._entries.keys())[:len(self._entries) - self.max_entries]:
+                if not self._entries[candidate][1].dirty:
+                    del self._entries[candidate]
+                    self.evictions += 1
+
+    def add(self, state: SessionState) -> bool:
+        """Inserta una sesión recién cargada; False si otro turno ya la cargó"""
+        with self._lock:
+            if state.key in self._entries:
+                return False
+            self._put(state.key, replace(state))
+            return True
+
+    def compare_and_set(self, expected_version: int, state: SessionState) -> bool:
+        with self._lock:
+            entry = self._entries.get(state.key)
+            persisted_version, exists_in_db = state.persisted_version, state.exists_in_db
+            if entry is not None:
+                current = entry[1]
+                if current.version != expected_version:
+                    return False
+                # La marca de persistencia la decide el flush, no la copia del llamador
+                persisted_version, exists_in_db = current.persisted_version, current.exists_in_db
+            self._put(state.key, replace(state, persisted_version=persisted_version, exists_in_db=exists_in_db))
+            return True
+
+    def mark_persisted(self, key: SessionKey, version: int) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1].persisted_version < version:
+                entry[1].persisted_version = version
+                entry[1].exists_in_db = True
+
+    def rebase(self, key: SessionKey, db_version: int, exists_in_db: bool) -> bool:
+        """La fila cambió fuera del store: el cambio pendiente pasa a aplicarse sobre db_version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            state = entry[1]
+            state.persisted_version, state.exists_in_db = db_version, exists_in_db
+            if state.version <= db_version:
+                state.version = db_version + 1
+            return True
+
+    def discard_clean(self, tenant_id: Optional[str] = None, telefono: Optional[str] = None) -> int:
+        """Descarta sesiones sin cambios pendientes (una, las del tenant o todas)"""
+        with self._lock:
+            keys = [
+                key for key, (_, state) in self._entries.items()
+                if not state.dirty
+                and (tenant_id is None or key[0] == tenant_id)
+                and (telefono is None or key[1] == telefono)
+            ]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def delete(self, key: SessionKey) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisSessionBackend:
+    """Sesiones compartidas entre workers; el CAS corre atómico en un script Lua"""
+
+    _CAS_SCRIPT = """
+        local cur = redis.call('GET', KEYS[1])
+        local new = cjson.decode(ARGV[2])
+        if cur then
+            local c = cjson.decode(cur)
+            if c['version'] ~= tonumber(ARGV[1]) then return 0 end
+            new['persisted_version'] = c['persisted_version']
+            new['exists_in_db'] = c['exists_in_db']
+        end
+        redis.call('SET', KEYS[1], cjson.encode(new), 'EX', ARGV[3])
+        return 1
+    """
+
+    _MARK_PERSISTED_SCRIPT = """
+        local cur = redis.call('GET', KEYS[1])
+        if not cur then return 0 end
+        local c = cjson.decode(cur)
+        if c['persisted_version'] < tonumber(ARGV[1]) then
+            c['persisted_version'] = tonumber(ARGV[1])
+            c['exists_in_db'] = true
+            redis.call('SET', KEYS[1], cjson.encode(c), 'KEEPTTL')
+        end
+        return 1
+    """
+
+    _REBASE_SCRIPT = """
+        local cur = redis.call('GET', KEYS[1])
+        if not cur then return 0 end
+        local c = cjson.decode(cur)
+        local db_version = tonumber(ARGV[1])
+        c['persisted_version'] = db_version
+        c['exists_in_db'] = ARGV[2] == '1'
+        if c['version'] <= db_version then c['version'] = db_version + 1 end
+        redis.call('SET', KEYS[1], cjson.encode(c), 'KEEPTTL')
+        return 1
+    """
+
+    _DISCARD_CLEAN_SCRIPT = """
+        local cur = redis.call('GET', KEYS[1])
+        if not cur then return 0 end
+        local c = cjson.decode(cur)
+        if c['version'] ~= c['persisted_version'] then return 0 end
+        redis.call('DEL', KEYS[1])
+        return 1
+    """
+
+    def __init__(self, client: Any, ttl: int = FLOW_SESSION_STORE_TTL_SECONDS, key_prefix: str = "flow_session:"):
+        self._client = client
+        self.ttl = ttl
+        self._prefix = key_prefix
+        self._cas = client.register_script(self._CAS_SCRIPT)
+        self._mark_persisted = client.register_script(self._MARK_PERSISTED_SCRIPT)
+        self._rebase = client.register_script(self._REBASE_SCRIPT)
+        self._discard_clean = client.register_script(self._DISCARD_CLEAN_SCRIPT)
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return -1  # No se cuenta (requiere SCAN)
+
+    def _key(self, key: SessionKey) -> str:
+        return f"{self._prefix}{key[0]}:{key[1]}"
+
+    def get(self, key: SessionKey) -> Optional[SessionState]:
+        raw = self._client.get(self._key(key))
+        return SessionState(**json.loads(raw)) if raw else None
+
+    def add(self, state: SessionState) -> bool:
+        return bool(self._client.set(self._key(state.key), json.dumps(asdict(state)), ex=self.ttl, nx=True))
+
+    def compare_and_set(self, expected_version: int, state: SessionState) -> bool:
+        return bool(self._cas(keys=[self._key(state.key)], args=[expected_version, json.dumps(asdict(state)), self.ttl]))
+
+    def mark_persisted(self, key: SessionKey, version: int) -> None:
+        self._mark_persisted(keys=[self._key(key)], args=[version])
+
+    def rebase(self, key: SessionKey, db_version: int, exists_in_db: bool) -> bool:
+        return bool(self._rebase(keys=[self._key(key)], args=[db_version, "1" if exists_in_db else "0"]))
+
+    def discard_clean(self, tenant_id: Optional[str] = None, telefono: Optional[str] = None) -> int:
+        # Sin teléfono no se recorre Redis (SCAN): esas sesiones expiran por TTL
+        if tenant_id is None or telefono is None:
+            return 0
+        return int(self._discard_clean(keys=[self._key((tenant_id, telefono))]))
+
+    def delete(self, key: SessionKey) -> None:
+        self._client.delete(self._key(key))
+
+
+def _build_backend():
+    if FLOW_SESSION_REDIS_URL:
+        try:
+            import redis
+            return RedisSessionBackend(redis.Redis.from_url(FLOW_SESSION_REDIS_URL, socket_timeout=0.5))
+        except ImportError:
+            logger.warning("FLOW_SESSION_REDIS_URL set but the redis package is not installed; using local store")
+        except Exception as e:
+            logger.warning(f"Could not connect flow session store to Redis: {e}")
+    return LocalSessionBackend()
+
+
+class FlowSessionStore:
+    """Sesiones de flow_chat_service: lectura del store, escritura diferida a flow_sesiones"""
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else _build_backend()
+        # Sesiones escritas por este proceso y aún no persistidas
+        self._dirty: "OrderedDict[SessionKey, None]" = OrderedDict()
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, Any] = {
+            "hits": 0,
+            "loads": 0,
+            "writes": 0,
+            "cas_conflicts": 0,
+            "flushes": 0,
+            "sync_flushes": 0,
+            "rows_flushed": 0,
+            "db_conflicts": 0,
+            "rebased": 0,
+            "invalidations": 0,
+            "flush_errors": 0,
+            "last_flush_ms": None,
+        }
+
+    # ==================== LECTURA / ESCRITURA ====================
+
+    def get(self, db: Session, tenant_id: str, telefono: str) -> SessionState:
+        """Sesión del usuario; en un miss se lee la fila por (tenant_id, telefono)"""
+        key = (tenant_id, telefono)
+        state = self.backend.get(key)
+        if state is not None:
+            self._stats["hits"] += 1
+            return state
+
+        self._stats["loads"] += 1
+        row = db.execute(_LOAD_SESSION, {"tenant_id": tenant_id, "telefono": telefono}).first()
+        if row is not None:
+            version = row.version or 0
+            state = SessionState(tenant_id, telefono, row.estado or "INITIAL", row.datos or "{}",
+                                 version=version, persisted_version=version, exists_in_db=True)
+        else:
+            # Sesión nueva: la fila se crea en el próximo flush
+            state = SessionState(tenant_id, telefono)
+        if not self.backend.add(state):
+            state = self.backend.get(key) or state
+        return state
+
+    def save(self, db: Session, state: SessionState, estado: Optional[str] = None,
+             datos: Optional[str] = None) -> bool:
+        """
+        Escribe la sesión si nadie la cambió desde que se leyó (CAS sobre state.version)
+        Actualiza `state` en sitio para que el resto del turno vea el nuevo estado
+        """
+        previous_estado = state.estado
+        new_state = replace(
+            state,
+            estado=estado if estado else state.estado,
+            datos=datos if datos is not None else state.datos,
+            version=state.version + 1,
+        )
+        if not self.backend.compare_and_set(state.version, new_state):
+            self._stats["cas_conflicts"] += 1
+            logger.warning(f"Flow session {state.telefono} changed concurrently; turn write discarded")
+            return False
+
+        self._stats["writes"] += 1
+        state.estado, state.datos, state.version = new_state.estado, new_state.datos, new_state.version
+        with self._dirty_lock:
+            self._dirty[state.key] = None
+
+        if new_state.estado != previous_estado and (
+            new_state.estado in SYNC_FLUSH_STATES or previous_estado in SYNC_FLUSH_STATES
+        ):
+            self._stats["sync_flushes"] += 1
+            try:
+                self._flush_keys(db, [state.key])
+            except Exception as e:
+                # Queda pendiente para el write-behind
+                self._stats["flush_errors"] += 1
+                logger.error(f"Synchronous flush of flow session {state.telefono} failed: {e}")
+        return True
+
+    # ==================== WRITE-BEHIND ====================
+
+    def _flush_keys(self, db: Session, keys: List[SessionKey]) -> int:
+        """Escribe las sesiones dadas en una sola transacción; devuelve filas escritas"""
+        with self._flush_lock:
+            with self._dirty_lock:
+                for key in keys:
+                    self._dirty.pop(key, None)
+
+            now = datetime.utcnow()
+            results = []
+            try:
+                for key in keys:
+                    state = self.backend.get(key)
+                    if state is None or not state.dirty:
+                        continue
+                    params = {
+                        "tenant_id": state.tenant_id,
+                        "telefono": state.telefono,
+                        "estado": state.estado,
+                        "datos": state.datos,
+                        "version": state.version,
+                        "base_version": state.persisted_version,
+                        "now": now,
+                    }
+                    statement = _UPDATE_SESSION_CAS if state.exists_in_db else _INSERT_SESSION
+                    results.append((key, state.version, db.execute(statement, params).rowcount == 1))
+                db.commit()
+            except Exception:
+                db.rollback()
+                # Reintentar en el próximo ciclo
+                with self._dirty_lock:
+                    for key in keys:
+                        self._dirty[key] = None
+                raise
+
+            written = 0
+            conflicts = []
+            for key, version, ok in results:
+                if ok:
+                    written += 1
+                    self.backend.mark_persisted(key, version)
+                    current = self.backend.get(key)
+                    if current is not None and current.dirty:
+                        with self._dirty_lock:
+                            self._dirty[key] = None
+                else:
+                    conflicts.append(key)
+            if conflicts:
+                self._rebase_conflicts(db, conflicts)
+            self._stats["rows_flushed"] += written
+            return written
+
+    def _rebase_conflicts(self, db: Session, keys: List[SessionKey]) -> None:
+        """
+        La fila cambió fuera del store (timeout_service, backend): se relee su versión y el
+        cambio pendiente del turno se reintenta sobre ella en el próximo flush
+        """
+        for key in keys:
+            self._stats["db_conflicts"] += 1
+            try:
+                row = db.execute(_LOAD_SESSION, {"tenant_id": key[0], "telefono": key[1]}).first()
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Could not reload flow session {key[1]} after a version conflict: {e}")
+            else:
+                if row is not None:
+                    rebased = self.backend.rebase(key, row.version or 0, True)
+                else:
+                    rebased = self.backend.rebase(key, 0, False)
+                if not rebased:
+                    continue
+                self._stats["rebased"] += 1
+                logger.warning(f"Flow session {key[1]} changed in flow_sesiones; re-applying pending turn state")
+            with self._dirty_lock:
+                self._dirty[key] = None
+
+    def invalidate(self, tenant_id: Optional[str] = None, telefono: Optional[str] = None) -> int:
+        """Evento del bus: descarta copias sin cambios pendientes (las pendientes se rebasan al escribir)"""
+        self._stats["invalidations"] += 1
+        return self.backend.discard_clean(tenant_id, telefono)
+
+    def flush(self) -> int:
+        """
+        Persiste las sesiones pendientes en lotes de FLOW_SESSION_FLUSH_BATCH_SIZE (bloqueante)
+        Solo las pendientes al empezar: las re-encoladas por un conflicto van en el próximo ciclo
+        """
+        with self._dirty_lock:
+            pending = list(self._dirty.keys())
+        written = 0
+        for start in range(0, len(pending), FLOW_SESSION_FLUSH_BATCH_SIZE):
+            keys = pending[start:start + FLOW_SESSION_FLUSH_BATCH_SIZE]
+            started = time.perf_counter()
+            db = SessionLocal()
+            try:
+                written += self._flush_keys(db, keys)
+            finally:
+                db.close()
+            self._stats["flushes"] += 1
+            self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return written
+
+    async def _loop(self) -> None:
+        logger.info("Starting flow session write-behind...")
+        while True:
+            await asyncio.sleep(FLOW_SESSION_FLUSH_INTERVAL_SECONDS)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                self._stats["flush_errors"] += 1
+                logger.error(f"Error flushing flow sessions: {e}")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Detiene el loop y persiste lo pendiente"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await asyncio.to_thread(self.flush)
+        # Cambios rebasados tras un conflicto en el primer pase
+        await asyncio.to_thread(self.flush)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._dirty_lock:
+            pending = len(self._dirty)
+        return {
+            **self._stats,
+            "backend": type(self.backend).__name__,
+            "size": len(self.backend),
+            "pending_flush": pending,
+            "evictions": self.backend.evictions,
+        }
+
+
+# Store global del proceso
+flow_session_store = FlowSessionStore()
+
+
+def get_flow_session_store_stats() -> Dict[str, Any]:
+    return flow_session_store.get_stats()
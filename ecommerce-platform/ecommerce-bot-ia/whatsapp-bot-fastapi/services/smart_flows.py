@@ -1,83 +1,26 @@
 import json
-import openai
+from services.llm_gateway import get_llm_client
 from typing import Dict, List, Any
+from services.catalog_snapshot import products_by_category, products_in_category
 
-def _clasificar_productos_por_gpt_para_catalogo(productos: List[Dict]) -> Dict:
+def _clasificar_productos_para_catalogo(productos: List[Dict]) -> Dict:
     """
-    Clasificación 100% dinámica y multi-tenant usando GPT.
-    Funciona para cualquier tipo de negocio sin lógica hardcodeada.
+    Catálogo agrupado por las categorías del tenant desde el índice precalculado
+    (asignaciones del indexador del backend sobre todo el catálogo, sin GPT)
     """
     if not productos:
         return {}
     
-    try:
-        import os
-        client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
-        # Crear lista de productos para GPT
-        productos_lista = []
-        for i, prod in enumerate(productos[:30]):  # Límite para no saturar
-            productos_lista.append(f"{i}. {prod.get('name', '')} - {prod.get('description', '')}")
-        
-        # PROMPT SIMPLIFICADO SIN JSON PARA EVITAR ERRORES DE PARSING
-        classification_prompt = f"""Clasifica estos productos en categorías simples.
-
-PRODUCTOS:
-{chr(10).join(productos_lista)}
-
-TAREA: Agrupa productos similares en máximo 4 categorías.
-
-RESPONDE SOLO LOS NOMBRES de las categorías separados por comas:
-Ejemplo: aceites, flores, semillas, accesorios"""
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": classification_prompt}],
-            temperature=0.1,
-            max_tokens=50
-        )
-        
-        # PROCESAMIENTO SIMPLE SIN JSON
-        categorias_texto = response.choices[0].message.content.strip()
-        categorias_nombres = [cat.strip() for cat in categorias_texto.split(',') if cat.strip()]
-        
-        # Crear clasificación automática basada en coincidencias de texto
-        clasificacion_dict = {}
-        for categoria in categorias_nombres[:4]:  # Máximo 4 categorías
-            productos_categoria = []
-            for i, prod in enumerate(productos):
-                nombre_lower = prod.get('name', '').lower()
-                desc_lower = prod.get('description', '').lower()
-                categoria_lower = categoria.lower()
-                
-                if categoria_lower in nombre_lower or categoria_lower in desc_lower:
-                    productos_categoria.append(i)
-            
-            if productos_categoria:  # Solo agregar si tiene productos
-                clasificacion_dict[categoria] = productos_categoria
-        
-        # Convertir a formato requerido
-        categorias_resultado = {}
-        for categoria, indices in clasificacion_dict.items():
-            categorias_resultado[categoria] = {
-                'productos': [productos[i] for i in indices if i < len(productos)],
-                'disponibles': 0,
-                'ofertas': 0
-            }
-        
-        print(f"🤖 GPT clasificó {len(productos)} productos en {len(categorias_resultado)} categorías dinámicas")
-        return categorias_resultado
-        
-    except Exception as e:
-        print(f"❌ Error en clasificación GPT para catálogo: {e}")
-        # Fallback: una sola categoría con todos los productos
-        return {
-            "Productos": {
-                'productos': productos,
-                'disponibles': 0,
-                'ofertas': 0
-            }
+    categorias_resultado = {
+        categoria: {
+            'productos': productos_categoria,
+            'disponibles': 0,
+            'ofertas': 0
         }
+        for categoria, productos_categoria in products_by_category(productos).items()
+    }
+    print(f"🗂️ Índice de categorías: {len(productos)} productos en {len(categorias_resultado)} categorías")
+    return categorias_resultado
 
 def detectar_intencion_con_gpt(mensaje: str, productos: list, tenant_info: dict = None) -> Dict:
     """
@@ -185,7 +128,7 @@ def detectar_intencion_con_gpt(mensaje: str, productos: list, tenant_info: dict
             "respuesta_sugerida": None
         }
 
-def _extraer_categorias_dinamicamente_con_gpt(productos: list) -> list:
+def _extraer_categorias_dinamicamente_con_gpt(productos: list, tenant_id: str = None) -> list:
     """
     Extrae categorías de productos usando GPT de manera 100% dinámica
     Funciona para cualquier tipo de negocio sin reglas hardcodeadas
@@ -194,7 +137,7 @@ def _extraer_categorias_dinamicamente_con_gpt(productos: list) -> list:
         return []
     
     try:
-        client = openai.OpenAI()
+        client = get_llm_client(tenant_id, "category_extraction")
         
         # Tomar muestra de productos para analizar
         muestra_productos = []
@@ -315,7 +258,7 @@ def _fallback_dinamico_con_gpt(mensaje: str, productos: list, tenant_info: dict)
     Fallback 100% dinámico usando GPT cuando falla la detección principal
     """
     try:
-        client = openai.OpenAI()
+        client = get_llm_client((tenant_info or {}).get('tenant_id'), "intent_fallback")
         
         # Usar GPT para detectar directamente qué busca el usuario
         fallback_prompt = f"""El usuario escribió: "{mensaje}"
@@ -426,75 +369,14 @@ def ejecutar_consulta_producto(producto_buscado: str, productos: list, tenant_in
     
     return respuesta
 
-def _filtrar_productos_con_gpt_interno(productos: list, categoria_solicitada: str) -> list:
-    """
-    Filtrado GPT 100% dinámico y multi-tenant.
-    Sin lógica hardcodeada - funciona para cualquier tipo de negocio.
-    """
-    print(f"🔥🔥🔥 ENTRANDO A _filtrar_productos_con_gpt_interno con categoria: {categoria_solicitada}")
-    if not productos or not categoria_solicitada:
-        print(f"🔥🔥🔥 SALIENDO: productos vacíos o categoría vacía")
-        return []
-    
-    try:
-        client = openai.OpenAI()
-        
-        # Crear lista de productos para clasificar (máximo 20 para no saturar GPT)
-        productos_para_clasificar = []
-        for i, prod in enumerate(productos[:20]):
-            productos_para_clasificar.append({
-                "index": i,
-                "name": prod.get("name", ""),
-                "description": prod.get("description", "")
-            })
-        
-        # PROMPT OPTIMIZADO PARA CLASIFICACIÓN DINÁMICA
-        classification_prompt = f"""Clasifica productos por categoría de manera inteligente.
-
-CATEGORÍA BUSCADA: "{categoria_solicitada}"
-
-PRODUCTOS DISPONIBLES:
-{chr(10).join([f"{p['index']}. {p['name']} - {p['description']}" for p in productos_para_clasificar])}
-
-INSTRUCCIONES:
-1. Analiza nombre y descripción de cada producto
-2. Determina cuáles pertenecen a la categoría "{categoria_solicitada}"
-3. Se flexible pero preciso (ej: "aceites" incluye tinturas, extractos)
-4. Considera sinónimos y términos relacionados
-
-RESPONDE SOLO los números de productos que pertenecen a "{categoria_solicitada}":
-Formato: [0, 3, 7]"""
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": classification_prompt}],
-            temperature=0.1,
-            max_tokens=100
-        )
-        
-        # Parsear respuesta con regex para extraer números
-        clasificacion_texto = response.choices[0].message.content.strip()
-        import re
-        numeros = re.findall(r'\d+', clasificacion_texto)
-        indices_relevantes = [int(n) for n in numeros if int(n) < len(productos)]
-        
-        # Retornar productos filtrados
-        productos_filtrados = [productos[i] for i in indices_relevantes if i < len(productos)]
-        return productos_filtrados
-        
-    except Exception as e:
-        print(f"❌ Error en clasificación GPT interna: {e}")
-        return []
-
 def ejecutar_consulta_categoria(categoria: str, productos: list, tenant_info: dict) -> str:
-    """Query específica: obtiene productos de una categoría usando clasificación GPT inteligente"""
+    """Query específica: obtiene productos de una categoría desde el índice de categorías precalculado"""
     
-    # USAR CLASIFICACIÓN GPT INTELIGENTE (multi-tenant y dinámico)
-    print(f"🚀 SMART_FLOWS: Filtrando categoría '{categoria}' con {len(productos)} productos")
-    productos_categoria = _filtrar_productos_con_gpt_interno(productos, categoria)
-    print(f"🚀 SMART_FLOWS: GPT retornó {len(productos_categoria)} productos")
+    # Índice invertido categoría -> productos (todo el catálogo, multi-tenant)
+    productos_categoria = products_in_category(productos, categoria)
+    print(f"🚀 SMART_FLOWS: categoría '{categoria}' -> {len(productos_categoria)} de {len(productos)} productos")
     
-    # Fallback si GPT falla: usar lógica simple por nombre de producto
+    # Fallback si no es una categoría del tenant: lógica simple por nombre de producto
     if not productos_categoria:
         for prod in productos:
             nombre_lower = prod['name'].lower()
@@ -549,9 +431,8 @@ def ejecutar_consulta_catalogo(productos: list, tenant_info: dict) -> str:
     productos_disponibles = sum(1 for p in productos if p.get('stock', 0) > 0)
     productos_ofertas = sum(1 for p in productos if p.get('sale_price') and p['sale_price'] < p['price'])
     
-    # CLASIFICACIÓN 100% DINÁMICA MULTI-TENANT CON GPT
-    # NO MÁS LÓGICA HARDCODEADA - CADA TENANT ES DIFERENTE
-    categorias = _clasificar_productos_por_gpt_para_catalogo(productos)
+    # CATEGORÍAS DEL TENANT DESDE EL ÍNDICE PRECALCULADO (sin GPT por mensaje)
+    categorias = _clasificar_productos_para_catalogo(productos)
     
     # Contar estadísticas por categoría
     for categoria, info in categorias.items():
@@ -5,10 +5,11 @@ Sistema de detección de intenciones completamente dinámico
 🚀 Escalable a cualquier tipo de negocio futuro
 """
 import json
-import openai
+from services.llm_gateway import get_llm_client
 import os
 from typing import Dict, List, Any, Optional
 from sqlalchemy.orm import Session
+from services.catalog_snapshot import products_in_category
 from services.tenant_config_manager import (
     get_cached_tenant_config, 
     extract_dynamic_categories_from_products,
@@ -39,7 +40,7 @@ class DynamicIntentDetector:
         print(f"🧠 Detectando intención para {self.tenant_config.business_name} ({self.tenant_config.business_type})")
         
         try:
-            client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+            client = get_llm_client(self.tenant_config.tenant_id, "intent")
             
             # Construir contexto dinámico del negocio
             categorias_texto = ", ".join([cat.name.lower() for cat in self.categorias]) if self.categorias else "productos generales"
@@ -226,78 +227,28 @@ RESPONDE SOLO UNA PALABRA:
 
 class DynamicProductFilter:
     """
-    Filtro de productos 100% dinámico usando GPT
+    Filtro de productos 100% dinámico usando el índice de categorías del tenant
     Se adapta a cualquier tipo de inventario
     """
     
     def __init__(self, tenant_config: TenantConfig):
         self.tenant_config = tenant_config
     
-    def filter_products_by_category_with_gpt(self, productos: List[Dict], categoria: str) -> List[Dict]:
+    def filter_products_by_category(self, productos: List[Dict], categoria: str) -> List[Dict]:
         """
-        Filtra productos por categoría usando GPT - 100% dinámico
+        Filtra productos por categoría con el índice precalculado del catálogo
+        (asignaciones del indexador del backend, sin GPT por mensaje)
         """
         if not productos or not categoria:
             return []
         
-        try:
-            client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            
-            # Preparar productos para clasificación
-            productos_para_clasificar = []
-            for i, prod in enumerate(productos[:25]):  # Límite para eficiencia
-                productos_para_clasificar.append({
-                    "index": i,
-                    "name": prod.get("name", ""),
-                    "description": prod.get("description", ""),
-                    "category": prod.get("category", "")
-                })
-            
-            # Prompt completamente genérico
-            classification_prompt = f"""Clasifica estos productos para determinar cuáles pertenecen a la categoría "{categoria}".
-
-NEGOCIO: {self.tenant_config.business_name} ({self.tenant_config.business_type})
-CATEGORÍA BUSCADA: "{categoria}"
-
-PRODUCTOS:
-{chr(10).join([f"{p['index']}. {p['name']} - {p['description']}" for p in productos_para_clasificar])}
-
-INSTRUCCIONES:
-1. Analiza nombre y descripción de cada producto
-2. Determina cuáles pertenecen realmente a "{categoria}"
-3. Sé flexible pero preciso en la clasificación
-4. Considera sinónimos y términos relacionados
-5. Usa tu conocimiento sobre el tipo de negocio: {self.tenant_config.business_type}
-
-RESPONDE SOLO los números (índices) de productos que pertenecen a "{categoria}":
-Formato: [0, 3, 7, 12]"""
-            
-            response = client.chat.completions.create(
-                model=self.tenant_config.ai_model,
-                messages=[{"role": "user", "content": classification_prompt}],
-                temperature=0.1,
-                max_tokens=150
-            )
-            
-            # Parsear respuesta
-            clasificacion_texto = response.choices[0].message.content.strip()
-            import re
-            numeros = re.findall(r'\d+', clasificacion_texto)
-            indices_relevantes = [int(n) for n in numeros if int(n) < len(productos)]
-            
-            # Retornar productos filtrados
-            productos_filtrados = [productos[i] for i in indices_relevantes if i < len(productos)]
-            
-            print(f"🔍 GPT filtró {len(productos_filtrados)} productos para categoría '{categoria}'")
-            return productos_filtrados
-            
-        except Exception as e:
-            print(f"❌ Error en filtrado GPT: {e}")
-            return self._fallback_filter(productos, categoria)
+        productos_filtrados = products_in_category(productos, categoria)
+        print(f"🔍 Índice de categorías: {len(productos_filtrados)} productos para '{categoria}'")
+        return productos_filtrados or self._fallback_filter(productos, categoria)
     
     def _fallback_filter(self, productos: List[Dict], categoria: str) -> List[Dict]:
         """
-        Filtrado de fallback sin GPT - búsqueda simple por texto
+        Fallback cuando no es una categoría del tenant - búsqueda simple por texto
         """
         productos_filtrados = []
         categoria_lower = categoria.lower()
@@ -466,7 +417,7 @@ def detectar_intencion_con_gpt_refactored(
     tenant_config = get_cached_tenant_config(db, tenant_id)
     
     # Extraer categorías dinámicamente
-    categorias = extract_dynamic_categories_from_products(productos)
+    categorias = extract_dynamic_categories_from_products(productos, tenant_id)
     
     # Crear detector dinámico
     detector = DynamicIntentDetector(tenant_config, productos, categorias)
@@ -506,13 +457,13 @@ def ejecutar_consulta_categoria_refactored(
     db: Session
 ) -> str:
     """
-    Consulta de categoría 100% dinámica usando GPT
+    Consulta de categoría 100% dinámica (índice de categorías del tenant)
     """
     tenant_config = get_cached_tenant_config(db, tenant_id)
     
-    # Filtrar productos usando GPT dinámico
+    # Filtrar productos con el índice de categorías
     filtro = DynamicProductFilter(tenant_config)
-    productos_categoria = filtro.filter_products_by_category_with_gpt(productos, categoria)
+    productos_categoria = filtro.filter_products_by_category(productos, categoria)
     
     # Generar respuesta dinámica
     generator = DynamicResponseGenerator(tenant_config)
@@ -527,7 +478,7 @@ def ejecutar_consulta_catalogo_refactored(
     Consulta de catálogo completo 100% dinámica
     """
     tenant_config = get_cached_tenant_config(db, tenant_id)
-    categorias = extract_dynamic_categories_from_products(productos)
+    categorias = extract_dynamic_categories_from_products(productos, tenant_id)
     
     generator = DynamicResponseGenerator(tenant_config)
     return generator.generate_catalog_response(productos, categorias)
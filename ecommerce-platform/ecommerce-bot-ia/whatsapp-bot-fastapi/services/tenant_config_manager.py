@@ -10,6 +10,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from dataclasses import dataclass, asdict
 from datetime import datetime, timedelta
+from services.cache import cache_manager
 
 @dataclass
 class TenantConfig:
@@ -167,7 +168,7 @@ def get_fallback_config(tenant_id: str) -> TenantConfig:
         updated_at=datetime.utcnow()
     )
 
-def extract_dynamic_categories_from_products(productos: List[Dict]) -> List[ProductCategory]:
+def extract_dynamic_categories_from_products(productos: List[Dict], tenant_id: Optional[str] = None) -> List[ProductCategory]:
     """
     Extrae categorías dinámicamente de los productos usando GPT
     100% adaptable a cualquier tipo de negocio
@@ -176,8 +177,8 @@ def extract_dynamic_categories_from_products(productos: List[Dict]) -> List[Prod
         return []
     
     try:
-        import openai
-        client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        from services.llm_gateway import get_llm_client
+        client = get_llm_client(tenant_id, "category_extraction")
         
         # Preparar muestra de productos
         productos_muestra = []
@@ -343,41 +344,28 @@ def get_dynamic_greeting_template(tenant_config: TenantConfig, categorias: List[
         emoji = " 👋" if usar_emojis else ""
         return f"¡Hola! Bienvenido a {empresa}{emoji}. ¿Qué estás buscando hoy? Tenemos: {categorias_texto}."
 
-# Cache en memoria para configuraciones (evitar consultas repetidas)
-_config_cache: Dict[str, TenantConfig] = {}
-_cache_expiry: Dict[str, datetime] = {}
-CACHE_TTL_MINUTES = 10
+# Cache acotado para configuraciones (evitar consultas repetidas)
+# Con el bus de invalidación activo el TTL puede subirse a horas
+CACHE_TTL_MINUTES = int(os.getenv("TENANT_CONFIG_CACHE_TTL_MINUTES", "10"))
+_config_cache = cache_manager.namespace("tenant_config", ttl=CACHE_TTL_MINUTES * 60, max_entries=1000)
 
 def get_cached_tenant_config(db: Session, tenant_id: str) -> TenantConfig:
     """
     Obtiene configuración con cache para performance
+    Single-flight: mensajes concurrentes del mismo tenant comparten una sola carga
     """
-    now = datetime.utcnow()
+    def load() -> TenantConfig:
+        # Cargar desde BD
+        config = get_tenant_config_from_db(db, tenant_id)
+        return config or get_fallback_config(tenant_id)
     
-    # Verificar cache
-    if (tenant_id in _config_cache and 
-        tenant_id in _cache_expiry and 
-        _cache_expiry[tenant_id] > now):
-        return _config_cache[tenant_id]
-    
-    # Cargar desde BD
-    config = get_tenant_config_from_db(db, tenant_id)
-    if not config:
-        config = get_fallback_config(tenant_id)
-    
-    # Guardar en cache
-    _config_cache[tenant_id] = config
-    _cache_expiry[tenant_id] = now + timedelta(minutes=CACHE_TTL_MINUTES)
-    
-    return config
+    return _config_cache.get_or_load("config", load, tenant_id=tenant_id)
 
 def clear_tenant_cache(tenant_id: str = None):
     """
     Limpia cache de configuración (útil después de updates)
     """
     if tenant_id:
-        _config_cache.pop(tenant_id, None)
-        _cache_expiry.pop(tenant_id, None)
+        _config_cache.invalidate_tenant(tenant_id)
     else:
-        _config_cache.clear()
-        _cache_expiry.clear()
\ No newline at end of file
+        _config_cache.clear()
\ No newline at end of file
@@ -2,9 +2,14 @@ import os
 import logging
 from typing import Optional
 from adapters import WhatsAppAdapter, TwilioAdapter, MetaAdapter
+from services.cache import cache_manager
 
 logger = logging.getLogger(__name__)
 
+# Credenciales descifradas: solo cache local del proceso (nunca en el backend compartido)
+WHATSAPP_SETTINGS_CACHE_TTL = float(os.getenv("WHATSAPP_SETTINGS_CACHE_TTL", "60"))
+_settings_cache = cache_manager.namespace("whatsapp_settings", ttl=WHATSAPP_SETTINGS_CACHE_TTL, max_entries=4)
+
 # Variable de entorno para seleccionar proveedor
 WA_PROVIDER = os.getenv("WA_PROVIDER", "twilio")  # Default a Twilio por compatibilidad
 
@@ -15,57 +20,62 @@ WA_PROVIDER = os.getenv("WA_PROVIDER", "twilio")  # Default a Twilio por compati
 #     "mundo_canino": "meta",
 # }
 
+def _load_config_from_db() -> Optional[dict]:
+    """Lee la configuración activa de WhatsApp (una sesión por carga, no por envío)"""
+    import sys
+    from pathlib import Path
+
+    # Agregar path del backend
+    backend_path = Path(__file__).parent.parent / "backend"
+    sys.path.append(str(backend_path))
+
+    from database import SessionLocal
+    from models import WhatsAppSettings
+    from encryption_service import decrypt_sensitive_data
+
+    db = SessionLocal()
+    try:
+        db_settings = db.query(WhatsAppSettings).filter(
+            WhatsAppSettings.is_active == True
+        ).first()
+
+        if not db_settings:
+            return None
+
+        config = {
+            "provider": db_settings.provider,
+            "is_active": db_settings.is_active
+        }
+
+        if db_settings.provider == "twilio":
+            config.update({
+                "twilio_account_sid": db_settings.twilio_account_sid,
+                "twilio_auth_token": decrypt_sensitive_data(db_settings.twilio_auth_token) if db_settings.twilio_auth_token else None,
+                "twilio_from": db_settings.twilio_from
+            })
+        elif db_settings.provider == "meta":
+            config.update({
+                "meta_token": decrypt_sensitive_data(db_settings.meta_token) if db_settings.meta_token else None,
+                "meta_phone_number_id": db_settings.meta_phone_number_id,
+                "meta_graph_api_version": db_settings.meta_graph_api_version
+            })
+
+        return config
+
+    finally:
+        db.close()
+
+
 def get_config_from_db() -> Optional[dict]:
     """
     Obtiene configuración global de WhatsApp desde la base de datos (single tenant)
+    Cacheada WHATSAPP_SETTINGS_CACHE_TTL segundos (evento "whatsapp_settings" del bus la invalida)
 
     Returns:
         dict: Configuración global o None si no existe
     """
     try:
-        import sys
-        from pathlib import Path
-
-        # Agregar path del backend
-        backend_path = Path(__file__).parent.parent / "backend"
-        sys.path.append(str(backend_path))
-
-        from database import SessionLocal
-        from models import WhatsAppSettings
-        from encryption_service import decrypt_sensitive_data
-
-        db = SessionLocal()
-        try:
-            db_settings = db.query(WhatsAppSettings).filter(
-                WhatsAppSettings.is_active == True
-            ).first()
-
-            if not db_settings:
-                return None
-
-            config = {
-                "provider": db_settings.provider,
-                "is_active": db_settings.is_active
-            }
-
-            if db_settings.provider == "twilio":
-                config.update({
-                    "twilio_account_sid": db_settings.twilio_account_sid,
-                    "twilio_auth_token": decrypt_sensitive_data(db_settings.twilio_auth_token) if db_settings.twilio_auth_token else None,
-                    "twilio_from": db_settings.twilio_from
-                })
-            elif db_settings.provider == "meta":
-                config.update({
-                    "meta_token": decrypt_sensitive_data(db_settings.meta_token) if db_settings.meta_token else None,
-                    "meta_phone_number_id": db_settings.meta_phone_number_id,
-                    "meta_graph_api_version": db_settings.meta_graph_api_version
-                })
-
-            return config
-
-        finally:
-            db.close()
-
+        return _settings_cache.get_or_load("active", _load_config_from_db, cache_none=True)
     except Exception as e:
         logger.error(f"Error getting config from DB: {str(e)}")
         return None
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la dependency de autenticación del backoffice
+Compara latencia (p50/p99) y consultas SQL por request de get_current_user_and_client:
+
+1. Sin cache (AUTH_PRINCIPAL_CACHE_TTL_SECONDS=0): dos SELECT por request, como antes
+2. Cache de principal por (sub, client_id, iat)
+3. Claims firmados (AUTH_SIGNED_CLAIMS): el token trae email/slug, sin DB
+
+Además verifica que borrar el usuario (evento "auth_principals") invalida el cache.
+Corre en proceso contra una base SQLite temporal: no necesita el backend levantado.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[2] / "ecommerce-bot-ia" / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+DB_FILE = Path(tempfile.mkdtemp()) / "bench_auth.db"
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
+os.environ["INVALIDATION_BUS_TRANSPORT"] = "inprocess"
+os.environ.pop("CACHE_REDIS_URL", None)
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "2000"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "50"))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def measure(label, credentials, counter):
+    import auth
+
+    latencies = []
+    queries_before = counter["queries"]
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        t0 = time.perf_counter()
+        await auth.get_current_user_and_client(credentials, None)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    queries = counter["queries"] - queries_before
+    print(f"{label:<28} p50={statistics.median(latencies):7.3f} ms  "
+          f"p99={percentile(latencies, 0.99):7.3f} ms  "
+          f"queries/req={queries / REQUESTS:5.2f}  db_qps={queries / elapsed:9.1f}")
+    return queries
+
+
+async def main():
+    from sqlalchemy import event
+    from fastapi import HTTPException
+    from fastapi.security import HTTPAuthorizationCredentials
+
+    import auth
+    from auth import AuthService
+    from auth_models import TenantClient, TenantUser
+    from database import Base, SessionLocal, engine
+    from services.invalidation_bus import invalidation_bus, publish_invalidation
+
+    counter = {"queries": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_queries(*args):
+        counter["queries"] += 1
+
+    Base.metadata.create_all(bind=engine, tables=[TenantClient.__table__, TenantUser.__table__])
+    invalidation_bus.start()
+
+    db = SessionLocal()
+    client = TenantClient(name="Bench Store", slug="bench-store")
+    db.add(client)
+    db.commit()
+    user = TenantUser(client_id=client.id, email="bench@example.com", password_hash="x", role="admin")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.refresh(client)
+
+    print("🔐 BENCHMARK AUTH PRINCIPAL")
+    print("=" * 90)
+    print(f"requests por escenario: {REQUESTS}")
+
+    token_data = {"sub": user.id, "client_id": client.id, "role": user.role}
+    plain = HTTPAuthorizationCredentials(scheme="Bearer", credentials=AuthService.create_access_token(token_data))
+
+    auth.AUTH_PRINCIPAL_CACHE_TTL_SECONDS = 0
+    baseline = await measure("sin cache (2 SELECT)", plain, counter)
+
+    auth.AUTH_PRINCIPAL_CACHE_TTL_SECONDS = 30
+    cached = await measure("cache (sub, client_id, iat)", plain, counter)
+
+    # Los claims solo se aceptan para tokens emitidos después del arranque del proceso
+    # (iat tiene resolución de segundos)
+    time.sleep(1.1)
+    auth.AUTH_SIGNED_CLAIMS = True
+    signed = HTTPAuthorizationCredentials(
+        scheme="Bearer",
+        credentials=AuthService.create_access_token({**token_data, **AuthService.principal_claims(user, client)})
+    )
+    claims = await measure("claims firmados", signed, counter)
+
+    print("\n⚡ Ráfaga concurrente tras invalidar (single-flight)")
+    auth.AUTH_SIGNED_CLAIMS = False
+    publish_invalidation("auth_principals", client.id)
+    before = counter["queries"]
+    await asyncio.gather(*(auth.get_current_user_and_client(plain, None) for _ in range(CONCURRENCY)))
+    print(f"{CONCURRENCY} requests concurrentes -> {counter['queries'] - before} consultas SQL")
+
+    print("\n🗑️ Invalidación al borrar el usuario")
+    db.delete(db.get(TenantUser, user.id))
+    db.commit()
+    publish_invalidation("auth_principals", client.id)
+    for label, credentials in (("token normal", plain), ("token con claims", signed)):
+        auth.AUTH_SIGNED_CLAIMS = credentials is signed
+        try:
+            await auth.get_current_user_and_client(credentials, None)
+            print(f"❌ {label}: sigue autenticando tras el borrado")
+        except HTTPException as e:
+            print(f"✅ {label}: rechazado ({e.status_code} {e.detail})")
+
+    db.close()
+    invalidation_bus.stop()
+
+    print("\n📊 Resumen")
+    print(f"consultas SQL: sin cache={baseline}, cache={cached}, claims={claims}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark de creación de links de pago Flow contra el servidor falso (fake_flow_server.py)
+
+- "antes": requests.post bloqueante por checkout, sin pool ni timeout (como el flujo
+  anterior, que bloqueaba el event loop => los checkouts se atendían en serie)
+- "después": services/flow_client.FlowClient (httpx pool compartido, concurrente)
+- Confirmaciones repetidas: se vuelve a pedir el link de cada pedido y se verifica que
+  Flow no recibe creaciones nuevas (idempotencia por commerceOrder)
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[2] / "ecommerce-bot-ia" / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_flow_server import FAKE_FLOW_API_KEY, FAKE_FLOW_SECRET_KEY, start_fake_flow_server  # noqa: E402
+
+CHECKOUTS = int(os.getenv("BENCH_CHECKOUTS", "200"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "20"))
+
+server, BASE_URL = start_fake_flow_server()
+os.environ["FLOW_BASE_URL"] = BASE_URL
+os.environ["FLOW_API_KEY"] = FAKE_FLOW_API_KEY
+os.environ["FLOW_SECRET_KEY"] = FAKE_FLOW_SECRET_KEY
+os.environ.setdefault("DATABASE_URL", "sqlite:///./bench_flow_checkout.db")
+os.environ.pop("CACHE_REDIS_URL", None)
+
+
+def summary(label: str, latencies, elapsed: float) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    print(f"{label:<30} p50: {statistics.median(ordered) * 1000:7.1f} ms   p95: {p95 * 1000:7.1f} ms   "
+          f"total: {elapsed:6.2f} s   {len(ordered) / elapsed:7.1f} checkouts/s")
+
+
+def run_before(prefix: str) -> None:
+    import requests
+    from services.flow_client import firmar
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(CHECKOUTS):
+        params = {"apiKey": FAKE_FLOW_API_KEY, "commerceOrder": f"{prefix}-{i}", "subject": "Bench",
+                  "amount": 1000, "email": "cliente@correo.com",
+                  "urlConfirmation": "http://localhost/flow/confirm", "urlReturn": "http://localhost/flow/return"}
+        params["s"] = firmar(params, FAKE_FLOW_SECRET_KEY)
+        call_started = time.perf_counter()
+        response = requests.post(f"{BASE_URL}/payment/create", data=params)
+        assert response.status_code == 200, response.text
+        latencies.append(time.perf_counter() - call_started)
+    summary("antes (requests, en serie)", latencies, time.perf_counter() - started)
+
+
+async def run_after(prefix: str):
+    from services.flow_client import flow_client
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def checkout(i: int):
+        async with semaphore:
+            call_started = time.perf_counter()
+            payment = await flow_client.create_payment(None, f"{prefix}-{i}", 1000, "Bench")
+            latencies.append(time.perf_counter() - call_started)
+            return payment
+
+    started = time.perf_counter()
+    payments = await asyncio.gather(*(checkout(i) for i in range(CHECKOUTS)))
+    summary(f"después (pool, x{CONCURRENCY})", latencies, time.perf_counter() - started)
+    return payments
+
+
+async def main():
+    from services.http_pool import http_clients
+    from services.flow_client import flow_client, get_flow_client_stats
+
+    print("💳 BENCHMARK CHECKOUT FLOW (servidor falso)")
+    print("=" * 70)
+    print(f"checkouts: {CHECKOUTS}  concurrencia: {CONCURRENCY}  latencia Flow: {server.state.latency * 1000:.0f} ms")
+
+    await asyncio.to_thread(run_before, "before")
+    payments = await run_after("after")
+
+    creates_before_retry = server.state.creates
+    retried = await asyncio.gather(*(
+        flow_client.create_payment(None, payment.commerce_order, 1000, "Bench") for payment in payments
+    ))
+    same_tokens = all(a.token == b.token and b.reused for a, b in zip(payments, retried))
+
+    print()
+    print(f"{'✅' if same_tokens else '❌'} confirmaciones repetidas reutilizan el token")
+    print(f"{'✅' if server.state.creates == creates_before_retry else '❌'} "
+          f"sin creaciones nuevas en Flow al reintentar ({server.state.creates - creates_before_retry})")
+    print(f"{'✅' if server.state.bad_signatures == 0 else '❌'} firmas válidas")
+    stats = get_flow_client_stats()
+    http = stats.get("http") or {}
+    print(f"\n📊 creados: {stats['created']}  reutilizados: {stats['reused']}  "
+          f"conexiones TCP (después): {http.get('tcp_connects')}")
+
+    await http_clients.aclose_all()
+    server.shutdown()
+    Path("bench_flow_checkout.db").unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark del motor de razonamiento (GPTReasoningEngine): three_step vs planner (LLM stub offline)
+
+- "three_step": extracción de categorías + decidir + ejecutar + formatear, todo con GPT
+- "planner": una llamada de planificación (acción tipada en JSON) ejecutada localmente
+  contra el catálogo y formateada con plantillas del tenant
+
+El stub simula latencia fija por llamada (BENCH_LLM_LATENCY_MS) más un costo por token
+generado (BENCH_LLM_MS_PER_TOKEN). Llamadas y tokens desde la contabilidad de llm_gateway.
+"""
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BOT_DIR = Path(__file__).resolve().parents[2] / "ecommerce-bot-ia" / "whatsapp-bot-fastapi"
+sys.path.insert(0, str(BOT_DIR))
+os.environ["LLM_BACKEND"] = "stub"
+os.environ["REPLY_STREAMING_ENABLED"] = "false"
+
+MESSAGES = int(os.getenv("BENCH_MESSAGES", "30"))
+LATENCY_MS = float(os.getenv("BENCH_LLM_LATENCY_MS", "250"))
+MS_PER_TOKEN = float(os.getenv("BENCH_LLM_MS_PER_TOKEN", "4"))
+TENANT_ID = "bench-tenant"
+
+CATEGORIAS = ["semillas", "aceites", "flores", "comestibles", "accesorios"]
+PRODUCTOS = [
+    {"id": f"p{i}", "name": f"{cat.title()[:-1]} Premium {i}", "description": f"{cat} de prueba",
+     "price": 10000 + i * 500, "stock": 5 + i % 7, "status": "Active", "client_id": TENANT_ID,
+     "category": cat.title(), "categories": (cat.title(),)}
+    for i, cat in enumerate(CATEGORIAS * 40)
+]
+
+PLAN = {"accion": "mostrar_categoria", "terminos": ["aceite"], "categoria": "Aceites",
+        "producto": "", "cantidad": 1, "respuesta": ""}
+DECISION = {"accion_elegida": "consulta_categoria", "razonamiento": "stub",
+            "productos_relevantes": ["aceite"], "categorias_relevantes": ["aceites"]}
+REPLY = ("¡Claro! Estos son nuestros aceites más pedidos:\n\n1. Aceite Premium 1 - $10.500\n"
+         "2. Aceite Premium 6 - $13.000\n\n¿Te muestro alguno en detalle? Para comprar escribe: Quiero [nombre]")
+
+
+def responder(messages, **kwargs):
+    """Misma forma que el modelo real: plan JSON, decisión JSON, categorías JSON o texto"""
+    prompt = "\n".join(m["content"] for m in messages)
+    if (kwargs.get("response_format") or {}).get("type") == "json_object":
+        content = json.dumps(PLAN, ensure_ascii=False)
+    elif "accion_elegida" in prompt:
+        content = json.dumps(DECISION, ensure_ascii=False)
+    elif "categor" in prompt.lower() and "JSON" in prompt and "Ejecuta" not in prompt:
+        content = json.dumps({"categorias": [{"nombre": c, "palabras_clave": [c]} for c in CATEGORIAS]})
+    else:
+        content = REPLY
+    time.sleep(len(content) / 4 * MS_PER_TOKEN / 1000)
+    return content
+
+
+def run(mode: str):
+    from services.gpt_reasoning_engine import GPTReasoningEngine
+    from services.llm_gateway import get_llm_stats, llm_gateway
+
+    llm_gateway.reset_stats()
+    latencies = []
+    for i in range(MESSAGES):
+        started = time.perf_counter()
+        engine = GPTReasoningEngine(None, TENANT_ID, PRODUCTOS, mode=mode)
+        respuesta = engine.process_message_with_pure_gpt_reasoning(
+            "+56900000000", f"qué aceites tienen? consulta {mode} {i}"
+        )
+        latencies.append(time.perf_counter() - started)
+        assert respuesta, mode
+
+    total = get_llm_stats()["usage"].get("total", {})
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+        "calls": total.get("calls", 0) / MESSAGES,
+        "prompt_tokens": total.get("prompt_tokens", 0) / MESSAGES,
+        "completion_tokens": total.get("completion_tokens", 0) / MESSAGES,
+    }
+
+
+def main():
+    from services.llm_gateway import set_llm_backend
+
+    set_llm_backend("stub", responder=responder, latency_ms=LATENCY_MS)
+
+    print("🧠 BENCHMARK MOTOR DE RAZONAMIENTO: three_step vs planner (LLM stub)")
+    print("=" * 70)
+    print(f"mensajes: {MESSAGES}  productos: {len(PRODUCTOS)}  latencia stub: {LATENCY_MS:.0f} ms + "
+          f"{MS_PER_TOKEN:.1f} ms/token")
+    print()
+    print(f"{'modo':<14}{'p50 ms':>10}{'p95 ms':>10}{'llamadas':>10}{'prompt tok':>12}{'compl. tok':>12}")
+
+    results = {mode: run(mode) for mode in ("three_step", "planner")}
+    for mode, r in results.items():
+        print(f"{mode:<14}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['calls']:>10.1f}"
+              f"{r['prompt_tokens']:>12.0f}{r['completion_tokens']:>12.0f}")
+
+    before, after = results["three_step"], results["planner"]
+    print()
+    print(f"{'✅' if after['calls'] < before['calls'] else '❌'} llamadas por mensaje: "
+          f"{before['calls']:.1f} -> {after['calls']:.1f}")
+    print(f"{'✅' if after['p50_ms'] <= before['p50_ms'] / 3 * 1.1 else '❌'} latencia p50: "
+          f"{before['p50_ms']:.0f} ms -> {after['p50_ms']:.0f} ms "
+          f"(-{(1 - after['p50_ms'] / before['p50_ms']) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark del pipeline de IA del bot: two_pass vs single_pass (LLM stub offline)
+
+- "two_pass": gpt_detect_intent (JSON) + gpt_generate_reply, dos llamadas en serie
+- "single_pass": gpt_detect_intent_and_reply, intención y respuesta en una sola llamada
+  con productos preseleccionados localmente (índice de categorías)
+
+El stub simula latencia fija por llamada (BENCH_LLM_LATENCY_MS) más un costo por token
+generado (BENCH_LLM_MS_PER_TOKEN). Fast-path local y cache de intenciones desactivados:
+se mide solo el camino que llega a GPT. Tokens (y proporción servida desde el cache de
+prefijo simulado por el stub) desde la contabilidad de llm_gateway.
+"""
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BOT_DIR = Path(__file__).resolve().parents[2] / "ecommerce-bot-ia" / "whatsapp-bot-fastapi"
+sys.path.insert(0, str(BOT_DIR))
+os.environ["LLM_BACKEND"] = "stub"
+os.environ["INTENT_RULES_ENABLED"] = "false"
+os.environ["INTENT_CACHE_FUZZY"] = "false"
+
+MESSAGES = int(os.getenv("BENCH_MESSAGES", "50"))
+LATENCY_MS = float(os.getenv("BENCH_LLM_LATENCY_MS", "250"))
+MS_PER_TOKEN = float(os.getenv("BENCH_LLM_MS_PER_TOKEN", "4"))
+TENANT_ID = "bench-tenant"
+
+CATEGORIAS = ["semillas", "aceites", "flores", "comestibles", "accesorios"]
+PRODUCTOS = [
+    {"id": f"p{i}", "name": f"{cat.title()[:-1]} Premium {i}", "description": f"{cat} de prueba",
+     "price": 10000 + i * 500, "stock": 5 + i % 7, "status": "Active", "client_id": TENANT_ID,
+     "category": cat.title(), "categories": (cat.title(),)}
+    for i, cat in enumerate(CATEGORIAS * 40)
+]
+
+INTENT = {"intencion": "consulta_categoria", "confianza": 0.9, "categoria_mencionada": "aceites",
+          "producto_mencionado": "", "negaciones": [], "presupuesto_mencionado": "",
+          "sentimiento": "neutral", "contexto_detectado": "stub"}
+REPLY = ("¡Claro! Estos son nuestros aceites más pedidos:\n\n1. Aceite Premium 1 - $10.500\n"
+         "2. Aceite Premium 6 - $13.000\n\n¿Te muestro alguno en detalle? Para comprar escribe: Quiero [nombre]")
+
+
+def responder(messages, **kwargs):
+    """Misma forma que el modelo real: intención JSON, texto o ambos en un JSON"""
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    if (kwargs.get("response_format") or {}).get("type") == "json_object":
+        if '"respuesta"' in system:
+            content = json.dumps({"intent": INTENT, "respuesta": REPLY}, ensure_ascii=False)
+        else:
+            content = json.dumps(INTENT, ensure_ascii=False)
+    else:
+        content = REPLY
+    time.sleep(len(content) / 4 * MS_PER_TOKEN / 1000)
+    return content
+
+
+def run(mode: str):
+    from services.ai_improvements import handle_message_with_context
+    from services.llm_gateway import get_llm_stats, llm_gateway
+
+    llm_gateway.reset_stats()
+    latencies = []
+    for i in range(MESSAGES):
+        started = time.perf_counter()
+        respuesta, metadata = handle_message_with_context(
+            tenant_id=TENANT_ID, store_name="Tienda Bench", telefono="+56900000000",
+            mensaje=f"hola, qué aceites me recomiendas para dormir? consulta {mode} {i}",
+            productos=PRODUCTOS, categorias_soportadas=CATEGORIAS, pipeline_mode=mode,
+        )
+        latencies.append(time.perf_counter() - started)
+        assert respuesta and metadata.get("pipeline_mode") == mode, metadata
+
+    total = get_llm_stats()["usage"].get("total", {})
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+        "calls": total.get("calls", 0) / MESSAGES,
+        "prompt_tokens": total.get("prompt_tokens", 0) / MESSAGES,
+        "cached_ratio": total.get("cached_token_ratio", 0.0),
+        "completion_tokens": total.get("completion_tokens", 0) / MESSAGES,
+    }
+
+
+def main():
+    from services.llm_gateway import set_llm_backend
+
+    set_llm_backend("stub", responder=responder, latency_ms=LATENCY_MS)
+
+    print("⚡ BENCHMARK PIPELINE IA: two_pass vs single_pass (LLM stub)")
+    print("=" * 78)
+    print(f"mensajes: {MESSAGES}  productos: {len(PRODUCTOS)}  latencia stub: {LATENCY_MS:.0f} ms + "
+          f"{MS_PER_TOKEN:.1f} ms/token")
+    print()
+    print(f"{'modo':<14}{'p50 ms':>10}{'p95 ms':>10}{'llamadas':>10}{'prompt tok':>12}{'compl. tok':>12}"
+          f"{'cache %':>10}")
+
+    results = {mode: run(mode) for mode in ("two_pass", "single_pass")}
+    for mode, r in results.items():
+        print(f"{mode:<14}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['calls']:>10.1f}"
+              f"{r['prompt_tokens']:>12.0f}{r['completion_tokens']:>12.0f}{r['cached_ratio'] * 100:>10.1f}")
+
+    before, after = results["two_pass"], results["single_pass"]
+    print()
+    print(f"{'✅' if after['calls'] < before['calls'] else '❌'} llamadas por mensaje: "
+          f"{before['calls']:.1f} -> {after['calls']:.1f}")
+    print(f"{'✅' if after['p50_ms'] < before['p50_ms'] else '❌'} latencia p50: "
+          f"{before['p50_ms']:.0f} ms -> {after['p50_ms']:.0f} ms")
+    print(f"{'✅' if after['prompt_tokens'] < before['prompt_tokens'] else '❌'} tokens de prompt por mensaje: "
+          f"{before['prompt_tokens']:.0f} -> {after['prompt_tokens']:.0f}")
+
+
+if __name__ == "__main__":
+    main()
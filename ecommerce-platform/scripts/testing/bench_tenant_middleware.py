@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del TenantMiddleware: requests/seg antes y después del cambio a ASGI puro
+
+- "antes": misma forma que el stack anterior -> resolución de tenant dentro de un
+  BaseHTTPMiddleware + un segundo @app.middleware("http") que hace print por request
+- "después": TenantMiddleware (ASGI puro) + ApiPathFixMiddleware
+
+La resolución de tenant se sirve desde el cache precargado, así se mide solo el
+overhead de los middlewares. Se invoca la app ASGI directamente (sin red ni servidor).
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[2] / "ecommerce-bot-ia" / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", "sqlite:///./bench_tenant_middleware.db")
+os.environ.pop("CACHE_REDIS_URL", None)
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "5000"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "50"))
+TENANT_ID = "11111111-2222-3333-4444-555555555555"
+
+
+def build_app(stack: str):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+    from starlette.middleware.base import BaseHTTPMiddleware
+
+    from api_path_middleware import ApiPathFixMiddleware
+    from tenant_middleware import TenantMiddleware, _tenant_context, get_tenant_id
+
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"tenant": get_tenant_id()}
+
+    @app.get("/api/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(5):
+                yield b"x" * 1024
+                await asyncio.sleep(0.01)
+        return StreamingResponse(chunks(), media_type="application/octet-stream")
+
+    if stack == "after":
+        app.add_middleware(TenantMiddleware)
+        app.add_middleware(ApiPathFixMiddleware)
+        return app
+
+    resolver = TenantMiddleware(app.router)
+
+    class BaseHTTPTenantMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request: Request, call_next):
+            tenant_id, _ = await resolver._resolve_tenant_id(request.scope, request.headers)
+            token = _tenant_context.set(tenant_id)
+            try:
+                return await call_next(request)
+            finally:
+                _tenant_context.reset(token)
+
+    app.add_middleware(BaseHTTPTenantMiddleware)
+
+    @app.middleware("http")
+    async def print_path(request: Request, call_next):
+        print(f"Middleware processing path: {request.url.path}")
+        return await call_next(request)
+
+    return app
+
+
+def make_scope(path: str):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"acme.sintestesia.cl"), (b"x-tenant-id", TENANT_ID.encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+
+
+async def call(app, path: str):
+    """Ejecuta un request; devuelve (status, segundos hasta el primer chunk de body)"""
+    started = time.perf_counter()
+    first_body = None
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal first_body, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body") and first_body is None:
+            first_body = time.perf_counter() - started
+
+    await app(make_scope(path), receive, send)
+    return status, first_body
+
+
+async def requests_per_second(app) -> float:
+    started = time.perf_counter()
+    for offset in range(0, REQUESTS, CONCURRENCY):
+        batch = min(CONCURRENCY, REQUESTS - offset)
+        results = await asyncio.gather(*(call(app, "/api/ping") for _ in range(batch)))
+        assert all(status == 200 for status, _ in results), results[:3]
+    return REQUESTS / (time.perf_counter() - started)
+
+
+async def main():
+    from tenant_middleware import _tenant_cache
+
+    # Resolución desde cache: se mide el middleware, no la base de datos
+    _tenant_cache.set(f"exists:{TENANT_ID}", True)
+    _tenant_cache.set("subdomain:acme", TENANT_ID)
+
+    print("🏢 BENCHMARK TENANT MIDDLEWARE")
+    print("=" * 70)
+    print(f"requests: {REQUESTS}  concurrencia: {CONCURRENCY}")
+
+    results = {}
+    for stack in ("before", "after"):
+        app = build_app(stack)
+        with contextlib.redirect_stdout(io.StringIO()):
+            await call(app, "/api/ping")  # warm-up (arma el middleware stack)
+            rps = await requests_per_second(app)
+            _, ttfb = await call(app, "/api/stream")
+        results[stack] = rps
+        label = "antes (BaseHTTPMiddleware x2)" if stack == "before" else "después (ASGI puro)"
+        print(f"{label:<32} {rps:9.0f} req/s   primer chunk streaming: {ttfb * 1000:6.1f} ms")
+
+    print(f"\n📊 Mejora: x{results['after'] / results['before']:.2f} requests/seg")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
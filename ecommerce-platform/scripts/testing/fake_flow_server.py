@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Servidor Flow falso para pruebas locales (sin red ni credenciales reales)
+
+- POST /api/payment/create: valida la firma, simula latencia y devuelve un token;
+  el mismo commerceOrder devuelve siempre el mismo token (y se cuenta como duplicado)
+- GET /api/payment/getStatus: status 2 (pagado) para tokens emitidos
+- Latencia configurable (FAKE_FLOW_LATENCY_MS) y fallos 503 cada N creaciones (FAKE_FLOW_FAIL_EVERY)
+
+Uso como fixture:
+    server, base_url = start_fake_flow_server()
+    ... FLOW_BASE_URL=base_url ...
+    server.shutdown()
+
+Uso standalone: python fake_flow_server.py  (escucha en FAKE_FLOW_PORT, por defecto 8765)
+"""
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+FAKE_FLOW_API_KEY = "fake-flow-api-key"
+FAKE_FLOW_SECRET_KEY = "fake-flow-secret-key"
+
+
+def _firma(params: dict, secret: str) -> str:
+    cadena = "&".join(f"{key}={params[key]}" for key in sorted(params))
+    return hmac.new(secret.encode(), cadena.encode(), hashlib.sha256).hexdigest()
+
+
+class FakeFlowState:
+    def __init__(self, latency_ms: float, fail_every: int, secret: str):
+        self.latency = latency_ms / 1000
+        self.fail_every = fail_every
+        self.secret = secret
+        self.lock = threading.Lock()
+        self.tokens = {}  # commerceOrder -> token
+        self.creates = 0
+        self.duplicates = 0
+        self.bad_signatures = 0
+        self.failures = 0
+        self.status_checks = 0
+
+
+class FakeFlowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: permite medir reutilización de conexiones
+    state: FakeFlowState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _signed(self, params: dict) -> bool:
+        firma = params.pop("s", "")
+        if not hmac.compare_digest(firma, _firma(params, self.state.secret)):
+            with self.state.lock:
+                self.state.bad_signatures += 1
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        params = dict(parse_qsl(self.rfile.read(length).decode()))
+        if urlparse(self.path).path != "/api/payment/create":
+            return self._reply(404, {"code": 404, "message": "not found"})
+        if not self._signed(params):
+            return self._reply(401, {"code": 108, "message": "invalid signature"})
+
+        time.sleep(self.state.latency)
+        state = self.state
+        with state.lock:
+            state.creates += 1
+            if state.fail_every and state.creates % state.fail_every == 0:
+                state.failures += 1
+                fail = True
+            else:
+                fail = False
+                order = params["commerceOrder"]
+                if order in state.tokens:
+                    state.duplicates += 1
+                else:
+                    state.tokens[order] = uuid.uuid4().hex
+                token = state.tokens[order]
+        if fail:
+            return self._reply(503, {"code": 503, "message": "temporarily unavailable"})
+        self._reply(200, {"url": "https://sandbox.flow.cl/app/web/pay.php", "token": token,
+                          "flowOrder": abs(hash(token)) % 10**8})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = dict(parse_qsl(url.query))
+        if url.path != "/api/payment/getStatus":
+            return self._reply(404, {"code": 404, "message": "not found"})
+        if not self._signed(params):
+            return self._reply(401, {"code": 108, "message": "invalid signature"})
+        time.sleep(self.state.latency)
+        with self.state.lock:
+            self.state.status_checks += 1
+            order = next((o for o, t in self.state.tokens.items() if t == params.get("token")), None)
+        if order is None:
+            return self._reply(400, {"code": 105, "message": "token not found"})
+        self._reply(200, {"commerceOrder": order, "status": 2})
+
+
+def start_fake_flow_server(latency_ms: float = None, fail_every: int = None, port: int = 0,
+                           secret: str = FAKE_FLOW_SECRET_KEY):
+    """Inicia el servidor en un thread; devuelve (server, base_url). server.state tiene los contadores"""
+    latency_ms = float(os.getenv("FAKE_FLOW_LATENCY_MS", "80")) if latency_ms is None else latency_ms
+    fail_every = int(os.getenv("FAKE_FLOW_FAIL_EVERY", "0")) if fail_every is None else fail_every
+    state = FakeFlowState(latency_ms, fail_every, secret)
+    handler = type("BoundFakeFlowHandler", (FakeFlowHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api"
+
+
+if __name__ == "__main__":
+    server, base_url = start_fake_flow_server(port=int(os.getenv("FAKE_FLOW_PORT", "8765")))
+    print(f"🧪 Fake Flow escuchando en {base_url}")
+    print(f"   FLOW_BASE_URL={base_url} FLOW_API_KEY={FAKE_FLOW_API_KEY} FLOW_SECRET_KEY={FAKE_FLOW_SECRET_KEY}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
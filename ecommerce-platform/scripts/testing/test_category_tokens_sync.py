@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Prueba de la normalización de categorías compartida por backend y bot
+
+- backend/services/category_index.py (indexador) y whatsapp-bot-fastapi/services/catalog_snapshot.py
+  (lectura del índice) tienen su propia copia del tokenizer: ambas deben ser idénticas o las
+  claves de categoría dejan de coincidir entre los dos servicios
+- Singular y plural de una misma categoría producen la misma clave
+"""
+import ast
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[2] / "ecommerce-bot-ia"
+SOURCES = {
+    "backend": APP_DIR / "backend" / "services" / "category_index.py",
+    "bot": APP_DIR / "whatsapp-bot-fastapi" / "services" / "catalog_snapshot.py",
+}
+# Nodos que forman el tokenizer (se comparan sin importar los módulos, que requieren BD)
+TOKENIZER_NAMES = {"_TOKEN_RE", "_singular"}
+
+PARES = [
+    ("flores", "flor"), ("aceites", "aceite"), ("semillas", "semilla"), ("papeles", "papel"),
+    ("muebles", "mueble"), ("comestibles", "comestible"), ("verdes", "verde"), ("canciones", "cancion"),
+]
+
+
+def tokenizer_nodes(path: Path):
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    nodes = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name in TOKENIZER_NAMES:
+            nodes.append(node)
+        elif isinstance(node, ast.Assign) and any(
+                isinstance(t, ast.Name) and t.id in TOKENIZER_NAMES for t in node.targets):
+            nodes.append(node)
+    return nodes
+
+
+def load_singular(nodes):
+    namespace = {"re": __import__("re")}
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), "<tokenizer>", "exec"), namespace)
+    return namespace["_singular"]
+
+
+def main():
+    print("🔤 PRUEBA DE NORMALIZACIÓN DE CATEGORÍAS")
+    print("=" * 60)
+    ok = True
+
+    nodes = {name: tokenizer_nodes(path) for name, path in SOURCES.items()}
+    dumps = {name: [ast.dump(node) for node in found] for name, found in nodes.items()}
+    passed = len(dumps["backend"]) == len(TOKENIZER_NAMES) and dumps["backend"] == dumps["bot"]
+    ok &= passed
+    print(f"{'✅' if passed else '❌'} tokenizer idéntico en backend y bot")
+
+    for name, found in nodes.items():
+        singular = load_singular(found)
+        for plural, esperado in PARES:
+            passed = singular(plural) == esperado and singular(esperado) == esperado
+            ok &= passed
+            if not passed:
+                print(f"❌ [{name}] {plural} -> {singular(plural)}, {esperado} -> {singular(esperado)}")
+    print(f"{'✅' if ok else '❌'} singular y plural comparten clave ({len(PARES)} pares)")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Prueba de concurrencia de la creación atómica de pedidos (services/order_placement.py)
+
+- ORDER_BUYERS compradores simultáneos (threads, una sesión cada uno) compran 1 unidad
+  de un producto con ORDER_STOCK unidades => exactamente ORDER_STOCK pedidos, stock final 0
+- Pedidos de dos ítems en órdenes inversos (A+B / B+A) para ejercitar bloqueos cruzados
+- Verifica que no hay sobreventa ni pedidos a medias y mide pedidos/seg
+
+Usa DATABASE_URL (Postgres para una prueba real de bloqueos; por defecto un SQLite local).
+"""
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BOT_DIR = Path(__file__).resolve().parents[2] / "ecommerce-bot-ia" / "whatsapp-bot-fastapi"
+sys.path.insert(0, str(BOT_DIR))
+SQLITE_FILE = "bench_order_placement.db"
+os.environ.setdefault("DATABASE_URL", f"sqlite:///./{SQLITE_FILE}")
+os.environ.pop("CACHE_REDIS_URL", None)
+
+BUYERS = int(os.getenv("ORDER_BUYERS", "200"))
+STOCK = int(os.getenv("ORDER_STOCK", "25"))
+WORKERS = int(os.getenv("ORDER_WORKERS", "20"))
+TENANT_ID = f"bench-{uuid.uuid4().hex[:8]}"
+
+
+def seed(SessionLocal, Product):
+    ids = {name: f"{TENANT_ID}-{name}" for name in ("low", "a", "b")}
+    with SessionLocal() as db:
+        for name, product_id in ids.items():
+            db.add(Product(id=product_id, name=f"Bench {name}", price=1000, stock=STOCK if name == "low" else BUYERS,
+                           status="Active", client_id=TENANT_ID))
+        db.commit()
+    return ids
+
+
+def buy(SessionLocal, place_order, pedido_data):
+    with SessionLocal() as db:
+        result = place_order(db, f"+569{uuid.uuid4().int % 10**8:08d}", TENANT_ID, pedido_data,
+                             sum(item["precio"] * item["cantidad"] for item in pedido_data.values()))
+        return result.ok
+
+
+def run(label, SessionLocal, place_order, orders):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(lambda pedido_data: buy(SessionLocal, place_order, pedido_data), orders))
+    elapsed = time.perf_counter() - started
+    placed = sum(results)
+    print(f"{label:<28} pedidos: {placed:5d}/{len(orders):<5d} rechazados: {len(orders) - placed:5d}   "
+          f"{len(orders) / elapsed:8.1f} intentos/s")
+    return placed
+
+
+def main():
+    from sqlalchemy import func
+    from database import Base, engine, SessionLocal
+    from models import Product, FlowPedido, FlowProductoPedido
+    from services.order_placement import place_order, get_order_placement_stats
+
+    Base.metadata.create_all(engine)
+    ids = seed(SessionLocal, Product)
+
+    def item(name):
+        return {"nombre": f"Bench {name}", "cantidad": 1, "precio": 1000}
+
+    print("🛒 CONCURRENCIA DE PEDIDOS")
+    print("=" * 70)
+    print(f"base: {engine.dialect.name}  compradores: {BUYERS}  stock bajo: {STOCK}  workers: {WORKERS}")
+
+    ok = True
+    placed_low = run("1 ítem, stock bajo", SessionLocal, place_order,
+                     [{ids["low"]: item("low")} for _ in range(BUYERS)])
+    crossed = [
+        {ids["a"]: item("a"), ids["b"]: item("b")} if i % 2 else {ids["b"]: item("b"), ids["a"]: item("a")}
+        for i in range(BUYERS)
+    ]
+    placed_crossed = run("2 ítems cruzados", SessionLocal, place_order, crossed)
+
+    with SessionLocal() as db:
+        stock = {name: db.query(Product.stock).filter(Product.id == product_id).scalar()
+                 for name, product_id in ids.items()}
+        pedido_ids = [row.id for row in db.query(FlowPedido.id).filter(FlowPedido.tenant_id == TENANT_ID)]
+        lineas = db.query(func.count(FlowProductoPedido.id)).filter(
+            FlowProductoPedido.pedido_id.in_(pedido_ids)
+        ).scalar()
+        total_pedidos = len(pedido_ids)
+
+    checks = [
+        ("sin sobreventa (stock bajo)", placed_low == STOCK and stock["low"] == 0),
+        ("stock >= 0 en todos", all(value >= 0 for value in stock.values())),
+        ("stock cruzado consistente", stock["a"] == stock["b"] == BUYERS - placed_crossed),
+        ("sin pedidos a medias", total_pedidos == placed_low + placed_crossed
+         and lineas == placed_low + 2 * placed_crossed),
+    ]
+    print()
+    for label, passed in checks:
+        ok = ok and passed
+        print(f"{'✅' if passed else '❌'} {label}")
+    print(f"\n📊 {get_order_placement_stats()}")
+
+    if engine.dialect.name == "sqlite":
+        engine.dispose()
+        Path(SQLITE_FILE).unlink(missing_ok=True)
+    else:
+        with SessionLocal() as db:
+            db.query(FlowProductoPedido).filter(FlowProductoPedido.pedido_id.in_(pedido_ids)).delete(
+                synchronize_session=False)
+            db.query(FlowPedido).filter(FlowPedido.tenant_id == TENANT_ID).delete(synchronize_session=False)
+            db.query(Product).filter(Product.client_id == TENANT_ID).delete(synchronize_session=False)
+            db.commit()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
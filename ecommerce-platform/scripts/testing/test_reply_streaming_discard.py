@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Prueba de la entrega anticipada de respuestas (services/reply_streaming.py) con LLM stub
+
+- Confianza de intención baja: flow_chat_service descarta la respuesta de IA y pasa al
+  motor de razonamiento => no debe salir ningún bloque anticipado por WhatsApp
+- Confianza alta: el primer párrafo sale antes de terminar la generación y al final solo
+  se envía lo que falta (sin repetir lo ya enviado)
+- single_pass: mismo criterio cuando la respuesta se genera aparte (JSON inválido => fallback
+  de dos llamadas, o intención válida sin "respuesta")
+"""
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+BOT_DIR = Path(__file__).resolve().parents[2] / "ecommerce-bot-ia" / "whatsapp-bot-fastapi"
+sys.path.insert(0, str(BOT_DIR))
+os.environ["LLM_BACKEND"] = "stub"
+os.environ["INTENT_RULES_ENABLED"] = "false"
+os.environ["INTENT_CACHE_FUZZY"] = "false"
+os.environ["REPLY_STREAMING_ENABLED"] = "true"
+
+TENANT_ID = "stream-test-tenant"
+PRODUCTOS = [
+    {"id": f"p{i}", "name": f"Aceite Premium {i}", "description": "aceite de prueba", "price": 10000 + i * 500,
+     "stock": 5, "status": "Active", "client_id": TENANT_ID, "category": "Aceites", "categories": ("Aceites",)}
+    for i in range(10)
+]
+REPLY = ("Tenemos varios aceites disponibles para ti, todos con stock y despacho rápido. "
+         "Te cuento los más pedidos de la semana por nuestros clientes.\n\n"
+         "1. Aceite Premium 1 - $10.500\n2. Aceite Premium 2 - $11.000\n\n"
+         "¿Te muestro alguno en detalle?")
+
+confianza = {"value": 0.9}
+# Salida de la llamada single_pass: "invalid" (sin intención => fallback) | "empty" (sin respuesta)
+single_pass = {"output": "invalid"}
+
+
+def intent_json():
+    return {"intencion": "consulta_categoria", "confianza": confianza["value"],
+            "categoria_mencionada": "aceites", "producto_mencionado": "", "negaciones": [],
+            "presupuesto_mencionado": "", "sentimiento": "neutral", "contexto_detectado": "stub"}
+
+
+def responder(messages, **kwargs):
+    if (kwargs.get("response_format") or {}).get("type") == "json_object":
+        if "PRODUCTOS RELEVANTES" in messages[-1]["content"] and single_pass["output"] == "empty":
+            return json.dumps({"intent": intent_json(), "respuesta": ""})
+        return json.dumps(intent_json())
+    return REPLY
+
+
+async def generate(mensaje: str, value: float, pipeline_mode: str = "two_pass"):
+    from services.ai_improvements import AI_REPLY_MIN_CONFIDENCE, handle_message_with_context
+    from services.reply_streaming import reply_streaming
+
+    confianza["value"] = value
+    sent = []
+
+    async def send(chunk):
+        sent.append(chunk)
+        return True
+
+    async with reply_streaming(send) as stream:
+        respuesta, metadata = await asyncio.to_thread(
+            handle_message_with_context, tenant_id=TENANT_ID, store_name="Tienda Test", telefono="+56900000000",
+            mensaje=mensaje, productos=PRODUCTOS, categorias_soportadas=["aceites"], pipeline_mode=pipeline_mode,
+        )
+        # Mismo criterio que procesar_mensaje_flow para usar o descartar la respuesta de IA
+        usada = metadata.get("intent_confidence", 0) > AI_REPLY_MIN_CONFIDENCE
+        final = await stream.finish(respuesta if usada else "Respuesta del motor de razonamiento")
+    return sent, final, usada
+
+
+async def main():
+    from services.llm_gateway import set_llm_backend
+
+    set_llm_backend("stub", responder=responder, latency_ms=0)
+    print("📨 PRUEBA DE ENTREGA ANTICIPADA (LLM stub)")
+    print("=" * 60)
+    ok = True
+
+    sent, final, usada = await generate("qué aceites tienen? (baja confianza)", 0.2)
+    passed = not usada and not sent and final == "Respuesta del motor de razonamiento"
+    ok &= passed
+    print(f"{'✅' if passed else '❌'} confianza baja: respuesta descartada, bloques anticipados: {len(sent)}")
+
+    sent, final, usada = await generate("qué aceites tienen? (alta confianza)", 0.9)
+    passed = usada and len(sent) == 1 and final and sent[0].strip() not in final
+    ok &= bool(passed)
+    print(f"{'✅' if passed else '❌'} confianza alta: {len(sent)} bloque anticipado, resto final: {len(final)} caracteres")
+
+    for output in ("invalid", "empty"):
+        single_pass["output"] = output
+        sent, final, usada = await generate(f"qué aceites tienen? (single_pass {output}, baja)", 0.2, "single_pass")
+        passed = not usada and not sent and final == "Respuesta del motor de razonamiento"
+        ok &= passed
+        print(f"{'✅' if passed else '❌'} single_pass {output}, confianza baja: respuesta descartada, "
+              f"bloques anticipados: {len(sent)}")
+
+    sent, final, usada = await generate("qué aceites tienen? (single_pass empty, alta)", 0.9, "single_pass")
+    passed = usada and len(sent) == 1 and final and sent[0].strip() not in final
+    ok &= bool(passed)
+    print(f"{'✅' if passed else '❌'} single_pass empty, confianza alta: {len(sent)} bloque anticipado")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))